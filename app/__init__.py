@@ -1,18 +1,28 @@
 from pathlib import Path
 
-from quart import Quart
+from quart import Quart, session
+from loguru import logger
 from quart_auth import QuartAuth, AuthUser
 from werkzeug.datastructures import ImmutableDict
-from sqlalchemy import select
 
 from .config import Settings
-from .database import init_db, AsyncSessionLocal
+from .database import init_db
 from .routes.auth import bp as auth_bp
 from .routes.public import bp as public_bp
 from .routes.quest import bp as quest_bp
 from .routes.courses import bp as courses_bp
 from .routes.payments import payments_bp
-from .models import User
+from .routes.admin import bp as admin_bp
+from .services.user_cache import UserIdentity, get_user_cache
+from .services.course_outline import get_course_outline_cache
+from .services.email import close_email_delivery
+from .services.email_outbox import get_email_dispatcher
+from .services.email_templates import get_email_templates
+from .services.quest_leads import get_quest_lead_sender
+from .services.passwords import get_password_hasher, shutdown_password_hasher
+from .services.generation_usage import get_usage_recorder
+from .services.http import close_http_clients
+from .services.openrouter import get_openrouter_service
 
 # Quart 0.19.6 использует flask.sansio.App, в котором отсутствует флаг
 # PROVIDE_AUTOMATIC_OPTIONS. Патчим дефолты, чтобы не получать KeyError
@@ -49,12 +59,14 @@ def create_app() -> Quart:
 
         async def _resolve(self):
             if not self._resolved:
-                async with AsyncSessionLocal() as session:
-                    result = await session.execute(
-                        select(User).where(User.id == int(self.auth_id))
-                    )
-                    self._user = result.scalar_one_or_none()
-                    self._resolved = True
+                # Данные берутся из кеша идентичности (мемо запроса + TTL/LRU процесса)
+                self._user = await get_user_cache().get(int(self.auth_id))
+                self._resolved = True
+
+        async def identity(self) -> UserIdentity | None:
+            """Данные текущего пользователя (username, avatar_url, is_active)"""
+            await self._resolve()
+            return self._user
 
     # Регистрация blueprints
     app.register_blueprint(public_bp)
@@ -62,18 +74,27 @@ def create_app() -> Quart:
     app.register_blueprint(quest_bp)
     app.register_blueprint(courses_bp)
     app.register_blueprint(payments_bp)
+    app.register_blueprint(admin_bp)
 
     @app.context_processor
     async def inject_globals():
-        return {"settings": settings}
+        current_identity = None
+        user_id = session.get("user_id")
+        if user_id:
+            try:
+                current_identity = await get_user_cache().get(int(user_id))
+            except Exception as e:
+                logger.error(f"Failed to resolve user identity for template: {e}")
+        return {"settings": settings, "current_identity": current_identity}
 
     # Middleware для проверки срока действия сессии
-    from app.middleware.session import check_session_expiry
+    from app.middleware.session import check_session_expiry, check_user_identity
     
     @app.before_request
     async def before_request():
-        """Проверка срока действия сессии перед каждым запросом"""
+        """Проверка срока действия сессии и активности пользователя перед каждым запросом"""
         await check_session_expiry()
+        await check_user_identity()
 
     # Инициализация базы данных при старте приложения
     @app.before_serving
@@ -81,5 +102,38 @@ def create_app() -> Quart:
         """Инициализация БД перед запуском сервера"""
         await init_db()
 
+        # Калибровка bcrypt под бюджет задержки (если задан)
+        if settings.bcrypt_target_ms > 0:
+            await get_password_hasher().calibrate(settings.bcrypt_target_ms)
+
+        # Долгоживущий клиент OpenRouter (пул соединений, keep-alive)
+        await get_openrouter_service().startup()
+
+        # Шаблоны писем компилируются до первой отправки (ошибка в шаблоне — сразу при старте)
+        get_email_templates()
+
+        # Отправка писем из outbox (несколько процессов делят очередь через SKIP LOCKED)
+        if settings.email_outbox_dispatcher:
+            get_email_dispatcher().start()
+
+        # Доставка заявок с квеста в Telegram (без токена бота заявки только сохраняются)
+        if settings.quest_leads_sender:
+            get_quest_lead_sender().start()
+
+        # Изменения структуры курсов от генератора (другой процесс) через LISTEN
+        get_course_outline_cache().start()
+
+    @app.after_serving
+    async def shutdown():
+        """Освобождение ресурсов при остановке сервера"""
+        shutdown_password_hasher()
+        await get_email_dispatcher().stop()
+        await get_quest_lead_sender().stop()
+        await get_course_outline_cache().stop()
+        await close_email_delivery()
+        await get_openrouter_service().aclose()
+        await close_http_clients()
+        await get_usage_recorder().aclose()
+
     return app
 
@@ -19,6 +19,131 @@ class Settings(BaseModel):
 
     # OpenRouter API (для AI генерации контента)
     openrouter_api_key: str = Field(default_factory=lambda: os.getenv("OPENROUTER_API_KEY", ""))
+    # Базовый URL API (можно указать локальный mock-сервер для тестов и бенчмарков)
+    openrouter_base_url: str = Field(
+        default_factory=lambda: os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+    )
+    # Таймаут запроса по умолчанию (с), пул соединений и HTTP/2 для OpenRouter
+    openrouter_timeout: float = Field(
+        default_factory=lambda: float(os.getenv("OPENROUTER_TIMEOUT", "60"))
+    )
+    openrouter_max_connections: int = Field(
+        default_factory=lambda: int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+    )
+    openrouter_http2: bool = Field(
+        default_factory=lambda: os.getenv("OPENROUTER_HTTP2", "true").lower()
+        in ("1", "true", "yes")
+    )
+    # Дисковый кеш ответов LLM (readwrite / readonly / replay / refresh / off)
+    llm_cache_mode: str = Field(default_factory=lambda: os.getenv("LLM_CACHE_MODE", "readwrite"))
+    llm_cache_dir: str = Field(default_factory=lambda: os.getenv("LLM_CACHE_DIR", ".cache/llm"))
+    llm_cache_max_mb: int = Field(default_factory=lambda: int(os.getenv("LLM_CACHE_MAX_MB", "512")))
+    # Планировщик запросов к LLM: бюджеты в минуту (0 — без ограничения), повторы, circuit breaker
+    llm_rpm: int = Field(default_factory=lambda: int(os.getenv("LLM_RPM", "120")))
+    llm_tpm: int = Field(default_factory=lambda: int(os.getenv("LLM_TPM", "400000")))
+    llm_max_retries: int = Field(default_factory=lambda: int(os.getenv("LLM_MAX_RETRIES", "5")))
+    llm_breaker_threshold: int = Field(
+        default_factory=lambda: int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+    )
+    llm_breaker_cooldown: float = Field(
+        default_factory=lambda: float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+    )
+    # Модели по задачам (первая — основная, остальные — запасные) и хеджирование медленных запросов
+    llm_lesson_models: str = Field(
+        default_factory=lambda: os.getenv("LLM_LESSON_MODELS", "openai/gpt-5.1,openai/gpt-5-mini")
+    )
+    llm_quiz_models: str = Field(
+        default_factory=lambda: os.getenv("LLM_QUIZ_MODELS", "openai/gpt-5.1,openai/gpt-5-mini")
+    )
+    llm_hedging: bool = Field(
+        default_factory=lambda: os.getenv("LLM_HEDGING", "true").lower() in ("1", "true", "yes")
+    )
+    llm_hedge_min_delay: float = Field(
+        default_factory=lambda: float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.0"))
+    )
+    # Сколько запросов к LLM одновременно выполняет генератор курса
+    course_gen_concurrency: int = Field(
+        default_factory=lambda: int(os.getenv("COURSE_GEN_CONCURRENCY", "4"))
+    )
+    # Воркер очереди генерации: задач одновременно и общий бюджет запросов к LLM на все задачи
+    generation_worker_jobs: int = Field(
+        default_factory=lambda: int(os.getenv("GENERATION_WORKER_JOBS", "4"))
+    )
+    generation_llm_concurrency: int = Field(
+        default_factory=lambda: int(os.getenv("GENERATION_LLM_CONCURRENCY", "8"))
+    )
+
+    # Поиск почти одинаковых уроков после генерации курса (Жаккар по шинглам; 0 — выключен)
+    lesson_dedup_threshold: float = Field(
+        default_factory=lambda: float(os.getenv("LESSON_DEDUP_THRESHOLD", "0.5"))
+    )
+    # Сколько раз за запуск генерации перегенерировать найденные копии
+    lesson_dedup_rounds: int = Field(
+        default_factory=lambda: int(os.getenv("LESSON_DEDUP_ROUNDS", "1"))
+    )
+
+    # SMTP (письма с кодами и о покупках).
+    # SMTP_SECURITY: ssl / starttls / none (по умолчанию — по порту)
+    smtp_host: str = Field(default_factory=lambda: os.getenv("SMTP_HOST") or "smtp.yandex.ru")
+    smtp_port: int = Field(default_factory=lambda: int(os.getenv("SMTP_PORT") or "465"))
+    smtp_user: str = Field(default_factory=lambda: os.getenv("SMTP_USER", ""))
+    smtp_password: str = Field(default_factory=lambda: os.getenv("SMTP_PASSWORD", ""))
+    smtp_security: str = Field(default_factory=lambda: os.getenv("SMTP_SECURITY", ""))
+    # Постоянные SMTP-соединения: сколько держать, через сколько секунд простоя
+    # переподключаться (сервер закрывает простаивающие), сколько писем на соединение
+    email_smtp_connections: int = Field(
+        default_factory=lambda: int(os.getenv("EMAIL_SMTP_CONNECTIONS", "3"))
+    )
+    email_smtp_idle_timeout: float = Field(
+        default_factory=lambda: float(os.getenv("EMAIL_SMTP_IDLE_TIMEOUT", "30"))
+    )
+    email_smtp_max_messages: int = Field(
+        default_factory=lambda: int(os.getenv("EMAIL_SMTP_MAX_MESSAGES", "100"))
+    )
+    # Очередь писем на отправку; при переполнении отправитель ждёт места
+    email_queue_size: int = Field(default_factory=lambda: int(os.getenv("EMAIL_QUEUE_SIZE", "200")))
+    # Outbox писем: фоновый диспетчер в процессе приложения, писем за захват,
+    # попыток на письмо и базовая пауза между попытками (удваивается), с
+    email_outbox_dispatcher: bool = Field(
+        default_factory=lambda: os.getenv("EMAIL_OUTBOX_DISPATCHER", "true").lower()
+        in ("1", "true", "yes")
+    )
+    email_outbox_batch_size: int = Field(
+        default_factory=lambda: int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+    )
+    email_outbox_max_attempts: int = Field(
+        default_factory=lambda: int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+    )
+    email_outbox_retry_base: float = Field(
+        default_factory=lambda: float(os.getenv("EMAIL_OUTBOX_RETRY_BASE", "5"))
+    )
+
+    # Заявки с квеста: Telegram-бот и фоновая доставка
+    # (дайджест — до N заявок в сообщении, 1 — без дайджестов)
+    telegram_bot_token: str = Field(default_factory=lambda: os.getenv("TELEGRAM_BOT_TOKEN", ""))
+    telegram_chat_id: str = Field(default_factory=lambda: os.getenv("TELEGRAM_CHAT_ID", ""))
+    telegram_api_url: str = Field(default_factory=lambda: os.getenv("TELEGRAM_API_URL", "https://api.telegram.org"))
+    quest_leads_sender: bool = Field(
+        default_factory=lambda: os.getenv("QUEST_LEADS_SENDER", "true").lower()
+        in ("1", "true", "yes")
+    )
+    quest_leads_digest_size: int = Field(
+        default_factory=lambda: int(os.getenv("QUEST_LEADS_DIGEST_SIZE", "10"))
+    )
+    quest_leads_max_attempts: int = Field(
+        default_factory=lambda: int(os.getenv("QUEST_LEADS_MAX_ATTEMPTS", "10"))
+    )
+
+    # Хеширование паролей (bcrypt в отдельном пуле потоков)
+    bcrypt_rounds: int = Field(default_factory=lambda: int(os.getenv("BCRYPT_ROUNDS", "12")))
+    # Бюджет на один хеш в мс; если > 0, cost-фактор подбирается калибровкой при старте
+    bcrypt_target_ms: int = Field(default_factory=lambda: int(os.getenv("BCRYPT_TARGET_MS", "0")))
+    password_hash_workers: int = Field(
+        default_factory=lambda: int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    )
+    password_hash_max_queue: int = Field(
+        default_factory=lambda: int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+    )
 
     @cached_property
     def debug(self) -> bool:
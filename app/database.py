@@ -3,8 +3,11 @@
 Использует PostgreSQL с асинхронным движком для работы с Quart.
 """
 import os
+import time
+from collections import deque
 from typing import AsyncGenerator
 
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
 from app.models import Base
@@ -29,6 +32,58 @@ engine = create_async_engine(
     max_overflow=20,  # Максимум дополнительных соединений
 )
 
+
+
+class PoolMonitor:
+    """
+    Занятость пула соединений: сколько соединений выдано и как долго их держат.
+
+    Пул общий для веб-запросов и фоновой работы процесса: долгое удержание
+    соединения (например, транзакция на всё время генерации курса) видно
+    по hold_max_ms и busy_seconds.
+    """
+
+    def __init__(self, pool, window: int = 1000):
+        self.pool = pool
+        self.checkouts = 0
+        self.max_checked_out = 0
+        self.busy_seconds = 0.0
+        self._holds: deque = deque(maxlen=window)
+        self._since: dict = {}
+        event.listen(pool, "checkout", self._on_checkout)
+        event.listen(pool, "checkin", self._on_checkin)
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        self._since[id(connection_record)] = time.perf_counter()
+        self.checkouts += 1
+        self.max_checked_out = max(self.max_checked_out, self.pool.checkedout())
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        started = self._since.pop(id(connection_record), None)
+        if started is not None:
+            held = time.perf_counter() - started
+            self.busy_seconds += held
+            self._holds.append(held * 1000)
+
+    def stats(self) -> dict:
+        """Снимок для /admin/metrics (задержки — по последним window выдачам)"""
+        holds = sorted(self._holds)
+        p95 = holds[min(len(holds) - 1, int(len(holds) * 0.95))] if holds else None
+        return {
+            "size": self.pool.size(),
+            "checked_out": self.pool.checkedout(),
+            "overflow": max(0, self.pool.overflow()),
+            "max_checked_out": self.max_checked_out,
+            "checkouts": self.checkouts,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "hold_p50_ms": round(holds[len(holds) // 2], 1) if holds else None,
+            "hold_p95_ms": round(p95, 1) if holds else None,
+            "hold_max_ms": round(holds[-1], 1) if holds else None,
+        }
+
+
+pool_monitor = PoolMonitor(engine.sync_engine.pool)
+
 # Фабрика сессий
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -36,6 +91,18 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+# Новые колонки в существующих таблицах (create_all не меняет уже созданные таблицы)
+SCHEMA_UPGRADES = [
+    "ALTER TABLE lessons ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)",
+    "ALTER TABLE lessons ADD COLUMN IF NOT EXISTS generation_status VARCHAR(20) "
+    "NOT NULL DEFAULT 'ready'",
+    "ALTER TABLE lessons ADD COLUMN IF NOT EXISTS generated_at TIMESTAMP WITHOUT TIME ZONE",
+    "ALTER TABLE generation_jobs ADD COLUMN IF NOT EXISTS cancel_requested BOOLEAN "
+    "NOT NULL DEFAULT false",
+    "ALTER TABLE lessons ADD COLUMN IF NOT EXISTS duplicate_of_id INTEGER "
+    "REFERENCES lessons(id) ON DELETE SET NULL",
+]
+
 
 async def init_db() -> None:
     """
@@ -51,10 +118,16 @@ async def init_db() -> None:
         UserCourse, 
         EmailVerification, 
         LoginAttempt,
+        RateLimitCounter,
         Payment,
         CourseModule,
         Lesson,
-        UserLessonProgress
+        UserLessonProgress,
+        UserCourseProgress,
+        GenerationJob,
+        GenerationUsage,
+        EmailOutbox,
+        QuestLead
     )
     from loguru import logger
     from sqlalchemy.exc import IntegrityError
@@ -66,6 +139,8 @@ async def init_db() -> None:
             # checkfirst=True должен предотвратить конфликты, но для надёжности
             # оборачиваем в try-except
             await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+            for statement in SCHEMA_UPGRADES:
+                await conn.execute(text(statement))
         logger.success("Database initialized successfully!")
     except IntegrityError as e:
         # Игнорируем ошибки дублирования - это нормально при параллельном запуске воркеров
@@ -7,6 +7,8 @@ from quart import session, redirect, url_for, request
 from quart_auth import logout_user
 from loguru import logger
 
+from app.services.user_cache import get_user_cache
+
 
 # Длительность сессии
 SESSION_LIFETIME_HOURS = 24
@@ -49,3 +51,29 @@ async def check_session_expiry():
         logger.error(f"Error parsing login_time: {e}")
         # В случае ошибки парсинга, переустанавливаем время
         session['login_time'] = datetime.utcnow().isoformat()
+
+
+async def check_user_identity():
+    """
+    Проверяет, что пользователь из сессии существует и активен.
+    Данные берутся из кеша идентичности, поэтому в обычном случае
+    запросов к БД нет. Деактивированный пользователь разлогинивается.
+    """
+    if request.path.startswith('/static/'):
+        return
+
+    user_id = session.get('user_id')
+    if not user_id:
+        return
+
+    try:
+        identity = await get_user_cache().get(int(user_id))
+    except Exception as e:
+        # Недоступность БД не должна ломать страницы, не требующие данных пользователя
+        logger.error(f"Failed to resolve user identity #{user_id}: {type(e).__name__}: {e}")
+        return
+
+    if identity is None or not identity.is_active:
+        logger.info(f"Logging out missing or deactivated user {user_id}")
+        logout_user()
+        session.clear()
@@ -6,7 +6,13 @@ from .payment import Payment
 from .course_module import CourseModule
 from .lesson import Lesson
 from .user_lesson_progress import UserLessonProgress
+from .user_course_progress import UserCourseProgress
 from .login_attempt import LoginAttempt
+from .rate_limit_counter import RateLimitCounter
+from .generation_job import GenerationJob
+from .generation_usage import GenerationUsage
+from .email_outbox import EmailOutbox
+from .quest_lead import QuestLead
 
 __all__ = [
     "User",
@@ -17,6 +23,12 @@ __all__ = [
     "CourseModule",
     "Lesson",
     "UserLessonProgress",
+    "UserCourseProgress",
     "LoginAttempt",
+    "RateLimitCounter",
+    "GenerationJob",
+    "GenerationUsage",
+    "EmailOutbox",
+    "QuestLead",
 ]
 
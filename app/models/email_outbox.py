@@ -0,0 +1,72 @@
+"""
+Модель исходящего письма (transactional outbox).
+Письмо записывается в той же транзакции, что и данные, о которых оно
+(код верификации, покупка), а отправляет его фоновый диспетчер:
+забирает пачки через SELECT ... FOR UPDATE SKIP LOCKED и повторяет
+неудачные отправки с нарастающей паузой.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import JSON, DateTime, Index, Integer, String, Text, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.user import Base
+
+
+class EmailOutbox(Base):
+    """
+    Письмо в очереди на отправку.
+
+    Статусы: "pending" → "sending" → "sent" / "failed" / "cancelled".
+    Неудачная попытка возвращает письмо в "pending" с паузой (next_attempt_at);
+    письмо, чей диспетчер не отчитался до locked_until (процесс убит), забирается заново.
+    """
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        # Выборка диспетчера: готовые к отправке письма
+        Index(
+            "ix_email_outbox_pending",
+            "next_attempt_at",
+            postgresql_where=text("status IN ('pending', 'sending')"),
+        ),
+    )
+
+    # Основные поля
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    # Вид письма: verification, purchase
+    kind: Mapped[str] = mapped_column(String(30), nullable=False)
+    recipient: Mapped[str] = mapped_column(String(120), nullable=False, index=True)
+    payload: Mapped[dict] = mapped_column(JSON, nullable=False)  # Аргументы сборщика письма
+
+    # Статус отправки
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+    # Аренда диспетчера
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Timestamps
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    # Позже письмо бессмысленно
+    expires_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<EmailOutbox #{self.id} {self.kind} {self.recipient} {self.status}>"
+
+    def to_dict(self) -> dict:
+        """Возвращает словарь со статусом письма (без payload — в нём код верификации)"""
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "attempts": self.attempts,
+            "next_attempt_at": self.next_attempt_at.isoformat() if self.next_attempt_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None,
+        }
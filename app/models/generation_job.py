@@ -0,0 +1,85 @@
+"""
+Модель задачи фоновой генерации контента курса.
+Очередь задач в PostgreSQL: воркер забирает задачи через
+SELECT ... FOR UPDATE SKIP LOCKED и пишет в строку прогресс и статус.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, DateTime, Index, Integer, String, Text, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.user import Base
+
+
+class GenerationJob(Base):
+    """
+    Задача генерации курса (или одного урока).
+
+    Статусы: "queued" → "running" → "succeeded" / "failed" / "cancelled".
+    Зависшая задача (воркер перестал обновлять heartbeat_at) возвращается в "queued".
+    """
+    __tablename__ = "generation_jobs"
+    __table_args__ = (
+        Index("ix_generation_jobs_status_created", "status", "created_at"),
+        # Не больше одной активной задачи на курс (или урок):
+        # повторная постановка не дублирует работу
+        Index(
+            "uq_generation_jobs_active",
+            "course_slug",
+            text("coalesce(lesson_id, 0)"),
+            unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+        ),
+    )
+
+    # Основные поля
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    course_slug: Mapped[str] = mapped_column(String(100), nullable=False, index=True)
+    # Перегенерация одного урока
+    lesson_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    # Перегенерировать все уроки
+    force: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+
+    # Статус выполнения
+    status: Mapped[str] = mapped_column(String(20), default="queued", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    worker_id: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    # Отмена выполняемой задачи
+    cancel_requested: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Прогресс
+    progress_done: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    progress_total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    current_item: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+
+    # Timestamps
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    started_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    # Последний признак жизни воркера
+    heartbeat_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<GenerationJob #{self.id} {self.course_slug} {self.status}>"
+
+    def to_dict(self) -> dict:
+        """Возвращает словарь с данными задачи"""
+        return {
+            "id": self.id,
+            "course_slug": self.course_slug,
+            "lesson_id": self.lesson_id,
+            "force": self.force,
+            "status": self.status,
+            "attempts": self.attempts,
+            "worker_id": self.worker_id,
+            "cancel_requested": self.cancel_requested,
+            "error": self.error,
+            "progress_done": self.progress_done,
+            "progress_total": self.progress_total,
+            "current_item": self.current_item,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
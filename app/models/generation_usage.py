@@ -0,0 +1,59 @@
+"""
+Модель учёта запросов к LLM при генерации контента.
+Одна строка — один вызов chat_completion: токены, стоимость, задержка,
+повторы и контекст (курс, урок, задача очереди, назначение запроса).
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import Boolean, DateTime, Float, ForeignKey, Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.user import Base
+
+
+class GenerationUsage(Base):
+    """
+    Учёт одного запроса к LLM.
+
+    Статусы: "ok", "cached" (ответ из кеша, токены не тратились),
+    "aborted" (поток прерван или оборвался), "error"
+    """
+    __tablename__ = "generation_usage"
+    __table_args__ = (
+        Index("ix_generation_usage_course_model", "course_slug", "model"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False, index=True
+    )
+
+    # Контекст запроса
+    model: Mapped[str] = mapped_column(String(100), nullable=False)
+    # lesson_text, quiz, ...
+    purpose: Mapped[Optional[str]] = mapped_column(String(50), nullable=True)
+    course_slug: Mapped[Optional[str]] = mapped_column(String(100), nullable=True)
+    lesson_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("lessons.id", ondelete="SET NULL"), nullable=True
+    )
+    job_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)  # generation_jobs.id
+
+    # Результат
+    status: Mapped[str] = mapped_column(String(20), nullable=False)
+    cached: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    stream: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    retries: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    # Токены и стоимость (USD)
+    prompt_tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    completion_tokens: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    cost: Mapped[Optional[float]] = mapped_column(Float, nullable=True)
+
+    # Время
+    latency_ms: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    # До первого фрагмента потока
+    ttfb_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<GenerationUsage #{self.id} {self.model} {self.course_slug} {self.status}>"
@@ -32,6 +32,17 @@ class Lesson(Base):
     content_type: Mapped[str] = mapped_column(String(50), default="text", nullable=False)  # "text", "video", "quiz"
     content_text: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Markdown текст урока
     content_html: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # HTML версия (для быстрого отображения)
+    # sha256 исходника + версии рендера (ETag)
+    content_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+
+    # Статус генерации контента: "pending" (ждёт генерации), "ready", "failed",
+    # "duplicate" (почти копия более раннего урока, ждёт перегенерации)
+    generation_status: Mapped[str] = mapped_column(String(20), default="ready", nullable=False)
+    # Ранний урок, копией которого оказался этот (см. services/lesson_duplicates.py)
+    duplicate_of_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("lessons.id", ondelete="SET NULL"), nullable=True
+    )
+    generated_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
 
     # Видео (опционально)
     video_url: Mapped[Optional[str]] = mapped_column(String(500), nullable=True)  # YouTube/Vimeo URL
@@ -83,6 +94,7 @@ class Lesson(Base):
             "quiz_questions": self.quiz_questions,
             "estimated_time_minutes": self.estimated_time_minutes,
             "is_free": self.is_free,
+            "generation_status": self.generation_status,
             "created_at": self.created_at.isoformat(),
             "updated_at": self.updated_at.isoformat(),
         }
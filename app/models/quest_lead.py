@@ -0,0 +1,65 @@
+"""
+Модель заявки с квеста (контакты и ответы).
+Заявка сохраняется при отправке формы, в Telegram её доставляет
+фоновый отправитель: забирает заявки через SELECT ... FOR UPDATE
+SKIP LOCKED и повторяет неудачные отправки.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import JSON, DateTime, Index, Integer, String, Text, text
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.user import Base
+
+
+class QuestLead(Base):
+    """
+    Заявка с квеста.
+
+    Статусы доставки в Telegram: "pending" → "sending" → "sent" / "failed".
+    """
+    __tablename__ = "quest_leads"
+    __table_args__ = (
+        # Выборка отправителя: недоставленные заявки
+        Index(
+            "ix_quest_leads_pending",
+            "next_attempt_at",
+            postgresql_where=text("status IN ('pending', 'sending')"),
+        ),
+    )
+
+    # Контакты
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    name: Mapped[str] = mapped_column(String(100), default="", nullable=False)
+    telegram: Mapped[str] = mapped_column(String(100), default="", nullable=False)
+    phone: Mapped[str] = mapped_column(String(50), default="", nullable=False)
+
+    # Ответы квеста
+    # Цель использования AI
+    purpose: Mapped[str] = mapped_column(String(100), default="", nullable=False)
+    # Доступ к нейросетям
+    access: Mapped[str] = mapped_column(String(100), default="", nullable=False)
+    # Проект мечты (текстовый ответ)
+    project: Mapped[str] = mapped_column(Text, default="", nullable=False)
+    # Рекомендованные курсы
+    courses: Mapped[list] = mapped_column(JSON, default=list, nullable=False)
+    # Все ответы квеста
+    answers: Mapped[list] = mapped_column(JSON, default=list, nullable=False)
+
+    # Доставка в Telegram
+    status: Mapped[str] = mapped_column(String(20), default="pending", nullable=False)
+    attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    next_attempt_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+    # Аренда отправителя
+    locked_until: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    # Timestamps
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow, nullable=False)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self) -> str:
+        return f"<QuestLead #{self.id} {self.telegram or self.phone} {self.status}>"
@@ -0,0 +1,39 @@
+"""
+Модель счётчиков rate limiting для общего (межпроцессного) бэкенда.
+Таблица UNLOGGED: не пишется в WAL, поэтому обновления дешёвые,
+а потеря счётчиков при сбое PostgreSQL допустима.
+"""
+from sqlalchemy import Boolean, Float, String
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.user import Base
+
+
+class RateLimitCounter(Base):
+    """
+    Состояние лимитера для одного ключа.
+
+    Поля используются в зависимости от алгоритма:
+    - скользящее окно: window_start, count, prev_count
+    - token bucket: tokens, updated_at
+    """
+    __tablename__ = "rate_limit_counters"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # "login:1.2.3.4"
+
+    # Скользящее окно (счётчики текущего и предыдущего окна)
+    window_start: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    count: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    prev_count: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+
+    # Token bucket
+    tokens: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    updated_at: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+
+    # Результат последнего обращения и время, после которого запись можно удалить
+    allowed: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
+    expires_at: Mapped[float] = mapped_column(Float, nullable=False, index=True)
+
+    def __repr__(self) -> str:
+        return f"<RateLimitCounter {self.key}>"
@@ -76,6 +76,27 @@ class User(Base):
             return False
         return bcrypt.checkpw(password.encode('utf-8'), self.password_hash.encode('utf-8'))
 
+    async def set_password_async(self, password: str) -> None:
+        """
+        Асинхронный вариант set_password для обработчиков запросов.
+        bcrypt выполняется в пуле потоков и не блокирует event loop.
+
+        Raises:
+            PasswordHasherBusy: если очередь хеширования переполнена
+        """
+        from app.services.passwords import get_password_hasher
+        self.password_hash = await get_password_hasher().hash_password(password)
+
+    async def check_password_async(self, password: str) -> bool:
+        """
+        Асинхронный вариант check_password для обработчиков запросов.
+
+        Raises:
+            PasswordHasherBusy: если очередь хеширования переполнена
+        """
+        from app.services.passwords import get_password_hasher
+        return await get_password_hasher().verify_password(password, self.password_hash)
+
     def __repr__(self) -> str:
         return f"<User {self.username} (#{self.id})>"
 
@@ -0,0 +1,72 @@
+"""
+Модель сводного прогресса пользователя по курсу.
+Материализованная сводка поверх user_lesson_progress: обновляется
+инкрементально при завершении урока, чтобы списки курсов и профиль
+не пересчитывали прогресс по всем урокам пользователя.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import DateTime, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy.orm import Mapped, mapped_column
+
+from app.models.user import Base
+
+
+class UserCourseProgress(Base):
+    """
+    Сводка прогресса пользователя по одному курсу.
+
+    Хранит:
+    - Количество завершённых уроков и общее число уроков курса
+    - Процент прохождения (0-100)
+    - Последний открытый урок и время последнего доступа
+    - Версию структуры курса, по которой посчитана сводка
+    """
+    __tablename__ = "user_course_progress"
+    __table_args__ = (
+        UniqueConstraint("user_id", "course_slug", name="uq_user_course_progress_user_course"),
+    )
+
+    # Основные поля
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    user_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey("users.id"), nullable=False, index=True
+    )
+    course_slug: Mapped[str] = mapped_column(String(100), nullable=False)
+
+    # Прогресс
+    completed_lessons: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    total_lessons: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    progress_percent: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+    # Последняя активность
+    last_lesson_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey("lessons.id", ondelete="SET NULL"), nullable=True
+    )
+    last_accessed_at: Mapped[datetime] = mapped_column(
+        DateTime, default=datetime.utcnow, nullable=False
+    )
+
+    # Версия структуры курса (CourseOutline.version); при смене сводка пересчитывается
+    outline_version: Mapped[Optional[str]] = mapped_column(String(16), nullable=True)
+
+    def __repr__(self) -> str:
+        return (
+            f"<UserCourseProgress user={self.user_id} course={self.course_slug} "
+            f"{self.completed_lessons}/{self.total_lessons}>"
+        )
+
+    def to_dict(self) -> dict:
+        """Возвращает словарь с данными прогресса"""
+        return {
+            "user_id": self.user_id,
+            "course_slug": self.course_slug,
+            "completed_lessons": self.completed_lessons,
+            "total_lessons": self.total_lessons,
+            "progress_percent": self.progress_percent,
+            "last_lesson_id": self.last_lesson_id,
+            "last_accessed_at": (
+                self.last_accessed_at.isoformat() if self.last_accessed_at else None
+            ),
+        }
@@ -0,0 +1,196 @@
+"""
+Служебные роуты для администраторов (метрики, управление генерацией).
+
+Доступ:
+- заголовок X-Admin-Token, совпадающий с ADMIN_API_TOKEN (для скриптов и мониторинга)
+- или авторизованный пользователь, чей username указан в ADMIN_USERNAMES (через запятую)
+"""
+import asyncio
+import hmac
+import json
+import os
+from datetime import datetime, timedelta
+from functools import wraps
+
+from quart import Blueprint, Response, abort, jsonify, request, session
+
+from app.data.courses import COURSES_EXTENDED
+from app.database import pool_monitor
+from app.services.course_generator import get_course_generator
+from app.services.course_outline import get_course_outline_cache
+from app.services.email import get_email_delivery
+from app.services.email_outbox import get_email_dispatcher
+from app.services.generation_events import listen_events
+from app.services.generation_jobs import FINAL_STATUSES, cancel_job, enqueue_job, get_job, list_jobs
+from app.services.generation_usage import GROUP_FIELDS, get_usage_recorder, usage_summary
+from app.services.http import http_clients_stats
+from app.services.openrouter import get_openrouter_service
+from app.services.passwords import get_password_hasher
+from app.services.quest_leads import get_quest_lead_sender
+from app.services.user_cache import get_user_cache
+
+bp = Blueprint("admin", __name__, url_prefix="/admin")
+
+
+async def is_admin() -> bool:
+    """Проверяет права администратора для текущего запроса"""
+    token = os.getenv("ADMIN_API_TOKEN")
+    provided = request.headers.get("X-Admin-Token")
+    if token and provided and hmac.compare_digest(token, provided):
+        return True
+
+    user_id = session.get("user_id")
+    if not user_id:
+        return False
+    names = os.getenv("ADMIN_USERNAMES", "").split(",")
+    admins = {name.strip().lower() for name in names if name.strip()}
+    identity = await get_user_cache().get(int(user_id))
+    return bool(identity and identity.is_active and identity.username.lower() in admins)
+
+
+def admin_required(view):
+    """Декоратор: 404 для всех, кроме администраторов (не раскрываем наличие роута)"""
+    @wraps(view)
+    async def wrapper(*args, **kwargs):
+        if not await is_admin():
+            abort(404)
+        return await view(*args, **kwargs)
+    return wrapper
+
+
+@bp.route("/metrics")
+@admin_required
+async def metrics():
+    """
+    Метрики процесса: кеши, пулы, очереди.
+    """
+    return jsonify({
+        "db_pool": pool_monitor.stats(),
+        "password_hasher": get_password_hasher().stats(),
+        "email": get_email_delivery().stats(),
+        "email_outbox": get_email_dispatcher().stats(),
+        "quest_leads": get_quest_lead_sender().stats(),
+        "user_cache": get_user_cache().stats(),
+        "course_outline_cache": get_course_outline_cache().stats(),
+        "http_clients": http_clients_stats(),
+        "llm_cache": get_openrouter_service().cache.stats(),
+        "llm_scheduler": get_openrouter_service().scheduler.stats(),
+        "usage_recorder": get_usage_recorder().stats(),
+        "model_router": get_course_generator().router.stats(),
+    })
+
+
+@bp.route("/generation/jobs", methods=["POST"])
+@admin_required
+async def enqueue_generation():
+    """
+    Ставит генерацию курсов в очередь (выполняет воркер generation_queue.py).
+
+    JSON: {"course_slug": "...", "force": false, "lesson_id": null}
+    или {"all": true} — все курсы каталога.
+    """
+    data = await request.get_json(silent=True) or {}
+    if data.get("all"):
+        slugs = list(COURSES_EXTENDED)
+    else:
+        slugs = [data.get("course_slug")]
+    if not all(slug in COURSES_EXTENDED for slug in slugs):
+        return jsonify({"error": "Unknown course_slug"}), 400
+
+    lesson_id = data.get("lesson_id")
+    if lesson_id is not None and (len(slugs) != 1 or not isinstance(lesson_id, int)):
+        return jsonify({"error": "lesson_id requires a single course_slug"}), 400
+
+    jobs = []
+    for slug in slugs:
+        job, created = await enqueue_job(slug, force=bool(data.get("force")), lesson_id=lesson_id)
+        jobs.append({**job.to_dict(), "created": created})
+    return jsonify({"jobs": jobs}), 202
+
+
+@bp.route("/generation/jobs")
+@admin_required
+async def generation_jobs():
+    """Последние задачи генерации (?status=running&limit=50)"""
+    limit = min(request.args.get("limit", 50, type=int), 500)
+    jobs = await list_jobs(status=request.args.get("status"), limit=limit)
+    return jsonify({"jobs": [job.to_dict() for job in jobs]})
+
+
+@bp.route("/generation/jobs/<int:job_id>")
+@admin_required
+async def generation_job(job_id: int):
+    """Состояние и прогресс одной задачи генерации"""
+    job = await get_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+@bp.route("/generation/jobs/<int:job_id>/cancel", methods=["POST"])
+@admin_required
+async def cancel_generation_job(job_id: int):
+    """Отменяет задачу генерации (выполняемая прерывается на ближайшем heartbeat воркера)"""
+    job = await cancel_job(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(job.to_dict())
+
+
+def _sse(event: str, data: dict) -> str:
+    """Одно событие в формате server-sent events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@bp.route("/generation/jobs/<int:job_id>/events")
+@admin_required
+async def generation_job_events(job_id: int):
+    """
+    Живой прогресс задачи генерации (text/event-stream).
+
+    События: job (снимок задачи при подключении), progress (готово/всего
+    и статусы уроков: символов текста, время до первого токена), status
+    (смена статуса задачи). Поток закрывается, когда задача завершена.
+    """
+    if await get_job(job_id) is None:
+        abort(404)
+
+    async def stream():
+        # Сначала подписка, затем снимок — события между ними не теряются
+        async with listen_events(job_id) as events:
+            job = await get_job(job_id)
+            yield _sse("job", job.to_dict())
+            if job.status in FINAL_STATUSES:
+                return
+            while True:
+                try:
+                    event = await asyncio.wait_for(events.get(), timeout=15)
+                except TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(event["type"], event)
+                if event["type"] == "status" and event["status"] in FINAL_STATUSES:
+                    return
+
+    response = Response(stream(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # nginx не буферизует поток
+    response.timeout = None
+    return response
+
+
+@bp.route("/generation/usage")
+@admin_required
+async def generation_usage():
+    """
+    Расход LLM на генерацию: токены, стоимость, перцентили задержки.
+
+    ?by=course_slug,model&hours=24&course=ai-for-beginners
+    """
+    group_by = [name for name in request.args.get("by", "course_slug,model").split(",") if name]
+    if not group_by or not set(group_by) <= set(GROUP_FIELDS):
+        return jsonify({"error": f"by: {', '.join(GROUP_FIELDS)}"}), 400
+    hours = request.args.get("hours", type=float)
+    since = datetime.utcnow() - timedelta(hours=hours) if hours else None
+    rows = await usage_summary(group_by, since=since, course_slug=request.args.get("course"))
+    return jsonify({"usage": rows})
@@ -13,10 +13,21 @@ import hmac
 import os
 
 from app.database import get_session
-from app.models import User, EmailVerification
+from app.models import User, EmailOutbox, EmailVerification
 from app.schemas.auth import LoginForm, RegisterForm
-from app.services.email import send_verification_email, generate_verification_code
-from app.utils.rate_limit import check_rate_limit, record_failed_login, reset_login_attempts
+from app.services.email import generate_verification_code
+from app.services.email_outbox import (
+    cancel_pending_emails, enqueue_email, get_email_dispatcher, get_email_status,
+)
+from app.services.passwords import PasswordHasherBusy
+from app.services.user_cache import UserIdentity, get_user_cache
+from app.utils.rate_limit import (
+    check_rate_limit,
+    get_client_ip,
+    rate_limit,
+    record_failed_login,
+    reset_login_attempts,
+)
 from pydantic import ValidationError
 from loguru import logger
 
@@ -83,6 +94,8 @@ def verify_telegram_auth(auth_data: dict) -> bool:
 # РЕГИСТРАЦИЯ (Шаг 1: Отправка кода)
 # ============================================
 @bp.route("/register", methods=["GET", "POST"])
+@rate_limit(3, per=600, key=("ip", "email"))
+@rate_limit(10, per=600, key="ip")
 async def register():
     """
     Форма регистрации нового пользователя.
@@ -139,22 +152,13 @@ async def register():
                 delete(EmailVerification).where(EmailVerification.email == form.email)
             )
 
-            # Сохраняем новый код в БД
+            # Сохраняем новый код в БД и письмо с ним в outbox — одной транзакцией
             verification = EmailVerification(email=form.email, code=code)
             db.add(verification)
+            outbox = await _queue_verification_email(db, verification, form.username)
             await db.commit()
-
-            # Отправляем email с кодом
-            email_sent = await send_verification_email(form.email, code, form.username)
-
-            if not email_sent:
-                errors.append("Не удалось отправить код на почту. Возникли технические неполадки. Попробуйте позже.")
-                return await render_template(
-                    "auth/register.html",
-                    errors=errors,
-                    form_data=form_data,
-                    page_title="Регистрация"
-                )
+            # Письмо отправит диспетчер в фоне, ответ не ждёт SMTP
+            get_email_dispatcher().wake()
 
             # Сохраняем данные в сессию для следующего шага
             session["reg_data"] = {
@@ -162,8 +166,9 @@ async def register():
                 "email": form.email,
                 "password": form.password
             }
+            session["reg_email_id"] = outbox.id
 
-            logger.info(f"Verification code sent to {form.email}")
+            logger.info(f"Verification email #{outbox.id} queued for {form.email}")
 
             # Переходим к форме ввода кода
             return await render_template(
@@ -196,6 +201,7 @@ async def register():
 # РЕГИСТРАЦИЯ (Шаг 2: Проверка кода)
 # ============================================
 @bp.route("/register/verify", methods=["POST"])
+@rate_limit(10, per=600, key=("ip", "email"))
 async def register_verify():
     """
     Проверка кода верификации и создание пользователя.
@@ -245,7 +251,7 @@ async def register_verify():
                 email=reg_data["email"],
                 avatar_url=f"https://api.dicebear.com/7.x/avataaars/svg?seed={reg_data['username']}"
             )
-            new_user.set_password(reg_data["password"])
+            await new_user.set_password_async(reg_data["password"])
 
             # Помечаем код как использованный
             verification.is_verified = True
@@ -262,14 +268,21 @@ async def register_verify():
 
             # Дополнительно сохраняем данные в сессию
             session["user_id"] = new_user.id
-            session["username"] = new_user.username
-            session["avatar_url"] = new_user.avatar_url
+            get_user_cache().put(UserIdentity.from_user(new_user))
             session["login_time"] = datetime.utcnow().isoformat()  # Время входа для проверки срока
 
             logger.info(f"User {new_user.username} successfully registered and logged in")
 
             return redirect(url_for("public.index"))
 
+    except PasswordHasherBusy:
+        errors = ["Сервер перегружен. Попробуйте ещё раз через несколько секунд."]
+        return await render_template(
+            "auth/register_verify.html",
+            errors=errors,
+            email=email,
+            page_title="Подтверждение email"
+        ), 503
     except Exception as e:
         logger.error(f"Verification error: {str(e)}")
         errors = [f"Ошибка верификации: {str(e)}"]
@@ -285,6 +298,8 @@ async def register_verify():
 # ПОВТОРНАЯ ОТПРАВКА КОДА
 # ============================================
 @bp.route("/register/resend", methods=["POST"])
+@rate_limit(3, per=600, key=("ip", "email"))
+@rate_limit(10, per=600, key="ip")
 async def register_resend():
     """
     Повторная отправка кода верификации.
@@ -306,29 +321,69 @@ async def register_resend():
                 delete(EmailVerification).where(EmailVerification.email == email)
             )
 
-            # Сохраняем новый код
+            # Сохраняем новый код и письмо с ним в outbox
             verification = EmailVerification(email=email, code=code)
             db.add(verification)
+            outbox = await _queue_verification_email(db, verification, username)
             await db.commit()
+            get_email_dispatcher().wake()
+            session["reg_email_id"] = outbox.id
 
-            # Отправляем email
-            email_sent = await send_verification_email(email, code, username)
-
-            if not email_sent:
-                return jsonify({"success": False, "error": "Не удалось отправить email"}), 500
-
-            logger.info(f"Verification code resent to {email}")
-            return jsonify({"success": True})
+            logger.info(f"Verification email #{outbox.id} re-queued for {email}")
+            return jsonify({"success": True, "email_id": outbox.id})
 
     except Exception as e:
         logger.error(f"Resend error: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
 
+# ============================================
+# СТАТУС ОТПРАВКИ КОДА
+# ============================================
+@bp.route("/register/email-status", methods=["GET"])
+async def register_email_status():
+    """
+    Статус письма с кодом текущей регистрации (опрашивает страница ввода кода).
+
+    Returns:
+        JSON: {"status": "pending" | "sending" | "sent" | "failed" | "cancelled", "attempts": n}
+    """
+    email_id = session.get("reg_email_id")
+    if not session.get("reg_data") or email_id is None:
+        return jsonify({"error": "Данные регистрации не найдены"}), 404
+
+    message = await get_email_status(email_id)
+    if message is None:
+        return jsonify({"error": "Письмо не найдено"}), 404
+    return jsonify({"status": message.status, "attempts": message.attempts})
+
+
+async def _queue_verification_email(
+    db, verification: EmailVerification, username: str
+) -> EmailOutbox:
+    """
+    Ставит письмо с кодом в outbox в транзакции кода верификации.
+
+    Письма со старыми кодами этому адресу, ещё не отправленные, отменяются;
+    письмо не уходит позже, чем истекает код.
+    """
+    await cancel_pending_emails(db, verification.email, "verification")
+    outbox = enqueue_email(
+        db,
+        "verification",
+        verification.email,
+        {"code": verification.code, "username": username},
+        expires_at=verification.expires_at,
+    )
+    await db.flush()
+    return outbox
+
+
 # ============================================
 # ВХОД
 # ============================================
 @bp.route("/login", methods=["GET", "POST"])
+@rate_limit(20, per=60, key="ip", algorithm="bucket")
 async def login():
     """
     Форма входа в систему с защитой от подбора паролей.
@@ -350,9 +405,7 @@ async def login():
     errors = []
     
     # Получаем IP адрес для rate limiting
-    ip_address = request.headers.get('X-Forwarded-For', request.remote_addr)
-    if ip_address and ',' in ip_address:
-        ip_address = ip_address.split(',')[0].strip()
+    ip_address = get_client_ip()
     
     try:
         # Валидация данных
@@ -361,18 +414,18 @@ async def login():
             password=form_data.get("password", ""),
         )
         
+        # Rate limiting - проверяем по IP адресу (до обращения к БД)
+        is_allowed, error_msg = await check_rate_limit(ip_address)
+        if not is_allowed:
+            errors.append(error_msg)
+            return await render_template(
+                "auth/login.html",
+                errors=errors,
+                form_data=form_data,
+                page_title="Вход"
+            )
+
         async for db in get_session():
-            # Rate limiting - проверяем по IP адресу
-            is_allowed, error_msg = await check_rate_limit(db, ip_address)
-            if not is_allowed:
-                errors.append(error_msg)
-                return await render_template(
-                    "auth/login.html",
-                    errors=errors,
-                    form_data=form_data,
-                    page_title="Вход"
-                )
-            
             # Поиск пользователя (по username или email)
             result = await db.execute(
                 select(User).where(
@@ -384,23 +437,22 @@ async def login():
             # Проверка существования и пароля
             if not user:
                 errors.append("Неверный логин или пароль")
-                await record_failed_login(db, ip_address)
-            elif not user.check_password(form.password):
+                await record_failed_login(ip_address)
+            elif not await user.check_password_async(form.password):
                 errors.append("Неверный логин или пароль")
-                await record_failed_login(db, ip_address)
+                await record_failed_login(ip_address)
             elif not user.is_active:
                 errors.append("Аккаунт деактивирован")
             else:
                 # Успешная авторизация - сбрасываем счетчик попыток
-                await reset_login_attempts(db, ip_address)
+                await reset_login_attempts(ip_address)
                 
                 # Авторизация через Quart-Auth
                 login_user(AuthUser(user.id))
 
-                # Дополнительно сохраняем данные в сессию для использования в шаблонах
+                # Сохраняем ID в сессию; username и аватар шаблоны берут из кеша идентичности
                 session["user_id"] = user.id
-                session["username"] = user.username
-                session["avatar_url"] = user.avatar_url
+                get_user_cache().put(UserIdentity.from_user(user))
                 session["login_time"] = datetime.utcnow().isoformat()  # Время входа для проверки срока
 
                 logger.info(f"User {user.username} logged in successfully from {ip_address}")
@@ -422,6 +474,14 @@ async def login():
             form_data=form_data,
             page_title="Вход"
         )
+    except PasswordHasherBusy:
+        errors = ["Сервер перегружен. Попробуйте войти через несколько секунд."]
+        return await render_template(
+            "auth/login.html",
+            errors=errors,
+            form_data=form_data,
+            page_title="Вход"
+        ), 503
     except Exception as e:
         logger.error(f"Login error: {str(e)}")
         errors = [f"Ошибка входа: {str(e)}"]
@@ -470,31 +530,37 @@ async def profile():
                 session.clear()
                 return redirect(url_for("auth.login"))
 
-            # Получаем купленные курсы
-            from app.models import UserCourse
-            courses_result = await db.execute(
-                select(UserCourse)
-                .where(UserCourse.user_id == user_id)
-                .order_by(UserCourse.purchased_at.desc())
-            )
-            purchased_courses = list(courses_result.scalars().all())
+            # Получаем купленные курсы вместе со сводкой прогресса
+            from app.services.course_progress import get_purchased_courses_with_progress
+            purchased_courses = await get_purchased_courses_with_progress(db, user_id)
 
             # Получаем информацию о курсах
             from app.services.courses import get_course_by_slug
             courses_info = []
-            for uc in purchased_courses:
+            for uc, progress in purchased_courses:
                 course = get_course_by_slug(uc.course_slug)
                 if course:
                     courses_info.append({
                         "course": course,
                         "purchased_at": uc.purchased_at,
-                        "status": uc.status
+                        "status": uc.status,
+                        "progress": progress
                     })
 
+            # Статистика по сводкам прогресса
+            summaries = [item["progress"] for item in courses_info if item["progress"]]
+            completed_lessons = sum(progress.completed_lessons for progress in summaries)
+            average_progress = (
+                round(sum(progress.progress_percent for progress in summaries) / len(courses_info))
+                if courses_info else 0
+            )
+
             return await render_template(
                 "profile.html",
                 user=user,
                 purchased_courses=courses_info,
+                completed_lessons=completed_lessons,
+                average_progress=average_progress,
                 page_title=f"Профиль: {user.username}"
             )
 
@@ -617,8 +683,7 @@ async def telegram_callback():
 
             # Дополнительно сохраняем данные в сессию
             session["user_id"] = user.id
-            session["username"] = user.username
-            session["avatar_url"] = user.avatar_url
+            get_user_cache().put(UserIdentity.from_user(user))
             session["login_time"] = datetime.utcnow().isoformat()  # Время входа для проверки срока
 
             return redirect(url_for("public.index"))
@@ -1,15 +1,27 @@
 """
 Роуты для работы с курсами (детальные страницы, покупка, личный кабинет)
 """
-from quart import Blueprint, render_template, abort, session, redirect, url_for, request, jsonify
+from quart import (
+    Blueprint, render_template, abort, session, redirect, url_for, request, jsonify, make_response,
+)
 from quart_auth import login_required, current_user
+import hashlib
 from datetime import datetime
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
+from sqlalchemy import or_, select, update
+from sqlalchemy.orm.attributes import set_committed_value
 
 from app.services.courses import get_course_by_slug
 from app.data.courses import get_course_full_data
-from app.models import UserCourse, CourseModule, Lesson, UserLessonProgress
+from app.models import UserCourse, Lesson, UserLessonProgress
+from app.services.course_outline import get_course_outline_cache
+from app.services.lesson_renderer import render_lesson
+from app.services.user_cache import get_user_cache
+from app.services.course_progress import (
+    get_purchased_courses_with_progress,
+    mark_lesson_completed,
+    progress_percent as calc_progress_percent,
+    touch_course_progress,
+)
 from app.database import engine, AsyncSessionLocal
 from sqlalchemy import text
 
@@ -124,29 +136,23 @@ async def my_courses():
     """
     user_id = session.get('user_id')
     
-    # Получаем все купленные курсы пользователя
-    async with engine.connect() as conn:
-        result = await conn.execute(
-            text("""SELECT course_slug, purchased_at, price_paid, status
-               FROM user_courses
-               WHERE user_id = :user_id
-               ORDER BY purchased_at DESC"""),
-            {"user_id": user_id}
-        )
-        purchases = result.fetchall()
+    # Получаем все купленные курсы пользователя вместе со сводкой прогресса
+    async with AsyncSessionLocal() as db_session:
+        purchases = await get_purchased_courses_with_progress(db_session, user_id)
     
     # Формируем список курсов с полными данными
     my_courses_list = []
-    for purchase in purchases:
-        course = get_course_by_slug(purchase[0])
+    for purchase, progress in purchases:
+        course = get_course_by_slug(purchase.course_slug)
         if course:
-            course_data = get_course_full_data(purchase[0])
+            course_data = get_course_full_data(purchase.course_slug)
             my_courses_list.append({
                 'course': course,
-                'purchased_at': purchase[1],
-                'price_paid': purchase[2],
-                'status': purchase[3],
-                'duration_weeks': course_data.get('duration_weeks', 4)
+                'purchased_at': purchase.purchased_at,
+                'price_paid': purchase.price_paid,
+                'status': purchase.status,
+                'duration_weeks': course_data.get('duration_weeks', 4),
+                'progress': progress
             })
     
     return await render_template(
@@ -177,30 +183,20 @@ async def my_course(slug: str):
         if not purchase:
             abort(403)  # Нет доступа
 
-        # Получаем модули и уроки курса
-        modules_result = await db_session.execute(
-            select(CourseModule)
-            .where(CourseModule.course_slug == slug)
-            .order_by(CourseModule.order)
-            .options(selectinload(CourseModule.lessons))
-        )
-        modules = list(modules_result.scalars().all())
+        # Структура курса из кеша (без запроса модулей и уроков)
+        outline = await get_course_outline_cache().get(slug)
 
-        # Получаем прогресс пользователя по всем урокам
-        progress_result = await db_session.execute(
-            select(UserLessonProgress)
-            .where(UserLessonProgress.user_id == user_id)
-        )
-        progress_map = {p.lesson_id: p for p in progress_result.scalars().all()}
+        # Если есть уроки, перенаправляем на первый урок первого модуля
+        first_lesson = outline.first_lesson
+        if first_lesson:
+            return redirect(url_for('courses.view_lesson', slug=slug, lesson_id=first_lesson.id))
 
-        # Считаем общий прогресс
-        total_lessons = sum(len(m.lessons) for m in modules)
-        completed_lessons = sum(
-            1 for m in modules
-            for lesson in m.lessons
-            if progress_map.get(lesson.id) and progress_map[lesson.id].status == "completed"
-        )
-        progress_percent = int((completed_lessons / total_lessons * 100)) if total_lessons > 0 else 0
+        # В курсе ещё нет уроков — прогресса тоже нет
+        modules = outline.modules
+        progress_map = {}
+        total_lessons = 0
+        completed_lessons = 0
+        progress_percent = 0
 
     course = get_course_by_slug(slug)
     if not course:
@@ -208,11 +204,6 @@ async def my_course(slug: str):
 
     course_data = get_course_full_data(slug)
 
-    # Если есть модули, перенаправляем на первый урок первого модуля
-    if modules and modules[0].lessons:
-        first_lesson = modules[0].lessons[0]
-        return redirect(url_for('courses.view_lesson', slug=slug, lesson_id=first_lesson.id))
-
     return await render_template(
         "courses/learn.html",
         course=course,
@@ -245,41 +236,39 @@ async def view_lesson(slug: str, lesson_id: int):
         if not purchase_result.scalar_one_or_none():
             abort(403)
 
+        # Структура курса для навигации — из кеша
+        outline = await get_course_outline_cache().get_with_lesson(slug, lesson_id)
+        if not outline.contains(lesson_id):
+            abort(404)
+        modules = outline.modules
+
         # Получаем урок
         lesson_result = await db_session.execute(
-            select(Lesson)
-            .where(Lesson.id == lesson_id)
-            .options(selectinload(Lesson.module))
+            select(Lesson).where(Lesson.id == lesson_id)
         )
         lesson = lesson_result.scalar_one_or_none()
 
-        if not lesson or lesson.module.course_slug != slug:
+        if not lesson:
             abort(404)
 
-        # Получаем все модули и уроки для навигации
-        modules_result = await db_session.execute(
-            select(CourseModule)
-            .where(CourseModule.course_slug == slug)
-            .order_by(CourseModule.order)
-            .options(selectinload(CourseModule.lessons))
-        )
-        modules = list(modules_result.scalars().all())
+        # HTML урока рендерится при генерации; уроки, созданные до пре-рендеринга,
+        # рендерятся один раз здесь и сохраняются
+        await _render_missing_html(db_session, lesson)
 
-        # Получаем прогресс пользователя
+        # Получаем прогресс пользователя только по урокам этого курса
         progress_result = await db_session.execute(
             select(UserLessonProgress)
-            .where(UserLessonProgress.user_id == user_id)
+            .where(
+                UserLessonProgress.user_id == user_id,
+                UserLessonProgress.lesson_id.in_(outline.lesson_ids)
+            )
         )
         progress_map = {p.lesson_id: p for p in progress_result.scalars().all()}
 
         # Считаем общий прогресс
-        total_lessons = sum(len(m.lessons) for m in modules)
-        completed_lessons = sum(
-            1 for m in modules
-            for l in m.lessons
-            if progress_map.get(l.id) and progress_map[l.id].status == "completed"
-        )
-        progress_percent = int((completed_lessons / total_lessons * 100)) if total_lessons > 0 else 0
+        total_lessons = outline.total_lessons
+        completed_lessons = sum(1 for p in progress_map.values() if p.status == "completed")
+        progress_percent = calc_progress_percent(completed_lessons, total_lessons)
 
         # Получаем или создаём прогресс для текущего урока
         lesson_progress = progress_map.get(lesson_id)
@@ -294,30 +283,30 @@ async def view_lesson(slug: str, lesson_id: int):
                 quiz_passed=False
             )
             db_session.add(lesson_progress)
-            await db_session.commit()
-            await db_session.refresh(lesson_progress)
         elif lesson_progress.status == "not_started":
             lesson_progress.status = "in_progress"
             lesson_progress.started_at = datetime.utcnow()
-            await db_session.commit()
 
-        # Находим следующий урок
-        next_lesson = None
-        found_current = False
-        for module in modules:
-            for l in sorted(module.lessons, key=lambda x: x.order):
-                if found_current:
-                    next_lesson = l
-                    break
-                if l.id == lesson_id:
-                    found_current = True
-            if next_lesson:
-                break
+        # Последний урок в сводке курса (и пересчёт сводки, если её ещё нет)
+        await touch_course_progress(db_session, user_id, lesson_id, outline, completed_lessons)
+        await db_session.commit()
+
+        # Следующий урок — из предрассчитанной карты переходов
+        next_lesson = outline.next_lesson(lesson_id)
+
+    # Страница не изменилась — отдаём 304 без рендеринга шаблона
+    identity = await get_user_cache().get(user_id)
+    etag = _lesson_etag(lesson, outline, progress_map, lesson_progress, identity)
+    if request.if_none_match.contains_weak(etag):
+        response = await make_response("", 304)
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
 
     course = get_course_by_slug(slug)
     course_data = get_course_full_data(slug)
 
-    return await render_template(
+    response = await make_response(await render_template(
         "courses/learn.html",
         course=course,
         course_data=course_data,
@@ -330,7 +319,56 @@ async def view_lesson(slug: str, lesson_id: int):
         total_lessons=total_lessons,
         completed_lessons=completed_lessons,
         page_title=f"{lesson.title} | {course.title}"
+    ))
+    response.set_etag(etag, weak=True)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+async def _render_missing_html(db_session, lesson) -> bool:
+    """
+    Рендерит урок без HTML для этого ответа и сохраняет результат.
+
+    Урок без текста (ещё генерируется) не трогается. HTML пишется условным
+    UPDATE — только если у строки всё ещё нет HTML и текст тот же, что был
+    прочитан: пакетная запись генератора, пришедшая параллельно, не
+    перезаписывается. Объект урока не помечается изменённым.
+    """
+    rendered = lesson.content_html is not None and lesson.content_hash is not None
+    if not lesson.content_text or rendered:
+        return False
+    content_html, digest = render_lesson(lesson.content_text)
+    await db_session.execute(
+        update(Lesson)
+        .where(
+            Lesson.id == lesson.id,
+            Lesson.content_text == lesson.content_text,
+            or_(Lesson.content_html.is_(None), Lesson.content_hash.is_(None)),
+        )
+        # Рендер — не правка урока: updated_at (часть ETag) не меняется
+        .values(content_html=content_html, content_hash=digest, updated_at=Lesson.updated_at)
     )
+    set_committed_value(lesson, "content_html", content_html)
+    set_committed_value(lesson, "content_hash", digest)
+    return True
+
+
+def _lesson_etag(lesson, outline, progress_map, lesson_progress, identity) -> str:
+    """
+    ETag страницы урока: хеш контента урока + всё, что меняет страницу
+    (структура курса, статусы уроков, шапка пользователя).
+    """
+    statuses = sorted((lesson_id, p.status) for lesson_id, p in progress_map.items())
+    state = repr((
+        lesson.content_hash,
+        lesson.updated_at.isoformat() if lesson.updated_at else None,
+        outline.version,
+        statuses,
+        lesson_progress.status if lesson_progress else None,
+        (identity.username, identity.avatar_url) if identity else None,
+    ))
+    digest = hashlib.sha1(state.encode("utf-8")).hexdigest()[:16]
+    return f"{(lesson.content_hash or 'pending')[:16]}-{digest}"
 
 
 @bp.route("/my/<slug>/lesson/<int:lesson_id>/complete", methods=['POST'])
@@ -352,18 +390,12 @@ async def complete_lesson(slug: str, lesson_id: int):
         if not purchase_result.scalar_one_or_none():
             abort(403)
 
-        # Получаем прогресс
-        progress_result = await db_session.execute(
-            select(UserLessonProgress).where(
-                UserLessonProgress.user_id == user_id,
-                UserLessonProgress.lesson_id == lesson_id
-            )
-        )
-        lesson_progress = progress_result.scalar_one_or_none()
+        outline = await get_course_outline_cache().get_with_lesson(slug, lesson_id)
+        if not outline.contains(lesson_id):
+            abort(404)
 
-        if lesson_progress:
-            lesson_progress.status = "completed"
-            lesson_progress.completed_at = datetime.utcnow()
+        # Урок и сводка курса обновляются в одной транзакции
+        if await mark_lesson_completed(db_session, user_id, lesson_id, outline):
             await db_session.commit()
 
     return jsonify({"success": True, "status": "completed"})
@@ -390,6 +422,10 @@ async def submit_quiz(slug: str, lesson_id: int):
         if not purchase_result.scalar_one_or_none():
             abort(403)
 
+        outline = await get_course_outline_cache().get_with_lesson(slug, lesson_id)
+        if not outline.contains(lesson_id):
+            abort(404)
+
         # Получаем урок с квизом
         lesson_result = await db_session.execute(
             select(Lesson).where(Lesson.id == lesson_id)
@@ -399,21 +435,25 @@ async def submit_quiz(slug: str, lesson_id: int):
         if not lesson or not lesson.quiz_questions:
             abort(404)
 
-        # Проверяем ответы
+        # Проверяем ответы (у проверенных квизов есть готовый answer_key)
         questions = lesson.quiz_questions.get('questions', [])
+        answer_key = (
+            lesson.quiz_questions.get('answer_key')
+            or [q.get('correct', -1) for q in questions]
+        )
         correct_count = 0
         results = []
 
         for idx, answer_idx in enumerate(answers):
             if idx < len(questions):
                 question = questions[idx]
-                is_correct = answer_idx == question.get('correct', -1)
+                is_correct = answer_idx == answer_key[idx]
                 if is_correct:
                     correct_count += 1
                 results.append({
                     'question_idx': idx,
                     'correct': is_correct,
-                    'correct_answer': question.get('correct'),
+                    'correct_answer': answer_key[idx],
                     'explanation': question.get('explanation', '')
                 })
 
@@ -434,9 +474,8 @@ async def submit_quiz(slug: str, lesson_id: int):
             lesson_progress.quiz_score = score
             lesson_progress.quiz_attempts += 1
             lesson_progress.quiz_passed = passed
-            if passed and lesson_progress.status != "completed":
-                lesson_progress.status = "completed"
-                lesson_progress.completed_at = datetime.utcnow()
+            if passed:
+                await mark_lesson_completed(db_session, user_id, lesson_id, outline)
             await db_session.commit()
 
     return jsonify({
@@ -6,11 +6,13 @@ from quart_auth import login_required, current_user
 from loguru import logger
 
 from app.data.courses import COURSES
+from app.utils.rate_limit import rate_limit
 
 payments_bp = Blueprint("payments", __name__)
 
 
 @payments_bp.route("/payments/create", methods=["POST"])
+@rate_limit(10, per=60, key="user_id")
 @login_required
 async def create_payment():
     """
@@ -42,5 +44,9 @@ async def payment_cancel():
 async def payment_webhook():
     """
     Обрабатывает webhook уведомления.
+
+    Без лимита по IP: платёжный провайдер шлёт уведомления с нескольких
+    адресов пачками, и отклонённый 429 колбэк о платеже теряется.
+    Защита вебхука — проверка подписи, а не счётчик запросов.
     """
     return jsonify({"status": "ignored"}), 200
@@ -2,10 +2,13 @@
 Роуты для магического квеста (бесплатное погружение)
 """
 
-from quart import Blueprint, render_template, request, session, redirect, url_for, jsonify, current_app
+from quart import (
+    Blueprint, Response, render_template, request, session, redirect, url_for, jsonify, current_app,
+)
 from app.data.quest_v2 import get_question, get_first_question, calculate_recommendation
-import httpx
-import os
+from app.utils.rate_limit import rate_limit
+from app.services.quest_graph import QuestPathError, get_quest_graph
+from app.services.quest_leads import get_quest_lead_sender, save_quest_lead
 
 bp = Blueprint("quest", __name__)
 
@@ -26,14 +29,32 @@ async def quest_start():
     
     first_question = get_first_question()
     
+    # С JS квест проходится в браузере по графу (static/js/quest.js), формы — запасной путь
     return await render_template(
         "quest/question.html",
         question=first_question,
         progress=10,  # 1 из 10 вопросов
+        graph_url=url_for('quest.quest_graph', version=get_quest_graph().version),
         page_title="Магический квест | Нейромагия"
     )
 
 
+@bp.route("/free-quest/graph/<version>.json")
+async def quest_graph(version: str):
+    """
+    Граф квеста для клиентского прохождения.
+    Версия в URL — хеш содержимого, поэтому ответ кешируется навсегда
+    """
+    graph = get_quest_graph()
+    if version != graph.version:
+        # Страница из кеша со старой версией получит актуальный граф
+        return redirect(url_for('quest.quest_graph', version=graph.version))
+    
+    response = Response(graph.body, mimetype="application/json")
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
 @bp.route("/free-quest/question/<question_id>")
 async def quest_question(question_id: str):
     """
@@ -61,6 +82,7 @@ async def quest_question(question_id: str):
 
 
 @bp.route("/free-quest/answer", methods=["POST"])
+@rate_limit(60, per=60, key="ip", algorithm="bucket")
 async def quest_answer():
     """
     Обработка ответа пользователя
@@ -172,18 +194,15 @@ async def quest_contact():
 
 
 @bp.route("/free-quest/contact", methods=["POST"])
+@rate_limit(5, per=3600, key="ip")
 async def quest_contact_submit():
     """
-    Обработка контактной формы и отправка в Telegram
+    Обработка контактной формы: заявка сохраняется для отправки в Telegram
     """
-    form_data = await request.form
-    
-    telegram = form_data.get('telegram', '').strip()
-    phone = form_data.get('phone', '').strip()
-    name = form_data.get('name', '').strip()
+    contact = _read_contact(await request.form)
     
     # Проверяем, что хотя бы один контакт указан
-    if not telegram and not phone:
+    if not contact['telegram'] and not contact['phone']:
         return await render_template(
             "quest/contact.html",
             contact=get_question('contact'),
@@ -193,123 +212,84 @@ async def quest_contact_submit():
         )
     
     # Сохраняем контакты в сессию
-    session['quest_contact'] = {
-        'telegram': telegram,
-        'phone': phone,
-        'name': name
-    }
+    session['quest_contact'] = contact
     
-    # Отправка в Telegram (игнорируем ошибки)
-    try:
-        await send_to_telegram_bot(session)
-    except Exception as e:
-        current_app.logger.error(f"Telegram send failed: {e}")
+    await _submit_lead(
+        session.get('quest_answers', []), contact, session.get('quest_recommendation')
+    )
     
     # Редирект на результаты
     return redirect(url_for('quest.quest_results'))
 
 
-async def send_to_telegram_bot(session_data):
+@bp.route("/free-quest/submit", methods=["POST"])
+@rate_limit(5, per=3600, key="ip")
+async def quest_submit():
     """
-    Отправка заявки в Telegram бот
+    Все ответы квеста одним запросом (клиентское прохождение по графу).
+    Путь проверяется по графу, в ответе — рекомендации и готовый блок результатов
     """
-    # Получаем токен бота из переменных окружения
-    bot_token = os.getenv('TELEGRAM_BOT_TOKEN')
-    chat_id = os.getenv('TELEGRAM_CHAT_ID')
-    
-    if not bot_token or not chat_id:
-        current_app.logger.warning("Telegram bot credentials not configured")
-        return
-    
-    # Формируем данные из квеста
-    answers = session_data.get('quest_answers', [])
-    contact = session_data.get('quest_contact', {})
-    recommendation = session_data.get('quest_recommendation', {})
-    
-    # Извлекаем проект мечты
-    user_project = ""
-    for answer in answers:
-        if answer.get('user_prompt'):
-            user_project = answer['user_prompt']
-    
-    # Извлекаем назначение и доступ
-    purpose = ""
-    access = ""
-    for answer in answers:
-        if 'purpose' in answer:
-            purpose = answer['purpose']
-        if 'access' in answer:
-            access = answer['access']
-    
-    # Рекомендованные курсы
-    courses = []
-    if recommendation.get('recommendations'):
-        courses = [rec['title'] for rec in recommendation['recommendations'][:3]]
-    
-    # Формируем сообщение
-    message = f"""
-🎓 НОВАЯ ЗАЯВКА С КВЕСТА
-
-👤 Контакты:
-Имя: {contact.get('name', 'Не указано')}
-Telegram: {contact.get('telegram', 'Не указано')}
-Телефон: {contact.get('phone', 'Не указан')}
-
-🎯 Цель использования AI:
-{purpose or 'Не определена'}
+    data = await request.get_json(silent=True) or {}
+    graph = get_quest_graph()
+    
+    if data.get('version') != graph.version:
+        return jsonify({
+            "success": False,
+            "error": "Квест обновился, пройдите его заново",
+            "restart_url": url_for('quest.quest_restart')
+        }), 409
+    
+    try:
+        answers = graph.validate_path(data.get('answers'))
+    except QuestPathError as e:
+        current_app.logger.warning(f"Quest submit rejected: {e}")
+        return jsonify({
+            "success": False, "error": "Ответы не прошли проверку, пройдите квест заново"
+        }), 400
+    
+    contact = _read_contact(data.get('contact') or {})
+    if not contact['telegram'] and not contact['phone']:
+        return jsonify({
+            "success": False, "error": "Пожалуйста, укажите хотя бы один способ связи"
+        }), 400
+    
+    recommendation = _recommend(answers)
+    
+    # Сессия — как после пошагового прохождения: страница результатов открывается по ссылке
+    session['quest_answers'] = answers
+    session['quest_contact'] = contact
+    session['quest_recommendation'] = recommendation
+    session.pop('quest_current', None)
+    
+    await _submit_lead(answers, contact, recommendation)
+    
+    return jsonify({
+        "success": True,
+        "recommendation": recommendation,
+        "html": await render_template("partials/quest_results.html", recommendation=recommendation),
+        "results_url": url_for('quest.quest_results')
+    })
 
-🌐 Доступ к нейросетям:
-{access or 'Не определён'}
 
-💡 Проект мечты:
-{user_project or 'Не указан'}
+def _read_contact(values) -> dict:
+    """Контакты из формы или JSON"""
+    return {
+        key: str(values.get(key) or '').strip()
+        for key in ('telegram', 'phone', 'name')
+    }
 
-📚 Рекомендованные курсы:
-{chr(10).join(f"• {course}" for course in courses) if courses else 'Не определены'}
 
----
-Время: {import_datetime()}
-"""
-    
-    # Отправляем в Telegram
+async def _submit_lead(answers: list, contact: dict, recommendation) -> None:
+    """Заявка сохраняется в БД, в Telegram её отправит фоновый QuestLeadSender"""
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-            response = await client.post(url, json={
-                "chat_id": chat_id,
-                "text": message
-            })
-            
-            result = response.json()
-            
-            if result.get('ok'):
-                current_app.logger.info(f"Quest application sent to Telegram: {contact.get('telegram', contact.get('phone'))}")
-            else:
-                current_app.logger.error(f"Telegram API error: {result}")
-                
+        await save_quest_lead(answers, contact, recommendation)
+        get_quest_lead_sender().wake()
     except Exception as e:
-        current_app.logger.error(f"Failed to send to Telegram: {e}")
-
+        current_app.logger.error(f"Quest lead save failed: {e}")
 
-def import_datetime():
-    """Вспомогательная функция для получения текущего времени"""
-    from datetime import datetime
-    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-
-@bp.route("/free-quest/results")
-async def quest_results():
-    """
-    Результаты квеста с рекомендациями
-    """
-    # БЕЗ try-except чтобы увидеть полную ошибку!
-    answers = session.get('quest_answers', [])
-    
-    if not answers:
-        # Если нет ответов - создаём базовую рекомендацию
-        answers = [{'purpose': 'general'}]
-    
-    # Вычисляем рекомендации на основе ответов
+def _recommend(answers: list) -> dict:
+    """Рекомендации по ответам (базовая рекомендация, если расчёт упал)"""
     try:
         recommendation = calculate_recommendation(answers)
         # Убеждаемся что есть все необходимые поля
@@ -332,6 +312,23 @@ async def quest_results():
                 }
             ]
         }
+    return recommendation
+
+
+@bp.route("/free-quest/results")
+async def quest_results():
+    """
+    Результаты квеста с рекомендациями
+    """
+    # БЕЗ try-except чтобы увидеть полную ошибку!
+    answers = session.get('quest_answers', [])
+    
+    if not answers:
+        # Если нет ответов - создаём базовую рекомендацию
+        answers = [{'purpose': 'general'}]
+    
+    # Вычисляем рекомендации на основе ответов
+    recommendation = _recommend(answers)
     
     # Сохраняем рекомендации в сессию
     session['quest_recommendation'] = recommendation
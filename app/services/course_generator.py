@@ -2,11 +2,23 @@
 Сервис для генерации контента курсов через AI.
 Использует OpenRouter API (GPT-4/5) для создания уроков, квизов, и другого контента.
 """
-import json
-from typing import Dict, List, Optional
+import asyncio
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
 from loguru import logger
-
-from app.services.openrouter import get_openrouter_service
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.config import Settings
+from app.services.openrouter import OpenRouterService, get_openrouter_service
+from app.services.course_outline import publish_outline_change
+from app.services.generation_usage import usage_context
+from app.services.lesson_duplicates import flag_duplicate_lessons
+from app.services.lesson_writer import LessonWriter, save_lessons
+from app.services.model_router import ModelRouter
+from app.services.quiz_schema import (
+    MIN_QUESTIONS, QUIZ_JSON_FORMAT, QuizFormatError, compact_quiz, parse_quiz,
+)
 from app.models import CourseModule, Lesson
 from app.database import AsyncSessionLocal
 from app.data.courses import COURSES_EXTENDED
@@ -20,11 +32,44 @@ class CourseGeneratorService:
     - Текстовый контент уроков (Markdown)
     - Квизы для проверки знаний
     - Описания модулей
+
+    Уроки курса генерируются параллельно: одновременно выполняется не
+    больше concurrency запросов к LLM (COURSE_GEN_CONCURRENCY), квиз
+    урока запрашивается сразу после его текста, а результаты собираются
+    в модули в исходном порядке программы.
+
+    Генерация инкрементальная: в БД дописываются только недостающие
+    уроки. Готовые уроки пишутся пачками (LessonWriter): короткая
+    транзакция на модуль, соединение из пула не держится во время LLM.
+
+    Модели для текста и квиза выбирает ModelRouter (LLM_LESSON_MODELS,
+    LLM_QUIZ_MODELS): запасные модели и хедж-запросы к медленным.
+
+    После генерации курс проверяется на почти одинаковые уроки
+    (LESSON_DEDUP_THRESHOLD, см. lesson_duplicates): поздний урок пары
+    перегенерируется с подсказкой, что не повторять.
     """
 
-    def __init__(self):
-        """Инициализация генератора курсов"""
-        self.openrouter = get_openrouter_service()
+    def __init__(
+        self,
+        openrouter: Optional[OpenRouterService] = None,
+        concurrency: Optional[int] = None,
+        router: Optional[ModelRouter] = None,
+    ):
+        """
+        Инициализация генератора курсов
+
+        Args:
+            openrouter: Клиент OpenRouter (по умолчанию глобальный)
+            concurrency: Максимум одновременных запросов к LLM
+            router: Выбор моделей по задачам (по умолчанию из настроек)
+        """
+        settings = Settings()
+        self.openrouter = openrouter or get_openrouter_service()
+        self.concurrency = concurrency or settings.course_gen_concurrency
+        self.router = router or ModelRouter.from_settings(self.openrouter, settings)
+        self.dedup_threshold = settings.lesson_dedup_threshold
+        self.dedup_rounds = settings.lesson_dedup_rounds
 
     async def generate_lesson_content(
         self,
@@ -47,6 +92,54 @@ class CourseGeneratorService:
         Returns:
             dict: {"content_text": "...", "quiz_questions": {...}}
         """
+        lesson_text = await self.generate_lesson_text(
+            lesson_title, module_title, course_title, target_audience, duration_minutes
+        )
+        if not lesson_text:
+            return self._failed_lesson(lesson_title)
+
+        # Генерируем квиз для урока
+        quiz_questions = await self.generate_quiz(lesson_title, lesson_text)
+
+        return {
+            "content_text": lesson_text,
+            "quiz_questions": quiz_questions
+        }
+
+    @staticmethod
+    def _failed_lesson(lesson_title: str) -> Dict[str, any]:
+        """Заглушка для урока, текст которого не удалось сгенерировать"""
+        logger.error(f"Failed to generate lesson content for: {lesson_title}")
+        return {
+            "content_text": f"# {lesson_title}\n\nКонтент не сгенерирован. Попробуйте позже.",
+            "quiz_questions": None
+        }
+
+    async def generate_lesson_text(
+        self,
+        lesson_title: str,
+        module_title: str,
+        course_title: str,
+        target_audience: str = "начинающие",
+        duration_minutes: int = 15,
+        refresh: bool = False,
+        on_delta: Optional[Callable[[str, int], Optional[bool]]] = None,
+        avoid: Optional[str] = None,
+    ) -> Optional[str]:
+        """
+        Генерирует Markdown текст одного урока (без квиза).
+
+        Args:
+            refresh: Не брать ответ из кеша LLM (перегенерация урока)
+            on_delta: Функция (фрагмент, длина текста): если задана, текст
+                запрашивается потоком и функция вызывается по мере генерации;
+                вернула False — генерация урока прерывается
+            avoid: Урок курса (название и заголовки), который прежняя версия
+                этого урока повторяла, — его шаги и примеры запрещаются в промте
+
+        Returns:
+            str: Текст урока или None в случае ошибки
+        """
         logger.info(f"Generating lesson content: {lesson_title}")
 
         # System prompt для генерации урока
@@ -134,37 +227,33 @@ class CourseGeneratorService:
 - Минимум текста, максимум действий
 - НЕ добавляй вступительный или заключительный текст от себя
 - Верни ТОЛЬКО контент урока"""
-
-        # Генерируем текст урока с помощью GPT-5.1
-        lesson_text = await self.openrouter.generate_text(
-            prompt=user_prompt,
-            system_prompt=system_prompt.format(
-                words=600 + (duration_minutes - 10) * 80  # 600-1000 слов
-            ),
-            model="openai/gpt-5.1",  # Лучшее следование инструкциям + дешевизна
-            temperature=0.4,  # Ниже для большей структурированности
-            max_tokens=4000
-        )
-
-        if not lesson_text:
-            logger.error(f"Failed to generate lesson content for: {lesson_title}")
-            return {
-                "content_text": f"# {lesson_title}\n\nКонтент не сгенерирован. Попробуйте позже.",
-                "quiz_questions": None
-            }
-
-        # Генерируем квиз для урока
-        quiz_questions = await self.generate_quiz(lesson_title, lesson_text)
-
-        return {
-            "content_text": lesson_text,
-            "quiz_questions": quiz_questions
-        }
+        if avoid:
+            user_prompt += f"""
+
+Прошлая версия этого урока почти повторяла другой урок курса:
+{avoid}
+НЕ повторяй его шаги, примеры и практическое задание — раскрой именно тему «{lesson_title}»."""
+
+        # Генерируем текст урока (по умолчанию GPT-5.1: лучшее следование инструкциям + дешевизна)
+        with usage_context(purpose="lesson_text"):
+            return await self.router.generate_text(
+                "lesson",
+                prompt=user_prompt,
+                system_prompt=system_prompt.format(
+                    words=600 + (duration_minutes - 10) * 80  # 600-1000 слов
+                ),
+                temperature=0.4,  # Ниже для большей структурированности
+                max_tokens=4000,
+                refresh=refresh,
+                stream=on_delta is not None,
+                on_delta=on_delta,
+            )
 
     async def generate_quiz(
         self,
         lesson_title: str,
         lesson_content: str,
+        refresh: bool = False,
     ) -> Optional[dict]:
         """
         Генерирует квиз для проверки знаний после урока.
@@ -172,9 +261,13 @@ class CourseGeneratorService:
         Args:
             lesson_title: Название урока
             lesson_content: Текст урока
+            refresh: Не брать ответ из кеша LLM
+
+        Ответ модели разбирается терпимо к обёрткам и обрывам, проверяется
+        по схеме; невалидный квиз один раз отправляется на исправление.
 
         Returns:
-            dict: Квиз в формате JSON или None
+            dict: Проверенный квиз в компактной форме (см. quiz_schema) или None
         """
         logger.info(f"Generating quiz for lesson: {lesson_title}")
 
@@ -208,138 +301,554 @@ class CourseGeneratorService:
 
 Создай квиз из 5 вопросов. Верни чистый JSON."""
 
-        # Генерируем квиз с помощью GPT-5.1 (отлично с JSON)
-        quiz_text = await self.openrouter.generate_text(
-            prompt=user_prompt,
-            system_prompt=system_prompt,
-            model="openai/gpt-5.1",
-            temperature=0.3,  # Очень низкая для JSON
-            max_tokens=2000
-        )
+        # Генерируем квиз (по умолчанию GPT-5.1: отлично с JSON)
+        with usage_context(purpose="quiz"):
+            quiz_text = await self.router.generate_text(
+                "quiz",
+                prompt=user_prompt,
+                system_prompt=system_prompt,
+                temperature=0.3,  # Очень низкая для JSON
+                max_tokens=2000,
+                refresh=refresh
+            )
 
         if not quiz_text:
             logger.warning(f"Failed to generate quiz for: {lesson_title}")
             return None
 
         try:
-            # Очищаем текст от markdown кодблоков если есть
-            quiz_text = quiz_text.strip()
-            if quiz_text.startswith("```json"):
-                quiz_text = quiz_text.replace("```json", "").replace("```", "").strip()
-            elif quiz_text.startswith("```"):
-                quiz_text = quiz_text.replace("```", "").strip()
-
-            # Парсим JSON
-            quiz_data = json.loads(quiz_text)
+            quiz = parse_quiz(quiz_text)
             logger.info(f"Quiz generated successfully for: {lesson_title}")
-            return quiz_data
+            return quiz
+        except QuizFormatError as e:
+            logger.warning(f"Invalid quiz for {lesson_title}, asking to repair: {e}")
+            problems, valid_questions = e.problems, e.valid_questions
+
+        # Исправление дешевле новой генерации: модель получает только сам квиз и ошибки, без урока
+        repaired_text = await self._repair_quiz(quiz_text, problems, refresh)
+        if repaired_text:
+            try:
+                quiz = parse_quiz(repaired_text)
+                logger.info(f"Quiz repaired for: {lesson_title}")
+                return quiz
+            except QuizFormatError as e:
+                valid_questions = max(valid_questions, e.valid_questions, key=len)
+                logger.warning(f"Repaired quiz for {lesson_title} is still invalid: {e}")
+
+        if len(valid_questions) >= MIN_QUESTIONS:
+            logger.warning(
+                f"Keeping {len(valid_questions)} valid quiz questions for: {lesson_title}"
+            )
+            return compact_quiz(valid_questions)
+        logger.error(f"Failed to get a valid quiz for: {lesson_title}")
+        return None
+
+    async def _repair_quiz(
+        self, quiz_text: str, problems: List[str], refresh: bool = False
+    ) -> Optional[str]:
+        """Просит модель исправить квиз по списку ошибок; возвращает ответ модели"""
+        system_prompt = f"""Исправь JSON квиза по списку ошибок.
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse quiz JSON: {e}\nText: {quiz_text}")
-            return None
+ФОРМАТ (строго!):
+{QUIZ_JSON_FORMAT}
+
+- Ровно 4 варианта ответа в каждом вопросе
+- correct — индекс правильного ответа (0-3)
+- Непустое объяснение у каждого вопроса
+- Сохрани смысл вопросов, исправь только ошибки
+
+ВЕРНИ ТОЛЬКО JSON, БЕЗ markdown кодблоков и текста."""
+
+        errors = "\n".join(f"- {problem}" for problem in problems[:20])
+        user_prompt = f"""Ошибки:
+{errors}
+
+Квиз:
+{quiz_text[:6000]}"""
+
+        with usage_context(purpose="quiz_repair"):
+            return await self.router.generate_text(
+                "quiz",
+                prompt=user_prompt,
+                system_prompt=system_prompt,
+                temperature=0.0,
+                max_tokens=2000,
+                refresh=refresh,
+            )
 
     async def generate_course(
         self,
         course_slug: str,
-        progress_callback: Optional[callable] = None
+        progress_callback: Optional[callable] = None,
+        force: bool = False,
+        slots: Optional[asyncio.Semaphore] = None,
+        lesson_callback: Optional[Callable[["LessonTask", str, int], Optional[bool]]] = None,
     ) -> bool:
         """
-        Генерирует полный контент для курса (все модули и уроки).
+        Генерирует недостающий контент курса (инкрементально).
+
+        Программа курса из каталога сравнивается с модулями и уроками в БД:
+        недостающие модули и уроки создаются со статусом "pending", ничего
+        не удаляется (прогресс студентов сохраняется). Генерируются только
+        уроки в статусе "pending"/"failed" (или все при force), каждый
+        урок сохраняется в своей короткой транзакции — после сбоя повторный
+        запуск продолжает с того же места. Затем уроки курса проверяются
+        на почти одинаковые, и копии перегенерируются (dedup_rounds раз).
 
         Args:
             course_slug: Slug курса (например "ai-for-beginners")
-            progress_callback: Функция для отслеживания прогресса (опционально)
+            progress_callback: Функция (готово, всего, название урока),
+                вызывается по завершении каждого урока (опционально)
+            force: Перегенерировать все уроки курса
+            slots: Общий семафор запросов к LLM (воркер очереди делит его
+                между курсами; по умолчанию — свой, на concurrency)
+            lesson_callback: Функция (урок, статус, символов текста) — живой
+                статус уроков; текст уроков при этом запрашивается потоком
 
         Returns:
-            bool: True если успешно, False если ошибка
+            bool: True если все уроки курса готовы, False если были ошибки
         """
         logger.info(f"Starting course generation for: {course_slug}")
 
+        meta = self._get_course_meta(course_slug)
+        if meta is None:
+            return False
+        course_info, program = meta
+
+        try:
+            tasks = await self._sync_course_structure(
+                course_slug, course_info.title, program, force
+            )
+
+            # Структура курса могла измениться — сбрасываем кеш навигации во всех процессах
+            await publish_outline_change(course_slug)
+
+            if not tasks:
+                logger.info(f"Course {course_slug} is up to date, nothing to generate")
+                return True
+            logger.info(f"Lessons to generate for {course_slug}: {len(tasks)}")
+
+            generate = dict(
+                course_title=course_info.title,
+                target_audience=course_info.level,
+                progress_callback=progress_callback,
+                slots=slots,
+                lesson_callback=lesson_callback,
+            )
+            failed = await self._generate_and_save(course_slug, tasks, refresh=force, **generate)
+
+            # Почти одинаковые уроки: поздний урок пары перегенерируется
+            # (не больше dedup_rounds раз)
+            for round_number in range(self.dedup_rounds + 1 if self.dedup_threshold > 0 else 0):
+                pairs = await flag_duplicate_lessons(course_slug, self.dedup_threshold)
+                if not pairs or round_number == self.dedup_rounds:
+                    break
+                flagged = {pair.second for pair in pairs}
+                synced = await self._sync_course_structure(course_slug, course_info.title, program)
+                tasks = [task for task in synced if task.lesson_id in flagged]
+                logger.info(f"Regenerating {len(tasks)} near-duplicate lessons of {course_slug}")
+                failed += await self._generate_and_save(course_slug, tasks, **generate)
+
+            return failed == 0
+
+        except Exception as e:
+            logger.error(f"Failed to generate course {course_slug}: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            return False
+
+    async def _generate_and_save(
+        self, course_slug: str, tasks: List["LessonTask"], **options
+    ) -> int:
+        """
+        Генерирует уроки и пишет их пачками по модулям (соединение из
+        пула берётся только на запись). Готовые уроки сохраняются и при
+        ошибке или отмене генерации.
+
+        Returns:
+            int: Сколько уроков не сгенерировано
+        """
+        failed = 0
+        lesson_callback = options.get("lesson_callback")
+        by_id = {task.lesson_id: task for task in tasks}
+
+        def saved(rows: List[Tuple[int, Optional[dict]]]) -> None:
+            # "ready" — урок уже в БД: его можно открыть по ссылке из статуса
+            for lesson_id, content in rows:
+                if content is not None and lesson_callback:
+                    lesson_callback(by_id[lesson_id], "ready", len(content["content_text"]))
+
+        writer = LessonWriter((task.module_index for task in tasks), on_saved=saved)
+
+        async def save(task: LessonTask, content: Optional[dict]) -> None:
+            nonlocal failed
+            if content is None:
+                failed += 1
+            await writer.add(task.lesson_id, content, task.module_index)
+
+        try:
+            with usage_context(course_slug=course_slug):
+                await self._generate_lessons(tasks, on_lesson=save, **options)
+        finally:
+            await writer.flush()
+
+        logger.info(
+            f"Course generation completed: {course_slug}. "
+            f"Generated: {len(tasks) - failed}, failed: {failed}. Saved: {writer.stats()}"
+        )
+        return failed
+
+    async def regenerate_lesson(
+        self, lesson_id: int, slots: Optional[asyncio.Semaphore] = None
+    ) -> bool:
+        """
+        Перегенерирует один урок (текст и квиз — два запроса к LLM, мимо кеша).
+
+        При ошибке прежний контент урока остаётся на месте.
+
+        Args:
+            lesson_id: ID урока
+            slots: Общий семафор запросов к LLM (опционально)
+
+        Returns:
+            bool: True если урок перегенерирован
+        """
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(Lesson, CourseModule)
+                .join(CourseModule, Lesson.module_id == CourseModule.id)
+                .where(Lesson.id == lesson_id)
+            )
+            row = result.one_or_none()
+            if row is None:
+                logger.error(f"Lesson not found for regeneration: {lesson_id}")
+                return False
+            lesson, module = row
+            original = None
+            if lesson.duplicate_of_id:
+                original = await session.get(Lesson, lesson.duplicate_of_id)
+
+        meta = self._get_course_meta(module.course_slug)
+        course_info = meta[0] if meta else None
+        task = LessonTask(
+            module_index=module.order - 1,
+            order=lesson.order,
+            title=lesson.title,
+            module_title=module.title,
+            lesson_id=lesson.id,
+            avoid=lesson_outline(original),
+        )
+        async with slots or asyncio.Semaphore(1):
+            with usage_context(course_slug=module.course_slug, lesson_id=lesson.id):
+                content = await self._generate_lesson(
+                    task,
+                    course_title=course_info.title if course_info else module.course_slug,
+                    target_audience=course_info.level if course_info else "начинающие",
+                    refresh=True,
+                )
+        await self._save_lesson(lesson.id, content)
+        logger.info(f"Lesson #{lesson_id} regenerated: {content is not None}")
+        return content is not None
+
+    async def generate_course_content(
+        self,
+        course_slug: str,
+        progress_callback: Optional[callable] = None,
+    ) -> Optional[List[dict]]:
+        """
+        Генерирует контент всех уроков курса без записи в БД.
+
+        Args:
+            course_slug: Slug курса
+            progress_callback: Функция (готово, всего, название урока)
+
+        Returns:
+            list: Модули в порядке программы:
+                [{"title": ..., "description": ...,
+                  "lessons": [{"title", "content_text", "quiz_questions"}]}]
+            None, если курса нет в каталоге
+        """
+        meta = self._get_course_meta(course_slug)
+        if meta is None:
+            return None
+        course_info, program = meta
+
+        tasks = [
+            LessonTask(
+                module_index=module_index,
+                order=lesson_order,
+                title=lesson_title,
+                module_title=module_data["title"],
+            )
+            for module_index, module_data in enumerate(program)
+            for lesson_order, lesson_title in enumerate(module_data["lessons"], start=1)
+        ]
+
+        with usage_context(course_slug=course_slug):
+            contents = await self._generate_lessons(
+                tasks,
+                course_title=course_info.title,
+                target_audience=course_info.level,
+                progress_callback=progress_callback,
+            )
+
+        # Сборка модулей в исходном порядке программы
+        modules = [
+            {
+                "title": module_data["title"],
+                "description": f"Модуль {module_index + 1} курса {course_info.title}",
+                "lessons": [],
+            }
+            for module_index, module_data in enumerate(program)
+        ]
+        for task, content in zip(tasks, contents, strict=True):
+            modules[task.module_index]["lessons"].append(
+                {"title": task.title, **(content or self._failed_lesson(task.title))}
+            )
+        return modules
+
+    @staticmethod
+    def _get_course_meta(course_slug: str):
+        """Информация о курсе и его программа из каталога (или None)"""
         # Получаем данные курса из каталога
         course_data = COURSES_EXTENDED.get(course_slug)
         if not course_data:
             logger.error(f"Course not found in catalog: {course_slug}")
-            return False
+            return None
 
         # Получаем информацию о курсе
         from app.data.catalog import COURSES
         course_info = next((c for c in COURSES if c.slug == course_slug), None)
         if not course_info:
             logger.error(f"Course info not found: {course_slug}")
-            return False
+            return None
 
-        try:
-            async with AsyncSessionLocal() as session:
-                # Удаляем старые модули если есть (для повторной генерации)
-                from sqlalchemy import select, delete
-                existing_modules = await session.execute(
-                    select(CourseModule).where(CourseModule.course_slug == course_slug)
-                )
-                for module in existing_modules.scalars():
-                    await session.delete(module)
-                await session.commit()
+        return course_info, course_data["program"]
+
+    async def _generate_lesson(
+        self,
+        task: "LessonTask",
+        course_title: str,
+        target_audience: str,
+        refresh: bool = False,
+        lesson_callback: Optional[Callable[["LessonTask", str, int], Optional[bool]]] = None,
+    ) -> Optional[dict]:
+        """
+        Текст и квиз одного урока; None, если текст не сгенерирован.
+
+        lesson_callback(урок, статус, символов текста) получает статусы
+        "started", "streaming" (текст идёт потоком), "quiz", "generated"
+        (урок ждёт записи в БД) или "failed". "ready" отправляет запись урока.
+        """
+        on_delta = None
+        if lesson_callback:
+            lesson_callback(task, "started", 0)
+
+            def on_delta(delta: str, length: int) -> Optional[bool]:
+                return lesson_callback(task, "streaming", length)
+
+        # Копию другого урока перегенерируем мимо кеша и с подсказкой, что не повторять
+        refresh = refresh or task.avoid is not None
+        lesson_text = await self.generate_lesson_text(
+            task.title, task.module_title, course_title, target_audience, 15,
+            refresh=refresh, on_delta=on_delta, avoid=task.avoid,
+        )
+        if not lesson_text:
+            logger.error(f"Failed to generate lesson content for: {task.title}")
+            if lesson_callback:
+                lesson_callback(task, "failed", 0)
+            return None
+        if lesson_callback:
+            lesson_callback(task, "quiz", len(lesson_text))
+        quiz_questions = await self.generate_quiz(task.title, lesson_text, refresh=refresh)
+        if lesson_callback:
+            lesson_callback(task, "generated", len(lesson_text))
+        return {"content_text": lesson_text, "quiz_questions": quiz_questions}
+
+    async def _generate_lessons(
+        self,
+        tasks: List["LessonTask"],
+        course_title: str,
+        target_audience: str,
+        progress_callback: Optional[callable] = None,
+        slots: Optional[asyncio.Semaphore] = None,
+        on_lesson: Optional[Callable[["LessonTask", Optional[dict]], Awaitable[None]]] = None,
+        refresh: bool = False,
+        lesson_callback: Optional[Callable[["LessonTask", str, int], Optional[bool]]] = None,
+    ) -> List[Optional[dict]]:
+        """
+        Генерирует уроки параллельно с ограничением на число запросов к LLM.
+
+        Урок занимает слот на время двух последовательных запросов
+        (текст, затем квиз), поэтому квиз урока идёт сразу за текстом,
+        пока другие слоты генерируют тексты следующих уроков.
+
+        Args:
+            tasks: Уроки в порядке программы
+            course_title: Название курса
+            target_audience: Целевая аудитория
+            progress_callback: Функция (готово, всего, название урока)
+            slots: Общий семафор запросов к LLM (по умолчанию — свой, на concurrency)
+            on_lesson: Корутина (урок, контент), вызывается сразу после генерации
+                урока (контент None — урок не сгенерирован), вне слота LLM
+            refresh: Не брать ответы из кеша LLM
+            lesson_callback: Функция (урок, статус, символов текста) — статус
+                каждого урока по ходу генерации (текст уроков идёт потоком)
+
+        Returns:
+            list: Контент уроков в порядке tasks (None для несгенерированных)
+        """
+        slots = slots or asyncio.Semaphore(self.concurrency)
+        results: List[Optional[dict]] = [None] * len(tasks)
+        done = 0
+
+        async def run(index: int, task: LessonTask) -> None:
+            nonlocal done
+            async with slots:
+                with usage_context(lesson_id=task.lesson_id):
+                    results[index] = await self._generate_lesson(
+                        task, course_title, target_audience, refresh, lesson_callback
+                    )
+            if on_lesson:
+                await on_lesson(task, results[index])
+            done += 1
+            logger.info(f"Generated lesson {done}/{len(tasks)}: {task.title}")
+            if progress_callback:
+                progress_callback(done, len(tasks), task.title)
+
+        # TaskGroup отменяет остальные уроки, если один упал с исключением
+        async with asyncio.TaskGroup() as group:
+            for index, task in enumerate(tasks):
+                group.create_task(run(index, task))
+
+        return results
+
+    async def _sync_course_structure(
+        self,
+        course_slug: str,
+        course_title: str,
+        program: List[dict],
+        force: bool = False,
+    ) -> List["LessonTask"]:
+        """
+        Приводит модули и уроки в БД к программе курса (одна короткая транзакция).
 
-                # Генерируем каждый модуль
-                total_lessons = 0
-                generated_lessons = 0
+        Модули сопоставляются по порядку в программе, уроки — по порядку
+        в модуле. Недостающие создаются, у изменившихся обновляется
+        название (урок со сменившейся темой ставится в очередь на генерацию,
+        старый контент остаётся до появления нового). Лишние модули и уроки
+        не удаляются.
 
-                for module_order, module_data in enumerate(course_data["program"], start=1):
-                    # Создаём модуль
-                    course_module = CourseModule(
+        Returns:
+            list: Уроки, которые нужно сгенерировать
+        """
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(CourseModule)
+                .where(CourseModule.course_slug == course_slug)
+                .options(selectinload(CourseModule.lessons))
+                .order_by(CourseModule.order, CourseModule.id)
+            )
+            modules_by_order: Dict[int, CourseModule] = {}
+            for module in result.scalars():
+                modules_by_order.setdefault(module.order, module)
+
+            pending = []
+            for module_order, module_data in enumerate(program, start=1):
+                module = modules_by_order.get(module_order)
+                if module is None:
+                    module = CourseModule(
                         course_slug=course_slug,
                         order=module_order,
                         title=module_data["title"],
-                        description=f"Модуль {module_order} курса {course_info.title}"
+                        description=f"Модуль {module_order} курса {course_title}",
+                        lessons=[],
                     )
-                    session.add(course_module)
-                    await session.flush()  # Чтобы получить ID модуля
-
-                    logger.info(f"Created module: {course_module.title}")
-
-                    # Генерируем уроки для модуля
-                    for lesson_order, lesson_title in enumerate(module_data["lessons"], start=1):
-                        total_lessons += 1
-
-                        # Callback для прогресса
-                        if progress_callback:
-                            progress_callback(generated_lessons, total_lessons, lesson_title)
-
-                        # Генерируем контент урока
-                        lesson_content = await self.generate_lesson_content(
-                            lesson_title=lesson_title,
-                            module_title=module_data["title"],
-                            course_title=course_info.title,
-                            target_audience=course_info.level,
-                            duration_minutes=15
-                        )
-
-                        # Создаём урок в БД
+                    session.add(module)
+                    logger.info(f"Created module: {module.title}")
+                elif module.title != module_data["title"]:
+                    module.title = module_data["title"]
+
+                lessons_by_order: Dict[int, Lesson] = {}
+                for lesson in sorted(module.lessons, key=lambda lesson: lesson.id):
+                    lessons_by_order.setdefault(lesson.order, lesson)
+
+                for lesson_order, lesson_title in enumerate(module_data["lessons"], start=1):
+                    lesson = lessons_by_order.get(lesson_order)
+                    if lesson is None:
                         lesson = Lesson(
-                            module_id=course_module.id,
                             order=lesson_order,
                             title=lesson_title,
                             content_type="text",
-                            content_text=lesson_content["content_text"],
-                            quiz_questions=lesson_content["quiz_questions"],
+                            generation_status="pending",
                             estimated_time_minutes=15,
                             is_free=(lesson_order == 1)  # Первый урок бесплатный
                         )
-                        session.add(lesson)
-                        generated_lessons += 1
+                        module.lessons.append(lesson)
+                    elif lesson.title != lesson_title:
+                        lesson.title = lesson_title
+                        lesson.generation_status = "pending"
 
-                        logger.info(f"Generated lesson {generated_lessons}/{total_lessons}: {lesson_title}")
+                    if force or needs_generation(lesson):
+                        pending.append((module, lesson, module_data["title"]))
 
-                # Сохраняем всё в БД
-                await session.commit()
+            await session.commit()
 
-                logger.info(f"Course generation completed: {course_slug}. Total lessons: {generated_lessons}")
-                return True
+        lessons_by_id = {
+            lesson.id: lesson for module in modules_by_order.values() for lesson in module.lessons
+        }
+        return [
+            LessonTask(
+                module_index=module.order - 1,
+                order=lesson.order,
+                title=lesson.title,
+                module_title=module_title,
+                lesson_id=lesson.id,
+                avoid=lesson_outline(lessons_by_id.get(lesson.duplicate_of_id)),
+            )
+            for module, lesson, module_title in pending
+        ]
+
+    async def _save_lesson(self, lesson_id: int, content: Optional[dict]) -> None:
+        """
+        Сохраняет результат генерации одного урока в отдельной транзакции.
 
-        except Exception as e:
-            logger.error(f"Failed to generate course {course_slug}: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return False
+        Если контент не сгенерирован, урок получает статус "failed"
+        (кроме уже готовых уроков — у них остаётся прежний контент).
+        """
+        await save_lessons([(lesson_id, content)])
+
+
+# Маркер заглушки, которую прежние версии генератора сохраняли вместо урока
+LEGACY_FAILED_MARKER = "Контент не сгенерирован. Попробуйте позже."
+
+
+def needs_generation(lesson: Lesson) -> bool:
+    """Нужно ли (пере)генерировать урок: нет контента, ошибка, заглушка или копия другого урока"""
+    if lesson.generation_status in ("pending", "failed", "duplicate"):
+        return True
+    return not lesson.content_text or LEGACY_FAILED_MARKER in lesson.content_text
+
+
+@dataclass(frozen=True)
+class LessonTask:
+    """Урок из программы курса, ожидающий генерации"""
+    module_index: int
+    order: int
+    title: str
+    module_title: str
+    lesson_id: Optional[int] = None
+    # Урок, который прежняя версия повторяла (см. lesson_outline)
+    avoid: Optional[str] = None
+
+
+def lesson_outline(lesson: Optional[Lesson]) -> Optional[str]:
+    """Название и заголовки урока — подсказка для промта, что не повторять"""
+    if lesson is None:
+        return None
+    lines = (lesson.content_text or "").splitlines()
+    headings = [line.strip() for line in lines if line.startswith("#")]
+    return "\n".join([f"Урок «{lesson.title}»", *headings])
 
 
 # Глобальный экземпляр сервиса
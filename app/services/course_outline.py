@@ -0,0 +1,349 @@
+"""
+Кеш структуры курса (модули и уроки) для навигации по урокам.
+
+Структура курса одинакова для всех студентов и меняется только при
+генерации курса, поэтому она загружается одним запросом, превращается
+в неизменяемый снимок CourseOutline и хранится в памяти процесса.
+
+- single-flight: одновременные запросы к одному курсу ждут одну загрузку
+- версия снимка — хеш структуры (меняется при любой правке модулей/уроков)
+- генератор курса (воркер очереди, скрипты) вызывает publish_outline_change:
+  slug уходит через PostgreSQL NOTIFY в канал course_outline, процессы
+  приложения слушают канал (listen) и сбрасывают снимок курса
+- урок, которого нет в снимке, перечитывает снимок (get_with_lesson):
+  NOTIFY мог потеряться, пока слушатель переподключался
+"""
+import asyncio
+import hashlib
+import itertools
+import os
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+from loguru import logger
+from sqlalchemy import select, text
+
+from app.models import CourseModule, Lesson
+
+# Канал PostgreSQL NOTIFY: slug курса, чья структура изменилась
+CHANNEL = "course_outline"
+
+
+@dataclass(frozen=True)
+class OutlineLesson:
+    """Урок в структуре курса (без контента)"""
+    id: int
+    module_id: int
+    order: int
+    title: str
+    estimated_time_minutes: int
+    is_free: bool
+
+
+@dataclass(frozen=True)
+class OutlineModule:
+    """Модуль курса с упорядоченными уроками"""
+    id: int
+    order: int
+    title: str
+    description: Optional[str]
+    lessons: tuple[OutlineLesson, ...]
+
+
+@dataclass(frozen=True)
+class CourseOutline:
+    """Неизменяемый снимок структуры курса"""
+    course_slug: str
+    version: str
+    modules: tuple[OutlineModule, ...]
+    lessons_by_id: Mapping[int, OutlineLesson]
+    next_lesson_ids: Mapping[int, int]
+    prev_lesson_ids: Mapping[int, int]
+
+    @property
+    def lesson_ids(self) -> tuple[int, ...]:
+        """ID всех уроков в порядке прохождения"""
+        return tuple(lesson.id for module in self.modules for lesson in module.lessons)
+
+    @property
+    def total_lessons(self) -> int:
+        return len(self.lessons_by_id)
+
+    @property
+    def first_lesson(self) -> Optional[OutlineLesson]:
+        for module in self.modules:
+            if module.lessons:
+                return module.lessons[0]
+        return None
+
+    def contains(self, lesson_id: int) -> bool:
+        return lesson_id in self.lessons_by_id
+
+    def next_lesson(self, lesson_id: int) -> Optional[OutlineLesson]:
+        next_id = self.next_lesson_ids.get(lesson_id)
+        return self.lessons_by_id[next_id] if next_id else None
+
+    def prev_lesson(self, lesson_id: int) -> Optional[OutlineLesson]:
+        prev_id = self.prev_lesson_ids.get(lesson_id)
+        return self.lessons_by_id[prev_id] if prev_id else None
+
+
+def build_outline(course_slug: str, rows: list) -> CourseOutline:
+    """
+    Собирает снимок из строк (module_id, module_order, module_title,
+    module_description, lesson_id, lesson_order, lesson_title,
+    estimated_time_minutes, is_free); lesson_id = None для пустых модулей.
+    """
+    modules: dict[int, dict] = {}
+    for row in rows:
+        module = modules.setdefault(row[0], {
+            "id": row[0], "order": row[1], "title": row[2], "description": row[3], "lessons": [],
+        })
+        if row[4] is not None:
+            module["lessons"].append(OutlineLesson(
+                id=row[4], module_id=row[0], order=row[5], title=row[6],
+                estimated_time_minutes=row[7], is_free=row[8],
+            ))
+
+    outline_modules = tuple(
+        OutlineModule(
+            id=m["id"], order=m["order"], title=m["title"], description=m["description"],
+            lessons=tuple(sorted(m["lessons"], key=lambda lesson: (lesson.order, lesson.id))),
+        )
+        for m in sorted(modules.values(), key=lambda m: (m["order"], m["id"]))
+    )
+
+    ordered = [lesson for module in outline_modules for lesson in module.lessons]
+    next_ids = {a.id: b.id for a, b in itertools.pairwise(ordered)}
+    prev_ids = {b.id: a.id for a, b in itertools.pairwise(ordered)}
+
+    digest = hashlib.sha1(repr([
+        (m.id, m.order, m.title, [(lesson.id, lesson.order, lesson.title) for lesson in m.lessons])
+        for m in outline_modules
+    ]).encode("utf-8")).hexdigest()[:12]
+
+    return CourseOutline(
+        course_slug=course_slug,
+        version=digest,
+        modules=outline_modules,
+        lessons_by_id=MappingProxyType({lesson.id: lesson for lesson in ordered}),
+        next_lesson_ids=MappingProxyType(next_ids),
+        prev_lesson_ids=MappingProxyType(prev_ids),
+    )
+
+
+async def load_outline(course_slug: str) -> CourseOutline:
+    """Загружает структуру курса одним запросом"""
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(
+                CourseModule.id, CourseModule.order, CourseModule.title, CourseModule.description,
+                Lesson.id, Lesson.order, Lesson.title,
+                Lesson.estimated_time_minutes, Lesson.is_free,
+            )
+            .outerjoin(Lesson, Lesson.module_id == CourseModule.id)
+            .where(CourseModule.course_slug == course_slug)
+        )
+        rows = result.all()
+    return build_outline(course_slug, rows)
+
+
+class CourseOutlineCache:
+    """Кеш снимков CourseOutline по slug курса с single-flight загрузкой"""
+
+    def __init__(self, ttl: float = 600, loader=load_outline, miss_reload_after: float = 5.0):
+        """
+        Args:
+            ttl: Время жизни снимка в секундах
+            loader: Корутина загрузки снимка по slug
+            miss_reload_after: Снимок моложе этого (с) не перечитывается
+                из-за неизвестного урока — защита БД от перебора ID
+        """
+        self.ttl = ttl
+        self.miss_reload_after = miss_reload_after
+        self._loader = loader
+        self._entries: dict[str, tuple[float, CourseOutline]] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Подписан ли процесс на канал course_outline прямо сейчас
+        self.subscribed = False
+        self.hits = 0
+        self.misses = 0
+        self.miss_reloads = 0
+        self.notifications = 0
+
+    async def get(self, course_slug: str) -> CourseOutline:
+        """Возвращает снимок структуры курса, загружая его при необходимости"""
+        entry = self._entries.get(course_slug)
+        if entry and entry[0] + self.ttl > time.monotonic():
+            self.hits += 1
+            return entry[1]
+
+        inflight = self._inflight.get(course_slug)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[course_slug] = future
+        try:
+            outline = await self._loader(course_slug)
+            self._entries[course_slug] = (time.monotonic(), outline)
+            future.set_result(outline)
+            return outline
+        except BaseException as e:
+            future.set_exception(e)
+            # Исключение получат ожидающие; помечаем как полученное, чтобы не было warning
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(course_slug, None)
+
+    async def get_with_lesson(self, course_slug: str, lesson_id: int) -> CourseOutline:
+        """
+        Снимок структуры курса для страницы урока.
+
+        Если урока в снимке нет, снимок перечитывается один раз: урок мог
+        появиться после загрузки снимка, а уведомление — не дойти.
+
+        Returns:
+            CourseOutline: Снимок; урока в нём может не быть (тогда 404)
+        """
+        outline = await self.get(course_slug)
+        if outline.contains(lesson_id):
+            return outline
+        entry = self._entries.get(course_slug)
+        if entry is not None and entry[0] + self.miss_reload_after > time.monotonic():
+            return outline
+        self.miss_reloads += 1
+        self._entries.pop(course_slug, None)
+        return await self.get(course_slug)
+
+    def invalidate(self, course_slug: str) -> None:
+        """Сбрасывает снимок курса (после генерации или правки структуры)"""
+        self._entries.pop(course_slug, None)
+        logger.info(f"Course outline cache invalidated: {course_slug}")
+
+    def clear(self) -> None:
+        """Сбрасывает снимки всех курсов"""
+        self._entries.clear()
+
+    async def listen(self, stop: asyncio.Event, engine=None, check_interval: float = 30.0) -> None:
+        """
+        Слушает канал course_outline и сбрасывает снимки изменённых курсов.
+
+        Держит одно соединение из пула. Уведомления, отправленные пока
+        соединения не было, теряются, поэтому после каждого подключения
+        сбрасываются все снимки.
+
+        Args:
+            stop: Событие остановки
+            engine: AsyncEngine (по умолчанию — engine приложения)
+            check_interval: Как часто проверять соединение, с
+        """
+        if engine is None:
+            from app.database import engine
+
+        def on_notify(connection, pid, channel, payload) -> None:
+            self.notifications += 1
+            self.invalidate(payload)
+
+        while not stop.is_set():
+            try:
+                async with engine.connect() as conn:
+                    raw = (await conn.get_raw_connection()).driver_connection
+                    await raw.add_listener(CHANNEL, on_notify)
+                    self.clear()
+                    self.subscribed = True
+                    try:
+                        while not stop.is_set():
+                            try:
+                                await asyncio.wait_for(stop.wait(), check_interval)
+                            except TimeoutError:
+                                # Оборванное соединение — исключение и переподключение
+                                await raw.execute("SELECT 1")
+                    finally:
+                        self.subscribed = False
+                        await raw.remove_listener(CHANNEL, on_notify)
+            except Exception as e:
+                logger.warning(f"Course outline listener error: {type(e).__name__}: {e}")
+                try:
+                    await asyncio.wait_for(stop.wait(), check_interval)
+                except TimeoutError:
+                    pass
+
+    def start(self) -> asyncio.Task:
+        """Запускает listen() фоновой задачей текущего event loop"""
+        if self._task is None or self._task.done():
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(
+                self.listen(self._stop), name="course-outline-listener"
+            )
+        return self._task
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """Останавливает фоновую задачу слушателя"""
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except TimeoutError:
+            self._task.cancel()
+        self._task = None
+
+    def stats(self) -> dict:
+        """Снимок счётчиков кеша"""
+        return {
+            "courses": {slug: outline.version for slug, (_, outline) in self._entries.items()},
+            "hits": self.hits,
+            "misses": self.misses,
+            "miss_reloads": self.miss_reloads,
+            "notifications": self.notifications,
+            "subscribed": self.subscribed,
+        }
+
+
+async def publish_outline_change(course_slug: str) -> None:
+    """
+    Сообщает всем процессам, что структура курса изменилась.
+
+    Снимок этого процесса сбрасывается сразу, остальные получают slug
+    через NOTIFY (ошибки только логируются — их снимки перечитаются
+    по TTL или при запросе неизвестного урока).
+    """
+    from app.database import engine
+
+    get_course_outline_cache().invalidate(course_slug)
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": course_slug},
+            )
+    except Exception as e:
+        logger.warning(f"Failed to publish course outline change: {e}")
+
+
+# Глобальный экземпляр кеша
+_outline_cache: Optional[CourseOutlineCache] = None
+
+
+def get_course_outline_cache() -> CourseOutlineCache:
+    """
+    Возвращает глобальный экземпляр CourseOutlineCache.
+
+    Returns:
+        CourseOutlineCache: Кеш структуры курсов
+    """
+    global _outline_cache
+    if _outline_cache is None:
+        _outline_cache = CourseOutlineCache(ttl=float(os.getenv("COURSE_OUTLINE_TTL", "600")))
+    return _outline_cache
@@ -0,0 +1,158 @@
+"""
+Сводный прогресс пользователя по курсу (таблица user_course_progress).
+
+Сводка обновляется в той же транзакции, что и прогресс урока:
+- mark_lesson_completed — переводит урок в "completed" условным UPDATE
+  и, только если статус действительно сменился, увеличивает счётчик
+  завершённых уроков (повторные/параллельные запросы не задваивают его)
+- touch_course_progress — при открытии урока запоминает последний урок;
+  если сводки нет или структура курса изменилась (другая версия
+  CourseOutline), пересчитывает её по уже загруженному прогрессу курса
+
+Списки курсов и профиль читают только сводку — одним запросом.
+"""
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import case, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import UserCourse, UserCourseProgress, UserLessonProgress
+from app.services.course_outline import CourseOutline
+
+
+def progress_percent(completed: int, total: int) -> int:
+    """Процент прохождения (0-100)"""
+    if total <= 0:
+        return 0
+    return min(100, int(completed * 100 / total))
+
+
+async def mark_lesson_completed(
+    db: AsyncSession,
+    user_id: int,
+    lesson_id: int,
+    outline: CourseOutline,
+) -> bool:
+    """
+    Отмечает урок завершённым и обновляет сводку курса. Коммит — за вызывающим.
+
+    Args:
+        db: Сессия БД (транзакция вызывающего)
+        user_id: ID пользователя
+        lesson_id: ID урока (должен входить в outline)
+        outline: Структура курса
+
+    Returns:
+        True, если урок был завершён этим вызовом
+    """
+    now = datetime.utcnow()
+    result = await db.execute(
+        update(UserLessonProgress)
+        .where(
+            UserLessonProgress.user_id == user_id,
+            UserLessonProgress.lesson_id == lesson_id,
+            UserLessonProgress.status != "completed",
+        )
+        .values(status="completed", completed_at=now)
+        .execution_options(synchronize_session="fetch")
+    )
+    if result.rowcount == 0:
+        return False
+
+    total = outline.total_lessons
+    completed = func.least(UserCourseProgress.completed_lessons + 1, total)
+    stmt = insert(UserCourseProgress).values(
+        user_id=user_id,
+        course_slug=outline.course_slug,
+        completed_lessons=1,
+        total_lessons=total,
+        progress_percent=progress_percent(1, total),
+        last_lesson_id=lesson_id,
+        last_accessed_at=now,
+        outline_version=outline.version,
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserCourseProgress.user_id, UserCourseProgress.course_slug],
+        set_={
+            "completed_lessons": completed,
+            "total_lessons": total,
+            "progress_percent": completed * 100 // max(total, 1),
+            "last_lesson_id": lesson_id,
+            "last_accessed_at": now,
+        },
+    ))
+    return True
+
+
+async def touch_course_progress(
+    db: AsyncSession,
+    user_id: int,
+    lesson_id: int,
+    outline: CourseOutline,
+    completed_lessons: int,
+) -> None:
+    """
+    Запоминает последний открытый урок. Коммит — за вызывающим.
+
+    Args:
+        db: Сессия БД
+        user_id: ID пользователя
+        lesson_id: Открытый урок
+        outline: Структура курса
+        completed_lessons: Число завершённых уроков курса (по прогрессу,
+            уже загруженному страницей) — используется, только если
+            сводки ещё нет или она посчитана по другой версии курса
+    """
+    now = datetime.utcnow()
+    total = outline.total_lessons
+    stmt = insert(UserCourseProgress).values(
+        user_id=user_id,
+        course_slug=outline.course_slug,
+        completed_lessons=completed_lessons,
+        total_lessons=total,
+        progress_percent=progress_percent(completed_lessons, total),
+        last_lesson_id=lesson_id,
+        last_accessed_at=now,
+        outline_version=outline.version,
+    )
+    stale = UserCourseProgress.outline_version.is_distinct_from(stmt.excluded.outline_version)
+
+    def refresh(column: str):
+        return case((stale, stmt.excluded[column]), else_=UserCourseProgress.__table__.c[column])
+
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[UserCourseProgress.user_id, UserCourseProgress.course_slug],
+        set_={
+            "completed_lessons": refresh("completed_lessons"),
+            "total_lessons": refresh("total_lessons"),
+            "progress_percent": refresh("progress_percent"),
+            "outline_version": stmt.excluded.outline_version,
+            "last_lesson_id": lesson_id,
+            "last_accessed_at": now,
+        },
+    ))
+
+
+async def get_purchased_courses_with_progress(
+    db: AsyncSession,
+    user_id: int,
+) -> list[tuple[UserCourse, Optional[UserCourseProgress]]]:
+    """
+    Купленные курсы пользователя вместе со сводкой прогресса (один запрос).
+
+    Returns:
+        Список пар (UserCourse, UserCourseProgress или None), новые покупки первыми
+    """
+    result = await db.execute(
+        select(UserCourse, UserCourseProgress)
+        .outerjoin(
+            UserCourseProgress,
+            (UserCourseProgress.user_id == UserCourse.user_id)
+            & (UserCourseProgress.course_slug == UserCourse.course_slug),
+        )
+        .where(UserCourse.user_id == user_id)
+        .order_by(UserCourse.purchased_at.desc())
+    )
+    return [(row[0], row[1]) for row in result.all()]
@@ -1,19 +1,40 @@
 """
 Сервис для отправки email через SMTP.
 Поддерживает Yandex, Gmail, Mail.ru и другие SMTP серверы.
+
+Письма отправляет EmailDelivery: небольшой пул постоянных SMTP-соединений
+(TCP, TLS и AUTH — один раз на соединение, а не на письмо) и asyncio-очередь
+с back-pressure перед ним. Всплеск регистраций не открывает по соединению
+на письмо, а встаёт в очередь к уже авторизованным соединениям.
+
+Письма собираются из заранее скомпилированных шаблонов templates/emails/
+(app/services/email_templates.py).
+
+Бенчмарк против локального SMTP (aiosmtpd):
+    python -m benchmarks.bench_email_delivery --messages 200
 """
-import os
-import smtplib
-import random
 import asyncio
+import random
+import smtplib
+import time
+from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from dataclasses import dataclass
+from email.message import Message
 from typing import Optional
+
 from loguru import logger
 
-# Thread pool для выполнения синхронных SMTP операций
-_executor = ThreadPoolExecutor(max_workers=3)
+from app.config import Settings
+from app.services.email_templates import get_email_templates
+from app.services.passwords import _percentile
+
+# Сколько последних замеров хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+# Ошибки, после которых соединение переоткрывается и письмо отправляется ещё раз:
+# сервер закрыл соединение (простой, лимит сессии) до того, как принял письмо
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError)
 
 
 def generate_verification_code() -> str:
@@ -26,197 +47,318 @@ def generate_verification_code() -> str:
     return ''.join([str(random.randint(0, 9)) for _ in range(6)])
 
 
-def _send_email_sync(email: str, code: str, username: str = "") -> bool:
-    """
-    Синхронная функция отправки email.
-    Вызывается из async функции через ThreadPoolExecutor.
-    """
-    try:
-        # Получаем настройки SMTP из переменных окружения
-        smtp_host = os.getenv("SMTP_HOST", "smtp.yandex.ru")
-        smtp_port = int(os.getenv("SMTP_PORT", "465"))
-        smtp_user = os.getenv("SMTP_USER")
-        smtp_password = os.getenv("SMTP_PASSWORD")
-        smtp_from_name = os.getenv("SMTP_FROM_NAME", "Нейромагия")
-        # ВАЖНО: From должен точно совпадать с smtp_user для Яндекса
-        smtp_from_email = smtp_user
-
-        if not smtp_user or not smtp_password:
-            logger.error("SMTP credentials not configured in .env")
-            return False
+class EmailDeliveryError(Exception):
+    """Письмо не отправлено не по вине SMTP-сервера (не настроен, сервис остановлен)"""
 
-        # Создаем сообщение
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f'Код подтверждения регистрации на Нейромагии: {code}'
-        # Яндекс требует простой формат From без имени отправителя
-        msg['From'] = smtp_from_email
-        msg['To'] = email
 
-        # HTML версия письма
-        html_body = _get_email_html_template(code, username)
+@dataclass(frozen=True)
+class SMTPConfig:
+    """Параметры SMTP-сервера"""
+    host: str
+    port: int
+    user: str
+    password: str
+    # "ssl" (SMTP_SSL), "starttls" или "none" (только для локального сервера)
+    security: str = "ssl"
+    timeout: float = 10.0
 
-        # Текстовая версия (запасной вариант)
-        text_body = f"""
-Добро пожаловать в Нейромагию!
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "SMTPConfig":
+        security = settings.smtp_security or ("ssl" if settings.smtp_port == 465 else "starttls")
+        return cls(
+            settings.smtp_host, settings.smtp_port,
+            settings.smtp_user, settings.smtp_password, security,
+        )
 
-Ваш код подтверждения: {code}
+    @property
+    def configured(self) -> bool:
+        return bool(self.user and self.password)
 
-Код действителен в течение 10 минут.
 
-Если вы не регистрировались на сайте Нейромагия, просто проигнорируйте это письмо.
+class SMTPConnection:
+    """
+    Постоянное авторизованное SMTP-соединение.
 
----
-С уважением,
-Команда Нейромагия
-https://neuromagicai.ru
-        """
+    Используется одним воркером EmailDelivery (в его потоке), поэтому
+    без блокировок. Соединение открывается лениво и переоткрывается:
+    - после idle_timeout секунд простоя (серверы закрывают такие соединения),
+    - после max_messages писем (лимит писем на сессию у почтовых сервисов),
+    - если сервер разорвал соединение во время отправки (письмо повторяется один раз).
+    """
 
-        # Прикрепляем обе версии
-        part1 = MIMEText(text_body, 'plain', 'utf-8')
-        part2 = MIMEText(html_body, 'html', 'utf-8')
-        msg.attach(part1)
-        msg.attach(part2)
-
-        # Отправляем письмо
-        if smtp_port == 465:
-            # SSL соединение
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10) as server:
-                server.set_debuglevel(0)
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
+    def __init__(self, config: SMTPConfig, idle_timeout: float = 30.0, max_messages: int = 100):
+        self.config = config
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self._server: Optional[smtplib.SMTP] = None
+        self._messages = 0
+        self._last_used = 0.0
+        self.connects = 0
+        self.reconnects = 0
+
+    def _connect(self) -> None:
+        config = self.config
+        if config.security == "ssl":
+            server = smtplib.SMTP_SSL(config.host, config.port, timeout=config.timeout)
         else:
-            # STARTTLS соединение (порт 587 или 25)
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as server:
-                server.set_debuglevel(0)
+            server = smtplib.SMTP(config.host, config.port, timeout=config.timeout)
+            if config.security == "starttls":
                 server.ehlo()
                 server.starttls()
                 server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
+        try:
+            server.login(config.user, config.password)
+        except Exception:
+            server.close()
+            raise
+        self._server = server
+        self._messages = 0
+        self.connects += 1
+
+    def send(self, message: Message) -> None:
+        """Отправляет письмо (блокирующий вызов, выполняется в потоке пула)"""
+        idle = time.monotonic() - self._last_used >= self.idle_timeout
+        if self._server is not None and (idle or self._messages >= self.max_messages):
+            self.close()
+        if self._server is None:
+            self._connect()
+        try:
+            self._server.send_message(message)
+        except RECONNECT_ERRORS as e:
+            logger.warning(f"SMTP connection lost ({type(e).__name__}: {e}), reconnecting")
+            self.reconnects += 1
+            self.close()
+            self._connect()
+            self._server.send_message(message)
+        except smtplib.SMTPRecipientsRefused:
+            # Адрес отклонён, smtplib уже сбросил сессию (RSET) — соединение живо
+            self._last_used = time.monotonic()
+            raise
+        except Exception:
+            # Состояние сессии после ошибки неизвестно —
+            # следующее письмо пойдёт по новому соединению
+            self.close()
+            raise
+        self._messages += 1
+        self._last_used = time.monotonic()
+
+    def close(self) -> None:
+        """Закрывает соединение (QUIT, если сервер ещё отвечает)"""
+        server, self._server = self._server, None
+        if server is None:
+            return
+        try:
+            server.quit()
+        except Exception:
+            server.close()
+
+
+class EmailDelivery:
+    """
+    Очередь писем и пул постоянных SMTP-соединений.
 
-        logger.info(f"Verification email sent to {email}")
-        return True
+    Пример:
+        delivery = EmailDelivery(SMTPConfig.from_settings(Settings()))
+        sent = await delivery.send(message)  # ждёт места в очереди и результата отправки
+        await delivery.aclose()  # при остановке сервера
 
-    except Exception as e:
-        error_msg = f"Failed to send email to {email}: {str(e)}"
-        logger.error(error_msg)
-        print(f"[EMAIL ERROR] {error_msg}")  # Вывод в консоль
-        print(f"[EMAIL ERROR] Exception type: {type(e).__name__}")
-        print(f"[EMAIL ERROR] SMTP settings: host={smtp_host}, port={smtp_port}, user={smtp_user}")
-        import traceback
-        traceback.print_exc()  # Полный traceback в консоль
-        return False
+    Каждое соединение обслуживает свой воркер (asyncio-задача): берёт
+    письмо из очереди и отправляет его в выделенном пуле потоков
+    (smtplib блокирующий). Очередь ограничена queue_size: когда она
+    полна, send() ждёт места — back-pressure вместо растущего хвоста.
+    """
 
+    def __init__(
+        self,
+        config: SMTPConfig,
+        connections: int = 3,
+        queue_size: int = 200,
+        idle_timeout: float = 30.0,
+        max_messages: int = 100,
+    ):
+        """
+        Args:
+            config: Параметры SMTP-сервера
+            connections: Сколько постоянных соединений (и потоков отправки) держать
+            queue_size: Максимум писем в очереди
+            idle_timeout: Через сколько секунд простоя соединение переоткрывается
+            max_messages: Писем на одно соединение, затем оно переоткрывается
+        """
+        self.config = config
+        self.connections = [
+            SMTPConnection(config, idle_timeout, max_messages) for _ in range(connections)
+        ]
+        self.queue_size = queue_size
+        self._executor = ThreadPoolExecutor(max_workers=connections, thread_name_prefix="smtp")
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: list[asyncio.Task] = []
+        self._sent = 0
+        self._failed = 0
+        self._max_queued = 0
+        self._wait_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._send_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def _start(self) -> asyncio.Queue:
+        """Запускает воркеры при первой отправке (нужен работающий event loop)"""
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._workers = [
+                asyncio.create_task(self._worker(connection), name=f"smtp-worker-{index}")
+                for index, connection in enumerate(self.connections)
+            ]
+        return self._queue
+
+    async def send(self, message: Message) -> bool:
+        """
+        Ставит письмо в очередь и ждёт результата отправки.
 
-def _get_email_html_template(code: str, username: str = "") -> str:
-    """
-    Генерирует красивый HTML шаблон письма с кодом верификации.
+        Returns:
+            bool: True если письмо принято SMTP-сервером
+        """
+        try:
+            await self.deliver(message)
+        except Exception:
+            return False
+        return True
 
-    Args:
-        code: 6-значный код верификации
-        username: Имя пользователя
+    async def deliver(self, message: Message) -> None:
+        """
+        Как send(), но ошибка отправки пробрасывается (нужна для повторов из outbox).
 
-    Returns:
-        str: HTML контент письма
+        Raises:
+            EmailDeliveryError: SMTP не настроен или отправка остановлена
+            smtplib.SMTPException, OSError: ошибка SMTP-сервера или сети
+        """
+        if not self.config.configured:
+            logger.error("SMTP credentials not configured in .env")
+            raise EmailDeliveryError("SMTP credentials not configured")
+        if message['From'] is None:
+            # Яндекс требует, чтобы From точно совпадал с SMTP_USER и был без имени отправителя
+            message['From'] = self.config.user
+        queue = self._start()
+        result = asyncio.get_running_loop().create_future()
+        await queue.put((message, result, time.perf_counter()))
+        self._max_queued = max(self._max_queued, queue.qsize())
+        await result
+
+    async def _worker(self, connection: SMTPConnection) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message, result, queued_at = await self._queue.get()
+            started = time.perf_counter()
+            self._wait_ms.append((started - queued_at) * 1000)
+            error = None
+            try:
+                await loop.run_in_executor(self._executor, connection.send, message)
+                self._sent += 1
+            except asyncio.CancelledError:
+                # Остановка сервиса: отправитель не должен ждать вечно
+                if not result.done():
+                    result.set_exception(EmailDeliveryError("Email delivery stopped"))
+                raise
+            except Exception as e:
+                self._failed += 1
+                logger.error(f"Failed to send email to {message['To']}: {type(e).__name__}: {e}")
+                error = e
+            finally:
+                self._send_ms.append((time.perf_counter() - started) * 1000)
+                self._queue.task_done()
+            if not result.done():
+                if error is None:
+                    result.set_result(None)
+                else:
+                    result.set_exception(error)
+
+    async def aclose(self, timeout: float = 10.0) -> None:
+        """Дожидается отправки очереди (не дольше timeout), закрывает соединения"""
+        if self._queue is not None:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except TimeoutError:
+                logger.warning(
+                    f"Email queue not drained on shutdown: {self._queue.qsize()} messages dropped"
+                )
+            for worker in self._workers:
+                worker.cancel()
+            await asyncio.gather(*self._workers, return_exceptions=True)
+            while not self._queue.empty():
+                _, result, _ = self._queue.get_nowait()
+                if not result.done():
+                    result.set_exception(EmailDeliveryError("Email delivery stopped"))
+            self._queue, self._workers = None, []
+        loop = asyncio.get_running_loop()
+        for connection in self.connections:
+            await loop.run_in_executor(self._executor, connection.close)
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        """Снимок метрик отправки"""
+        def summary(samples) -> dict:
+            ordered = sorted(samples)
+            return {
+                "p50": round(_percentile(ordered, 50), 1),
+                "p95": round(_percentile(ordered, 95), 1),
+            }
+
+        return {
+            "connections": len(self.connections),
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queued": self._max_queued,
+            "queue_size": self.queue_size,
+            "sent": self._sent,
+            "failed": self._failed,
+            "connects": sum(connection.connects for connection in self.connections),
+            "reconnects": sum(connection.reconnects for connection in self.connections),
+            "wait_ms": summary(self._wait_ms),
+            "send_ms": summary(self._send_ms),
+        }
+
+
+# Глобальный экземпляр сервиса
+_email_delivery: Optional[EmailDelivery] = None
+
+
+def get_email_delivery() -> EmailDelivery:
     """
-    greeting = f"Здравствуйте, {username}!" if username else "Здравствуйте!"
-
-    return f"""
-<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Код подтверждения</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);">
-    <table width="100%" cellpadding="0" cellspacing="0" style="min-height: 100vh;">
-        <tr>
-            <td align="center" style="padding: 40px 20px;">
-                <!-- Главный контейнер -->
-                <table width="600" cellpadding="0" cellspacing="0" style="background: white; border-radius: 16px; box-shadow: 0 20px 60px rgba(0,0,0,0.3); overflow: hidden;">
-                    <!-- Шапка с градиентом -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px; text-align: center;">
-                            <h1 style="margin: 0; color: white; font-size: 32px; font-weight: 700; text-shadow: 0 2px 4px rgba(0,0,0,0.2);">
-                                ✨ Нейромагия
-                            </h1>
-                            <p style="margin: 10px 0 0; color: rgba(255,255,255,0.9); font-size: 16px;">
-                                Магия искусственного интеллекта
-                            </p>
-                        </td>
-                    </tr>
-
-                    <!-- Основной контент -->
-                    <tr>
-                        <td style="padding: 40px;">
-                            <h2 style="margin: 0 0 20px; color: #1a202c; font-size: 24px; font-weight: 600;">
-                                {greeting}
-                            </h2>
-
-                            <p style="margin: 0 0 30px; color: #4a5568; font-size: 16px; line-height: 1.6;">
-                                Спасибо за регистрацию на платформе <strong>Нейромагия</strong>!
-                                Чтобы подтвердить свой email, введите код ниже:
-                            </p>
-
-                            <!-- Код верификации -->
-                            <table width="100%" cellpadding="0" cellspacing="0">
-                                <tr>
-                                    <td align="center" style="padding: 30px 0;">
-                                        <div style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); border-radius: 12px; padding: 3px;">
-                                            <div style="background: white; border-radius: 10px; padding: 20px 40px;">
-                                                <span style="font-size: 42px; font-weight: 700; color: #667eea; letter-spacing: 8px; font-family: 'Courier New', monospace;">
-                                                    {code}
-                                                </span>
-                                            </div>
-                                        </div>
-                                    </td>
-                                </tr>
-                            </table>
-
-                            <p style="margin: 30px 0 0; color: #718096; font-size: 14px; line-height: 1.6;">
-                                ⏰ Код действителен в течение <strong>10 минут</strong>
-                            </p>
-
-                            <div style="margin-top: 40px; padding-top: 30px; border-top: 2px solid #e2e8f0;">
-                                <p style="margin: 0 0 10px; color: #718096; font-size: 14px;">
-                                    Если вы не регистрировались на сайте Нейромагия, просто проигнорируйте это письмо.
-                                </p>
-                            </div>
-                        </td>
-                    </tr>
-
-                    <!-- Подвал -->
-                    <tr>
-                        <td style="background: #f7fafc; padding: 30px; text-align: center; border-top: 1px solid #e2e8f0;">
-                            <p style="margin: 0 0 10px; color: #4a5568; font-size: 14px;">
-                                С уважением,<br>
-                                <strong>Команда Нейромагия</strong>
-                            </p>
-                            <p style="margin: 15px 0 0; color: #a0aec0; font-size: 12px;">
-                                <a href="https://neuromagicai.ru" style="color: #667eea; text-decoration: none;">neuromagicai.ru</a> •
-                                <a href="mailto:hello@neuro-magic.ru" style="color: #667eea; text-decoration: none;">hello@neuro-magic.ru</a>
-                            </p>
-                        </td>
-                    </tr>
-                </table>
-
-                <!-- Копирайт -->
-                <p style="margin-top: 30px; color: rgba(255,255,255,0.8); font-size: 12px; text-align: center;">
-                    © 2025 Нейромагия. Все права защищены.
-                </p>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
+    Возвращает глобальный экземпляр EmailDelivery.
+
+    Returns:
+        EmailDelivery: Очередь и пул SMTP-соединений
     """
+    global _email_delivery
+    if _email_delivery is None:
+        settings = Settings()
+        _email_delivery = EmailDelivery(
+            SMTPConfig.from_settings(settings),
+            connections=settings.email_smtp_connections,
+            queue_size=settings.email_queue_size,
+            idle_timeout=settings.email_smtp_idle_timeout,
+            max_messages=settings.email_smtp_max_messages,
+        )
+    return _email_delivery
+
+
+async def close_email_delivery() -> None:
+    """Отправляет оставшиеся письма и закрывает соединения (при остановке сервера)"""
+    global _email_delivery
+    if _email_delivery is not None:
+        await _email_delivery.aclose()
+        _email_delivery = None
+
+
+def _build_verification_message(email: str, code: str, username: str = "") -> Message:
+    """Письмо с кодом подтверждения регистрации"""
+    return get_email_templates().message(
+        "verification",
+        email,
+        {"code": code, "username": username},
+        context={"has_name": bool(username)},
+    )
 
 
 async def send_verification_email(email: str, code: str, username: str = "") -> bool:
     """
-    Async обертка для отправки email с кодом верификации.
-    Выполняет синхронную SMTP операцию в отдельном потоке.
+    Отправляет email с кодом верификации через очередь EmailDelivery.
 
     Args:
         email: Email получателя
@@ -226,264 +368,97 @@ async def send_verification_email(email: str, code: str, username: str = "") ->
     Returns:
         bool: True если отправлено успешно, False в случае ошибки
     """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(_executor, _send_email_sync, email, code, username)
-
-
-def _send_purchase_email_sync(email: str, username: str, course_title: str, course_id: str, amount: float) -> bool:
-    """
-    Синхронная функция отправки email о покупке курса.
-    Вызывается из async функции через ThreadPoolExecutor.
-    """
-    try:
-        # Получаем настройки SMTP из переменных окружения
-        smtp_host = os.getenv("SMTP_HOST", "smtp.yandex.ru")
-        smtp_port = int(os.getenv("SMTP_PORT", "465"))
-        smtp_user = os.getenv("SMTP_USER")
-        smtp_password = os.getenv("SMTP_PASSWORD")
-        smtp_from_email = smtp_user
-
-        if not smtp_user or not smtp_password:
-            logger.error("SMTP credentials not configured in .env")
-            return False
-
-        # Создаем сообщение
-        msg = MIMEMultipart('alternative')
-        msg['Subject'] = f'Вы приобрели курс "{course_title}" на Нейромагии!'
-        msg['From'] = smtp_from_email
-        msg['To'] = email
-
-        # HTML версия письма
-        html_body = _get_purchase_email_html_template(username, course_title, course_id, amount)
-
-        # Текстовая версия (запасной вариант)
-        text_body = f"""
-Поздравляем, {username}!
-
-Вы успешно приобрели курс "{course_title}" на платформе Нейромагия!
-
-Сумма покупки: {amount:.2f} руб.
-
-Что дальше?
-1. Войдите в личный кабинет на сайте neuromagicai.ru
-2. Перейдите в раздел "Мои курсы"
-3. Начните обучение прямо сейчас!
-
-Чек об оплате был отправлен на ваш email отдельным письмом.
-
-Если у вас возникнут вопросы, пишите нам на hello@neuro-magic.ru
-
----
-С уважением,
-Команда Нейромагия
-https://neuromagicai.ru
-        """
-
-        # Прикрепляем обе версии
-        part1 = MIMEText(text_body, 'plain', 'utf-8')
-        part2 = MIMEText(html_body, 'html', 'utf-8')
-        msg.attach(part1)
-        msg.attach(part2)
-
-        # Отправляем письмо
-        if smtp_port == 465:
-            with smtplib.SMTP_SSL(smtp_host, smtp_port, timeout=10) as server:
-                server.set_debuglevel(0)
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
-        else:
-            with smtplib.SMTP(smtp_host, smtp_port, timeout=10) as server:
-                server.set_debuglevel(0)
-                server.ehlo()
-                server.starttls()
-                server.ehlo()
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
-
-        logger.info(f"Purchase confirmation email sent to {email}")
-        return True
-
-    except Exception as e:
-        logger.error(f"Failed to send purchase email to {email}: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        return False
+    sent = await get_email_delivery().send(_build_verification_message(email, code, username))
+    if sent:
+        logger.info(f"Verification email sent to {email}")
+    return sent
+
+
+# Что получает покупатель курса (в письме о покупке)
+COURSE_BENEFITS = {
+    "chatgpt-basics": (
+        "10+ видео-уроков о работе с ChatGPT",
+        "Практические задания и примеры",
+        "Готовые шаблоны промптов",
+        "Сертификат о прохождении курса",
+    ),
+    "prompt-engineering": (
+        "15+ уроков по промпт-инжинирингу",
+        "Продвинутые техники работы с AI",
+        "Библиотека из 100+ промптов",
+        "Сертификат о прохождении курса",
+    ),
+    "midjourney-master": (
+        "20+ уроков по Midjourney",
+        "Создание профессиональных изображений",
+        "Секретные параметры и настройки",
+        "Сертификат о прохождении курса",
+    ),
+}
+DEFAULT_COURSE_BENEFITS = (
+    "Доступ к видео-урокам",
+    "Практические задания",
+    "Поддержка преподавателя",
+    "Сертификат о прохождении",
+)
+
+
+def _build_purchase_message(
+    email: str, username: str, course_title: str, course_id: str, amount: float
+) -> Message:
+    """Письмо о покупке курса (вариант шаблона компилируется на курс)"""
+    return get_email_templates().message(
+        "purchase",
+        email,
+        {"username": username, "course_title": course_title, "amount": f"{amount:.2f}"},
+        context={
+            "course_id": course_id,
+            "benefits": COURSE_BENEFITS.get(course_id, DEFAULT_COURSE_BENEFITS),
+        },
+    )
 
 
-def _get_purchase_email_html_template(username: str, course_title: str, course_id: str, amount: float) -> str:
+async def send_purchase_email(email: str, username: str, course_title: str, course_id: str, amount: float) -> bool:
     """
-    Генерирует красивый HTML шаблон письма о покупке курса.
+    Отправляет email о покупке курса через очередь EmailDelivery.
 
     Args:
+        email: Email получателя
         username: Имя пользователя
         course_title: Название курса
         course_id: ID курса
-        amount: Сумма покупки
+        amount: Сумма покупки в рублях
 
     Returns:
-        str: HTML контент письма
-    """
-    # Определяем что пользователь получит в курсе (можно расширить)
-    course_benefits = {
-        "chatgpt-basics": [
-            "10+ видео-уроков о работе с ChatGPT",
-            "Практические задания и примеры",
-            "Готовые шаблоны промптов",
-            "Сертификат о прохождении курса"
-        ],
-        "prompt-engineering": [
-            "15+ уроков по промпт-инжинирингу",
-            "Продвинутые техники работы с AI",
-            "Библиотека из 100+ промптов",
-            "Сертификат о прохождении курса"
-        ],
-        "midjourney-master": [
-            "20+ уроков по Midjourney",
-            "Создание профессиональных изображений",
-            "Секретные параметры и настройки",
-            "Сертификат о прохождении курса"
-        ],
-    }
-
-    benefits = course_benefits.get(course_id, [
-        "Доступ к видео-урокам",
-        "Практические задания",
-        "Поддержка преподавателя",
-        "Сертификат о прохождении"
-    ])
-
-    benefits_html = "".join([f"<li style='margin: 10px 0; color: #4a5568; font-size: 16px;'>✓ {benefit}</li>" for benefit in benefits])
-
-    return f"""
-<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Покупка курса</title>
-</head>
-<body style="margin: 0; padding: 0; font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial, sans-serif; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);">
-    <table width="100%" cellpadding="0" cellspacing="0" style="min-height: 100vh;">
-        <tr>
-            <td align="center" style="padding: 40px 20px;">
-                <!-- Главный контейнер -->
-                <table width="600" cellpadding="0" cellspacing="0" style="background: white; border-radius: 16px; box-shadow: 0 20px 60px rgba(0,0,0,0.3); overflow: hidden;">
-                    <!-- Шапка с градиентом -->
-                    <tr>
-                        <td style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); padding: 40px; text-align: center;">
-                            <h1 style="margin: 0; color: white; font-size: 32px; font-weight: 700; text-shadow: 0 2px 4px rgba(0,0,0,0.2);">
-                                🎉 Поздравляем!
-                            </h1>
-                            <p style="margin: 10px 0 0; color: rgba(255,255,255,0.9); font-size: 18px;">
-                                Вы приобрели курс на Нейромагии
-                            </p>
-                        </td>
-                    </tr>
-
-                    <!-- Основной контент -->
-                    <tr>
-                        <td style="padding: 40px;">
-                            <h2 style="margin: 0 0 10px; color: #1a202c; font-size: 24px; font-weight: 600;">
-                                Здравствуйте, {username}!
-                            </h2>
-
-                            <p style="margin: 0 0 30px; color: #4a5568; font-size: 16px; line-height: 1.6;">
-                                Спасибо за покупку! Вы успешно приобрели курс:
-                            </p>
-
-                            <!-- Карточка курса -->
-                            <div style="background: linear-gradient(135deg, #f7fafc 0%, #edf2f7 100%); border-radius: 12px; padding: 25px; margin: 0 0 30px;">
-                                <h3 style="margin: 0 0 10px; color: #667eea; font-size: 20px; font-weight: 600;">
-                                    {course_title}
-                                </h3>
-                                <p style="margin: 0; color: #718096; font-size: 16px;">
-                                    Сумма покупки: <strong style="color: #667eea;">{amount:.2f} руб.</strong>
-                                </p>
-                            </div>
-
-                            <!-- Что вас ждет -->
-                            <h3 style="margin: 0 0 20px; color: #1a202c; font-size: 20px; font-weight: 600;">
-                                🚀 Что вас ждет:
-                            </h3>
-                            <ul style="margin: 0 0 30px; padding: 0 0 0 20px; list-style: none;">
-                                {benefits_html}
-                            </ul>
-
-                            <!-- Как начать -->
-                            <div style="background: #f0fdf4; border-left: 4px solid #10b981; border-radius: 8px; padding: 20px; margin: 0 0 30px;">
-                                <h4 style="margin: 0 0 15px; color: #065f46; font-size: 18px; font-weight: 600;">
-                                    📚 Как начать обучение:
-                                </h4>
-                                <ol style="margin: 0; padding: 0 0 0 20px; color: #065f46;">
-                                    <li style="margin: 8px 0;">Войдите в личный кабинет на <a href="https://neuromagicai.ru" style="color: #667eea; text-decoration: none;">neuromagicai.ru</a></li>
-                                    <li style="margin: 8px 0;">Перейдите в раздел "Мои курсы"</li>
-                                    <li style="margin: 8px 0;">Начните обучение прямо сейчас!</li>
-                                </ol>
-                            </div>
-
-                            <!-- Кнопка -->
-                            <table width="100%" cellpadding="0" cellspacing="0">
-                                <tr>
-                                    <td align="center" style="padding: 20px 0;">
-                                        <a href="https://neuromagicai.ru/courses/{course_id}" style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; text-decoration: none; padding: 15px 40px; border-radius: 8px; font-size: 16px; font-weight: 600; box-shadow: 0 4px 12px rgba(102, 126, 234, 0.3);">
-                                            Начать обучение →
-                                        </a>
-                                    </td>
-                                </tr>
-                            </table>
-
-                            <div style="margin-top: 30px; padding-top: 25px; border-top: 2px solid #e2e8f0;">
-                                <p style="margin: 0 0 10px; color: #718096; font-size: 14px;">
-                                    📧 Чек об оплате был отправлен на ваш email отдельным письмом от ЮKassa.
-                                </p>
-                                <p style="margin: 10px 0 0; color: #718096; font-size: 14px;">
-                                    💬 Если у вас возникнут вопросы, пишите нам на <a href="mailto:hello@neuro-magic.ru" style="color: #667eea; text-decoration: none;">hello@neuro-magic.ru</a>
-                                </p>
-                            </div>
-                        </td>
-                    </tr>
-
-                    <!-- Подвал -->
-                    <tr>
-                        <td style="background: #f7fafc; padding: 30px; text-align: center; border-top: 1px solid #e2e8f0;">
-                            <p style="margin: 0 0 10px; color: #4a5568; font-size: 14px;">
-                                С уважением,<br>
-                                <strong>Команда Нейромагия</strong>
-                            </p>
-                            <p style="margin: 15px 0 0; color: #a0aec0; font-size: 12px;">
-                                <a href="https://neuromagicai.ru" style="color: #667eea; text-decoration: none;">neuromagicai.ru</a> •
-                                <a href="mailto:hello@neuro-magic.ru" style="color: #667eea; text-decoration: none;">hello@neuro-magic.ru</a>
-                            </p>
-                        </td>
-                    </tr>
-                </table>
-
-                <!-- Копирайт -->
-                <p style="margin-top: 30px; color: rgba(255,255,255,0.8); font-size: 12px; text-align: center;">
-                    © 2025 Нейромагия. Все права защищены.
-                </p>
-            </td>
-        </tr>
-    </table>
-</body>
-</html>
+        bool: True если отправлено успешно, False в случае ошибки
     """
+    message = _build_purchase_message(email, username, course_title, course_id, amount)
+    sent = await get_email_delivery().send(message)
+    if sent:
+        logger.info(f"Purchase confirmation email sent to {email}")
+    return sent
 
 
-async def send_purchase_email(email: str, username: str, course_title: str, course_id: str, amount: float) -> bool:
+# Виды писем для отложенной отправки (email_outbox): kind → сборщик письма по (email, **payload)
+EMAIL_BUILDERS = {
+    "verification": _build_verification_message,
+    "purchase": _build_purchase_message,
+}
+
+
+def build_email(kind: str, email: str, payload: dict) -> Message:
     """
-    Async обертка для отправки email о покупке курса.
-    Выполняет синхронную SMTP операцию в отдельном потоке.
+    Собирает письмо заданного вида.
 
     Args:
+        kind: Вид письма (ключ EMAIL_BUILDERS)
         email: Email получателя
-        username: Имя пользователя
-        course_title: Название курса
-        course_id: ID курса
-        amount: Сумма покупки в рублях
+        payload: Аргументы сборщика (код, имя, курс...)
 
-    Returns:
-        bool: True если отправлено успешно, False в случае ошибки
+    Raises:
+        ValueError: Неизвестный вид письма
     """
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(_executor, _send_purchase_email_sync, email, username, course_title, course_id, amount)
+    builder = EMAIL_BUILDERS.get(kind)
+    if builder is None:
+        raise ValueError(f"Unknown email kind: {kind}")
+    return builder(email, **payload)
@@ -0,0 +1,265 @@
+"""
+Transactional outbox для писем.
+
+Роут не отправляет письмо сам: enqueue_email() добавляет строку в
+email_outbox в сессию вызывающего, и она коммитится вместе с данными
+(код верификации записан ⇔ письмо с ним стоит в очереди). Ответ
+пользователю не ждёт SMTP.
+
+EmailDispatcher (фоновая задача каждого процесса приложения, на общем
+OutboxWorker) забирает пачки готовых писем с арендой и SKIP LOCKED,
+отправляет их через пул SMTP-соединений (EmailDelivery) и пишет результат:
+    "sent"      — принято SMTP-сервером
+    "pending"   — ошибка, следующая попытка через экспоненциальную паузу
+    "failed"    — исчерпаны попытки
+    "cancelled" — письмо устарело (expires_at) или заменено новым кодом
+
+Гарантия — «хотя бы один раз»: если процесс умер между отправкой и
+записью статуса, письмо после окончания аренды (locked_until) уйдёт ещё раз.
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import Settings
+from app.database import AsyncSessionLocal
+from app.models import EmailOutbox
+from app.services.email import EMAIL_BUILDERS, EmailDelivery, build_email, get_email_delivery
+from app.services.outbox_worker import (
+    OutboxWorker,
+    claim_rows,
+    error_text,
+    finish_rows,
+    retry_delay,
+)
+
+FINAL_STATUSES = ("sent", "failed", "cancelled")
+
+
+def enqueue_email(
+    db: AsyncSession,
+    kind: str,
+    recipient: str,
+    payload: dict,
+    expires_at: Optional[datetime] = None,
+) -> EmailOutbox:
+    """
+    Добавляет письмо в outbox в сессии вызывающего (коммит — его).
+
+    Args:
+        db: Сессия, в транзакции которой пишутся данные письма
+        kind: Вид письма (ключ EMAIL_BUILDERS)
+        recipient: Email получателя
+        payload: Аргументы сборщика письма
+        expires_at: После этого момента письмо не отправляется
+
+    Returns:
+        EmailOutbox: Строка outbox (id появится после flush/commit)
+    """
+    if kind not in EMAIL_BUILDERS:
+        raise ValueError(f"Unknown email kind: {kind}")
+    now = datetime.utcnow()
+    message = EmailOutbox(
+        kind=kind,
+        recipient=recipient,
+        payload=payload,
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+        expires_at=expires_at,
+    )
+    db.add(message)
+    return message
+
+
+async def cancel_pending_emails(db: AsyncSession, recipient: str, kind: str) -> int:
+    """
+    Отменяет ещё не отправленные письма вида kind получателю (в сессии вызывающего).
+
+    Нужна при новом коде верификации: письмо со старым кодом уже бесполезно.
+    """
+    result = await db.execute(
+        update(EmailOutbox)
+        .where(
+            EmailOutbox.recipient == recipient,
+            EmailOutbox.kind == kind,
+            EmailOutbox.status == "pending",
+        )
+        .values(status="cancelled", last_error="Superseded")
+    )
+    return result.rowcount
+
+
+async def get_email_status(message_id: int) -> Optional[EmailOutbox]:
+    """Письмо outbox по ID (или None)"""
+    async with AsyncSessionLocal() as db:
+        return await db.get(EmailOutbox, message_id)
+
+
+async def claim_emails(worker_id: str, limit: int, lease: float) -> List[EmailOutbox]:
+    """
+    Забирает до limit писем, готовых к отправке, и арендует их на lease секунд.
+
+    Returns:
+        List[EmailOutbox]: Письма в статусе "sending" (attempts уже увеличен)
+    """
+    order = (EmailOutbox.next_attempt_at, EmailOutbox.id)
+    return await claim_rows(EmailOutbox, limit, lease, order_by=order, worker_id=worker_id)
+
+
+async def finish_emails(changes: List[dict]) -> None:
+    """Записывает результаты отправки пачки (словари с id и новыми значениями полей)"""
+    await finish_rows(EmailOutbox, changes)
+
+
+def outcome(
+    message: EmailOutbox,
+    error: Optional[BaseException],
+    max_attempts: int,
+    retry_base: float,
+    now: Optional[datetime] = None,
+) -> dict:
+    """
+    Новые значения полей письма после попытки отправки.
+
+    Args:
+        message: Письмо (attempts — с учётом этой попытки)
+        error: Ошибка отправки или None, если письмо принято
+        max_attempts: После стольких попыток письмо помечается failed
+
+    Returns:
+        dict: {"id": ..., "status": ..., ...} для finish_emails
+    """
+    now = now or datetime.utcnow()
+    changes = {"id": message.id, "locked_until": None}
+    if error is None:
+        return {**changes, "status": "sent", "sent_at": now, "last_error": None}
+
+    if message.expires_at is not None and message.expires_at <= now:
+        return {**changes, "status": "cancelled", "last_error": "Expired"}
+    text = error_text(error)
+    next_attempt_at = now + timedelta(seconds=retry_delay(message.attempts, retry_base))
+    if message.attempts >= max_attempts:
+        return {**changes, "status": "failed", "last_error": text}
+    if message.expires_at is not None and next_attempt_at >= message.expires_at:
+        # Следующая попытка опоздает: код к тому времени уже недействителен
+        return {**changes, "status": "failed", "last_error": text}
+    return {**changes, "status": "pending", "next_attempt_at": next_attempt_at, "last_error": text}
+
+
+class EmailDispatcher(OutboxWorker):
+    """
+    Фоновая отправка писем из outbox.
+
+    Пример:
+        dispatcher = get_email_dispatcher()
+        dispatcher.start()   # при старте сервера
+        dispatcher.wake()    # после коммита нового письма — не ждать опроса
+        await dispatcher.stop()
+    """
+
+    name = "Email dispatcher"
+    task_name = "email-dispatcher"
+
+    def __init__(
+        self,
+        delivery: Optional[EmailDelivery] = None,
+        batch_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_base: Optional[float] = None,
+        poll_interval: float = 2.0,
+        lease: float = 60.0,
+    ):
+        """
+        Args:
+            delivery: Очередь и пул SMTP-соединений (по умолчанию глобальный)
+            batch_size: Писем за один захват
+            max_attempts: Попыток отправки на письмо
+            retry_base: Базовая пауза между попытками, с (удваивается с каждой попыткой)
+            poll_interval: Как часто проверять outbox без сигнала wake(), с
+            lease: На сколько секунд письмо закрепляется за диспетчером
+        """
+        settings = Settings()
+        super().__init__(batch_size or settings.email_outbox_batch_size, poll_interval, lease)
+        self._delivery = delivery
+        self.max_attempts = max_attempts or settings.email_outbox_max_attempts
+        self.retry_base = retry_base or settings.email_outbox_retry_base
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def delivery(self) -> EmailDelivery:
+        return self._delivery or get_email_delivery()
+
+    async def dispatch_batch(self) -> int:
+        """
+        Забирает и отправляет одну пачку писем.
+
+        Returns:
+            int: Сколько писем обработано
+        """
+        messages = await claim_emails(self.worker_id, self.batch_size, self.lease)
+        if not messages:
+            return 0
+        errors = await asyncio.gather(*(self._send(message) for message in messages))
+        now = datetime.utcnow()
+        changes = []
+        for message, error in zip(messages, errors, strict=True):
+            change = outcome(message, error, self.max_attempts, self.retry_base, now)
+            changes.append(change)
+            if change["status"] == "sent":
+                self.sent += 1
+                logger.info(f"Email #{message.id} ({message.kind}) sent to {message.recipient}")
+            elif change["status"] == "failed":
+                self.failed += 1
+                logger.error(
+                    f"Email #{message.id} to {message.recipient} "
+                    f"failed after {message.attempts} attempts"
+                )
+            elif change["status"] == "pending":
+                self.retried += 1
+        await finish_emails(changes)
+        return len(messages)
+
+    async def _send(self, message: EmailOutbox) -> Optional[BaseException]:
+        """Отправляет письмо; возвращает ошибку вместо исключения"""
+        if message.expires_at is not None and message.expires_at <= datetime.utcnow():
+            return TimeoutError("Email expired before sending")
+        try:
+            email = build_email(message.kind, message.recipient, message.payload)
+            await self.delivery.deliver(email)
+        except Exception as e:
+            return e
+        return None
+
+    def stats(self) -> dict:
+        """Счётчики диспетчера этого процесса"""
+        return {
+            **super().stats(),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+
+# Глобальный экземпляр диспетчера
+_email_dispatcher: Optional[EmailDispatcher] = None
+
+
+def get_email_dispatcher() -> EmailDispatcher:
+    """
+    Возвращает глобальный экземпляр EmailDispatcher.
+
+    Returns:
+        EmailDispatcher: Фоновая отправка писем из outbox
+    """
+    global _email_dispatcher
+    if _email_dispatcher is None:
+        _email_dispatcher = EmailDispatcher()
+    return _email_dispatcher
@@ -0,0 +1,334 @@
+"""
+Шаблоны писем: Jinja-файлы templates/emails/, скомпилированные заранее.
+
+Письмо — это несколько килобайт HTML со стилями, в котором от получателя
+зависят только код, имя, сумма. Поэтому шаблон рендерится один раз — с
+маркерами на месте личных полей — и режется на неизменные фрагменты;
+письмо собирается склейкой фрагментов с подставленными (экранированными)
+значениями, без исполнения шаблона. Из того же HTML с маркерами один раз
+строится текстовая версия письма, так что текст больше не дублируется
+вручную.
+
+Поля письма делятся на два вида:
+    fields  — личные значения получателя; в шаблоне только как {{ поле }}
+              (без фильтров и условий — их не видно при компиляции)
+    context — значения, общие для многих писем (список преимуществ курса,
+              есть ли имя); по ним можно ветвиться и строить циклы, на
+              каждый набор контекста компилируется свой вариант шаблона
+
+MIME-заголовки частей письма тоже не строятся на каждое письмо: они
+общие для всех писем, тело частей кодируется base64 одним вызовом.
+
+Бенчмарк:
+    python -m benchmarks.bench_email_templates --messages 5000
+"""
+import base64
+import re
+import uuid
+from dataclasses import dataclass
+from email.message import Message
+from html import unescape
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from jinja2 import Environment, FileSystemLoader, meta
+from markupsafe import escape
+
+TEMPLATES_DIR = Path(__file__).resolve().parent.parent.parent / "templates"
+# Шаблоны писем (имя → файл в templates/)
+EMAIL_TEMPLATES = {
+    "verification": "emails/verification.html",
+    "purchase": "emails/purchase.html",
+}
+
+# Маркер поля: символы из Private Use Area не встречаются в тексте шаблонов и не экранируются
+_MARKER = "\ue000{}\ue001"
+_MARKER_RE = re.compile("\ue000(\\w+)\ue001")
+# Закодированное слово RFC 2047: "=?utf-8?b?" + base64(45 байт) + "?=" = 72 символа
+_HEADER_CHUNK_BYTES = 45
+
+# Заголовки частей одинаковы у всех писем
+_TEXT_HEADERS = (
+    ("Content-Type", 'text/plain; charset="utf-8"'), ("Content-Transfer-Encoding", "base64")
+)
+_HTML_HEADERS = (
+    ("Content-Type", 'text/html; charset="utf-8"'), ("Content-Transfer-Encoding", "base64")
+)
+
+# Теги, начинающие новый абзац текстовой версии, и теги, содержимое которых не текст
+_BLOCK_TAGS = {"p", "div", "h1", "h2", "h3", "h4", "h5", "h6", "table", "tr", "ul", "ol", "li"}
+_SKIP_TAGS = {"head", "style", "script", "title"}
+
+
+class _TextExtractor(HTMLParser):
+    """Текст письма из HTML: абзацы по блочным тегам, пункты списков, адреса ссылок"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[Tuple[str, bool]] = []  # (текст абзаца, пункт списка)
+        self._buffer: List[str] = []
+        self._item = False
+        self._skip = 0
+        self._links: List[Tuple[Optional[str], int]] = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "br":
+            self._buffer.append("\n")
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+            self._item = tag == "li"
+        elif tag == "a":
+            # Адрес ссылки и начало её текста в буфере
+            self._links.append((dict(attrs).get("href"), len(self._buffer)))
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip -= 1
+        elif tag in _BLOCK_TAGS:
+            self._flush()
+        elif tag == "a" and self._links:
+            href, start = self._links.pop()
+            text = " ".join("".join(self._buffer[start:]).split())
+            # Адрес пишется после текста ссылки, если текст его не повторяет
+            target = (href or "").removeprefix("mailto:")
+            self._buffer[start:] = [text]
+            if target and text not in (target, target.removeprefix("https://")):
+                self._buffer.append(f" ({target})")
+
+    def handle_data(self, data):
+        if not self._skip:
+            # Перевод строки в HTML — просто пробел; строки текста разделяет только <br>
+            self._buffer.append(data.replace("\n", " "))
+
+    def _flush(self):
+        lines = (" ".join(line.split()) for line in "".join(self._buffer).split("\n"))
+        text = "\n".join(line for line in lines if line)
+        if text:
+            self.blocks.append(("- " + text if self._item else text, self._item))
+        self._buffer = []
+        self._item = False
+
+    def text(self) -> str:
+        self._flush()
+        parts = []
+        for index, (text, item) in enumerate(self.blocks):
+            if index:
+                # Пункты одного списка — через строку, абзацы — через пустую строку
+                parts.append("\n" if item and self.blocks[index - 1][1] else "\n\n")
+            parts.append(text)
+        return "".join(parts)
+
+
+def html_to_text(html: str) -> str:
+    """Текстовая версия HTML-письма (для клиентов без HTML и спам-фильтров)"""
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return parser.text()
+
+
+def encode_header(value: str, linesep: str = "\n") -> str:
+    """
+    Значение заголовка по RFC 2047 (base64, utf-8), свёрнутое по строкам.
+
+    ASCII-значение возвращается как есть.
+    """
+    if value.isascii():
+        return value
+    words, chunk, size = [], [], 0
+    for char in value:
+        length = len(char.encode())
+        if size + length > _HEADER_CHUNK_BYTES:
+            words.append("".join(chunk))
+            chunk, size = [], 0
+        chunk.append(char)
+        size += length
+    words.append("".join(chunk))
+    encoded = (f"=?utf-8?b?{base64.b64encode(word.encode()).decode('ascii')}?=" for word in words)
+    return (linesep + " ").join(encoded)
+
+
+class EncodedHeader:
+    """
+    Заголовок, закодированный заранее.
+
+    Генератор email (политика compat32) не перекодирует объекты с методом
+    encode(), а вызывает его — заголовок сворачивается одной склейкой.
+    """
+
+    def __init__(self, value: str):
+        self.value = value
+
+    def encode(
+        self, splitchars: str = ";, \t", maxlinelen: Optional[int] = None, linesep: str = "\n"
+    ) -> str:
+        return encode_header(self.value, linesep)
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def _fragments(rendered: str) -> Tuple[str, ...]:
+    """Неизменные фрагменты и имена полей вперемешку: (текст, поле, текст, поле, ..., текст)"""
+    return tuple(_MARKER_RE.split(rendered))
+
+
+def _join(fragments: Tuple[str, ...], values: Dict[str, str]) -> str:
+    parts = list(fragments)
+    for index in range(1, len(parts), 2):
+        parts[index] = values[parts[index]]
+    return "".join(parts)
+
+
+@dataclass(frozen=True)
+class CompiledEmail:
+    """Вариант шаблона письма для одного контекста: фрагменты темы, HTML и текста"""
+    name: str
+    fields: Tuple[str, ...]
+    subject: Tuple[str, ...]
+    html: Tuple[str, ...]
+    text: Tuple[str, ...]
+
+    def render(self, fields: dict) -> Tuple[str, str, str]:
+        """
+        Подставляет личные поля.
+
+        Returns:
+            (тема, HTML, текст)
+
+        Raises:
+            KeyError: Не передано поле шаблона
+        """
+        raw = {name: str(fields[name]) for name in self.fields}
+        escaped = {name: str(escape(value)) for name, value in raw.items()}
+        return _join(self.subject, raw), _join(self.html, escaped), _join(self.text, raw)
+
+
+class EmailTemplates:
+    """
+    Скомпилированные шаблоны писем.
+
+    Пример:
+        templates = EmailTemplates()
+        templates.load()  # при старте: разбор и компиляция Jinja
+        message = templates.message(
+            "verification", "mage@example.com", {"code": "123456"}, {"has_name": False}
+        )
+    """
+
+    def __init__(self, directory: Path = TEMPLATES_DIR, templates: Optional[Dict[str, str]] = None):
+        self.env = Environment(
+            loader=FileSystemLoader(str(directory)), autoescape=True, auto_reload=False
+        )
+        self.templates = dict(templates or EMAIL_TEMPLATES)
+        self._variables: Dict[str, frozenset] = {}
+        self._compiled: Dict[tuple, CompiledEmail] = {}
+
+    def load(self) -> None:
+        """Компилирует все шаблоны писем (ошибка в шаблоне видна при старте, а не при отправке)"""
+        for name in self.templates:
+            self._template(name)
+
+    def _template(self, name: str):
+        path = self.templates[name]
+        if name not in self._variables:
+            source = self.env.loader.get_source(self.env, path)[0]
+            variables = meta.find_undeclared_variables(self.env.parse(source))
+            self._variables[name] = frozenset(variables)
+        return self.env.get_template(path)
+
+    def compile(self, name: str, context: Optional[dict] = None) -> CompiledEmail:
+        """
+        Вариант шаблона для контекста (кешируется).
+
+        Args:
+            name: Имя шаблона (ключ EMAIL_TEMPLATES)
+            context: Значения, общие для многих писем (хешируемые)
+        """
+        context = context or {}
+        key = (name, tuple(sorted(context.items())))
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            return compiled
+
+        template = self._template(name)
+        variables = self._variables[name] - context.keys()
+        markers = {field: _MARKER.format(field) for field in variables}
+        module = template.make_module({**context, **markers})
+        html = str(module)
+        subject = " ".join(unescape(str(getattr(module, "subject", ""))).split())
+        # Поля варианта — те, что попали в письмо (ветка по контексту может поле не выводить)
+        rendered = set(_MARKER_RE.findall(html)) | set(_MARKER_RE.findall(subject))
+        if not rendered <= variables:
+            transformed = sorted(rendered - variables)
+            raise ValueError(
+                f"Email template {name}: fields {transformed} are transformed, "
+                f"use plain {{{{ field }}}}"
+            )
+        compiled = CompiledEmail(
+            name=name,
+            fields=tuple(sorted(rendered)),
+            subject=_fragments(subject),
+            html=_fragments(html),
+            text=_fragments(html_to_text(html)),
+        )
+        self._compiled[key] = compiled
+        return compiled
+
+    def message(
+        self, name: str, email: str, fields: dict, context: Optional[dict] = None
+    ) -> Message:
+        """
+        Письмо (multipart/alternative: текст и HTML) по шаблону.
+
+        Args:
+            name: Имя шаблона
+            email: Email получателя
+            fields: Личные поля получателя
+            context: Общие значения (см. compile)
+        """
+        subject, html, text = self.compile(name, context).render(fields)
+        return build_message(email, subject, html, text)
+
+
+def _part(headers: Tuple[Tuple[str, str], ...], body: str) -> Message:
+    part = Message()
+    for name, value in headers:
+        part[name] = value
+    part.set_payload(base64.encodebytes(body.encode()).decode("ascii"))
+    return part
+
+
+def build_message(email: str, subject: str, html: str, text: str) -> Message:
+    """Письмо из готовых темы, HTML и текста (From подставляет EmailDelivery)"""
+    message = Message()
+    # Граница задаётся сразу: генератору не нужно искать её в теле письма ("_" не бывает в base64)
+    message["Content-Type"] = f'multipart/alternative; boundary="=_{uuid.uuid4().hex}"'
+    message["MIME-Version"] = "1.0"
+    # Перевод строки из поля (название курса) не должен начать новый заголовок
+    message["Subject"] = EncodedHeader(" ".join(subject.split()))
+    message["To"] = email
+    # Текстовая версия — первой: клиент показывает последнюю понятную ему часть
+    message.set_payload([_part(_TEXT_HEADERS, text), _part(_HTML_HEADERS, html)])
+    return message
+
+
+# Глобальный экземпляр шаблонов писем
+_email_templates: Optional[EmailTemplates] = None
+
+
+def get_email_templates() -> EmailTemplates:
+    """
+    Возвращает глобальный экземпляр EmailTemplates.
+
+    Returns:
+        EmailTemplates: Скомпилированные шаблоны писем
+    """
+    global _email_templates
+    if _email_templates is None:
+        _email_templates = EmailTemplates()
+        _email_templates.load()
+    return _email_templates
@@ -0,0 +1,76 @@
+"""
+События генерации курсов через PostgreSQL LISTEN/NOTIFY.
+
+Воркер очереди (отдельный процесс) публикует статус задач и уроков
+в канал generation_events, админский SSE-эндпоинт приложения слушает
+канал и ретранслирует события своей задачи в браузер.
+
+Формат события (JSON, до 8000 байт — ограничение NOTIFY):
+    {"job_id": 1, "type": "status", "status": "running", ...}
+    {"job_id": 1, "type": "progress", "done": 3, "total": 16, "lessons": [...]}
+"""
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from loguru import logger
+from sqlalchemy import text
+
+from app.database import engine
+
+CHANNEL = "generation_events"
+# NOTIFY отклоняет payload длиннее 8000 байт
+MAX_PAYLOAD_BYTES = 7900
+
+
+async def publish_event(event: dict) -> None:
+    """Публикует событие в канал (ошибки только логируются — генерация важнее)"""
+    payload = json.dumps(event, ensure_ascii=False, default=str)
+    if len(payload.encode()) > MAX_PAYLOAD_BYTES and event.get("lessons"):
+        # Слишком много уроков в одном событии — делим пополам
+        lessons = event["lessons"]
+        half = len(lessons) // 2
+        await publish_event({**event, "lessons": lessons[:half]})
+        await publish_event({**event, "lessons": lessons[half:]})
+        return
+    try:
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": payload},
+            )
+    except Exception as e:
+        logger.warning(f"Failed to publish generation event: {e}")
+
+
+@asynccontextmanager
+async def listen_events(job_id: int, max_queued: int = 1000) -> AsyncIterator[asyncio.Queue]:
+    """
+    Подписка на события одной задачи.
+
+    Держит соединение из пула на время подписки. Если читатель не
+    успевает, лишние события отбрасываются (прогресс — это снимки,
+    следующий перекроет пропущенный).
+
+    Yields:
+        asyncio.Queue: Очередь событий задачи (dict)
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued)
+
+    def on_notify(connection, pid, channel, payload) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            return
+        if event.get("job_id") == job_id and not queue.full():
+            queue.put_nowait(event)
+
+    async with engine.connect() as conn:
+        raw = (await conn.get_raw_connection()).driver_connection
+        await raw.add_listener(CHANNEL, on_notify)
+        try:
+            yield queue
+        finally:
+            await raw.remove_listener(CHANNEL, on_notify)
@@ -0,0 +1,504 @@
+"""
+Очередь фоновой генерации курсов в PostgreSQL.
+
+Задачи лежат в таблице generation_jobs. Воркер забирает их через
+SELECT ... FOR UPDATE SKIP LOCKED (несколько воркеров не получат одну
+задачу), выполняет до N задач одновременно и делит между ними один
+семафор запросов к LLM — восемь курсов в очереди нагружают LLM на весь
+бюджет, а не идут друг за другом.
+
+Прогресс задачи копится в памяти и пишется в строку вместе с heartbeat
+раз в несколько секунд. Задачи, чей воркер перестал обновлять heartbeat
+(процесс убит), возвращаются в очередь — генерация инкрементальная,
+поэтому повтор продолжает с последнего сохранённого урока.
+"""
+import asyncio
+import os
+import socket
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import case, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import Settings
+from app.database import AsyncSessionLocal, pool_monitor
+from app.models import GenerationJob
+from app.services.course_generator import CourseGeneratorService, LessonTask, get_course_generator
+from app.services.generation_events import publish_event
+from app.services.generation_usage import get_usage_recorder, usage_context
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("succeeded", "failed", "cancelled")
+# После стольких запусков зависшая задача помечается failed, а не возвращается в очередь
+MAX_ATTEMPTS = 3
+# Попыток поставить задачу, если активная задача курса завершается между INSERT и SELECT
+ENQUEUE_ATTEMPTS = 3
+
+
+async def enqueue_job(
+    course_slug: str,
+    force: bool = False,
+    lesson_id: Optional[int] = None,
+) -> Tuple[GenerationJob, bool]:
+    """
+    Ставит генерацию курса (или одного урока) в очередь.
+
+    Если по курсу уже есть активная задача, новая не создаётся.
+
+    Args:
+        course_slug: Slug курса
+        force: Перегенерировать все уроки курса
+        lesson_id: Перегенерировать только этот урок
+
+    Returns:
+        (задача, True если создана новая)
+    """
+    if lesson_id is None:
+        same_target = GenerationJob.lesson_id.is_(None)
+    else:
+        same_target = GenerationJob.lesson_id == lesson_id
+    async with AsyncSessionLocal() as db:
+        for _ in range(ENQUEUE_ATTEMPTS):
+            result = await db.execute(
+                insert(GenerationJob)
+                .values(
+                    course_slug=course_slug,
+                    lesson_id=lesson_id,
+                    force=force,
+                    status="queued",
+                    attempts=0,
+                    cancel_requested=False,
+                    progress_done=0,
+                    progress_total=0,
+                    created_at=datetime.utcnow(),
+                )
+                .on_conflict_do_nothing()
+                .returning(GenerationJob)
+            )
+            job = result.scalar_one_or_none()
+            created = job is not None
+            if created:
+                break
+            # Уникальный индекс по активным задачам: берём уже стоящую в очереди.
+            # Между INSERT и SELECT она могла завершиться — тогда вставляем снова
+            result = await db.execute(
+                select(GenerationJob).where(
+                    GenerationJob.course_slug == course_slug,
+                    same_target,
+                    GenerationJob.status.in_(ACTIVE_STATUSES),
+                )
+            )
+            job = result.scalar_one_or_none()
+            if job is not None:
+                break
+        else:
+            raise RuntimeError(f"Could not enqueue generation job for {course_slug}")
+        await db.commit()
+
+    if created:
+        target = f"{course_slug} lesson {lesson_id}" if lesson_id else course_slug
+        logger.info(f"Generation job #{job.id} queued: {target}")
+    return job, created
+
+
+async def get_job(job_id: int) -> Optional[GenerationJob]:
+    """Задача по ID (или None)"""
+    async with AsyncSessionLocal() as db:
+        return await db.get(GenerationJob, job_id)
+
+
+async def list_jobs(status: Optional[str] = None, limit: int = 50) -> List[GenerationJob]:
+    """Последние задачи (новые сверху), опционально с фильтром по статусу"""
+    query = select(GenerationJob).order_by(GenerationJob.id.desc()).limit(limit)
+    if status:
+        query = query.where(GenerationJob.status == status)
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        return list(result.scalars())
+
+
+async def claim_job(worker_id: str) -> Optional[GenerationJob]:
+    """
+    Забирает самую старую задачу из очереди.
+
+    Выбор и перевод в "running" — один UPDATE с подзапросом
+    FOR UPDATE SKIP LOCKED: строки, заблокированные другими
+    воркерами, пропускаются без ожидания.
+
+    Returns:
+        GenerationJob или None, если очередь пуста
+    """
+    now = datetime.utcnow()
+    next_job = (
+        select(GenerationJob.id)
+        .where(GenerationJob.status == "queued")
+        .order_by(GenerationJob.created_at, GenerationJob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == next_job)
+            .values(
+                status="running",
+                worker_id=worker_id,
+                attempts=GenerationJob.attempts + 1,
+                started_at=now,
+                heartbeat_at=now,
+                finished_at=None,
+                error=None,
+            )
+            .returning(GenerationJob)
+            .execution_options(synchronize_session=False)
+        )
+        job = result.scalar_one_or_none()
+        await db.commit()
+        return job
+
+
+async def update_progress(
+    job_id: int, worker_id: str, done: int, total: int, current_item: Optional[str]
+) -> Optional[bool]:
+    """
+    Записывает прогресс и heartbeat задачи.
+
+    Returns:
+        bool: Запрошена ли отмена задачи;
+            None — задача больше не принадлежит воркеру
+            (например, возвращена в очередь как зависшая)
+    """
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(GenerationJob)
+            .where(
+                GenerationJob.id == job_id,
+                GenerationJob.worker_id == worker_id,
+                GenerationJob.status == "running",
+            )
+            .values(
+                progress_done=done,
+                progress_total=total,
+                current_item=current_item[:255] if current_item else None,
+                heartbeat_at=datetime.utcnow(),
+            )
+            .returning(GenerationJob.cancel_requested)
+        )
+        cancel_requested = result.scalar_one_or_none()
+        await db.commit()
+        return cancel_requested
+
+
+async def finish_job(job_id: int, worker_id: str, status: str, error: Optional[str] = None) -> None:
+    """Переводит задачу в финальный статус ("succeeded" / "failed" / "cancelled")"""
+    if status not in FINAL_STATUSES:
+        raise ValueError(f"Not a final job status: {status}")
+    now = datetime.utcnow()
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id, GenerationJob.worker_id == worker_id)
+            .values(status=status, error=error, finished_at=now, heartbeat_at=now)
+        )
+        await db.commit()
+
+
+async def requeue_stale_jobs(stale_after: float) -> int:
+    """
+    Возвращает в очередь задачи, чей воркер не обновлял heartbeat дольше stale_after секунд.
+
+    Задачи, исчерпавшие MAX_ATTEMPTS запусков, помечаются failed,
+    задачи с запрошенной отменой — cancelled.
+
+    Returns:
+        int: Количество возвращённых в очередь задач
+    """
+    now = datetime.utcnow()
+    stale = (
+        GenerationJob.status == "running",
+        GenerationJob.heartbeat_at < now - timedelta(seconds=stale_after),
+    )
+    async with AsyncSessionLocal() as db:
+        failed = await db.execute(
+            update(GenerationJob)
+            .where(
+                *stale, (GenerationJob.attempts >= MAX_ATTEMPTS) | GenerationJob.cancel_requested
+            )
+            .values(
+                status=case((GenerationJob.cancel_requested, "cancelled"), else_="failed"),
+                error=case(
+                    (GenerationJob.cancel_requested, "Cancelled by admin"),
+                    else_="Worker stopped responding",
+                ),
+                finished_at=now,
+            )
+        )
+        requeued = await db.execute(
+            update(GenerationJob)
+            .where(*stale)
+            .values(status="queued", worker_id=None)
+        )
+        await db.commit()
+
+    if failed.rowcount or requeued.rowcount:
+        logger.warning(
+            f"Stale generation jobs: requeued {requeued.rowcount}, failed {failed.rowcount}"
+        )
+    return requeued.rowcount
+
+
+async def cancel_job(job_id: int) -> Optional[GenerationJob]:
+    """
+    Отменяет задачу.
+
+    Задача в очереди отменяется сразу; у выполняемой выставляется
+    cancel_requested — воркер прервёт генерацию на ближайшем heartbeat
+    (уже сгенерированные уроки сохраняются).
+
+    Returns:
+        GenerationJob или None, если задачи нет
+    """
+    now = datetime.utcnow()
+    queued = GenerationJob.status == "queued"
+    async with AsyncSessionLocal() as db:
+        await db.execute(
+            update(GenerationJob)
+            .where(GenerationJob.id == job_id, GenerationJob.status.in_(ACTIVE_STATUSES))
+            .values(
+                cancel_requested=True,
+                status=case((queued, "cancelled"), else_=GenerationJob.status),
+                error=case((queued, "Cancelled by admin"), else_=GenerationJob.error),
+                finished_at=case((queued, now), else_=GenerationJob.finished_at),
+            )
+        )
+        await db.commit()
+        job = await db.get(GenerationJob, job_id)
+
+    if job is not None:
+        logger.info(f"Generation job #{job_id} cancel requested (status: {job.status})")
+    return job
+
+
+@dataclass
+class JobProgress:
+    """
+    Последний прогресс задачи в памяти воркера.
+
+    В БД сбрасывается с heartbeat, живые статусы уроков (changed)
+    публикуются в канал событий каждые events_interval секунд.
+    """
+    done: int = 0
+    total: int = 0
+    current_item: Optional[str] = None
+    lessons: dict = field(default_factory=dict)
+    changed: set = field(default_factory=set)
+    # "cancelled" — отмена администратором, "lost" — задачу забрали
+    stop_reason: Optional[str] = None
+
+    def __call__(self, done: int, total: int, title: str) -> None:
+        self.done, self.total, self.current_item = done, total, title
+        self.changed.add(None)
+
+    def lesson(self, task: LessonTask, status: str, chars: int) -> None:
+        """Статус урока от генератора (started / streaming / quiz / generated / ready / failed)"""
+        now = time.monotonic()
+        key = task.lesson_id or task.title
+        state = self.lessons.setdefault(
+            key, {"lesson_id": task.lesson_id, "title": task.title, "started": now}
+        )
+        if status == "streaming" and "ttfb_ms" not in state:
+            # Время до первого фрагмента текста от LLM
+            state["ttfb_ms"] = int((now - state["started"]) * 1000)
+        state.update(status=status, chars=chars, elapsed_ms=int((now - state["started"]) * 1000))
+        self.changed.add(key)
+
+    def drain(self, job_id: int) -> Optional[dict]:
+        """Событие с изменениями с прошлого вызова (или None, если изменений нет)"""
+        if not self.changed:
+            return None
+        lessons = [
+            {name: value for name, value in self.lessons[key].items() if name != "started"}
+            for key in self.changed if key is not None
+        ]
+        self.changed.clear()
+        return {
+            "job_id": job_id, "type": "progress",
+            "done": self.done, "total": self.total, "lessons": lessons,
+        }
+
+
+class GenerationWorker:
+    """
+    Воркер очереди генерации.
+
+    Выполняет до jobs задач одновременно; все задачи делят один семафор
+    на llm_concurrency запросов к LLM.
+    """
+
+    def __init__(
+        self,
+        jobs: Optional[int] = None,
+        llm_concurrency: Optional[int] = None,
+        generator: Optional[CourseGeneratorService] = None,
+        poll_interval: float = 2.0,
+        heartbeat_interval: float = 5.0,
+        events_interval: float = 0.5,
+        stale_after: float = 120.0,
+    ):
+        settings = Settings()
+        self.jobs = jobs or settings.generation_worker_jobs
+        self.llm_concurrency = llm_concurrency or settings.generation_llm_concurrency
+        self.generator = generator or get_course_generator()
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        self.events_interval = events_interval
+        self.stale_after = stale_after
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processed = 0
+
+    async def run(self, stop: Optional[asyncio.Event] = None, until_empty: bool = False) -> None:
+        """
+        Основной цикл воркера.
+
+        Args:
+            stop: Событие остановки (новые задачи не берутся, текущие дорабатывают)
+            until_empty: Завершиться, когда очередь пуста и все задачи выполнены
+        """
+        stop = stop or asyncio.Event()
+        slots = asyncio.Semaphore(self.llm_concurrency)
+        running: set = set()
+        wakeup = asyncio.Event()
+        logger.info(
+            f"Generation worker {self.worker_id} started: "
+            f"jobs={self.jobs}, llm_concurrency={self.llm_concurrency}"
+        )
+
+        def on_done(task: asyncio.Task) -> None:
+            running.discard(task)
+            wakeup.set()
+
+        try:
+            while not stop.is_set():
+                await requeue_stale_jobs(self.stale_after)
+
+                # Забираем задачи, пока есть свободные места
+                claimed = False
+                while len(running) < self.jobs:
+                    job = await claim_job(self.worker_id)
+                    if job is None:
+                        break
+                    claimed = True
+                    task = asyncio.create_task(self._execute(job, slots))
+                    running.add(task)
+                    task.add_done_callback(on_done)
+
+                if until_empty and not running and not claimed:
+                    break
+
+                # Ждём освобождения места, остановки или следующего опроса
+                wakeup.clear()
+                waiters = [asyncio.create_task(wakeup.wait()), asyncio.create_task(stop.wait())]
+                await asyncio.wait(
+                    waiters, timeout=self.poll_interval, return_when=asyncio.FIRST_COMPLETED
+                )
+                for waiter in waiters:
+                    waiter.cancel()
+        finally:
+            if running:
+                logger.info(f"Generation worker {self.worker_id}: waiting for {len(running)} jobs")
+                await asyncio.gather(*running, return_exceptions=True)
+            await get_usage_recorder().aclose()
+            logger.info(
+                f"Generation worker {self.worker_id} stopped, processed {self.processed} jobs. "
+                f"DB pool: {pool_monitor.stats()}"
+            )
+
+    async def _execute(self, job: GenerationJob, slots: asyncio.Semaphore) -> None:
+        """Выполняет одну задачу: прогресс в БД и в канал событий, реакция на отмену"""
+        logger.info(f"Generation job #{job.id} started: {job.course_slug} (attempt {job.attempts})")
+        await publish_event(
+            {"job_id": job.id, "type": "status", "status": "running", "attempt": job.attempts}
+        )
+        progress = JobProgress()
+        work = asyncio.create_task(self._generate(job, slots, progress))
+        monitor = asyncio.create_task(self._monitor(job.id, progress, work))
+        try:
+            success = await work
+            if success:
+                status, error = "succeeded", None
+            else:
+                status, error = "failed", "Some lessons were not generated"
+        except asyncio.CancelledError:
+            if progress.stop_reason is None:
+                raise
+            status, error = "cancelled", "Cancelled by admin"
+        except Exception as e:
+            logger.exception(f"Generation job #{job.id} crashed")
+            status, error = "failed", str(e)
+        finally:
+            monitor.cancel()
+
+        if progress.stop_reason == "lost":
+            logger.warning(
+                f"Generation job #{job.id} was taken from worker {self.worker_id}, dropping it"
+            )
+            return
+        await update_progress(
+            job.id, self.worker_id, progress.done, progress.total, progress.current_item
+        )
+        await finish_job(job.id, self.worker_id, status, error)
+        final = progress.drain(job.id) or {"job_id": job.id, "type": "progress", "lessons": []}
+        await publish_event(final)
+        await publish_event({"job_id": job.id, "type": "status", "status": status, "error": error})
+        self.processed += 1
+        logger.info(f"Generation job #{job.id} {status}: {job.course_slug}")
+
+    async def _generate(
+        self, job: GenerationJob, slots: asyncio.Semaphore, progress: JobProgress
+    ) -> bool:
+        """Сама генерация (курс целиком или один урок)"""
+        with usage_context(job_id=job.id):
+            if job.lesson_id is not None:
+                return await self.generator.regenerate_lesson(job.lesson_id, slots=slots)
+            return await self.generator.generate_course(
+                job.course_slug,
+                progress_callback=progress,
+                force=job.force,
+                slots=slots,
+                lesson_callback=progress.lesson,
+            )
+
+    async def _monitor(self, job_id: int, progress: JobProgress, work: asyncio.Task) -> None:
+        """
+        Публикует живой прогресс каждые events_interval секунд, раз в
+        heartbeat_interval пишет прогресс в БД и проверяет отмену задачи.
+        """
+        loop = asyncio.get_running_loop()
+        next_heartbeat = loop.time() + self.heartbeat_interval
+        while True:
+            await asyncio.sleep(self.events_interval)
+            event = progress.drain(job_id)
+            if event:
+                await publish_event(event)
+            if loop.time() < next_heartbeat:
+                continue
+            next_heartbeat = loop.time() + self.heartbeat_interval
+            try:
+                cancel = await update_progress(
+                    job_id, self.worker_id, progress.done, progress.total, progress.current_item
+                )
+            except Exception as e:
+                logger.warning(f"Failed to update progress of generation job #{job_id}: {e}")
+                continue
+            if cancel is None or cancel:
+                # Прерываем генерацию: закрытие потоков останавливает расход токенов
+                progress.stop_reason = "lost" if cancel is None else "cancelled"
+                logger.warning(f"Generation job #{job_id} stopping: {progress.stop_reason}")
+                work.cancel()
+                return
@@ -0,0 +1,252 @@
+"""
+Учёт токенов, стоимости и задержек запросов к LLM.
+
+Контекст запроса (курс, урок, задача очереди, назначение) передаётся
+через contextvars: генератор оборачивает свои вызовы в usage_context(),
+OpenRouterService берёт контекст в момент запроса. Задачи asyncio
+наследуют контекст, поэтому параллельные уроки не путаются.
+
+Записи копятся в памяти и пишутся в generation_usage пакетами
+(один INSERT на пакет) — учёт не добавляет запрос к БД на каждый вызов LLM.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Iterator, List, Optional, Sequence
+
+from loguru import logger
+from sqlalchemy import func, insert, select
+
+from app.models import GenerationUsage
+
+# Справочные цены, USD за 1M токенов (вход, выход) — для ответов без usage.cost
+MODEL_PRICES = {
+    "openai/gpt-5.1": (1.25, 10.0),
+    "openai/gpt-5-mini": (0.25, 2.0),
+}
+
+# Поля, по которым можно группировать отчёт
+GROUP_FIELDS = ("course_slug", "model", "purpose", "lesson_id", "job_id", "status")
+
+_usage_context: ContextVar[dict] = ContextVar("llm_usage_context", default={})
+
+
+@contextmanager
+def usage_context(**fields) -> Iterator[None]:
+    """
+    Дополняет контекст учёта для вызовов LLM внутри блока.
+
+    Пример:
+        with usage_context(course_slug="ai-for-beginners", lesson_id=42):
+            await openrouter.generate_text(...)
+    """
+    given = {key: value for key, value in fields.items() if value is not None}
+    token = _usage_context.set({**_usage_context.get(), **given})
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+def current_usage_context() -> dict:
+    """Текущий контекст учёта"""
+    return dict(_usage_context.get())
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Стоимость по справочным ценам (None для неизвестной модели)"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    return (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+
+
+@dataclass
+class LLMCall:
+    """Один вызов LLM: заполняется по ходу запроса, в конце превращается в строку учёта"""
+    model: str
+    stream: bool = False
+    context: dict = field(default_factory=current_usage_context)
+    started: float = field(default_factory=time.perf_counter)
+    status: str = "error"
+    cached: bool = False
+    attempts: int = 0
+    ttfb_ms: Optional[int] = None
+    usage: dict = field(default_factory=dict)
+
+    def first_byte(self) -> None:
+        """Отметка первого фрагмента потокового ответа"""
+        if self.ttfb_ms is None:
+            self.ttfb_ms = int((time.perf_counter() - self.started) * 1000)
+
+    def to_row(self) -> dict:
+        prompt_tokens = int(self.usage.get("prompt_tokens") or 0)
+        completion_tokens = int(self.usage.get("completion_tokens") or 0)
+        cost = self.usage.get("cost")
+        if cost is None and not self.cached:
+            cost = estimate_cost(self.model, prompt_tokens, completion_tokens)
+        return {
+            "created_at": datetime.utcnow(),
+            "model": self.model,
+            "purpose": self.context.get("purpose"),
+            "course_slug": self.context.get("course_slug"),
+            "lesson_id": self.context.get("lesson_id"),
+            "job_id": self.context.get("job_id"),
+            "status": self.status,
+            "cached": self.cached,
+            "stream": self.stream,
+            "retries": max(0, self.attempts - 1),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "cost": 0.0 if self.cached else cost,
+            "latency_ms": int((time.perf_counter() - self.started) * 1000),
+            "ttfb_ms": self.ttfb_ms,
+        }
+
+
+class UsageRecorder:
+    """
+    Пакетная запись учёта в generation_usage.
+
+    Запись уходит в БД, когда набралось batch_size строк или прошло
+    flush_interval секунд с первой строки пакета. Ошибка записи учёта
+    только логируется — генерация важнее статистики.
+    """
+
+    def __init__(self, batch_size: int = 50, flush_interval: float = 2.0, max_buffer: int = 10_000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: List[dict] = []
+        self._task: Optional[asyncio.Task] = None
+        self._full: Optional[asyncio.Event] = None
+        self.recorded = 0
+        self.dropped = 0
+        self.flushes = 0
+
+    def record(self, row: dict) -> None:
+        """Добавляет строку в пакет (вызывается из корутины, без ожидания)"""
+        if len(self._buffer) >= self.max_buffer:
+            self._buffer.pop(0)
+            self.dropped += 1
+        self._buffer.append(row)
+
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._full = asyncio.Event()
+            self._task = loop.create_task(self._flush_later(self._full))
+        if len(self._buffer) >= self.batch_size:
+            self._full.set()
+
+    async def _flush_later(self, full: asyncio.Event) -> None:
+        try:
+            await asyncio.wait_for(full.wait(), timeout=self.flush_interval)
+        except TimeoutError:
+            pass
+        await self.flush()
+
+    async def flush(self) -> int:
+        """Пишет накопленные строки; возвращает их количество"""
+        rows, self._buffer = self._buffer, []
+        if not rows:
+            return 0
+        from app.database import engine
+
+        try:
+            async with engine.begin() as conn:
+                await conn.execute(insert(GenerationUsage), rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            logger.warning(f"Failed to write {len(rows)} generation usage rows: {e}")
+            return 0
+        self.recorded += len(rows)
+        self.flushes += 1
+        return len(rows)
+
+    async def aclose(self) -> None:
+        """Дописывает остаток (after_serving, завершение скриптов и воркера)"""
+        task, self._task = self._task, None
+        if task is not None and not task.done() and task.get_loop() is asyncio.get_running_loop():
+            # Будим отложенную запись и дожидаемся её, а не отменяем посреди INSERT
+            self._full.set()
+            await task
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "buffered": len(self._buffer),
+            "recorded": self.recorded,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+        }
+
+
+async def usage_summary(
+    group_by: Sequence[str] = ("course_slug", "model"),
+    since: Optional[datetime] = None,
+    course_slug: Optional[str] = None,
+) -> List[dict]:
+    """
+    Сводка учёта по группам: вызовы, токены, стоимость, перцентили задержки.
+
+    Args:
+        group_by: Поля группировки из GROUP_FIELDS
+        since: Только записи не старше этого момента (UTC)
+        course_slug: Только один курс
+
+    Returns:
+        list: Строки сводки, самые дорогие группы первыми
+    """
+    unknown = set(group_by) - set(GROUP_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown group fields: {', '.join(sorted(unknown))}")
+
+    keys = [getattr(GenerationUsage, name) for name in group_by]
+    latency = GenerationUsage.latency_ms
+    spent = GenerationUsage.cached.is_(False)
+    cost = func.coalesce(func.sum(GenerationUsage.cost), 0.0)
+    query = select(
+        *keys,
+        func.count().label("calls"),
+        func.count().filter(GenerationUsage.status.in_(("error", "aborted"))).label("failed"),
+        func.count().filter(GenerationUsage.cached).label("cached"),
+        func.coalesce(func.sum(GenerationUsage.retries), 0).label("retries"),
+        func.coalesce(func.sum(GenerationUsage.prompt_tokens), 0).label("prompt_tokens"),
+        func.coalesce(func.sum(GenerationUsage.completion_tokens), 0).label("completion_tokens"),
+        cost.label("cost"),
+        # Перцентили только по реальным запросам: ответы из кеша исказили бы задержку
+        func.percentile_cont(0.5).within_group(latency).filter(spent).label("latency_p50_ms"),
+        func.percentile_cont(0.95).within_group(latency).filter(spent).label("latency_p95_ms"),
+        func.percentile_cont(0.5).within_group(GenerationUsage.ttfb_ms).filter(spent).label("ttfb_p50_ms"),
+    ).group_by(*keys).order_by(cost.desc())
+
+    if since is not None:
+        query = query.where(GenerationUsage.created_at >= since)
+    if course_slug:
+        query = query.where(GenerationUsage.course_slug == course_slug)
+
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(query)
+        return [dict(row._mapping) for row in result]
+
+
+# Глобальный экземпляр
+_usage_recorder: Optional[UsageRecorder] = None
+
+
+def get_usage_recorder() -> UsageRecorder:
+    """
+    Возвращает глобальный UsageRecorder.
+
+    Returns:
+        UsageRecorder: Пакетная запись учёта
+    """
+    global _usage_recorder
+    if _usage_recorder is None:
+        _usage_recorder = UsageRecorder()
+    return _usage_recorder
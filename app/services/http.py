@@ -0,0 +1,132 @@
+"""
+Общие долгоживущие HTTP-клиенты (httpx) для внешних API.
+
+Клиент на каждый внешний сервис создаётся один раз и переиспользует
+соединения (keep-alive, пул с ограничениями, опционально HTTP/2),
+вместо DNS/TCP/TLS на каждый запрос:
+
+    client = get_http_client("telegram", timeout=30.0, max_connections=5)
+    response = await client.post(url, json=payload)
+
+Клиенты закрываются в after_serving через close_http_clients().
+Клиент привязан к event loop: если код выполняется в другом loop
+(скрипты, тесты), создаётся новый клиент.
+"""
+import asyncio
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+from loguru import logger
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:  # pragma: no cover - зависит от окружения
+    HTTP2_AVAILABLE = False
+
+
+@dataclass
+class _ClientEntry:
+    client: httpx.AsyncClient
+    loop: asyncio.AbstractEventLoop
+    http2: bool
+    max_connections: int
+    requests: int = 0
+
+
+_clients: dict[str, _ClientEntry] = {}
+
+
+def get_http_client(
+    name: str,
+    *,
+    timeout: float = 30.0,
+    max_connections: int = 20,
+    max_keepalive_connections: int = 10,
+    keepalive_expiry: float = 30.0,
+    http2: bool = False,
+    headers: Optional[dict] = None,
+) -> httpx.AsyncClient:
+    """
+    Возвращает общий клиент с указанным именем, создавая его при первом обращении.
+
+    Параметры применяются только при создании клиента.
+
+    Args:
+        name: Имя клиента (обычно имя внешнего сервиса)
+        timeout: Таймаут по умолчанию в секундах (переопределяется в запросе)
+        max_connections: Максимум одновременных соединений
+        max_keepalive_connections: Сколько простаивающих соединений держать открытыми
+        keepalive_expiry: Через сколько секунд простоя закрывать соединение
+        http2: Включить HTTP/2 (если установлен пакет h2)
+        headers: Заголовки по умолчанию
+    """
+    loop = asyncio.get_running_loop()
+    entry = _clients.get(name)
+    if entry and not entry.client.is_closed and entry.loop is loop:
+        return entry.client
+
+    if http2 and not HTTP2_AVAILABLE:
+        logger.warning(
+            f"HTTP/2 requested for '{name}' client but h2 is not installed, using HTTP/1.1"
+        )
+        http2 = False
+
+    entry = _ClientEntry(
+        client=None,  # type: ignore[arg-type]
+        loop=loop,
+        http2=http2,
+        max_connections=max_connections,
+    )
+
+    async def count_request(request: httpx.Request) -> None:
+        entry.requests += 1
+
+    entry.client = httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        http2=http2,
+        headers=headers,
+        event_hooks={"request": [count_request]},
+    )
+    _clients[name] = entry
+    logger.info(f"HTTP client '{name}' created (http2={http2}, max_connections={max_connections})")
+    return entry.client
+
+
+async def close_http_client(name: str) -> None:
+    """Закрывает клиент с указанным именем"""
+    entry = _clients.pop(name, None)
+    if entry and not entry.client.is_closed:
+        await entry.client.aclose()
+        logger.info(f"HTTP client '{name}' closed after {entry.requests} requests")
+
+
+async def close_http_clients() -> None:
+    """Закрывает все общие клиенты (при остановке сервера)"""
+    for name in list(_clients):
+        try:
+            await close_http_client(name)
+        except Exception as e:
+            logger.error(f"Failed to close HTTP client '{name}': {e}")
+
+
+def http_clients_stats() -> dict:
+    """Снимок состояния клиентов для метрик"""
+    stats = {}
+    for name, entry in _clients.items():
+        pool = getattr(entry.client._transport, "_pool", None)
+        connections = getattr(pool, "connections", None)
+        stats[name] = {
+            "http2": entry.http2,
+            "max_connections": entry.max_connections,
+            "open_connections": len(connections) if connections is not None else None,
+            "requests": entry.requests,
+            "closed": entry.client.is_closed,
+        }
+    return stats
@@ -0,0 +1,294 @@
+"""
+Поиск почти одинаковых уроков курса (MinHash + LSH на NumPy).
+
+LLM часто повторяет одни и те же шаги и примеры в соседних уроках.
+Каждый урок превращается в множество шинглов — хешей k подряд идущих
+слов (заголовки Markdown не учитываются, а шинглы, которые есть у
+большей части уроков, считаются шаблоном и отбрасываются). Похожесть
+двух уроков — коэффициент Жаккара их множеств.
+
+Сравнивать все пары — O(n²), поэтому:
+  1. MinHash: для каждого урока сигнатура из num_perm минимумов
+     хешей шинглов (все уроки пачкой — одна матричная операция);
+     доля совпавших позиций двух сигнатур оценивает Жаккара.
+  2. LSH: сигнатура режется на bands полос по rows строк; уроки,
+     совпавшие хотя бы в одной полосе, — кандидаты в пары.
+  3. Кандидаты проверяются по сигнатурам, а затем точно — по шинглам.
+
+Тысячи уроков обрабатываются за секунды (см. benchmarks/bench_lesson_duplicates.py).
+
+Найденные пары помечаются в БД (flag_duplicate_lessons): более поздний
+урок пары получает статус "duplicate" и ссылку duplicate_of_id на
+ранний — генератор курса перегенерирует такие уроки с подсказкой,
+что нельзя повторять.
+"""
+import asyncio
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+import numpy as np
+from loguru import logger
+from sqlalchemy import select, update
+
+SHINGLE_SIZE = 4
+NUM_PERM = 128
+# Шинглы, которые есть у большей доли уроков, — шаблон промта, а не содержание
+MAX_DOCUMENT_FREQUENCY = 0.5
+# Частоту шинглов считаем только на наборах хотя бы из стольких уроков
+MIN_DOCUMENTS_FOR_FREQUENCY = 10
+# Кандидаты с оценкой по сигнатуре ниже threshold - ESTIMATE_MARGIN точно не проверяются
+ESTIMATE_MARGIN = 0.1
+# Вероятность, с которой LSH находит пару с похожестью ровно на пороге
+LSH_RECALL = 0.95
+# Сколько ячеек матрицы хешей (перестановки × шинглы) считается за раз
+MAX_HASH_CELLS = 1 << 22
+
+_WORD = re.compile(r"\w+")
+_HEADING = re.compile(r"^\s*#.*$", re.MULTILINE)
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def tokenize(text: str) -> List[str]:
+    """Слова текста урока в нижнем регистре, без строк-заголовков Markdown"""
+    return _WORD.findall(_HEADING.sub(" ", text or "").lower())
+
+
+def shingles(words: Sequence[str], size: int = SHINGLE_SIZE) -> np.ndarray:
+    """
+    Уникальные 64-битные хеши шинглов (size подряд идущих слов).
+
+    Слова хешируются встроенным hash(): он солится заново в каждом
+    процессе, поэтому хеши сравнимы только в пределах одного запуска
+    (сигнатуры нигде не сохраняются).
+
+    Args:
+        words: Слова текста (см. tokenize)
+        size: Слов в шингле; текст короче — один шингл из всех слов
+
+    Returns:
+        np.ndarray: Отсортированные хеши (uint64), пустой массив для пустого текста
+    """
+    ids = np.fromiter(map(hash, words), dtype=np.int64, count=len(words)).view(np.uint64)
+    if ids.size == 0:
+        return ids
+    size = min(size, ids.size)
+    windows = ids.size - size + 1
+    hashes = np.zeros(windows, dtype=np.uint64)
+    # Полиномиальный хеш окна (переполнение uint64 — часть хеша)
+    for offset in range(size):
+        hashes = hashes * _MIX + ids[offset:offset + windows] + np.uint64(1)
+    return np.unique(hashes)
+
+
+def lsh_params(
+    threshold: float, num_perm: int = NUM_PERM, recall: float = LSH_RECALL
+) -> Tuple[int, int]:
+    """
+    Число полос и строк в полосе для порога похожести.
+
+    Пара с похожестью s становится кандидатом с вероятностью
+    1 - (1 - s^rows)^bands. Пропущенную пару уже не найти, а лишний
+    кандидат отсеивается проверкой, поэтому берутся самые длинные
+    полосы (меньше кандидатов), при которых пара на пороге находится
+    с вероятностью не ниже recall.
+
+    Returns:
+        tuple: (bands, rows), bands * rows <= num_perm
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        if 1 - (1 - threshold ** rows) ** bands < recall:
+            break
+        best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """
+    MinHash-сигнатуры множеств шинглов.
+
+    Хеш-функции — multiply-shift: h(x) = (a·x + b) mod 2^64 >> 32
+    со случайными нечётными a; seed фиксирует их, поэтому сигнатуры
+    разных запусков сравнимы.
+    """
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        self.num_perm = num_perm
+        odd = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64) << np.uint64(1)
+        self._a = odd | np.uint64(1)
+        self._b = rng.integers(0, 1 << 63, num_perm, dtype=np.uint64)
+
+    def signatures(self, sets: Sequence[np.ndarray]) -> np.ndarray:
+        """
+        Сигнатуры непустых множеств шинглов.
+
+        Множества обрабатываются пачками (не больше MAX_HASH_CELLS ячеек
+        матрицы хешей), минимум по каждому множеству — np.minimum.reduceat.
+
+        Returns:
+            np.ndarray: Матрица (число множеств × num_perm), uint32
+        """
+        result = np.empty((len(sets), self.num_perm), dtype=np.uint32)
+        budget = max(1, MAX_HASH_CELLS // self.num_perm)
+        start = 0
+        while start < len(sets):
+            end, total = start, 0
+            while end < len(sets) and (end == start or total + len(sets[end]) <= budget):
+                total += len(sets[end])
+                end += 1
+            values = np.concatenate(sets[start:end])
+            offsets = np.cumsum([0] + [len(item) for item in sets[start:end - 1]])
+            hashes = (self._a[:, None] * values[None, :] + self._b[:, None]) >> np.uint64(32)
+            result[start:end] = np.minimum.reduceat(hashes, offsets, axis=1).T
+            start = end
+        return result
+
+
+@dataclass(frozen=True)
+class DuplicatePair:
+    """Пара похожих документов: second — более поздний (его и перегенерируют)"""
+    first: Hashable
+    second: Hashable
+    similarity: float
+
+
+def find_duplicates(
+    documents: Sequence[Tuple[Hashable, str]],
+    threshold: float = 0.5,
+    num_perm: int = NUM_PERM,
+    shingle_size: int = SHINGLE_SIZE,
+    max_df: float = MAX_DOCUMENT_FREQUENCY,
+) -> List[DuplicatePair]:
+    """
+    Пары документов с похожестью (Жаккар по шинглам) не ниже threshold.
+
+    Args:
+        documents: (ключ, текст) в порядке курса — в паре first раньше second
+        threshold: Порог похожести, 0..1
+        num_perm: Длина MinHash-сигнатуры (точность оценки ~ 1/sqrt(num_perm))
+        shingle_size: Слов в шингле
+        max_df: Шинглы, встречающиеся в большей доле документов, отбрасываются
+
+    Returns:
+        list: Пары по убыванию похожести
+    """
+    sets = [shingles(tokenize(text), shingle_size) for _, text in documents]
+
+    if len(sets) >= MIN_DOCUMENTS_FOR_FREQUENCY:
+        values, counts = np.unique(np.concatenate(sets), return_counts=True)
+        common = values[counts > max_df * len(sets)]
+        if common.size:
+            sets = [item[~np.isin(item, common, assume_unique=True)] for item in sets]
+
+    indexed = [index for index, item in enumerate(sets) if item.size]
+    if len(indexed) < 2:
+        return []
+    signatures = MinHasher(num_perm).signatures([sets[index] for index in indexed])
+
+    # LSH: кандидаты — документы, совпавшие хотя бы в одной полосе сигнатуры
+    bands, rows = lsh_params(threshold, num_perm)
+    weights = np.random.default_rng(0).integers(1, 1 << 63, rows, dtype=np.uint64) | np.uint64(1)
+    count = len(indexed)
+    candidates = []
+    for band in range(bands):
+        band_rows = signatures[:, band * rows:(band + 1) * rows].astype(np.uint64)
+        keys = (band_rows * weights).sum(axis=1)
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+        sizes = np.diff(np.append(starts, count))
+        # Корзины из одного документа (почти все) пар не дают
+        for start, size in zip(starts[sizes > 1], sizes[sizes > 1], strict=True):
+            bucket = order[start:start + size]
+            left, right = np.triu_indices(size, k=1)
+            first = np.minimum(bucket[left], bucket[right])
+            second = np.maximum(bucket[left], bucket[right])
+            candidates.append(first.astype(np.int64) * count + second)
+    if not candidates:
+        return []
+    pairs = np.unique(np.concatenate(candidates))
+    first, second = pairs // count, pairs % count
+
+    # Оценка по сигнатурам, затем точная проверка по шинглам
+    estimates = (signatures[first] == signatures[second]).mean(axis=1)
+    keep = estimates >= threshold - ESTIMATE_MARGIN
+    result = []
+    for i, j in zip(first[keep], second[keep], strict=True):
+        a, b = sets[indexed[i]], sets[indexed[j]]
+        common = np.intersect1d(a, b, assume_unique=True).size
+        similarity = common / (a.size + b.size - common)
+        if similarity >= threshold:
+            result.append(DuplicatePair(
+                documents[indexed[i]][0], documents[indexed[j]][0], round(similarity, 3)
+            ))
+    return sorted(result, key=lambda pair: pair.similarity, reverse=True)
+
+
+async def flag_duplicate_lessons(
+    course_slug: str, threshold: float, dry_run: bool = False
+) -> List[DuplicatePair]:
+    """
+    Ищет почти одинаковые уроки курса и помечает их для перегенерации.
+
+    Сравниваются уроки с контентом (статусы "ready" и "duplicate") в порядке
+    программы. Более поздний урок каждой пары получает статус "duplicate"
+    и duplicate_of_id — самый похожий на него ранний урок. Уроки, помеченные
+    раньше, но больше ни на что не похожие, возвращаются в "ready".
+
+    Args:
+        course_slug: Slug курса
+        threshold: Порог похожести (Жаккар по шинглам), 0..1
+        dry_run: Только найти пары, ничего не менять в БД
+
+    Returns:
+        list: Найденные пары (ключи — ID уроков)
+    """
+    from app.database import AsyncSessionLocal
+    from app.models import CourseModule, Lesson
+
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(Lesson.id, Lesson.content_text, Lesson.generation_status)
+            .join(CourseModule, Lesson.module_id == CourseModule.id)
+            .where(
+                CourseModule.course_slug == course_slug,
+                Lesson.generation_status.in_(("ready", "duplicate")),
+                Lesson.content_text.is_not(None),
+            )
+            .order_by(CourseModule.order, Lesson.order, Lesson.id)
+        )
+        rows = result.all()
+
+    started = time.perf_counter()
+    documents = [(row.id, row.content_text) for row in rows]
+    pairs = await asyncio.to_thread(find_duplicates, documents, threshold)
+    logger.info(
+        f"Duplicate scan for {course_slug}: {len(rows)} lessons, {len(pairs)} pairs "
+        f"above {threshold} in {time.perf_counter() - started:.2f}s"
+    )
+
+    # Пары отсортированы по убыванию похожести: первая пара урока — самая похожая
+    duplicate_of: Dict[int, int] = {}
+    for pair in pairs:
+        duplicate_of.setdefault(pair.second, pair.first)
+        logger.info(
+            f"Lesson #{pair.second} duplicates #{pair.first} (similarity {pair.similarity})"
+        )
+
+    changes = [
+        {"id": lesson_id, "generation_status": "duplicate", "duplicate_of_id": original}
+        for lesson_id, original in duplicate_of.items()
+    ] + [
+        {"id": row.id, "generation_status": "ready", "duplicate_of_id": None}
+        for row in rows
+        if row.generation_status == "duplicate" and row.id not in duplicate_of
+    ]
+    if changes and not dry_run:
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(Lesson), changes)
+            await session.commit()
+    return pairs
@@ -0,0 +1,121 @@
+"""
+Пре-рендеринг Markdown уроков в безопасный HTML.
+
+Урок рендерится один раз — при генерации или пакетным бэкафиллом
+(render_lessons.py) — и хранится в Lesson.content_html вместе с
+content_hash. Просмотр урока отдаёт готовый HTML без парсинга,
+а content_hash служит основой ETag.
+
+Конвейер: Markdown → HTML → плейсхолдеры [IMAGE: ...] и чек-листы
+"- [ ]" → санитайзер nh3 (всегда последним шагом: модель может вернуть
+произвольный HTML, в том числе <script>).
+
+Все функции чистые и работают только со строками, поэтому их можно
+выполнять в пуле процессов.
+"""
+import hashlib
+import html
+import re
+from typing import Optional
+
+import markdown
+import nh3
+
+# Версия конвейера: входит в хеш, поэтому правка рендера помечает
+# все уроки устаревшими для бэкафилла
+RENDERER_VERSION = 1
+
+MARKDOWN_EXTENSIONS = ["extra", "sane_lists"]
+
+ALLOWED_TAGS = {
+    "h1", "h2", "h3", "h4", "h5", "h6", "p", "br", "hr",
+    "strong", "em", "b", "i", "del", "code", "pre", "blockquote",
+    "ul", "ol", "li", "a", "img", "figure", "figcaption", "span",
+    "table", "thead", "tbody", "tr", "th", "td",
+}
+ALLOWED_ATTRIBUTES = {
+    "a": {"href", "title"},
+    "img": {"src", "alt", "title"},
+    "th": {"align"},
+    "td": {"align"},
+    "code": {"class"},
+    "figure": {"class"},
+    "li": {"class"},
+    "span": {"class"},
+}
+URL_SCHEMES = {"http", "https", "mailto"}
+
+_IMAGE_PLACEHOLDER = re.compile(r"<p>\s*\[IMAGE:\s*(.+?)\s*\]\s*</p>", re.IGNORECASE | re.DOTALL)
+_TASK_ITEM = re.compile(r"<li>\s*\[([ xX])\]\s*")
+
+
+def content_hash(content_text: Optional[str]) -> str:
+    """Хеш исходного текста урока с учётом версии конвейера (sha256, hex)"""
+    payload = f"{RENDERER_VERSION}\0{content_text or ''}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def _image_placeholder(match: re.Match) -> str:
+    description = html.escape(html.unescape(match.group(1)), quote=False)
+    return (
+        '<figure class="lesson-figure lesson-figure--placeholder">'
+        f"<figcaption>🖼 {description}</figcaption>"
+        "</figure>"
+    )
+
+
+def _task_item(match: re.Match) -> str:
+    checked = match.group(1).lower() == "x"
+    return f'<li class="task-item">{"☑" if checked else "☐"} '
+
+
+def render_markdown(content_text: Optional[str]) -> str:
+    """
+    Превращает Markdown урока в санитизированный HTML.
+
+    Args:
+        content_text: Markdown текст урока
+
+    Returns:
+        str: HTML, безопасный для вывода через | safe
+    """
+    if not content_text:
+        return ""
+    rendered = markdown.markdown(content_text, extensions=MARKDOWN_EXTENSIONS, output_format="html")
+    rendered = _IMAGE_PLACEHOLDER.sub(_image_placeholder, rendered)
+    rendered = _TASK_ITEM.sub(_task_item, rendered)
+    return nh3.clean(
+        rendered,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        url_schemes=URL_SCHEMES,
+        link_rel="noopener noreferrer nofollow",
+    )
+
+
+def render_lesson(content_text: Optional[str]) -> tuple[str, str]:
+    """
+    Рендерит урок.
+
+    Returns:
+        Tuple (content_html, content_hash)
+    """
+    return render_markdown(content_text), content_hash(content_text)
+
+
+def apply_rendering(lesson) -> bool:
+    """
+    Обновляет content_html/content_hash урока, если текст изменился.
+
+    Args:
+        lesson: Объект Lesson
+
+    Returns:
+        True, если урок был перерендерен
+    """
+    digest = content_hash(lesson.content_text)
+    if lesson.content_hash == digest and lesson.content_html is not None:
+        return False
+    lesson.content_html = render_markdown(lesson.content_text)
+    lesson.content_hash = digest
+    return True
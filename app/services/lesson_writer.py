@@ -0,0 +1,161 @@
+"""
+Пакетная запись сгенерированных уроков в БД.
+
+Генерация урока — десятки секунд запросов к LLM, запись — миллисекунды.
+Чтобы генерация не держала соединения из пула (их делят с веб-воркерами),
+готовые уроки копятся в памяти и пишутся пачками: одна короткая
+транзакция, как только готовы все уроки модуля (или пачка выросла
+до max_batch, или первый урок ждёт дольше max_delay). Markdown
+рендерится до того, как взято соединение.
+
+Строки уроков к этому моменту уже есть (их создаёт синхронизация
+структуры курса со статусом "pending"), поэтому пачка — это один
+executemany UPDATE по первичному ключу: asyncpg отправляет его
+конвейером, без круга до БД на каждый урок.
+"""
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+
+from app.models import Lesson
+from app.services.lesson_renderer import render_lesson
+
+lessons_table = Lesson.__table__
+
+
+def _ready_row(lesson_id: int, content: dict, generated_at: datetime) -> dict:
+    content_html, content_hash = render_lesson(content["content_text"])
+    return {
+        "lesson_id": lesson_id,
+        "content_text": content["content_text"],
+        "content_html": content_html,
+        "content_hash": content_hash,
+        "quiz_questions": content["quiz_questions"],
+        "generated_at": generated_at,
+    }
+
+
+async def save_lessons(results: List[Tuple[int, Optional[dict]]]) -> float:
+    """
+    Сохраняет результаты генерации уроков в одной транзакции.
+
+    Если контент урока не сгенерирован, урок получает статус "failed"
+    (кроме уже готовых уроков — у них остаётся прежний контент).
+    Уроки, удалённые во время генерации, пропускаются.
+
+    Args:
+        results: Пары (ID урока, контент или None)
+
+    Returns:
+        float: Сколько секунд было занято соединение
+    """
+    now = datetime.utcnow()
+    ready = [
+        _ready_row(lesson_id, content, now)
+        for lesson_id, content in results if content is not None
+    ]
+    failed = [lesson_id for lesson_id, content in results if content is None]
+    if not ready and not failed:
+        return 0.0
+
+    from app.database import engine
+
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        if ready:
+            await conn.execute(
+                update(lessons_table)
+                .where(lessons_table.c.id == bindparam("lesson_id"))
+                .values(
+                    content_text=bindparam("content_text"),
+                    content_html=bindparam("content_html"),
+                    content_hash=bindparam("content_hash"),
+                    quiz_questions=bindparam("quiz_questions"),
+                    generation_status="ready",
+                    duplicate_of_id=None,
+                    generated_at=bindparam("generated_at"),
+                ),
+                ready,
+            )
+        if failed:
+            await conn.execute(
+                update(lessons_table)
+                .where(lessons_table.c.id.in_(failed), lessons_table.c.generation_status != "ready")
+                .values(generation_status="failed")
+            )
+    return time.perf_counter() - started
+
+
+class LessonWriter:
+    """
+    Буфер готовых уроков одного запуска генерации.
+
+    Пример:
+        writer = LessonWriter(task.module_index for task in tasks, on_saved=report)
+        await writer.add(task.lesson_id, content, task.module_index)  # по мере генерации
+        await writer.flush()  # в конце (и при ошибке/отмене)
+    """
+
+    def __init__(
+        self,
+        groups: Iterable[int],
+        max_batch: int = 20,
+        max_delay: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+        on_saved: Optional[Callable[[List[Tuple[int, Optional[dict]]]], None]] = None,
+    ):
+        """
+        Args:
+            groups: Модуль каждого урока запуска (пачка пишется, когда готов весь модуль)
+            max_batch: Писать, как только накопилось столько уроков
+            max_delay: Писать, если первый урок пачки ждёт дольше (с) — потолок потерь при падении
+            on_saved: Функция (пары урок–контент пачки), вызывается после коммита пачки
+        """
+        self._remaining = Counter(groups)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.clock = clock
+        self.on_saved = on_saved
+        self._buffer: List[Tuple[int, Optional[dict]]] = []
+        self._first_at = 0.0
+        self._lock = asyncio.Lock()
+        self.rows = 0
+        self.transactions = 0
+        self.db_seconds = 0.0
+
+    async def add(self, lesson_id: int, content: Optional[dict], group: int) -> None:
+        """Добавляет результат урока; при необходимости пишет пачку"""
+        if not self._buffer:
+            self._first_at = self.clock()
+        self._buffer.append((lesson_id, content))
+        self._remaining[group] -= 1
+        if (
+            self._remaining[group] <= 0
+            or len(self._buffer) >= self.max_batch
+            or self.clock() - self._first_at >= self.max_delay
+        ):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Пишет всё накопленное одной транзакцией"""
+        async with self._lock:
+            rows, self._buffer = self._buffer, []
+            if not rows:
+                return
+            self.db_seconds += await save_lessons(rows)
+            self.rows += len(rows)
+            self.transactions += 1
+        if self.on_saved:
+            self.on_saved(rows)
+
+    def stats(self) -> dict:
+        return {
+            "rows": self.rows,
+            "transactions": self.transactions,
+            "db_ms": round(self.db_seconds * 1000, 1),
+            "buffered": len(self._buffer),
+        }
@@ -0,0 +1,208 @@
+"""
+Дисковый кеш ответов LLM, адресуемый по содержимому запроса.
+
+Ключ — sha256 от (model, messages, temperature, max_tokens), поэтому
+повторная генерация курса не платит за уже полученные ответы, а
+прерванная генерация при перезапуске быстро проходит готовые уроки.
+
+Режимы (LLM_CACHE_MODE):
+- readwrite — читать и записывать (по умолчанию)
+- readonly  — только читать; промахи идут в API, но не сохраняются
+- replay    — только читать; промах — ошибка LLMCacheMiss (тесты без сети)
+- refresh   — не читать, но записывать свежие ответы (принудительное обновление)
+- off       — кеш выключен
+
+Файлы лежат в LLM_CACHE_DIR/<2 символа ключа>/<ключ>.json. Общий
+размер ограничен LLM_CACHE_MAX_MB: при превышении удаляются файлы,
+к которым дольше всего не обращались (mtime обновляется при чтении).
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+CACHE_MODES = ("readwrite", "readonly", "replay", "refresh", "off")
+
+
+class LLMCacheMiss(RuntimeError):
+    """Ответа нет в кеше, а режим replay запрещает обращаться к API"""
+
+
+def cache_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    max_tokens: Optional[int],
+) -> str:
+    """Ключ кеша: sha256 канонического JSON параметров запроса"""
+    payload = json.dumps(
+        {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """Кеш ответов LLM в файлах с LRU-вытеснением по размеру"""
+
+    def __init__(
+        self, directory: str | Path, max_bytes: int = 512 * 1024 * 1024, mode: str = "readwrite"
+    ):
+        """
+        Args:
+            directory: Каталог кеша
+            max_bytes: Максимальный общий размер файлов
+            mode: Режим работы (см. CACHE_MODES)
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.mode = mode
+        self._size: Optional[int] = None  # считается при первой записи
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    @property
+    def readable(self) -> bool:
+        return self.mode in ("readwrite", "readonly", "replay")
+
+    @property
+    def writable(self) -> bool:
+        return self.mode in ("readwrite", "refresh")
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.json"
+
+    # Синхронные операции с файлами выполняются в пуле потоков
+    def _read(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)  # отметка для LRU
+            return entry
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Broken LLM cache entry {key[:12]}: {e}")
+            return None
+
+    def _write(self, key: str, entry: dict) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = json.dumps(entry, ensure_ascii=False).encode("utf-8")
+        previous = path.stat().st_size if path.exists() else 0
+
+        # Атомарная запись: временный файл + rename
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        if self._size is None:
+            self._size = self._scan_size()
+        else:
+            self._size += len(data) - previous
+        if self._size > self.max_bytes:
+            self._evict()
+
+    def _files(self) -> list[Path]:
+        return list(self.directory.glob("*/*.json"))
+
+    def _scan_size(self) -> int:
+        total = 0
+        for path in self._files():
+            try:
+                total += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+
+    def _evict(self) -> None:
+        """Удаляет самые давно использованные файлы до 90% лимита"""
+        entries = []
+        for path in self._files():
+            try:
+                stat = path.stat()
+                entries.append((stat.st_mtime, stat.st_size, path))
+            except FileNotFoundError:
+                pass
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        for _, size, path in entries:
+            if total <= target:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+        self._size = total
+
+    async def get(self, key: str) -> Optional[str]:
+        """
+        Возвращает закешированный ответ или None.
+
+        Raises:
+            LLMCacheMiss: В режиме replay, если ответа нет
+        """
+        if not self.readable:
+            return None
+        entry = await asyncio.to_thread(self._read, key)
+        if entry is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise LLMCacheMiss(f"LLM response {key[:12]} is not cached (replay mode)")
+            return None
+        self.hits += 1
+        return entry["content"]
+
+    async def put(self, key: str, content: str, model: str, usage: Optional[dict] = None) -> None:
+        """Сохраняет ответ (если режим разрешает запись)"""
+        if not self.writable:
+            return
+        entry = {
+            "key": key,
+            "model": model,
+            "content": content,
+            "usage": usage,
+            "created_at": time.time(),
+        }
+        try:
+            await asyncio.to_thread(self._write, key, entry)
+            self.writes += 1
+        except OSError as e:
+            # Кеш — оптимизация: ошибка записи не должна ломать генерацию
+            logger.warning(f"Failed to write LLM cache entry {key[:12]}: {e}")
+
+    def stats(self) -> dict:
+        """Снимок счётчиков кеша"""
+        return {
+            "mode": self.mode,
+            "directory": str(self.directory),
+            "size_bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,357 @@
+"""
+Планировщик запросов к LLM (OpenRouter): бюджеты, повторы, circuit breaker.
+
+Каждый запрос к провайдеру проходит через LLMScheduler.call():
+
+1. Ожидание, пока провайдер не на паузе: после 429 с Retry-After или при
+   открытом circuit breaker ждут все одновременные генерации, а не только
+   запрос, получивший ошибку.
+2. Бюджеты запросов в минуту (RPM) и токенов в минуту (TPM) — token bucket
+   из app.utils.limiter. С RATE_LIMIT_BACKEND=postgres бюджет общий для
+   всех процессов (приложение и воркеры очереди генерации).
+3. Повторы при 408/429/5xx и сетевых ошибках: Retry-After, если провайдер
+   его прислал, иначе экспоненциальная задержка с полным джиттером.
+4. Circuit breaker: после N подряд неудачных запросов (5xx, таймауты)
+   очередь встаёт на паузу; по её окончании проходит один пробный запрос.
+   Успех закрывает breaker, неудача снова открывает его на удвоенное время.
+
+Ошибки клиента (400, 401, 402, 403, 404) не повторяются.
+"""
+import asyncio
+import random
+import time
+from datetime import timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Optional
+
+import httpx
+from loguru import logger
+
+from app.config import Settings
+from app.utils.limiter import LimiterBackend, MemoryBackend, TokenBucketLimiter, get_limiter_backend
+
+# Коды ответа, после которых запрос имеет смысл повторить
+RETRYABLE_STATUSES = frozenset({408, 409, 425, 429, 500, 502, 503, 504, 520, 522, 524})
+# Оценка длины ответа для TPM, если max_tokens не задан
+DEFAULT_COMPLETION_TOKENS = 2000
+
+
+def parse_retry_after(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """
+    Разбирает заголовок Retry-After (секунды или HTTP-дата).
+
+    Returns:
+        float: Секунды ожидания (не меньше 0) или None, если заголовка нет или он некорректен
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    now = time.time() if now is None else now
+    return max(0.0, moment.timestamp() - now)
+
+
+def estimate_tokens(text_length: int, max_tokens: Optional[int] = None) -> int:
+    """Грубая оценка токенов запроса для бюджета TPM (~3 символа кириллицы на токен)"""
+    return text_length // 3 + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker: closed → open (пауза) → half-open (один пробный запрос) → closed.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = cooldown
+        self.opened_until = 0.0
+        self.opened_count = 0
+        self._probe = 0  # Номер последней выданной пробы half-open
+        self._probe_in_flight = False
+
+    def wait_time(self) -> float:
+        """
+        Сколько ждать перед запросом (0 — можно отправлять).
+
+        Пробу half-open не занимает: её забирает acquire() прямо перед отправкой.
+        """
+        if self.state == "closed":
+            return 0.0
+        now = self.clock()
+        if self.state == "open":
+            if now < self.opened_until:
+                return self.opened_until - now
+            self.state = "half_open"
+        if self._probe_in_flight:
+            return min(1.0, self.cooldown)
+        return 0.0
+
+    def acquire(self) -> Optional[int]:
+        """
+        Разрешение на отправку запроса.
+
+        Returns:
+            None — ждать (breaker открыт или проба уже в пути),
+            0 — обычный запрос,
+            номер пробы — пробный запрос half-open; вызывающий владеет пробой
+            и передаёт номер в release_probe(), если запрос кончился без исхода
+        """
+        if self.wait_time() > 0:
+            return None
+        if self.state == "closed":
+            return 0
+        self._probe += 1
+        self._probe_in_flight = True
+        return self._probe
+
+    def release_probe(self, probe: Optional[int]) -> None:
+        """Освобождает пробу её владельцем (номер из acquire()), если исход не записан"""
+        if probe and probe == self._probe:
+            self._probe_in_flight = False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            logger.info("LLM circuit breaker closed: provider is responding again")
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self.state == "half_open":
+            # Пробный запрос не прошёл — пауза вдвое дольше
+            self.cooldown = min(self.max_cooldown, self.cooldown * 2)
+            self._open()
+        elif self.state == "closed" and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = "open"
+        self.opened_until = self.clock() + self.cooldown
+        self.opened_count += 1
+        self._probe_in_flight = False
+        logger.warning(
+            f"LLM circuit breaker opened after {self.failures} failures, "
+            f"pausing requests for {self.cooldown:.0f}s"
+        )
+
+
+class LLMScheduler:
+    """
+    Общий для всех генераций планировщик запросов к одному провайдеру LLM.
+    """
+
+    def __init__(
+        self,
+        rpm: int = 0,
+        tpm: int = 0,
+        max_retries: int = 5,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        max_wait: float = 900.0,
+        breaker: Optional[CircuitBreaker] = None,
+        backend: Optional[LimiterBackend] = None,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            rpm: Запросов в минуту (0 — без ограничения)
+            tpm: Токенов в минуту (0 — без ограничения)
+            max_retries: Повторов одного запроса после первой попытки
+            backoff_base: Базовая задержка экспоненциального backoff, с
+            backoff_max: Максимальная задержка между попытками, с
+            max_wait: Сколько всего запрос может ждать (паузы, бюджет, повторы), с
+            breaker: Circuit breaker (по умолчанию — 5 ошибок, пауза 30 с)
+            backend: Хранилище бюджетов (по умолчанию — в памяти процесса)
+        """
+        backend = backend or MemoryBackend()
+        self.rpm_limiter = (
+            TokenBucketLimiter(backend, "llm:rpm", capacity=rpm, rate=rpm / 60) if rpm > 0 else None
+        )
+        self.tpm_limiter = (
+            TokenBucketLimiter(backend, "llm:tpm", capacity=tpm, rate=tpm / 60) if tpm > 0 else None
+        )
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_wait = max_wait
+        self.breaker = breaker or CircuitBreaker(clock=clock)
+        self.sleep = sleep
+        self.clock = clock
+        self.paused_until = 0.0
+
+        # Счётчики для /admin/metrics
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.gave_up = 0
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "LLMScheduler":
+        """Планировщик с параметрами из настроек (LLM_RPM, LLM_TPM, LLM_MAX_RETRIES, ...)"""
+        return cls(
+            rpm=settings.llm_rpm,
+            tpm=settings.llm_tpm,
+            max_retries=settings.llm_max_retries,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.llm_breaker_threshold,
+                cooldown=settings.llm_breaker_cooldown,
+            ),
+            backend=get_limiter_backend(),
+        )
+
+    def pause(self, seconds: float) -> None:
+        """Ставит все запросы на паузу (например, по Retry-After)"""
+        until = self.clock() + seconds
+        if until > self.paused_until:
+            self.paused_until = until
+            logger.warning(f"LLM requests paused for {seconds:.1f}s")
+
+    def backoff(self, attempt: int) -> float:
+        """Экспоненциальная задержка с полным джиттером (attempt с 0)"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def call(
+        self,
+        send: Callable[[], Awaitable[httpx.Response]],
+        estimated_tokens: int = 0,
+        key: str = "default",
+    ) -> httpx.Response:
+        """
+        Отправляет запрос с учётом бюджетов, пауз и повторов.
+
+        Args:
+            send: Корутина-фабрика, отправляющая запрос (вызывается на каждую попытку)
+            estimated_tokens: Оценка токенов запроса для бюджета TPM
+            key: Ключ бюджета (один провайдер — один ключ)
+
+        Returns:
+            httpx.Response: Последний ответ (успешный или с ошибкой, которую не стоит повторять)
+
+        Raises:
+            httpx.TransportError: Сетевая ошибка на последней попытке
+            TimeoutError: Запрос ждал дольше max_wait
+        """
+        deadline = self.clock() + self.max_wait
+        attempt = 0
+        while True:
+            probe = None
+            while probe is None:
+                await self._wait_until_ready(deadline)
+                await self._acquire_budget(key, estimated_tokens, deadline)
+                # Проба half-open занимается прямо перед отправкой
+                # (пока ждали бюджет, её мог забрать другой)
+                probe = self.breaker.acquire()
+
+            self.requests += 1
+            try:
+                response = await send()
+            except httpx.TransportError as e:
+                self.breaker.record_failure()
+                if attempt >= self.max_retries:
+                    self.gave_up += 1
+                    raise
+                delay = self.backoff(attempt)
+                logger.warning(
+                    f"LLM request failed ({type(e).__name__}), retry {attempt + 1} in {delay:.1f}s"
+                )
+            else:
+                if response.status_code not in RETRYABLE_STATUSES:
+                    # Успех или ошибка запроса: провайдер жив
+                    self.breaker.record_success()
+                    return response
+
+                retry_after = parse_retry_after(response.headers.get("Retry-After"))
+                if response.status_code == 429:
+                    # Лимит провайдера (сам провайдер жив): ждут все запросы
+                    self.breaker.record_success()
+                    delay = retry_after if retry_after is not None else self.backoff(attempt)
+                    self.pause(delay)
+                else:
+                    self.breaker.record_failure()
+                    delay = retry_after if retry_after is not None else self.backoff(attempt)
+                if attempt >= self.max_retries:
+                    self.gave_up += 1
+                    return response
+                await response.aclose()  # Потоковый ответ: освобождаем соединение до повтора
+                logger.warning(
+                    f"LLM request got {response.status_code}, retry {attempt + 1} in {delay:.1f}s"
+                )
+            finally:
+                # Проба без исхода (исключение, отмена хеджа или задачи) освобождается
+                # только владельцем: отмена обычного запроса в half-open
+                # не должна пропустить вторую пробу
+                self.breaker.release_probe(probe)
+
+            if self.clock() + delay > deadline:
+                raise TimeoutError(f"LLM request exceeded max wait of {self.max_wait:.0f}s")
+            attempt += 1
+            self.retries += 1
+            await self.sleep(delay)
+
+    async def _wait_until_ready(self, deadline: float) -> None:
+        """Ждёт окончания общей паузы и разрешения circuit breaker"""
+        while True:
+            # Сначала общая пауза: breaker опрашивается только после неё
+            wait = self.paused_until - self.clock()
+            if wait <= 0:
+                wait = self.breaker.wait_time()
+                if wait <= 0:
+                    return
+            if self.clock() + wait > deadline:
+                raise TimeoutError(f"LLM provider unavailable for more than {self.max_wait:.0f}s")
+            await self.sleep(wait)
+
+    async def _acquire_budget(self, key: str, estimated_tokens: int, deadline: float) -> None:
+        """Списывает запрос из RPM и токены из TPM, дожидаясь пополнения бюджетов"""
+        for limiter, cost in ((self.rpm_limiter, 1), (self.tpm_limiter, estimated_tokens)):
+            if limiter is None:
+                continue
+            # Запрос крупнее всего бюджета ждёт полного ведра
+            cost = min(max(cost, 1), limiter.capacity)
+            while True:
+                decision = await limiter.hit(key, cost=cost)
+                if decision.allowed:
+                    break
+                self.throttled += 1
+                if self.clock() + decision.retry_after > deadline:
+                    raise TimeoutError(
+                        f"LLM budget {limiter.prefix} exhausted for more than {self.max_wait:.0f}s"
+                    )
+                await self.sleep(decision.retry_after + random.uniform(0, 0.05))
+
+    def stats(self) -> dict:
+        """Состояние планировщика для /admin/metrics"""
+        return {
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened_count,
+            "paused_for": round(max(0.0, self.paused_until - self.clock()), 1),
+            "rpm": self.rpm_limiter.capacity if self.rpm_limiter else None,
+            "tpm": self.tpm_limiter.capacity if self.tpm_limiter else None,
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "gave_up": self.gave_up,
+        }
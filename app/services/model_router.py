@@ -0,0 +1,417 @@
+"""
+Маршрутизация запросов к LLM между моделями.
+
+Для каждой задачи (урок, квиз) задан упорядоченный список моделей:
+первая — основная, остальные — запасные. Роутер ведёт по каждой
+модели EWMA задержки и доли ошибок и по ним выбирает порядок:
+модель с частыми ошибками уходит в конец списка, а заметно более
+медленная, чем остальные, пропускает вперёд быструю.
+
+Если запрос к модели идёт дольше её p95 (для потоковых ответов —
+p95 времени до первого фрагмента), роутер параллельно отправляет
+хедж-запрос к следующей модели. Побеждает попытка, первой выдавшая
+ответ (для потока — первый фрагмент), проигравшая отменяется.
+Ошибка модели — сразу запрос к следующей по списку.
+"""
+import asyncio
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence
+
+from loguru import logger
+
+from app.config import Settings
+from app.services.llm_cache import LLMCacheMiss
+
+
+def parse_models(value: str) -> List[str]:
+    """'openai/gpt-5.1, openai/gpt-5-mini' → список моделей без пустых и повторов"""
+    models: List[str] = []
+    for model in value.split(","):
+        model = model.strip()
+        if model and model not in models:
+            models.append(model)
+    return models
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """Перцентиль выборки (ближайший ранг)"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+@dataclass
+class ModelStats:
+    """Наблюдения за одной моделью в одной задаче"""
+    alpha: float = 0.2
+    error_half_life: float = 60.0  # за сколько секунд без запросов доля ошибок падает вдвое
+    window: int = 200
+    latency_ms: Optional[float] = None  # EWMA полного ответа
+    ttfb_ms: Optional[float] = None  # EWMA первого фрагмента потока
+    error_rate: float = 0.0  # EWMA доли ошибок
+    error_updated_at: float = 0.0
+    requests: int = 0
+    errors: int = 0
+    hedges: int = 0  # хедж-запросов к этой модели
+    wins: int = 0  # ответов, принятых от этой модели
+    cancelled: int = 0  # проигравших попыток
+    latencies: deque = field(default_factory=deque)
+    ttfbs: deque = field(default_factory=deque)
+
+    def _ewma(self, current: Optional[float], value: float) -> float:
+        return value if current is None else current + self.alpha * (value - current)
+
+    def _sample(self, samples: deque, value: float) -> None:
+        samples.append(value)
+        if len(samples) > self.window:
+            samples.popleft()
+
+    def observe(
+        self, latency_ms: float, ok: bool, now: float, ttfb_ms: Optional[float] = None
+    ) -> None:
+        """Завершённый запрос: задержка и успех"""
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.error_rate = self._ewma(self.current_error_rate(now), 0.0 if ok else 1.0)
+        self.error_updated_at = now
+        if ok:
+            self.latency_ms = self._ewma(self.latency_ms, latency_ms)
+            self._sample(self.latencies, latency_ms)
+        if ttfb_ms is not None:
+            self.ttfb_ms = self._ewma(self.ttfb_ms, ttfb_ms)
+            self._sample(self.ttfbs, ttfb_ms)
+
+    def observe_cancelled(self, elapsed_ms: float, stream: bool, first_byte: bool) -> None:
+        """
+        Отменённая попытка: её задержка известна только снизу.
+
+        Время до отмены всё равно попадает в окно перцентиля — иначе
+        медленные ответы, которые всегда проигрывают хеджу, выпадали бы
+        из выборки и p95 сползал бы вниз, учащая хеджи.
+        """
+        self.cancelled += 1
+        if stream and not first_byte:
+            self._sample(self.ttfbs, elapsed_ms)
+        elif not stream:
+            self._sample(self.latencies, elapsed_ms)
+
+    def current_error_rate(self, now: float) -> float:
+        """Доля ошибок, затухающая со временем: упавшая модель со временем снова пробуется"""
+        if not self.error_rate or self.error_half_life <= 0:
+            return self.error_rate
+        return self.error_rate * 0.5 ** ((now - self.error_updated_at) / self.error_half_life)
+
+    def p95(self, stream: bool, min_samples: int) -> Optional[float]:
+        """p95 задержки (для потока — первого фрагмента) в мс; None, пока мало данных"""
+        samples = self.ttfbs if stream else self.latencies
+        if len(samples) < min_samples:
+            return None
+        return percentile(samples, 0.95)
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "latency_ewma_ms": round(self.latency_ms) if self.latency_ms is not None else None,
+            "ttfb_ewma_ms": round(self.ttfb_ms) if self.ttfb_ms is not None else None,
+            "latency_p95_ms": round(percentile(self.latencies, 0.95)) if self.latencies else None,
+            "ttfb_p95_ms": round(percentile(self.ttfbs, 0.95)) if self.ttfbs else None,
+            "error_rate": round(self.current_error_rate(now), 3),
+            "requests": self.requests,
+            "errors": self.errors,
+            "hedges": self.hedges,
+            "wins": self.wins,
+            "cancelled": self.cancelled,
+        }
+
+
+class ModelRouter:
+    """
+    Запросы к LLM с запасными моделями и хеджированием.
+
+    Пример:
+        router = ModelRouter(openrouter, {"quiz": ["openai/gpt-5.1", "openai/gpt-5-mini"]})
+        text = await router.generate_text("quiz", prompt, system_prompt=..., max_tokens=2000)
+    """
+
+    def __init__(
+        self,
+        openrouter,
+        routes: Dict[str, List[str]],
+        hedging: bool = True,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 1.0,
+        max_error_rate: float = 0.5,
+        slow_ratio: float = 3.0,
+        alpha: float = 0.2,
+        error_half_life: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Args:
+            openrouter: Клиент OpenRouter (generate_text)
+            routes: Задача → модели в порядке предпочтения
+            hedging: Отправлять хедж-запрос, когда модель отвечает дольше своего p95
+            hedge_min_samples: Сколько ответов модели нужно, чтобы доверять её p95
+            hedge_min_delay: Не хеджировать раньше, чем через столько секунд
+            max_error_rate: Модель с долей ошибок выше — в конец списка
+            slow_ratio: Модель медленнее самой быстрой во столько раз — после остальных
+            alpha: Вес нового наблюдения в EWMA
+            error_half_life: За сколько секунд без запросов доля ошибок падает вдвое
+        """
+        self.openrouter = openrouter
+        self.routes = {task: list(models) for task, models in routes.items() if models}
+        self.hedging = hedging
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.max_error_rate = max_error_rate
+        self.slow_ratio = slow_ratio
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.clock = clock
+        self._stats: Dict[tuple, ModelStats] = {}
+
+    @classmethod
+    def from_settings(cls, openrouter, settings: Settings) -> "ModelRouter":
+        return cls(
+            openrouter,
+            routes={
+                "lesson": parse_models(settings.llm_lesson_models),
+                "quiz": parse_models(settings.llm_quiz_models),
+            },
+            hedging=settings.llm_hedging,
+            hedge_min_delay=settings.llm_hedge_min_delay,
+        )
+
+    def model_stats(self, task: str, model: str) -> ModelStats:
+        key = (task, model)
+        if key not in self._stats:
+            self._stats[key] = ModelStats(alpha=self.alpha, error_half_life=self.error_half_life)
+        return self._stats[key]
+
+    def candidates(self, task: str) -> List[str]:
+        """
+        Модели задачи в порядке попыток.
+
+        Исходный порядок сохраняется, но модели с долей ошибок выше
+        max_error_rate идут последними, а модели медленнее самой
+        быстрой в slow_ratio раз — после остальных исправных.
+        """
+        if task not in self.routes:
+            raise ValueError(f"Unknown LLM task: {task}")
+        now = self.clock()
+        models = self.routes[task]
+        stats = {model: self.model_stats(task, model) for model in models}
+        healthy = [m for m in models if stats[m].current_error_rate(now) <= self.max_error_rate]
+        failing = sorted(
+            (m for m in models if m not in healthy),
+            key=lambda m: stats[m].current_error_rate(now),
+        )
+        known = [stats[m].latency_ms for m in healthy if stats[m].latency_ms is not None]
+        fastest = min(known, default=None)
+
+        def too_slow(model: str) -> bool:
+            latency = stats[model].latency_ms
+            if fastest is None or latency is None:
+                return False
+            return latency > self.slow_ratio * fastest
+
+        # sorted устойчив: внутри групп остаётся порядок из настроек
+        return sorted(healthy, key=too_slow) + failing
+
+    def hedge_delay(self, task: str, model: str, stream: bool) -> Optional[float]:
+        """Через сколько секунд после запроса к модели отправлять хедж (None — не хеджировать)"""
+        if not self.hedging:
+            return None
+        p95 = self.model_stats(task, model).p95(stream, self.hedge_min_samples)
+        if p95 is None:
+            return None
+        return max(self.hedge_min_delay, p95 / 1000)
+
+    async def generate_text(
+        self,
+        task: str,
+        prompt: str,
+        system_prompt: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        refresh: bool = False,
+        stream: bool = False,
+        on_delta: Optional[Callable[[str, int], Optional[bool]]] = None,
+    ) -> Optional[str]:
+        """
+        Генерирует текст моделями задачи task.
+
+        Сначала ищет готовый ответ в кеше LLM у всех моделей задачи
+        (ответ запасной модели из прошлого запуска тоже годится), затем
+        запрашивает модели по очереди с хеджированием.
+
+        Args:
+            task: Задача из routes ("lesson", "quiz")
+            on_delta: Функция (фрагмент, длина текста); получает фрагменты
+                только победившей попытки. Вернула False — генерация
+                прерывается без перехода к запасным моделям
+
+        Returns:
+            str: Текст или None, если ни одна модель не ответила
+        """
+        models = self.candidates(task)
+        request = dict(
+            prompt=prompt, system_prompt=system_prompt,
+            temperature=temperature, max_tokens=max_tokens,
+        )
+
+        if not refresh:
+            replay_miss: Optional[LLMCacheMiss] = None
+            for model in models:
+                try:
+                    content = await self.openrouter.generate_text(
+                        **request, model=model, cached_only=True, on_delta=on_delta
+                    )
+                except LLMCacheMiss as e:
+                    replay_miss = replay_miss or e
+                    continue
+                if content is not None:
+                    return content
+            if replay_miss is not None:
+                # Режим replay: запросов к API нет, запасные модели не помогут
+                raise replay_miss
+
+        return await self._race(task, models, request, stream, on_delta)
+
+    async def _race(
+        self,
+        task: str,
+        models: List[str],
+        request: dict,
+        stream: bool,
+        on_delta: Optional[Callable[[str, int], Optional[bool]]],
+    ) -> Optional[str]:
+        """Попытки по моделям: запасная — после ошибки, хедж — после p95"""
+        remaining = list(models)
+        attempts: Dict[asyncio.Task, str] = {}
+        owner: Optional[str] = None  # попытка, чьи фрагменты уходят вызывающему
+        aborted = False
+        last_model, last_started = models[0], self.clock()
+
+        def launch(hedge: bool) -> None:
+            nonlocal last_model, last_started
+            model = remaining.pop(0)
+            stats = self.model_stats(task, model)
+            if hedge:
+                stats.hedges += 1
+                logger.info(
+                    f"Hedging {task} request to {model}: {last_model} is slower than its p95"
+                )
+            last_model, last_started = model, self.clock()
+            coroutine = self._attempt(task, model, request, stream, relay(model))
+            attempts[asyncio.create_task(coroutine)] = model
+
+        def relay(model: str) -> Callable[[str, int], Optional[bool]]:
+            def on_fragment(delta: str, length: int) -> Optional[bool]:
+                nonlocal owner, aborted
+                if owner is None:
+                    owner = model
+                    for attempt, other in attempts.items():
+                        if other != model:
+                            attempt.cancel()
+                if owner != model or aborted:
+                    return False
+                if on_delta and on_delta(delta, length) is False:
+                    aborted = True
+                    return False
+                return None
+            return on_fragment
+
+        launch(hedge=False)
+        try:
+            while attempts:
+                timeout = None
+                if remaining and owner is None:
+                    delay = self.hedge_delay(task, last_model, stream)
+                    if delay is not None:
+                        timeout = max(0.0, last_started + delay - self.clock())
+                done, _ = await asyncio.wait(
+                    attempts, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    launch(hedge=True)
+                    continue
+
+                for attempt in done:
+                    model = attempts.pop(attempt)
+                    if attempt.cancelled():
+                        continue
+                    content = attempt.result()
+                    if aborted:
+                        return None
+                    if content is not None and owner in (None, model):
+                        self.model_stats(task, model).wins += 1
+                        return content
+                    if owner == model:
+                        # Поток победителя оборвался — начинаем заново со следующей модели
+                        owner = None
+
+                if not attempts and remaining:
+                    logger.warning(
+                        f"LLM {task} request to {model} failed, falling back to {remaining[0]}"
+                    )
+                    launch(hedge=False)
+            logger.error(f"All models failed for {task} request: {', '.join(models)}")
+            return None
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+            if attempts:
+                await asyncio.gather(*attempts, return_exceptions=True)
+
+    async def _attempt(
+        self,
+        task: str,
+        model: str,
+        request: dict,
+        stream: bool,
+        on_fragment: Callable[[str, int], Optional[bool]],
+    ) -> Optional[str]:
+        """Один запрос к модели с записью задержки и исхода в её статистику"""
+        stats = self.model_stats(task, model)
+        started = self.clock()
+        first_byte_ms: Optional[float] = None
+        declined = False
+
+        def track(delta: str, length: int) -> Optional[bool]:
+            nonlocal first_byte_ms, declined
+            if first_byte_ms is None:
+                first_byte_ms = (self.clock() - started) * 1000
+            result = on_fragment(delta, length)
+            declined = declined or result is False
+            return result
+
+        try:
+            content = await self.openrouter.generate_text(
+                **request, model=model, refresh=True, stream=stream, on_delta=track
+            )
+        except asyncio.CancelledError:
+            elapsed_ms = (self.clock() - started) * 1000
+            stats.observe_cancelled(elapsed_ms, stream, first_byte_ms is not None)
+            raise
+        if not declined:
+            # Прерванный нами поток — не ошибка модели
+            stats.observe(
+                (self.clock() - started) * 1000, content is not None, self.clock(),
+                ttfb_ms=first_byte_ms if stream else None,
+            )
+        return content
+
+    def stats(self) -> dict:
+        """Снимок статистики по задачам и моделям (для /admin/metrics)"""
+        now = self.clock()
+        return {
+            task: {
+                "order": self.candidates(task),
+                "models": {
+                    model: self.model_stats(task, model).to_dict(now)
+                    for model in models
+                },
+            }
+            for task, models in self.routes.items()
+        }
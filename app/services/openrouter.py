@@ -2,11 +2,18 @@
 Сервис для работы с OpenRouter API.
 Используется для генерации контента курсов через GPT-4/5.
 """
+import asyncio
+import json
+
 import httpx
-from typing import Dict, List, Optional, Any
+from typing import Awaitable, Callable, Dict, List, Optional, Any
 from loguru import logger
 
 from app.config import Settings
+from app.services.http import close_http_client, get_http_client
+from app.services.generation_usage import LLMCall, get_usage_recorder
+from app.services.llm_cache import LLMCache, cache_key
+from app.services.llm_scheduler import LLMScheduler, estimate_tokens
 
 
 class OpenRouterService:
@@ -17,8 +24,17 @@ class OpenRouterService:
     - openai/gpt-4
     - openai/gpt-5-mini
     - anthropic/claude-3
+
+    Все запросы идут через один долгоживущий httpx-клиент (пул соединений,
+    keep-alive, HTTP/2), который создаётся в startup() и закрывается в aclose().
+    Успешные ответы сохраняются в дисковый кеш (LLM_CACHE_MODE).
+    Запросы к API идут через LLMScheduler: бюджеты RPM/TPM, повторы
+    при 429/5xx с учётом Retry-After и circuit breaker.
+    Каждый вызов учитывается в generation_usage (токены, стоимость, задержка).
     """
 
+    CLIENT_NAME = "openrouter"
+
     def __init__(self, settings: Settings):
         """
         Инициализация сервиса OpenRouter.
@@ -28,19 +44,50 @@ class OpenRouterService:
         """
         self.settings = settings
         self.api_key = settings.openrouter_api_key
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
+        self.base_url = f"{settings.openrouter_base_url.rstrip('/')}/chat/completions"
         self.site_url = "https://neuro-magic.ru"  # Для рейтингов на openrouter.ai
         self.site_name = "Neuromagic"  # Используем латиницу для HTTP headers
 
+        self.cache = LLMCache(
+            settings.llm_cache_dir,
+            max_bytes=settings.llm_cache_max_mb * 1024 * 1024,
+            mode=settings.llm_cache_mode,
+        )
+        self.scheduler = LLMScheduler.from_settings(settings)
+
         if not self.api_key:
             logger.warning("OpenRouter API key not found in settings")
 
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Общий клиент OpenRouter (создаётся при первом обращении)"""
+        return get_http_client(
+            self.CLIENT_NAME,
+            timeout=self.settings.openrouter_timeout,
+            max_connections=self.settings.openrouter_max_connections,
+            max_keepalive_connections=self.settings.openrouter_max_connections,
+            http2=self.settings.openrouter_http2,
+        )
+
+    async def startup(self) -> None:
+        """Создаёт клиент заранее (before_serving)"""
+        _ = self.client
+
+    async def aclose(self) -> None:
+        """Закрывает клиент и его соединения (after_serving)"""
+        await close_http_client(self.CLIENT_NAME)
+
     async def chat_completion(
         self,
         messages: List[Dict[str, Any]],
         model: str = "openai/gpt-5-mini",
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        refresh: bool = False,
+        stream: bool = False,
+        on_delta: Optional[Callable[[str, int], Optional[bool]]] = None,
+        cached_only: bool = False,
     ) -> Optional[str]:
         """
         Делает запрос к OpenRouter API для генерации текста.
@@ -51,10 +98,36 @@ class OpenRouterService:
             model: Модель для использования (по умолчанию gpt-5-mini)
             temperature: Температура генерации (0.0-1.0)
             max_tokens: Максимальное количество токенов в ответе
+            timeout: Таймаут этого запроса в секундах (по умолчанию OPENROUTER_TIMEOUT)
+            refresh: Не брать ответ из кеша (свежий ответ всё равно сохранится)
+            stream: Получать ответ потоком (server-sent events) по мере генерации
+            on_delta: Функция (новый фрагмент, длина текста в символах), вызывается
+                на каждый фрагмент потока; вернула False — генерация прерывается
+                (соединение закрывается, провайдер перестаёт тратить токены)
+            cached_only: Только ответ из кеша, без запроса к API (None, если ответа нет)
 
         Returns:
-            str: Сгенерированный текст или None в случае ошибки
+            str: Сгенерированный текст или None в случае ошибки (или прерывания)
+
+        Raises:
+            LLMCacheMiss: В режиме кеша replay, если ответа нет в кеше
         """
+        call = LLMCall(model=model, stream=stream)
+        key = cache_key(model, messages, temperature, max_tokens)
+        if not refresh:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.info(
+                    f"OpenRouter response served from cache. Model: {model}, key: {key[:12]}"
+                )
+                call.status, call.cached = "cached", True
+                get_usage_recorder().record(call.to_row())
+                if on_delta:
+                    on_delta(cached, len(cached))
+                return cached
+        if cached_only:
+            return None
+
         try:
             headers = {
                 "Authorization": f"Bearer {self.api_key}",
@@ -67,40 +140,140 @@ class OpenRouterService:
                 "model": model,
                 "messages": messages,
                 "temperature": temperature,
+                "usage": {"include": True},  # OpenRouter вернёт стоимость запроса в usage.cost
             }
 
             # Добавляем max_tokens если указан
             if max_tokens:
                 payload["max_tokens"] = max_tokens
+            if stream:
+                payload["stream"] = True
 
-            # Делаем асинхронный запрос
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                response = await client.post(
-                    self.base_url,
-                    headers=headers,
-                    json=payload
+            def send() -> Awaitable[httpx.Response]:
+                call.attempts += 1
+                return self.client.send(
+                    self.client.build_request(
+                        "POST",
+                        self.base_url,
+                        headers=headers,
+                        json=payload,
+                        timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+                    ),
+                    stream=stream,
                 )
 
-                response.raise_for_status()
-                data = response.json()
+            def track_delta(delta: str, length: int) -> Optional[bool]:
+                call.first_byte()
+                return on_delta(delta, length) if on_delta else None
+
+            # Делаем асинхронный запрос через общий клиент (повторы и бюджеты — в планировщике)
+            prompt_chars = sum(len(str(m.get("content", ""))) for m in messages)
+            response = await self.scheduler.call(
+                send, estimated_tokens=estimate_tokens(prompt_chars, max_tokens)
+            )
+
+            if stream:
+                try:
+                    if response.is_error:
+                        await response.aread()
+                    response.raise_for_status()
+                    content, usage, call.status = await self._read_stream(response, track_delta)
+                finally:
+                    await response.aclose()
+                call.usage = usage
+                if content:
+                    logger.info(f"OpenRouter stream completed. Model: {model}, tokens: {usage}")
+                    await self.cache.put(key, content, model=model, usage=usage)
+                return content
 
-                # Извлекаем текст ответа
-                if "choices" in data and len(data["choices"]) > 0:
-                    content = data["choices"][0]["message"]["content"]
-                    logger.info(f"OpenRouter API request successful. Model: {model}, tokens: {data.get('usage', {})}")
-                    return content
-                else:
-                    logger.error(f"Unexpected response format: {data}")
-                    return None
+            response.raise_for_status()
+            data = response.json()
 
+            # Извлекаем текст ответа
+            call.usage = data.get("usage") or {}
+            if "choices" in data and len(data["choices"]) > 0:
+                content = data["choices"][0]["message"]["content"]
+                call.status = "ok"
+                logger.info(
+                    f"OpenRouter API request successful. "
+                    f"Model: {model}, tokens: {data.get('usage', {})}"
+                )
+                if content:
+                    await self.cache.put(key, content, model=model, usage=data.get("usage"))
+                    if on_delta:
+                        on_delta(content, len(content))
+                return content
+            else:
+                logger.error(f"Unexpected response format: {data}")
+                return None
+
+        except asyncio.CancelledError:
+            # Запрос отменён (хедж-запрос выиграл или задача отменена) — это не ошибка API
+            call.status = "cancelled"
+            raise
         except httpx.HTTPStatusError as e:
             logger.error(f"HTTP error from OpenRouter: {e.response.status_code} - {e.response.text}")
             return None
+        except TimeoutError as e:
+            logger.error(f"OpenRouter request abandoned: {e}")
+            return None
         except Exception as e:
             logger.error(f"Failed to make OpenRouter API request: {str(e)}")
             import traceback
             traceback.print_exc()
             return None
+        finally:
+            if not call.cached:
+                get_usage_recorder().record(call.to_row())
+
+    @staticmethod
+    async def _read_stream(
+        response: httpx.Response,
+        on_delta: Optional[Callable[[str, int], Optional[bool]]] = None,
+    ) -> tuple:
+        """
+        Читает ответ в формате server-sent events.
+
+        Строки "data: {...}" — фрагменты ответа, "data: [DONE]" — конец потока,
+        строки-комментарии (": OPENROUTER PROCESSING") пропускаются. Поток,
+        закрытый без [DONE] и finish_reason (обрыв прокси или провайдера),
+        считается ошибкой: обрезанный текст не возвращается и не кешируется.
+
+        Returns:
+            Tuple (текст или None, usage из последнего фрагмента, статус "ok" / "aborted" / "error")
+        """
+        parts: List[str] = []
+        length = 0
+        usage: dict = {}
+        finished = False
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                finished = True
+                break
+            chunk = json.loads(data)
+            if "error" in chunk:
+                # Ошибка посреди потока: статус уже 200, провайдер сообщает её фрагментом
+                logger.error(f"OpenRouter stream error: {chunk['error']}")
+                return None, usage, "error"
+            usage = chunk.get("usage") or usage
+            for choice in chunk.get("choices") or []:
+                finished = finished or bool(choice.get("finish_reason"))
+                delta = (choice.get("delta") or {}).get("content")
+                if not delta:
+                    continue
+                parts.append(delta)
+                length += len(delta)
+                if on_delta and on_delta(delta, length) is False:
+                    logger.warning(f"OpenRouter stream aborted by caller after {length} chars")
+                    return None, usage, "aborted"
+        if not finished:
+            logger.error(f"OpenRouter stream closed without [DONE] after {length} chars")
+            return None, usage, "error"
+        content = "".join(parts) or None
+        return content, usage, "ok" if content else "aborted"
 
     async def generate_text(
         self,
@@ -109,6 +282,11 @@ class OpenRouterService:
         model: str = "openai/gpt-5-mini",
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        refresh: bool = False,
+        stream: bool = False,
+        on_delta: Optional[Callable[[str, int], Optional[bool]]] = None,
+        cached_only: bool = False,
     ) -> Optional[str]:
         """
         Упрощённый метод для генерации текста по промту.
@@ -119,6 +297,11 @@ class OpenRouterService:
             model: Модель для использования
             temperature: Температура генерации
             max_tokens: Максимальное количество токенов
+            timeout: Таймаут запроса в секундах (опционально)
+            refresh: Не брать ответ из кеша
+            stream: Получать ответ потоком (SSE)
+            on_delta: Функция (фрагмент, длина текста) для потокового режима
+            cached_only: Только ответ из кеша, без запроса к API
 
         Returns:
             str: Сгенерированный текст или None
@@ -142,7 +325,12 @@ class OpenRouterService:
             messages=messages,
             model=model,
             temperature=temperature,
-            max_tokens=max_tokens
+            max_tokens=max_tokens,
+            timeout=timeout,
+            refresh=refresh,
+            stream=stream,
+            on_delta=on_delta,
+            cached_only=cached_only,
         )
 
 
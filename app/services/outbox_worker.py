@@ -0,0 +1,212 @@
+"""
+Общая часть фоновых очередей-таблиц (outbox): письма, заявки квеста.
+
+Строка очереди проходит статусы "pending" → "sending" → итоговый и несёт
+attempts, next_attempt_at и locked_until (аренда). Воркер забирает пачку
+готовых строк одним UPDATE ... WHERE id IN (SELECT ... FOR UPDATE SKIP
+LOCKED) — несколько процессов не получат одну строку, — обрабатывает их и
+пишет результат одним executemany UPDATE. Строка, чей воркер не отчитался
+до locked_until (процесс убит), забирается заново: гарантия — «хотя бы
+один раз».
+
+OutboxWorker — цикл с опросом и сигналом wake(), запуск и остановка
+фоновой задачей; что делать с пачкой, решает подкласс (dispatch_batch).
+"""
+import asyncio
+import os
+import random
+import socket
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, List, Optional
+
+from loguru import logger
+from sqlalchemy import and_, or_, select, update
+
+from app.database import AsyncSessionLocal
+
+# Максимальная пауза между попытками, с
+RETRY_MAX_DELAY = 300.0
+# Длина текста ошибки, сохраняемого в строке
+MAX_ERROR_LENGTH = 500
+
+
+def retry_delay(attempts: int, base: float, max_delay: float = RETRY_MAX_DELAY) -> float:
+    """Пауза перед следующей попыткой: экспоненциальная, со случайным разбросом (full jitter)"""
+    return random.uniform(0, min(max_delay, base * 2 ** attempts))
+
+
+def error_text(error: BaseException) -> str:
+    """Текст ошибки для колонки last_error"""
+    return f"{type(error).__name__}: {error}"[:MAX_ERROR_LENGTH]
+
+
+async def claim_rows(
+    model: Any, limit: int, lease: float, order_by: tuple = (), **values
+) -> List[Any]:
+    """
+    Забирает до limit готовых строк очереди и арендует их на lease секунд.
+
+    Готовы строки в "pending" с наступившим next_attempt_at и строки в
+    "sending", чья аренда истекла (воркер не записал результат).
+
+    Args:
+        model: Модель очереди (EmailOutbox, QuestLead)
+        order_by: Порядок захвата (по умолчанию — по id)
+        values: Дополнительные поля захваченных строк (например worker_id)
+
+    Returns:
+        List: Строки в статусе "sending" (attempts уже увеличен), по id
+    """
+    now = datetime.utcnow()
+    ready = (
+        select(model.id)
+        .where(
+            or_(
+                and_(model.status == "pending", model.next_attempt_at <= now),
+                and_(model.status == "sending", model.locked_until < now),
+            )
+        )
+        .order_by(*(order_by or (model.id,)))
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            update(model)
+            .where(model.id.in_(ready))
+            .values(
+                status="sending",
+                attempts=model.attempts + 1,
+                locked_until=now + timedelta(seconds=lease),
+                **values,
+            )
+            .returning(model)
+        )
+        rows = list(result.scalars())
+        await db.commit()
+    return sorted(rows, key=lambda row: row.id)
+
+
+async def finish_rows(model: Any, changes: List[dict]) -> None:
+    """Записывает результаты обработки пачки (словари с id и новыми значениями полей)"""
+    if not changes:
+        return
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(model), changes)
+        await db.commit()
+
+
+class OutboxWorker(ABC):
+    """
+    Фоновый обработчик очереди-таблицы.
+
+    Подкласс реализует dispatch_batch() (захват, обработка, запись
+    результатов пачки) и при необходимости paused_for() — паузу, в
+    течение которой очередь не опрашивается (например после 429).
+
+    Пример:
+        worker.start()   # при старте сервера
+        worker.wake()    # после коммита новой строки — не ждать опроса
+        await worker.stop()
+    """
+
+    # Имя для журнала и имя фоновой задачи
+    name = "Outbox worker"
+    task_name = "outbox-worker"
+
+    def __init__(self, batch_size: int, poll_interval: float = 2.0, lease: float = 60.0):
+        """
+        Args:
+            batch_size: Строк за один захват
+            poll_interval: Как часто проверять очередь без сигнала wake(), с
+            lease: На сколько секунд строки закрепляются за воркером
+        """
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._wakeup = asyncio.Event()
+        self._stop: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def configured(self) -> bool:
+        """Можно ли запускать воркер (например, заданы ли учётные данные)"""
+        return True
+
+    def wake(self) -> None:
+        """Сигнал о новой строке: воркер проверит очередь сразу, а не по опросу"""
+        self._wakeup.set()
+
+    def paused_for(self) -> float:
+        """Сколько секунд очередь не опрашивается (0 — без паузы)"""
+        return 0.0
+
+    @abstractmethod
+    async def dispatch_batch(self) -> int:
+        """
+        Забирает и обрабатывает одну пачку.
+
+        Returns:
+            int: Сколько строк обработано
+        """
+
+    async def run(self, stop: Optional[asyncio.Event] = None, until_empty: bool = False) -> None:
+        """
+        Основной цикл: захват пачки, обработка, запись результатов.
+
+        Args:
+            stop: Событие остановки (текущая пачка дорабатывает)
+            until_empty: Завершиться, когда готовых строк не осталось
+        """
+        stop = stop or asyncio.Event()
+        logger.info(f"{self.name} {self.worker_id} started: batch={self.batch_size}")
+        while not stop.is_set():
+            self._wakeup.clear()
+            try:
+                processed = await self.dispatch_batch()
+            except Exception as e:
+                # БД недоступна и т.п.: строки дождутся в очереди
+                logger.error(f"{self.name} error: {type(e).__name__}: {e}")
+                processed = 0
+            # Полная пачка — в очереди могут быть ещё строки
+            if processed >= self.batch_size:
+                continue
+            pause = self.paused_for()
+            if not processed and until_empty and pause <= 0:
+                break
+
+            waiters = [asyncio.create_task(self._wakeup.wait()), asyncio.create_task(stop.wait())]
+            await asyncio.wait(
+                waiters, timeout=max(self.poll_interval, pause), return_when=asyncio.FIRST_COMPLETED
+            )
+            for waiter in waiters:
+                waiter.cancel()
+        logger.info(f"{self.name} {self.worker_id} stopped: {self.stats()}")
+
+    def start(self) -> Optional[asyncio.Task]:
+        """Запускает run() фоновой задачей текущего event loop (если воркер настроен)"""
+        if not self.configured:
+            logger.warning(f"{self.name} is not configured, not started")
+            return None
+        if self._task is None or self._task.done():
+            self._stop = asyncio.Event()
+            self._task = asyncio.create_task(self.run(self._stop), name=self.task_name)
+        return self._task
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Останавливает фоновую задачу (текущая пачка дорабатывает не дольше timeout)"""
+        if self._task is None:
+            return
+        self._stop.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except TimeoutError:
+            logger.warning(f"{self.name} did not stop in time")
+        self._task = None
+
+    def stats(self) -> dict:
+        """Счётчики воркера этого процесса (подклассы дополняют)"""
+        return {"running": self._task is not None and not self._task.done()}
@@ -0,0 +1,218 @@
+"""
+Сервис асинхронного хеширования паролей.
+
+bcrypt намеренно медленный (200-300 мс на хеш), поэтому вызывать его прямо
+из обработчика нельзя — блокируется весь event loop воркера Hypercorn.
+Сервис выполняет bcrypt в отдельном ограниченном пуле потоков, отклоняет
+запросы при переполнении очереди и собирает метрики задержек.
+
+Калибровка cost-фактора:
+    python -m app.services.passwords --target-ms 250
+"""
+import argparse
+import asyncio
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import bcrypt
+from loguru import logger
+
+from app.config import Settings
+
+# Допустимый диапазон cost-фактора bcrypt
+MIN_ROUNDS = 10
+MAX_ROUNDS = 15
+
+# Сколько последних замеров хранить для перцентилей
+LATENCY_WINDOW = 1000
+
+
+class PasswordHasherBusy(Exception):
+    """Очередь хеширования переполнена, запрос нужно отклонить"""
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    """Перцентиль по отсортированному списку (метод ближайшего ранга)"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(percent / 100 * len(values))) - 1))
+    return values[index]
+
+
+def calibrate_rounds(
+    target_ms: float,
+    min_rounds: int = MIN_ROUNDS,
+    max_rounds: int = MAX_ROUNDS,
+    samples: int = 3,
+) -> int:
+    """
+    Подбирает максимальный cost-фактор bcrypt, укладывающийся в бюджет.
+
+    Каждый шаг cost удваивает время хеширования, поэтому достаточно
+    измерить минимальный cost и экстраполировать, проверив результат замером.
+
+    Args:
+        target_ms: Бюджет времени на один хеш в миллисекундах
+        min_rounds: Нижняя граница cost (используется даже если бюджет меньше)
+        max_rounds: Верхняя граница cost
+        samples: Количество замеров на каждый проверяемый cost
+
+    Returns:
+        int: Подобранный cost-фактор
+    """
+    def measure(rounds: int) -> float:
+        salt = bcrypt.gensalt(rounds)
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            bcrypt.hashpw(b"calibration-password", salt)
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    base_ms = measure(min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and base_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+
+    # Экстраполяция может ошибаться на загруженной машине — проверяем замером
+    while rounds > min_rounds and measure(rounds) > target_ms:
+        rounds -= 1
+
+    logger.info(
+        f"bcrypt calibrated: rounds={rounds} "
+        f"(base {base_ms:.1f} ms at {min_rounds}, target {target_ms} ms)"
+    )
+    return rounds
+
+
+class PasswordHasher:
+    """
+    Асинхронный фасад над bcrypt.
+
+    - Выделенный пул потоков (не конкурирует с email и другими executor'ами)
+    - Ограничение глубины очереди: при переполнении — PasswordHasherBusy
+    - Метрики: количество операций, отказы, перцентили задержки
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_queue: int = 32):
+        """
+        Args:
+            rounds: cost-фактор bcrypt для новых хешей
+            workers: Количество потоков для bcrypt
+            max_queue: Максимум операций в работе и ожидании одновременно
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bcrypt")
+        self._in_flight = 0
+        self._completed = 0
+        self._rejected = 0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    async def _run(self, func, *args):
+        """Выполняет bcrypt-операцию в пуле с учётом back-pressure и метрик"""
+        if self._in_flight >= self.max_queue:
+            self._rejected += 1
+            logger.warning(f"Password hasher queue is full ({self._in_flight}/{self.max_queue})")
+            raise PasswordHasherBusy("Password hashing queue is full")
+
+        self._in_flight += 1
+        started = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, func, *args)
+        finally:
+            self._in_flight -= 1
+            self._completed += 1
+            self._latencies.append((time.perf_counter() - started) * 1000)
+
+    async def hash_password(self, password: str) -> str:
+        """
+        Возвращает bcrypt-хеш пароля.
+
+        Raises:
+            PasswordHasherBusy: если очередь переполнена
+        """
+        salt = bcrypt.gensalt(self.rounds)
+        hashed = await self._run(bcrypt.hashpw, password.encode("utf-8"), salt)
+        return hashed.decode("utf-8")
+
+    async def verify_password(self, password: str, password_hash: Optional[str]) -> bool:
+        """
+        Проверяет пароль по хешу.
+
+        Raises:
+            PasswordHasherBusy: если очередь переполнена
+        """
+        if not password_hash:
+            return False
+        return await self._run(
+            bcrypt.checkpw, password.encode("utf-8"), password_hash.encode("utf-8")
+        )
+
+    async def calibrate(self, target_ms: float) -> int:
+        """Калибрует cost-фактор в пуле потоков и применяет его к новым хешам"""
+        loop = asyncio.get_running_loop()
+        self.rounds = await loop.run_in_executor(self._executor, calibrate_rounds, target_ms)
+        return self.rounds
+
+    def stats(self) -> dict:
+        """Снимок метрик сервиса"""
+        latencies = sorted(self._latencies)
+        return {
+            "rounds": self.rounds,
+            "workers": self.workers,
+            "in_flight": self._in_flight,
+            "max_queue": self.max_queue,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "latency_ms": {
+                "p50": round(_percentile(latencies, 50), 1),
+                "p95": round(_percentile(latencies, 95), 1),
+                "p99": round(_percentile(latencies, 99), 1),
+            },
+        }
+
+    def shutdown(self) -> None:
+        """Останавливает пул потоков"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Глобальный экземпляр сервиса
+_password_hasher: Optional[PasswordHasher] = None
+
+
+def get_password_hasher() -> PasswordHasher:
+    """
+    Возвращает глобальный экземпляр PasswordHasher.
+
+    Returns:
+        PasswordHasher: Сервис хеширования паролей
+    """
+    global _password_hasher
+    if _password_hasher is None:
+        settings = Settings()
+        _password_hasher = PasswordHasher(
+            rounds=settings.bcrypt_rounds,
+            workers=settings.password_hash_workers,
+            max_queue=settings.password_hash_max_queue,
+        )
+    return _password_hasher
+
+
+def shutdown_password_hasher() -> None:
+    """Останавливает глобальный экземпляр (при остановке сервера)"""
+    global _password_hasher
+    if _password_hasher is not None:
+        _password_hasher.shutdown()
+        _password_hasher = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Калибровка cost-фактора bcrypt")
+    parser.add_argument("--target-ms", type=float, required=True, help="Бюджет на один хеш, мс")
+    args = parser.parse_args()
+    print(f"BCRYPT_ROUNDS={calibrate_rounds(args.target_ms)}")
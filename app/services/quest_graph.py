@@ -0,0 +1,138 @@
+"""
+Граф квеста для клиента: QUEST_DATA, скомпилированный в JSON один раз.
+
+Раньше каждый шаг квеста — POST ответа, редирект и GET страницы вопроса
+(около 20 запросов за квест, сессионная cookie растёт с каждым ответом).
+Теперь браузер один раз получает граф (вопросы, варианты, переходы) по
+URL с версией — хешем содержимого, поэтому его можно кешировать навсегда:
+изменится QUEST_DATA — изменится и URL. static/js/quest.js проходит граф
+локально и отправляет все ответы одним POST /free-quest/submit.
+
+Метаданные ответов (purpose, access, ...) в граф не попадают: сервер не
+доверяет клиенту и восстанавливает их сам, проверяя путь по QUEST_DATA
+(validate_path) — ответы получаются такими же, как при пошаговом
+прохождении, и calculate_recommendation работает без изменений.
+"""
+import hashlib
+import json
+from typing import Dict, List, Optional
+
+from app.data.quest_v2 import QUEST_DATA
+
+START = "q1"
+# Поля вопроса, нужные клиенту для показа
+_NODE_FIELDS = ("id", "type", "text", "description", "placeholder", "hint", "min_length", "next")
+# Поля ответа, которые не относятся к метаданным профиля
+_ANSWER_FIELDS = ("id", "text", "next")
+# Ограничение текстового ответа (проект мечты): ответы хранятся в сессионной cookie
+MAX_TEXT_LENGTH = 2000
+
+
+class QuestPathError(ValueError):
+    """Ответы не образуют путь по графу квеста"""
+
+
+class QuestGraph:
+    """
+    Скомпилированный граф квеста.
+
+    Пример:
+        graph = get_quest_graph()
+        graph.version   # хеш содержимого, часть URL графа
+        graph.body      # JSON для клиента (bytes)
+        answers = graph.validate_path(submitted)
+    """
+
+    def __init__(self, data: Dict[str, dict] = QUEST_DATA, start: str = START):
+        self.data = data
+        self.start = start
+        nodes = {node_id: _client_node(node) for node_id, node in data.items()}
+        payload = {"start": start, "nodes": nodes}
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        self.version = hashlib.sha256(canonical.encode()).hexdigest()[:12]
+        body = {"version": self.version, **payload}
+        self.body = json.dumps(body, ensure_ascii=False, separators=(",", ":")).encode()
+
+    def validate_path(self, submitted: List[dict]) -> List[dict]:
+        """
+        Проверяет ответы клиента по графу и восстанавливает их метаданные.
+
+        Args:
+            submitted: [{"question_id", "answer_id"} | {"question_id", "text"}, ...]
+                       от первого вопроса до формы контактов
+
+        Returns:
+            List[dict]: Ответы в формате сессии quest_answers
+
+        Raises:
+            QuestPathError: Пропущен вопрос, неизвестный вариант, короткий текст,
+                путь не дошёл до контактов
+        """
+        if not isinstance(submitted, list):
+            raise QuestPathError("answers must be a list")
+        answers = []
+        current = self.start
+        for item in submitted:
+            node = self.data.get(current)
+            if node is None or node["type"] not in ("choice", "text"):
+                raise QuestPathError(f"unexpected answer after {current}")
+            if not isinstance(item, dict) or item.get("question_id") != current:
+                raise QuestPathError(f"expected answer to {current}")
+
+            if node["type"] == "choice":
+                answer_id = item.get("answer_id")
+                chosen = next(
+                    (answer for answer in node["answers"] if answer["id"] == answer_id), None
+                )
+                if chosen is None:
+                    raise QuestPathError(f"unknown answer {answer_id!r} to {current}")
+                answer = {"question_id": current, "answer_id": answer_id, "answer_text": ""}
+                answer.update(
+                    {key: value for key, value in chosen.items() if key not in _ANSWER_FIELDS}
+                )
+                current = chosen["next"]
+            else:
+                text = item.get("text")
+                if not isinstance(text, str):
+                    raise QuestPathError(f"text answer to {current} has invalid length")
+                text = text.strip()
+                if not node.get("min_length", 0) <= len(text) <= MAX_TEXT_LENGTH:
+                    raise QuestPathError(f"text answer to {current} has invalid length")
+                answer = {
+                    "question_id": current, "answer_id": None,
+                    "answer_text": text, "user_prompt": text,
+                }
+                current = node["next"]
+            answers.append(answer)
+
+        if self.data.get(current, {}).get("type") != "contact":
+            raise QuestPathError(f"quest is not finished: stopped at {current}")
+        return answers
+
+
+def _client_node(node: dict) -> dict:
+    client = {key: node[key] for key in _NODE_FIELDS if key in node}
+    if "answers" in node:
+        client["answers"] = [
+            {key: answer[key] for key in _ANSWER_FIELDS} for answer in node["answers"]
+        ]
+    if node["type"] == "text":
+        client["max_length"] = MAX_TEXT_LENGTH
+    return client
+
+
+# Глобальный экземпляр графа
+_quest_graph: Optional[QuestGraph] = None
+
+
+def get_quest_graph() -> QuestGraph:
+    """
+    Возвращает глобальный экземпляр QuestGraph.
+
+    Returns:
+        QuestGraph: Граф квеста, скомпилированный из QUEST_DATA
+    """
+    global _quest_graph
+    if _quest_graph is None:
+        _quest_graph = QuestGraph()
+    return _quest_graph
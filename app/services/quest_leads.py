@@ -0,0 +1,378 @@
+"""
+Заявки с квеста: сохранение в quest_leads и фоновая доставка в Telegram.
+
+Форма контактов только записывает заявку в БД и сразу редиректит на
+результаты — медленный Bot API больше не держит запрос пользователя.
+QuestLeadSender (фоновая задача процесса приложения, на общем
+OutboxWorker) забирает недоставленные заявки с арендой и SKIP LOCKED и
+шлёт их через общий httpx-клиент "telegram":
+    - одна заявка — подробное сообщение, как раньше;
+    - несколько сразу (всплеск) — дайджест: заявки коротко, по несколько
+      в сообщении (до 4096 символов), чтобы не упереться в лимит сообщений
+      в группу;
+    - 429 Too Many Requests — пауза на retry_after из ответа, попытка не
+      засчитывается;
+    - другие ошибки — повтор с экспоненциальной паузой, после
+      QUEST_LEADS_MAX_ATTEMPTS попыток заявка помечается failed (в БД она
+      остаётся).
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from app.config import Settings
+from app.database import AsyncSessionLocal
+from app.models import QuestLead
+from app.services.http import get_http_client
+from app.services.outbox_worker import (
+    OutboxWorker,
+    claim_rows,
+    error_text,
+    finish_rows,
+    retry_delay,
+)
+
+# Ограничение Bot API на длину сообщения
+MAX_MESSAGE_LENGTH = 4096
+# Длина текстового ответа («проект мечты») в подробном сообщении и в дайджесте
+PROJECT_LENGTH = 1500
+DIGEST_PROJECT_LENGTH = 300
+# Пауза при 429 без retry_after в ответе, с
+DEFAULT_RETRY_AFTER = 5.0
+
+
+class TelegramError(Exception):
+    """Bot API отклонил сообщение; retry_after — сколько секунд ждать при 429"""
+
+    def __init__(self, description: str, retry_after: Optional[float] = None):
+        super().__init__(description)
+        self.retry_after = retry_after
+
+
+async def send_telegram_message(bot_token: str, chat_id: str, text: str, api_url: str) -> None:
+    """
+    Отправляет сообщение через Bot API (общий клиент "telegram").
+
+    Raises:
+        TelegramError: Ответ Bot API без ok (retry_after заполнен при 429)
+        httpx.HTTPError: Сеть, таймаут
+    """
+    client = get_http_client("telegram", timeout=10.0, max_connections=5)
+    response = await client.post(
+        f"{api_url}/bot{bot_token}/sendMessage",
+        json={"chat_id": chat_id, "text": text, "disable_web_page_preview": True},
+    )
+    try:
+        result = response.json()
+    except ValueError:
+        result = {}
+    if response.status_code == 200 and result.get("ok"):
+        return
+    retry_after = (result.get("parameters") or {}).get("retry_after")
+    if response.status_code == 429 and retry_after is None:
+        retry_after = float(response.headers.get("Retry-After") or DEFAULT_RETRY_AFTER)
+    description = result.get("description") or f"HTTP {response.status_code}"
+    raise TelegramError(description, retry_after=retry_after)
+
+
+def lead_fields(answers: List[dict], contact: dict, recommendation: Optional[dict]) -> dict:
+    """Поля заявки из ответов квеста, контактов и рекомендации"""
+    project = purpose = access = ""
+    for answer in answers:
+        if answer.get('user_prompt'):
+            project = answer['user_prompt']
+        if 'purpose' in answer:
+            purpose = answer['purpose']
+        if 'access' in answer:
+            access = answer['access']
+    courses = [rec['title'] for rec in (recommendation or {}).get('recommendations', [])[:3]]
+    return {
+        "name": contact.get('name', '')[:100],
+        "telegram": contact.get('telegram', '')[:100],
+        "phone": contact.get('phone', '')[:50],
+        "purpose": str(purpose)[:100],
+        "access": str(access)[:100],
+        "project": project,
+        "courses": courses,
+        "answers": answers,
+    }
+
+
+async def save_quest_lead(
+    answers: List[dict], contact: dict, recommendation: Optional[dict] = None
+) -> QuestLead:
+    """
+    Сохраняет заявку для фоновой отправки.
+
+    Returns:
+        QuestLead: Сохранённая заявка
+    """
+    now = datetime.utcnow()
+    lead = QuestLead(
+        **lead_fields(answers, contact, recommendation),
+        status="pending",
+        attempts=0,
+        next_attempt_at=now,
+        created_at=now,
+    )
+    async with AsyncSessionLocal() as db:
+        db.add(lead)
+        await db.commit()
+    logger.info(f"Quest lead #{lead.id} saved: {lead.telegram or lead.phone}")
+    return lead
+
+
+async def claim_leads(worker_id: str, limit: int, lease: float) -> List[QuestLead]:
+    """
+    Забирает до limit недоставленных заявок (старые первыми) и арендует их на lease секунд.
+
+    Returns:
+        List[QuestLead]: Заявки в статусе "sending" (attempts уже увеличен)
+    """
+    return await claim_rows(QuestLead, limit, lease)
+
+
+async def finish_leads(changes: List[dict]) -> None:
+    """Записывает результаты отправки (словари с id и новыми значениями полей)"""
+    await finish_rows(QuestLead, changes)
+
+
+def _shorten(text: str, length: int) -> str:
+    return text if len(text) <= length else text[:length - 1] + "…"
+
+
+def format_lead(lead: QuestLead) -> str:
+    """Подробное сообщение об одной заявке"""
+    courses = "\n".join(f"• {course}" for course in lead.courses) or 'Не определены'
+    return f"""🎓 НОВАЯ ЗАЯВКА С КВЕСТА
+
+👤 Контакты:
+Имя: {lead.name or 'Не указано'}
+Telegram: {lead.telegram or 'Не указано'}
+Телефон: {lead.phone or 'Не указан'}
+
+🎯 Цель использования AI:
+{lead.purpose or 'Не определена'}
+
+🌐 Доступ к нейросетям:
+{lead.access or 'Не определён'}
+
+💡 Проект мечты:
+{_shorten(lead.project, PROJECT_LENGTH) or 'Не указан'}
+
+📚 Рекомендованные курсы:
+{courses}
+
+---
+Время: {lead.created_at:%Y-%m-%d %H:%M:%S} UTC"""
+
+
+def format_digest_entry(lead: QuestLead) -> str:
+    """Заявка в дайджесте: коротко, несколько строк"""
+    contacts = " · ".join(value for value in (lead.name, lead.telegram, lead.phone) if value)
+    lines = [f"#{lead.id} {contacts} ({lead.created_at:%H:%M} UTC)"]
+    if lead.purpose or lead.access:
+        lines.append(f"🎯 {lead.purpose or '—'} · 🌐 {lead.access or '—'}")
+    if lead.project:
+        lines.append(f"💡 {_shorten(' '.join(lead.project.split()), DIGEST_PROJECT_LENGTH)}")
+    if lead.courses:
+        lines.append(f"📚 {', '.join(lead.courses)}")
+    return "\n".join(lines)
+
+
+def plan_messages(leads: List[QuestLead]) -> List[Tuple[str, List[QuestLead]]]:
+    """
+    Сообщения для пачки заявок: (текст, заявки в нём).
+
+    Одна заявка — подробное сообщение; несколько — дайджесты, каждый до
+    MAX_MESSAGE_LENGTH символов.
+    """
+    if len(leads) == 1:
+        return [(format_lead(leads[0]), leads)]
+
+    messages: List[Tuple[str, List[QuestLead]]] = []
+    entries: List[str] = []
+    group: List[QuestLead] = []
+
+    def flush():
+        header = f"🎓 НОВЫЕ ЗАЯВКИ С КВЕСТА: {len(group)}"
+        messages.append(("\n\n".join([header, *entries]), list(group)))
+
+    for lead in leads:
+        entry = format_digest_entry(lead)
+        # Заголовок (до 40 символов) + разделители + записи
+        if group and 40 + sum(len(e) + 2 for e in entries) + len(entry) + 2 > MAX_MESSAGE_LENGTH:
+            flush()
+            entries, group = [], []
+        entries.append(entry)
+        group.append(lead)
+    flush()
+    return messages
+
+
+class QuestLeadSender(OutboxWorker):
+    """
+    Фоновая доставка заявок в Telegram.
+
+    Пример:
+        sender = get_quest_lead_sender()
+        sender.start()   # при старте сервера
+        sender.wake()    # после сохранения заявки — не ждать опроса
+        await sender.stop()
+    """
+
+    name = "Quest lead sender"
+    task_name = "quest-lead-sender"
+
+    def __init__(
+        self,
+        bot_token: Optional[str] = None,
+        chat_id: Optional[str] = None,
+        send: Optional[Callable[[str], Awaitable[None]]] = None,
+        digest_size: Optional[int] = None,
+        max_attempts: Optional[int] = None,
+        retry_base: float = 5.0,
+        poll_interval: float = 5.0,
+        lease: float = 60.0,
+    ):
+        """
+        Args:
+            bot_token, chat_id: Бот и чат для заявок (по умолчанию из настроек)
+            send: Отправка текста (по умолчанию Bot API sendMessage)
+            digest_size: Сколько заявок собирать в дайджест за раз (1 — каждая отдельным сообщением)
+            max_attempts: Попыток отправки на заявку (без учёта 429)
+            retry_base: Базовая пауза между попытками, с (удваивается)
+            poll_interval: Как часто проверять заявки без сигнала wake(), с
+            lease: На сколько секунд заявки закрепляются за отправителем
+        """
+        settings = Settings()
+        digest_size = max(1, digest_size or settings.quest_leads_digest_size)
+        super().__init__(digest_size, poll_interval, lease)
+        self.bot_token = bot_token or settings.telegram_bot_token
+        self.chat_id = chat_id or settings.telegram_chat_id
+        self.api_url = settings.telegram_api_url
+        self._send = send
+        self.max_attempts = max_attempts or settings.quest_leads_max_attempts
+        self.retry_base = retry_base
+        self._paused_until = 0.0  # time.monotonic() конца паузы после 429
+        self.sent = 0
+        self.messages = 0
+        self.rate_limited = 0
+        self.failed = 0
+
+    @property
+    def digest_size(self) -> int:
+        return self.batch_size
+
+    @property
+    def configured(self) -> bool:
+        return self._send is not None or bool(self.bot_token and self.chat_id)
+
+    async def send(self, text: str) -> None:
+        if self._send is not None:
+            await self._send(text)
+        else:
+            await send_telegram_message(self.bot_token, self.chat_id, text, self.api_url)
+
+    def paused_for(self) -> float:
+        """Сколько секунд осталось до конца паузы после 429"""
+        return max(0.0, self._paused_until - time.monotonic())
+
+    async def dispatch_batch(self) -> int:
+        """
+        Забирает и отправляет одну пачку заявок (до digest_size).
+
+        Returns:
+            int: Сколько заявок обработано (0 — очередь пуста или пауза после 429)
+        """
+        if self.paused_for() > 0:
+            return 0
+        leads = await claim_leads(self.worker_id, self.digest_size, self.lease)
+        if not leads:
+            return 0
+
+        changes: Dict[int, dict] = {}
+        plan = plan_messages(leads)
+        for index, (text, group) in enumerate(plan):
+            now = datetime.utcnow()
+            try:
+                await self.send(text)
+            except TelegramError as e:
+                if e.retry_after is None:
+                    self._retry(group, e, now, changes)
+                    continue
+                # Лимит Bot API: ждём, сколько сказано, и не тратим попытки
+                self.rate_limited += 1
+                self._paused_until = time.monotonic() + e.retry_after
+                logger.warning(
+                    f"Telegram rate limit, pausing quest lead delivery for {e.retry_after}s"
+                )
+                resume_at = now + timedelta(seconds=e.retry_after)
+                for _, rest in plan[index:]:
+                    for lead in rest:
+                        changes[lead.id] = {
+                            "id": lead.id, "status": "pending", "locked_until": None,
+                            "attempts": lead.attempts - 1, "next_attempt_at": resume_at,
+                            "last_error": str(e),
+                        }
+                break
+            except Exception as e:
+                self._retry(group, e, now, changes)
+            else:
+                self.messages += 1
+                self.sent += len(group)
+                for lead in group:
+                    changes[lead.id] = {
+                        "id": lead.id, "status": "sent", "locked_until": None, "sent_at": now,
+                    }
+                logger.info(f"Quest leads sent to Telegram: {[lead.id for lead in group]}")
+        await finish_leads(list(changes.values()))
+        return len(leads)
+
+    def _retry(
+        self, group: List[QuestLead], error: BaseException, now: datetime, changes: Dict[int, dict]
+    ) -> None:
+        """Повтор с экспоненциальной паузой или failed после max_attempts"""
+        text = error_text(error)
+        for lead in group:
+            change = {"id": lead.id, "locked_until": None, "last_error": text}
+            if lead.attempts >= self.max_attempts:
+                self.failed += 1
+                logger.error(
+                    f"Quest lead #{lead.id} not delivered after {lead.attempts} attempts: {text}"
+                )
+                changes[lead.id] = {**change, "status": "failed"}
+            else:
+                delay = retry_delay(lead.attempts, self.retry_base)
+                change.update(status="pending", next_attempt_at=now + timedelta(seconds=delay))
+                changes[lead.id] = change
+
+    def stats(self) -> dict:
+        """Счётчики отправителя этого процесса"""
+        return {
+            **super().stats(),
+            "sent": self.sent,
+            "messages": self.messages,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "paused_for": round(self.paused_for(), 1),
+        }
+
+
+# Глобальный экземпляр отправителя
+_quest_lead_sender: Optional[QuestLeadSender] = None
+
+
+def get_quest_lead_sender() -> QuestLeadSender:
+    """
+    Возвращает глобальный экземпляр QuestLeadSender.
+
+    Returns:
+        QuestLeadSender: Фоновая доставка заявок в Telegram
+    """
+    global _quest_lead_sender
+    if _quest_lead_sender is None:
+        _quest_lead_sender = QuestLeadSender()
+    return _quest_lead_sender
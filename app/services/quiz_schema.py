@@ -0,0 +1,250 @@
+"""
+Разбор и проверка квизов, сгенерированных LLM.
+
+Модель не всегда возвращает чистый JSON: бывают обёртки ```json,
+пояснения до и после, висячие запятые, оборванный по max_tokens
+конец. JSONScanner за один проход по тексту (можно кормить
+фрагментами потока) находит первый JSON-объект и при обрыве
+достраивает закрывающие скобки. validate_quiz проверяет схему и
+приводит квиз к компактной форме, которую проверка ответов
+(courses.submit_quiz) использует как есть:
+
+    {
+        "questions": [
+            {"question": "...", "answers": ["...", "...", "...", "..."],
+             "correct": 2, "explanation": "..."}
+        ],
+        "answer_key": [2, ...]
+    }
+"""
+import json
+import re
+from typing import Any, List, Optional
+
+ANSWERS_PER_QUESTION = 4
+# Квиз, в котором после исправления осталось меньше валидных вопросов, отбрасывается
+MIN_QUESTIONS = 3
+
+# Формат для промта исправления (совпадает с форматом из промта генерации квиза)
+QUIZ_JSON_FORMAT = """{
+    "questions": [
+        {
+            "question": "Текст вопроса?",
+            "answers": ["Вариант 1", "Вариант 2", "Вариант 3", "Вариант 4"],
+            "correct": 0,
+            "explanation": "Почему это правильный ответ (1 предложение)"
+        }
+    ]
+}"""
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_DANGLING_KEY = re.compile(r',?\s*"(?:[^"\\]|\\.)*"\s*:\s*$')
+
+
+class QuizFormatError(ValueError):
+    """
+    Квиз не разобран или не прошёл проверку схемы.
+
+    Attributes:
+        problems: Список ошибок (для лога и промта исправления)
+        valid_questions: Вопросы, прошедшие проверку (в компактной форме)
+    """
+
+    def __init__(self, problems: List[str], valid_questions: Optional[List[dict]] = None):
+        super().__init__("; ".join(problems))
+        self.problems = problems
+        self.valid_questions = valid_questions or []
+
+
+class JSONScanner:
+    """
+    Инкрементальный поиск первого JSON-объекта или массива в тексте.
+
+    Пример:
+        scanner = JSONScanner()
+        for fragment in stream:
+            if scanner.feed(fragment):
+                break  # объект закрыт, дальше — пояснения модели
+        data = scanner.loads()
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._closers: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self.started = False
+        self.complete = False
+
+    def feed(self, fragment: str) -> bool:
+        """Добавляет фрагмент текста; возвращает True, когда верхний объект закрыт"""
+        if self.complete:
+            return True
+        begin = 0
+        for index, char in enumerate(fragment):
+            if not self.started:
+                if char in "{[":
+                    self.started = True
+                    self._closers.append("}" if char == "{" else "]")
+                    begin = index
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._closers.append("}" if char == "{" else "]")
+            elif char in "}]" and self._closers and char == self._closers[-1]:
+                self._closers.pop()
+                if not self._closers:
+                    self._parts.append(fragment[begin:index + 1])
+                    self.complete = True
+                    return True
+        if self.started:
+            self._parts.append(fragment[begin:])
+        return False
+
+    def text(self) -> str:
+        """
+        Найденный JSON; если текст оборвался, недостающие кавычки
+        и скобки дописываются, а недописанный ключ отбрасывается.
+        """
+        text = "".join(self._parts)
+        if self.complete or not self.started:
+            return text
+        if self._in_string:
+            if self._escape:
+                text = text[:-1]  # оборвалось на обратном слеше
+            text += '"'
+        text = _DANGLING_KEY.sub("", text.rstrip()).rstrip().rstrip(",")
+        return text + "".join(reversed(self._closers))
+
+    def loads(self) -> Any:
+        """
+        Разбирает найденный JSON с поправками на типичные ошибки моделей.
+
+        Raises:
+            QuizFormatError: JSON не найден или не разбирается
+        """
+        if not self.started:
+            raise QuizFormatError(["в ответе нет JSON-объекта"])
+        text = self.text()
+        for candidate in (text, _TRAILING_COMMA.sub(r"\1", text)):
+            try:
+                # strict=False: переводы строк внутри строк JSON — частая ошибка моделей
+                return json.loads(candidate, strict=False)
+            except json.JSONDecodeError as e:
+                error = e
+        raise QuizFormatError([
+            f"невалидный JSON: {error.msg} (строка {error.lineno}, позиция {error.colno})"
+        ])
+
+
+def extract_json(text: str) -> Any:
+    """Первый JSON-объект или массив из ответа модели (см. JSONScanner)"""
+    scanner = JSONScanner()
+    scanner.feed(text)
+    return scanner.loads()
+
+
+def _correct_index(value: Any, answers: List[str]) -> Optional[int]:
+    """Индекс правильного ответа: число, строка с числом или текст самого ответа"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        if value in answers:
+            return answers.index(value)
+    return None
+
+
+def _validate_question(number: int, raw: Any) -> tuple:
+    """(вопрос в компактной форме или None, ошибки вопроса)"""
+    if not isinstance(raw, dict):
+        return None, [f"вопрос {number}: ожидается объект"]
+    problems = []
+    question = str(raw.get("question") or "").strip()
+    if not question:
+        problems.append(f"вопрос {number}: пустой текст вопроса")
+
+    answers = raw.get("answers")
+    if not isinstance(answers, list):
+        answers = []
+    answers = [str(answer).strip() for answer in answers if str(answer).strip()]
+    if len(answers) != ANSWERS_PER_QUESTION:
+        problems.append(
+            f"вопрос {number}: нужно {ANSWERS_PER_QUESTION} непустых варианта ответа, "
+            f"а не {len(answers)}"
+        )
+
+    correct = _correct_index(raw.get("correct"), answers)
+    if correct is None or not 0 <= correct < ANSWERS_PER_QUESTION:
+        problems.append(
+            f"вопрос {number}: correct должен быть индексом ответа "
+            f"от 0 до {ANSWERS_PER_QUESTION - 1}, а не {raw.get('correct')!r}"
+        )
+
+    explanation = str(raw.get("explanation") or "").strip()
+    if not explanation:
+        problems.append(f"вопрос {number}: пустое объяснение")
+
+    if problems:
+        return None, problems
+    item = {
+        "question": question, "answers": answers, "correct": correct, "explanation": explanation,
+    }
+    return item, []
+
+
+def validate_quiz(data: Any) -> dict:
+    """
+    Проверяет квиз и приводит его к компактной форме.
+
+    Каждый вопрос: непустой текст, ровно 4 непустых ответа,
+    correct — индекс одного из них, непустое объяснение.
+
+    Returns:
+        dict: {"questions": [...], "answer_key": [...]}
+
+    Raises:
+        QuizFormatError: Ошибки схемы (с валидными вопросами в valid_questions)
+    """
+    if isinstance(data, list):
+        data = {"questions": data}
+    questions = data.get("questions") if isinstance(data, dict) else None
+    if not isinstance(questions, list) or not questions:
+        raise QuizFormatError(["нет непустого списка questions"])
+
+    valid, problems = [], []
+    for number, raw in enumerate(questions, start=1):
+        question, question_problems = _validate_question(number, raw)
+        if question is not None:
+            valid.append(question)
+        problems.extend(question_problems)
+    if problems:
+        raise QuizFormatError(problems, valid)
+    return compact_quiz(valid)
+
+
+def compact_quiz(questions: List[dict]) -> dict:
+    """Квиз из проверенных вопросов с ключом ответов для проверки"""
+    return {"questions": questions, "answer_key": [question["correct"] for question in questions]}
+
+
+def parse_quiz(text: str) -> dict:
+    """
+    Квиз из ответа модели: извлечение JSON и проверка схемы.
+
+    Raises:
+        QuizFormatError: JSON не найден, не разбирается или не прошёл проверку
+    """
+    return validate_quiz(extract_json(text))
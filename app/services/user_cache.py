@@ -0,0 +1,176 @@
+"""
+Кеш идентичности пользователя (id, username, avatar, is_active).
+
+Два уровня:
+- мемо на время запроса (quart.g) — повторные обращения в одном запросе бесплатны
+- кеш процесса с TTL и LRU-вытеснением — страницы авторизованного
+  пользователя в обычном случае не делают ни одного запроса к users
+
+Любое изменение строки User через ORM (аватар, профиль, деактивация)
+инвалидирует запись автоматически через событие SQLAlchemy. Изменения
+из других процессов подхватываются по истечении TTL.
+"""
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from loguru import logger
+from quart import g, has_app_context
+from sqlalchemy import event, select
+
+from app.models import User
+
+
+@dataclass(frozen=True)
+class UserIdentity:
+    """Неизменяемый снимок данных пользователя для шаблонов и авторизации"""
+    id: int
+    username: str
+    email: str
+    avatar_url: str
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserIdentity":
+        return cls(
+            id=user.id,
+            username=user.username,
+            email=user.email,
+            avatar_url=user.avatar_url,
+            is_active=user.is_active,
+        )
+
+
+class UserIdentityCache:
+    """
+    Кеш UserIdentity по user_id с TTL и ограничением размера.
+
+    Счётчики:
+    - request_hits: найдено в мемо текущего запроса
+    - hits: найдено в кеше процесса
+    - misses: пришлось загрузить из БД
+    """
+
+    def __init__(self, ttl: float = 300, max_size: int = 10_000):
+        """
+        Args:
+            ttl: Время жизни записи в секундах
+            max_size: Максимум записей (самые старые вытесняются)
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries: OrderedDict[int, tuple[float, UserIdentity]] = OrderedDict()
+        self.request_hits = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def _request_memo() -> Optional[dict]:
+        if not has_app_context():
+            return None
+        if not hasattr(g, "_user_identities"):
+            g._user_identities = {}
+        return g._user_identities
+
+    async def _load(self, user_id: int) -> Optional[UserIdentity]:
+        from app.database import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(User.id, User.username, User.email, User.avatar_url, User.is_active)
+                .where(User.id == user_id)
+            )
+            row = result.one_or_none()
+        return UserIdentity(*row) if row else None
+
+    async def get(self, user_id: int) -> Optional[UserIdentity]:
+        """
+        Возвращает данные пользователя или None, если пользователь не найден.
+
+        Args:
+            user_id: ID пользователя
+        """
+        memo = self._request_memo()
+        if memo is not None and user_id in memo:
+            self.request_hits += 1
+            return memo[user_id]
+
+        identity = None
+        entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            identity = entry[1]
+        else:
+            self.misses += 1
+            identity = await self._load(user_id)
+            if identity:
+                self.put(identity)
+
+        if memo is not None:
+            memo[user_id] = identity
+        return identity
+
+    def put(self, identity: UserIdentity) -> None:
+        """Кладёт свежие данные в кеш (например, сразу после входа)"""
+        self._entries[identity.id] = (time.monotonic() + self.ttl, identity)
+        self._entries.move_to_end(identity.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        """Удаляет пользователя из кеша процесса и из мемо текущего запроса"""
+        if self._entries.pop(user_id, None) is not None:
+            self.invalidations += 1
+        memo = self._request_memo()
+        if memo is not None:
+            memo.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Полностью очищает кеш"""
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        """Снимок счётчиков кеша"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "request_hits": self.request_hits,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+        }
+
+
+# Глобальный экземпляр кеша
+_user_cache: Optional[UserIdentityCache] = None
+
+
+def get_user_cache() -> UserIdentityCache:
+    """
+    Возвращает глобальный экземпляр UserIdentityCache.
+
+    Returns:
+        UserIdentityCache: Кеш идентичности пользователей
+    """
+    global _user_cache
+    if _user_cache is None:
+        _user_cache = UserIdentityCache(
+            ttl=float(os.getenv("USER_CACHE_TTL", "300")),
+            max_size=int(os.getenv("USER_CACHE_MAX_SIZE", "10000")),
+        )
+    return _user_cache
+
+
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _invalidate_on_change(mapper, connection, target: User) -> None:
+    """Профиль, аватар или статус изменились — сбрасываем кеш пользователя"""
+    get_user_cache().invalidate(target.id)
+    logger.debug(f"User identity cache invalidated for #{target.id}")
@@ -0,0 +1,398 @@
+"""
+Движок rate limiting: алгоритмы и бэкенды хранения состояния.
+
+Алгоритмы:
+- SlidingWindowLimiter — скользящее окно (взвешенные счётчики текущего
+  и предыдущего окна, O(1) памяти на ключ)
+- TokenBucketLimiter — token bucket (допускает всплески до capacity)
+
+Бэкенды:
+- MemoryBackend — в памяти процесса, LRU с ограничением числа ключей
+- PostgresBackend — общий для всех воркеров и нод, UNLOGGED-таблица
+  rate_limit_counters, одно обращение к БД на проверку
+
+Бэкенд по умолчанию выбирается переменной RATE_LIMIT_BACKEND (memory | postgres).
+"""
+import math
+import os
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional, Protocol
+
+from loguru import logger
+from sqlalchemy import Float, String, bindparam, text
+
+# Максимум ключей в памяти процесса (самые старые вытесняются)
+MEMORY_MAX_KEYS = 100_000
+
+# Как часто (в обращениях) удалять истёкшие записи из PostgreSQL
+POSTGRES_CLEANUP_EVERY = 1000
+
+
+@dataclass(frozen=True)
+class Decision:
+    """Результат проверки лимита"""
+    allowed: bool
+    remaining: float
+    retry_after: float = 0.0  # секунд до следующей разрешённой попытки
+
+
+def _sliding_estimate(
+    count: float, prev_count: float, window_start: float, now: float, window: float
+) -> float:
+    """Оценка числа событий за последние window секунд"""
+    weight = max(0.0, 1.0 - (now - window_start) / window)
+    return prev_count * weight + count
+
+
+def _sliding_retry_after(
+    count: float,
+    prev_count: float,
+    window_start: float,
+    now: float,
+    window: float,
+    limit: float,
+    need: float,
+) -> float:
+    """Через сколько секунд оценка опустится до limit - need"""
+    budget = limit - need
+    if count > budget:
+        # Текущее окно уже переполнено: ждём его переход в «предыдущее» и затухание
+        until_next = window_start + window - now
+        decay = window * (1.0 - budget / count) if count > 0 else 0.0
+        return max(0.0, until_next + max(0.0, decay))
+    if prev_count <= 0:
+        return 0.0
+    elapsed_needed = window * (1.0 - (budget - count) / prev_count)
+    return max(0.0, elapsed_needed - (now - window_start))
+
+
+class LimiterBackend(Protocol):
+    """Хранилище состояния лимитеров"""
+
+    async def sliding_window(
+        self, key: str, limit: float, window: float, cost: float, now: float
+    ) -> Decision: ...
+
+    async def token_bucket(
+        self, key: str, capacity: float, rate: float, cost: float, now: float
+    ) -> Decision: ...
+
+    async def reset(self, key: str) -> None: ...
+
+
+class MemoryBackend:
+    """
+    Бэкенд в памяти процесса.
+
+    Все операции O(1), число ключей ограничено (LRU-вытеснение),
+    поэтому поток уникальных IP не может исчерпать память.
+    """
+
+    def __init__(self, max_keys: int = MEMORY_MAX_KEYS):
+        self.max_keys = max_keys
+        self._state: OrderedDict[str, list[float]] = OrderedDict()
+
+    def _get(self, key: str) -> Optional[list[float]]:
+        state = self._state.get(key)
+        if state is not None:
+            self._state.move_to_end(key)
+        return state
+
+    def _put(self, key: str, state: list[float]) -> None:
+        self._state[key] = state
+        self._state.move_to_end(key)
+        while len(self._state) > self.max_keys:
+            self._state.popitem(last=False)
+
+    async def sliding_window(
+        self, key: str, limit: float, window: float, cost: float, now: float
+    ) -> Decision:
+        current_start = math.floor(now / window) * window
+        state = self._get(key)  # [window_start, count, prev_count]
+        if state is None:
+            state = [current_start, 0.0, 0.0]
+        elif state[0] != current_start:
+            previous = state[1] if state[0] == current_start - window else 0.0
+            state = [current_start, 0.0, previous]
+
+        estimate = _sliding_estimate(state[1], state[2], current_start, now, window)
+        need = max(cost, 1.0)
+        allowed = estimate + need <= limit
+        if allowed and cost > 0:
+            state[1] += cost
+            estimate += cost
+        self._put(key, state)
+
+        retry_after = 0.0
+        if not allowed:
+            retry_after = _sliding_retry_after(
+                state[1], state[2], current_start, now, window, limit, need
+            )
+        remaining = max(0.0, limit - estimate)
+        return Decision(allowed=allowed, remaining=remaining, retry_after=retry_after)
+
+    async def token_bucket(
+        self, key: str, capacity: float, rate: float, cost: float, now: float
+    ) -> Decision:
+        state = self._get(key)  # [tokens, updated_at]
+        tokens = capacity if state is None else min(capacity, state[0] + (now - state[1]) * rate)
+
+        need = max(cost, 1.0)
+        allowed = tokens >= need
+        if allowed:
+            tokens -= cost
+        self._put(key, [tokens, now])
+
+        retry_after = 0.0 if allowed else (need - tokens) / rate
+        return Decision(allowed=allowed, remaining=tokens, retry_after=retry_after)
+
+    async def reset(self, key: str) -> None:
+        self._state.pop(key, None)
+
+
+class PostgresBackend:
+    """
+    Общий бэкенд на PostgreSQL (таблица rate_limit_counters, UNLOGGED).
+
+    Каждая проверка — один атомарный INSERT ... ON CONFLICT DO UPDATE
+    в режиме autocommit: без отдельных SELECT/COMMIT и без долгих блокировок.
+    """
+
+    _SLIDING_SQL = text("""
+        INSERT INTO rate_limit_counters AS c
+            (key, window_start, count, prev_count, tokens, updated_at, allowed, expires_at)
+        VALUES (
+            :key, :ws, CASE WHEN :need <= :limit THEN :cost ELSE 0 END,
+            0, 0, 0, :need <= :limit, :expires
+        )
+        ON CONFLICT (key) DO UPDATE SET
+            allowed = (
+                CASE WHEN c.window_start = :ws THEN c.prev_count
+                     WHEN c.window_start = :ws - :window THEN c.count ELSE 0 END * :weight
+                + CASE WHEN c.window_start = :ws THEN c.count ELSE 0 END
+                + :need <= :limit
+            ),
+            count = CASE WHEN c.window_start = :ws THEN c.count ELSE 0 END + CASE WHEN (
+                CASE WHEN c.window_start = :ws THEN c.prev_count
+                     WHEN c.window_start = :ws - :window THEN c.count ELSE 0 END * :weight
+                + CASE WHEN c.window_start = :ws THEN c.count ELSE 0 END
+                + :need <= :limit
+            ) THEN :cost ELSE 0 END,
+            prev_count = CASE WHEN c.window_start = :ws THEN c.prev_count
+                              WHEN c.window_start = :ws - :window THEN c.count ELSE 0 END,
+            window_start = :ws,
+            expires_at = :expires
+        RETURNING count, prev_count, allowed
+    """).bindparams(
+        bindparam("key", type_=String),
+        *(
+            bindparam(name, type_=Float)
+            for name in ("ws", "window", "weight", "limit", "cost", "need", "expires")
+        ),
+    )
+
+    _BUCKET_SQL = text("""
+        INSERT INTO rate_limit_counters AS c
+            (key, window_start, count, prev_count, tokens, updated_at, allowed, expires_at)
+        VALUES (
+            :key, 0, 0, 0,
+            CASE WHEN :need <= :capacity THEN :capacity - :cost ELSE :capacity END,
+            :now, :need <= :capacity, :expires
+        )
+        ON CONFLICT (key) DO UPDATE SET
+            allowed = LEAST(:capacity, c.tokens + (:now - c.updated_at) * :rate) >= :need,
+            tokens = LEAST(:capacity, c.tokens + (:now - c.updated_at) * :rate) - CASE
+                WHEN LEAST(:capacity, c.tokens + (:now - c.updated_at) * :rate) >= :need THEN :cost
+                ELSE 0 END,
+            updated_at = :now,
+            expires_at = :expires
+        RETURNING tokens, allowed
+    """).bindparams(
+        bindparam("key", type_=String),
+        *(
+            bindparam(name, type_=Float)
+            for name in ("capacity", "rate", "cost", "need", "now", "expires")
+        ),
+    )
+
+    def __init__(self, engine=None):
+        """
+        Args:
+            engine: AsyncEngine (по умолчанию — движок приложения)
+        """
+        self._engine = engine
+        self._calls = 0
+
+    def _get_engine(self):
+        if self._engine is None:
+            from app.database import engine
+            self._engine = engine
+        return self._engine
+
+    async def _execute(self, statement, params: dict):
+        self._calls += 1
+        engine = self._get_engine()
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            row = (await conn.execute(statement, params)).one()
+            if self._calls % POSTGRES_CLEANUP_EVERY == 0:
+                await conn.execute(
+                    text("DELETE FROM rate_limit_counters WHERE expires_at < :now"),
+                    {"now": params.get("now", time.time())},
+                )
+        return row
+
+    async def sliding_window(
+        self, key: str, limit: float, window: float, cost: float, now: float
+    ) -> Decision:
+        current_start = math.floor(now / window) * window
+        need = max(cost, 1.0)
+        count, prev_count, allowed = await self._execute(self._SLIDING_SQL, {
+            "key": key,
+            "ws": current_start,
+            "window": window,
+            "weight": max(0.0, 1.0 - (now - current_start) / window),
+            "limit": limit,
+            "cost": cost,
+            "need": need,
+            "now": now,
+            "expires": current_start + 2 * window,
+        })
+        estimate = _sliding_estimate(count, prev_count, current_start, now, window)
+        retry_after = 0.0
+        if not allowed:
+            retry_after = _sliding_retry_after(
+                count, prev_count, current_start, now, window, limit, need
+            )
+        remaining = max(0.0, limit - estimate)
+        return Decision(allowed=allowed, remaining=remaining, retry_after=retry_after)
+
+    async def token_bucket(
+        self, key: str, capacity: float, rate: float, cost: float, now: float
+    ) -> Decision:
+        need = max(cost, 1.0)
+        tokens, allowed = await self._execute(self._BUCKET_SQL, {
+            "key": key,
+            "capacity": capacity,
+            "rate": rate,
+            "cost": cost,
+            "need": need,
+            "now": now,
+            "expires": now + capacity / rate,
+        })
+        retry_after = 0.0 if allowed else (need - tokens) / rate
+        return Decision(allowed=allowed, remaining=tokens, retry_after=retry_after)
+
+    async def reset(self, key: str) -> None:
+        engine = self._get_engine()
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(
+                text("DELETE FROM rate_limit_counters WHERE key = :key"), {"key": key}
+            )
+
+
+class _Limiter(ABC):
+    """Общая часть лимитеров: префикс ключей, часы и fail-open при сбоях бэкенда"""
+
+    def __init__(
+        self, backend: LimiterBackend, prefix: str, clock: Callable[[], float] = time.time
+    ):
+        self.backend = backend
+        self.prefix = prefix
+        self.clock = clock
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}:{key}"
+
+    @abstractmethod
+    async def _check(self, key: str, cost: float) -> Decision:
+        """Проверка и учёт события в бэкенде (своя для каждого алгоритма)"""
+
+    async def hit(self, key: str, cost: float = 1) -> Decision:
+        """Учитывает событие; если лимит исчерпан — отказ без учёта"""
+        try:
+            return await self._check(key, cost)
+        except Exception as e:
+            # Недоступность хранилища не должна блокировать вход на сайт
+            logger.error(f"Rate limiter backend error for {self.prefix}: {type(e).__name__}: {e}")
+            return Decision(allowed=True, remaining=0)
+
+    async def peek(self, key: str) -> Decision:
+        """Проверяет, будет ли разрешено следующее событие, ничего не учитывая"""
+        return await self.hit(key, cost=0)
+
+    async def reset(self, key: str) -> None:
+        """Сбрасывает состояние ключа"""
+        try:
+            await self.backend.reset(self._key(key))
+        except Exception as e:
+            logger.error(f"Rate limiter backend error for {self.prefix}: {type(e).__name__}: {e}")
+
+
+class SlidingWindowLimiter(_Limiter):
+    """Не более limit событий за скользящее окно window секунд"""
+
+    def __init__(
+        self,
+        backend: LimiterBackend,
+        prefix: str,
+        limit: int,
+        window: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(backend, prefix, clock)
+        self.limit = limit
+        self.window = window
+
+    async def _check(self, key: str, cost: float) -> Decision:
+        return await self.backend.sliding_window(
+            self._key(key), self.limit, self.window, cost, self.clock()
+        )
+
+
+class TokenBucketLimiter(_Limiter):
+    """Ведро на capacity токенов, пополняемое со скоростью rate токенов в секунду"""
+
+    def __init__(
+        self,
+        backend: LimiterBackend,
+        prefix: str,
+        capacity: int,
+        rate: float,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__(backend, prefix, clock)
+        self.capacity = capacity
+        self.rate = rate
+
+    async def _check(self, key: str, cost: float) -> Decision:
+        return await self.backend.token_bucket(
+            self._key(key), self.capacity, self.rate, cost, self.clock()
+        )
+
+
+# Глобальный экземпляр бэкенда
+_backend: Optional[LimiterBackend] = None
+
+
+def get_limiter_backend() -> LimiterBackend:
+    """
+    Возвращает бэкенд лимитеров согласно RATE_LIMIT_BACKEND.
+
+    Returns:
+        LimiterBackend: MemoryBackend (по умолчанию) или PostgresBackend
+    """
+    global _backend
+    if _backend is None:
+        kind = os.getenv("RATE_LIMIT_BACKEND", "memory").lower()
+        if kind == "postgres":
+            _backend = PostgresBackend()
+        else:
+            if kind != "memory":
+                logger.warning(f"Unknown RATE_LIMIT_BACKEND={kind}, falling back to memory")
+            _backend = MemoryBackend()
+    return _backend
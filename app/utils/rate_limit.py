@@ -1,127 +1,210 @@
 """
-Утилиты для защиты от подбора паролей (rate limiting).
+Утилиты для защиты от подбора паролей и флуда (rate limiting).
+
+Неудачные попытки входа считаются скользящим окном в движке
+app.utils.limiter (в памяти процесса или в общей UNLOGGED-таблице),
+без SELECT/COMMIT в основной сессии БД на каждую попытку.
+
+Декоратор rate_limit задаёт лимиты на уровне роутов:
+
+    @bp.route("/register/resend", methods=["POST"])
+    @rate_limit(3, per=600, key=("ip", "email"))
+    @rate_limit(10, per=600, key="ip")
+    async def register_resend(): ...
+
+Проверка выполняется до тела обработчика, поэтому отказ (429)
+не стоит ни запросов к БД, ни SMTP/HTTP вызовов.
 """
-from datetime import datetime, timedelta
-from sqlalchemy import select
-from sqlalchemy.ext.asyncio import AsyncSession
+import math
+import os
+from functools import wraps
+from typing import Awaitable, Callable, Iterable, Optional
+
 from loguru import logger
+from quart import jsonify, request, session
 
-from app.models import LoginAttempt
+from app.utils.limiter import SlidingWindowLimiter, TokenBucketLimiter, get_limiter_backend
 
 
 # Настройки rate limiting
-MAX_LOGIN_ATTEMPTS = 5  # Максимум попыток
-BLOCK_DURATION_MINUTES = 15  # Длительность блокировки в минутах
-RESET_ATTEMPTS_MINUTES = 30  # Сбросить счетчик через N минут после последней попытки
+MAX_LOGIN_ATTEMPTS = 5  # Максимум неудачных попыток за окно
+BLOCK_DURATION_MINUTES = 15  # Окно подсчёта попыток (оно же максимальная длительность блокировки)
+# Сколько обратных прокси (nginx, балансировщик) стоит перед приложением:
+# каждый дописывает адрес предыдущего узла в конец X-Forwarded-For
+TRUSTED_PROXIES = int(os.getenv("TRUSTED_PROXIES", "0"))
+
+# Глобальный экземпляр лимитера
+_login_limiter: Optional[SlidingWindowLimiter] = None
+
+
+def get_login_limiter() -> SlidingWindowLimiter:
+    """
+    Возвращает лимитер неудачных попыток входа.
+
+    Returns:
+        SlidingWindowLimiter: Лимитер на общем бэкенде приложения
+    """
+    global _login_limiter
+    if _login_limiter is None:
+        _login_limiter = SlidingWindowLimiter(
+            get_limiter_backend(),
+            prefix="login",
+            limit=MAX_LOGIN_ATTEMPTS,
+            window=BLOCK_DURATION_MINUTES * 60,
+        )
+    return _login_limiter
 
 
-async def check_rate_limit(db: AsyncSession, identifier: str) -> tuple[bool, str | None]:
+async def check_rate_limit(identifier: str) -> tuple[bool, str | None]:
     """
     Проверяет, не заблокирован ли пользователь.
-    
+
     Args:
-        db: Сессия БД
         identifier: Идентификатор (IP адрес или username)
-    
+
     Returns:
         Tuple (is_allowed, error_message)
         - is_allowed: True если можно попытаться войти, False если заблокирован
         - error_message: Сообщение об ошибке если заблокирован
     """
-    result = await db.execute(
-        select(LoginAttempt).where(LoginAttempt.identifier == identifier)
-    )
-    attempt = result.scalar_one_or_none()
-    
-    now = datetime.utcnow()
-    
-    if not attempt:
-        # Первая попытка
-        return True, None
-    
-    # Проверяем, не истекла ли блокировка
-    if attempt.is_blocked and attempt.blocked_until:
-        if now >= attempt.blocked_until:
-            # Блокировка истекла, разблокируем
-            attempt.is_blocked = False
-            attempt.attempts = 0
-            attempt.blocked_until = None
-            await db.commit()
-            logger.info(f"Rate limit unblocked for {identifier}")
-            return True, None
-        else:
-            # Все еще заблокирован
-            minutes_left = int((attempt.blocked_until - now).total_seconds() / 60)
-            return False, f"Слишком много попыток входа. Попробуйте через {minutes_left} минут."
-    
-    # Проверяем, не нужно ли сбросить счетчик
-    time_since_last = now - attempt.last_attempt_at
-    if time_since_last > timedelta(minutes=RESET_ATTEMPTS_MINUTES):
-        attempt.attempts = 0
-        await db.commit()
-        logger.info(f"Rate limit reset for {identifier}")
+    decision = await get_login_limiter().peek(identifier)
+    if decision.allowed:
         return True, None
-    
-    # Проверяем количество попыток
-    if attempt.attempts >= MAX_LOGIN_ATTEMPTS:
-        # Блокируем
-        attempt.is_blocked = True
-        attempt.blocked_until = now + timedelta(minutes=BLOCK_DURATION_MINUTES)
-        await db.commit()
-        logger.warning(f"Rate limit exceeded for {identifier}. Blocked for {BLOCK_DURATION_MINUTES} minutes.")
-        return False, f"Слишком много попыток входа. Попробуйте через {BLOCK_DURATION_MINUTES} минут."
-    
-    return True, None
-
-
-async def record_failed_login(db: AsyncSession, identifier: str) -> None:
+
+    minutes_left = max(1, round(decision.retry_after / 60))
+    logger.warning(f"Rate limit exceeded for {identifier}. Retry in {minutes_left} minutes.")
+    return False, f"Слишком много попыток входа. Попробуйте через {minutes_left} минут."
+
+
+async def record_failed_login(identifier: str) -> None:
     """
     Записывает неудачную попытку входа.
-    
+
     Args:
-        db: Сессия БД
         identifier: Идентификатор (IP адрес или username)
     """
-    result = await db.execute(
-        select(LoginAttempt).where(LoginAttempt.identifier == identifier)
-    )
-    attempt = result.scalar_one_or_none()
-    
-    now = datetime.utcnow()
-    
-    if not attempt:
-        # Создаем новую запись
-        attempt = LoginAttempt(
-            identifier=identifier,
-            attempts=1,
-            last_attempt_at=now
-        )
-        db.add(attempt)
-    else:
-        # Увеличиваем счетчик
-        attempt.attempts += 1
-        attempt.last_attempt_at = now
-    
-    await db.commit()
-    logger.info(f"Failed login recorded for {identifier}. Total attempts: {attempt.attempts}")
+    decision = await get_login_limiter().hit(identifier)
+    logger.info(f"Failed login recorded for {identifier}. Attempts left: {decision.remaining:.0f}")
 
 
-async def reset_login_attempts(db: AsyncSession, identifier: str) -> None:
+async def reset_login_attempts(identifier: str) -> None:
     """
     Сбрасывает счетчик попыток после успешного входа.
-    
+
     Args:
-        db: Сессия БД
         identifier: Идентификатор (IP адрес или username)
     """
-    result = await db.execute(
-        select(LoginAttempt).where(LoginAttempt.identifier == identifier)
-    )
-    attempt = result.scalar_one_or_none()
-    
-    if attempt:
-        attempt.attempts = 0
-        attempt.is_blocked = False
-        attempt.blocked_until = None
-        await db.commit()
-        logger.info(f"Login attempts reset for {identifier}")
+    await get_login_limiter().reset(identifier)
+    logger.info(f"Login attempts reset for {identifier}")
+
+
+# ============================================
+# ЛИМИТЫ НА УРОВНЕ РОУТОВ
+# ============================================
+def get_client_ip() -> str:
+    """
+    IP клиента для лимитов и журнала входов.
+
+    Левые адреса X-Forwarded-For присылает сам клиент, им верить нельзя.
+    При TRUSTED_PROXIES=N берётся N-й адрес с конца — его дописал первый
+    из наших прокси. Без прокси (или если заголовок короче) — адрес соединения.
+    """
+    if TRUSTED_PROXIES > 0:
+        forwarded = request.headers.get("X-Forwarded-For", "")
+        hops = [hop.strip() for hop in forwarded.split(",") if hop.strip()]
+        if len(hops) >= TRUSTED_PROXIES:
+            return hops[-TRUSTED_PROXIES]
+    return request.remote_addr or "unknown"
+
+
+async def _key_ip() -> Optional[str]:
+    return get_client_ip()
+
+
+async def _key_user_id() -> Optional[str]:
+    user_id = session.get("user_id")
+    return str(user_id) if user_id else None
+
+
+async def _key_email() -> Optional[str]:
+    # Email из отправленной формы или из незавершённой регистрации
+    email = (await request.form).get("email")
+    if not email:
+        email = (session.get("reg_data") or {}).get("email")
+    return email.strip().lower() if email else None
+
+
+# Доступные составляющие ключа лимита
+KEY_FUNCTIONS: dict[str, Callable[[], Awaitable[Optional[str]]]] = {
+    "ip": _key_ip,
+    "user_id": _key_user_id,
+    "email": _key_email,
+}
+
+
+def _too_many_requests(retry_after: float):
+    """Ответ 429: JSON для API-запросов, текст для обычных форм"""
+    seconds = max(1, math.ceil(retry_after))
+    message = f"Слишком много запросов. Попробуйте через {max(1, math.ceil(seconds / 60))} мин."
+    if request.is_json or request.accept_mimetypes.best == "application/json":
+        response = jsonify({"success": False, "error": message})
+    else:
+        response = message
+    return response, 429, {"Retry-After": str(seconds)}
+
+
+def rate_limit(
+    limit: int,
+    per: float,
+    key: str | Iterable[str] = "ip",
+    algorithm: str = "sliding",
+    methods: Iterable[str] = ("POST",),
+):
+    """
+    Декоратор лимита запросов к роуту.
+
+    Args:
+        limit: Количество запросов (для token bucket — размер всплеска)
+        per: Период в секундах, за который разрешено limit запросов
+        key: Составляющие ключа: "ip", "user_id", "email" или их кортеж
+            (например ("ip", "email") — отдельный счётчик на каждую пару).
+            Если составляющую не удалось определить, вместо неё берётся IP.
+        algorithm: "sliding" (скользящее окно) или "bucket" (token bucket)
+        methods: HTTP-методы, к которым применяется лимит
+    """
+    key_parts = (key,) if isinstance(key, str) else tuple(key)
+    unknown = [part for part in key_parts if part not in KEY_FUNCTIONS]
+    if unknown:
+        raise ValueError(f"Unknown rate limit key parts: {unknown}")
+    methods = {method.upper() for method in methods}
+
+    def decorator(view):
+        limiter = None
+
+        def get_limiter():
+            nonlocal limiter
+            if limiter is None:
+                name = f"{view.__module__}.{view.__name__}"
+                prefix = f"route:{name}:{'+'.join(key_parts)}:{limit}/{per:g}"
+                backend = get_limiter_backend()
+                if algorithm == "bucket":
+                    limiter = TokenBucketLimiter(backend, prefix, capacity=limit, rate=limit / per)
+                else:
+                    limiter = SlidingWindowLimiter(backend, prefix, limit=limit, window=per)
+            return limiter
+
+        @wraps(view)
+        async def wrapper(*args, **kwargs):
+            if request.method in methods:
+                parts = [await KEY_FUNCTIONS[part]() or get_client_ip() for part in key_parts]
+                decision = await get_limiter().hit("|".join(parts))
+                if not decision.allowed:
+                    logger.warning(
+                        f"Route rate limit exceeded: {request.endpoint} key={'|'.join(parts)}"
+                    )
+                    return _too_many_requests(decision.retry_after)
+            return await view(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,116 @@
+"""
+Бенчмарк: время генерации курса в зависимости от параллелизма.
+
+Поднимает локальный mock OpenRouter (задержки из распределения,
+ошибки 5xx, всплески 429 — см. benchmarks.mock_openrouter) и генерирует
+контент курса (без записи в БД) при разных значениях concurrency.
+Последовательная генерация = concurrency 1. Запросы идут через
+настоящие OpenRouterService, LLMScheduler и ModelRouter, поэтому
+повторы и 429 видны в отчёте.
+
+С --with-cache дополнительно сравнивает холодный и тёплый прогон
+с дисковым кешем LLM (повторная генерация того же курса).
+
+Запуск:
+    python -m benchmarks.bench_course_generation --latency 0.5 --levels 1,2,4,8,16
+    python -m benchmarks.bench_course_generation --levels 4 --with-cache
+    python -m benchmarks.bench_course_generation --distribution lognormal --error-rate 0.05 \
+        --burst-every 10 --burst-length 1 --levels 4,8,16 --repeat 3
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+
+from app.config import Settings
+from app.services.course_generator import CourseGeneratorService
+from app.services.openrouter import OpenRouterService
+from benchmarks.mock_openrouter import add_profile_arguments, create_mock_app, profile_from_args, start_mock_server
+
+
+def bench_settings(args: argparse.Namespace, **overrides) -> Settings:
+    return Settings(**{
+        "openrouter_api_key": "bench",
+        "openrouter_base_url": f"http://127.0.0.1:{args.port}/api/v1",
+        "llm_cache_mode": "off",
+        "llm_rpm": args.rpm,
+        "llm_tpm": 0,
+        "llm_hedging": args.hedging,
+        **overrides,
+    })
+
+
+async def run_level(openrouter: OpenRouterService, stats: dict, course: str, level: int) -> dict:
+    """Один прогон генерации курса: стена, уроки, запросы, повторы"""
+    scheduler = openrouter.scheduler
+    before = {name: stats[name] for name in ("requests", "errors", "rate_limited", "stream_errors")}
+    retries, gave_up = scheduler.retries, scheduler.gave_up
+    stats.update(max_in_flight=0)
+
+    generator = CourseGeneratorService(openrouter=openrouter, concurrency=level)
+    started = time.perf_counter()
+    modules = await generator.generate_course_content(course)
+    wall = time.perf_counter() - started
+
+    lessons = [lesson for module in modules for lesson in module["lessons"]]
+    return {
+        "wall": wall,
+        "lessons": len(lessons),
+        "failed": sum(1 for lesson in lessons if lesson["quiz_questions"] is None),
+        "max_in_flight": stats["max_in_flight"],
+        "retries": scheduler.retries - retries,
+        "gave_up": scheduler.gave_up - gave_up,
+        **{name: stats[name] - value for name, value in before.items()},
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--course", default="ai-for-beginners", help="Slug курса из каталога")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="Уровни concurrency через запятую")
+    parser.add_argument("--repeat", type=int, default=1, help="Прогонов на уровень (в отчёте — медиана стены)")
+    parser.add_argument("--port", type=int, default=8901)
+    parser.add_argument("--rpm", type=int, default=0, help="Бюджет LLM_RPM планировщика (0 — без ограничения)")
+    parser.add_argument("--hedging", action="store_true", help="Включить хедж-запросы ModelRouter")
+    parser.add_argument("--with-cache", action="store_true", help="Сравнить холодный и тёплый кеш LLM")
+    add_profile_arguments(parser)
+    parser.set_defaults(latency=0.5, jitter=0.1)
+    args = parser.parse_args()
+
+    app = create_mock_app(profile=profile_from_args(args))
+    stats = app.config["MOCK_STATS"]
+    server, shutdown = await start_mock_server(app, port=args.port)
+    openrouter = OpenRouterService(bench_settings(args))
+
+    baseline = None
+    print(
+        f"{'concurrency':>11} {'lessons':>8} {'failed':>7} {'requests':>9} {'retries':>8} {'429':>5} "
+        f"{'5xx':>5} {'in-flight':>10} {'wall, s':>8} {'lessons/s':>10} {'speedup':>8}"
+    )
+    try:
+        for level in (int(x) for x in args.levels.split(",")):
+            runs = [await run_level(openrouter, stats, args.course, level) for _ in range(args.repeat)]
+            wall = statistics.median(run["wall"] for run in runs)
+            baseline = baseline or wall
+            total = {name: sum(run[name] for run in runs) for name in runs[0] if name != "wall"}
+            print(
+                f"{level:>11} {total['lessons']:>8} {total['failed']:>7} {total['requests']:>9} "
+                f"{total['retries']:>8} {total['rate_limited']:>5} {total['errors'] + total['stream_errors']:>5} "
+                f"{max(run['max_in_flight'] for run in runs):>10} {wall:>8.2f} "
+                f"{runs[0]['lessons'] / wall:>10.2f} {baseline / wall:>7.1f}x"
+            )
+
+        if args.with_cache:
+            with tempfile.TemporaryDirectory() as cache_dir:
+                cached = OpenRouterService(bench_settings(args, llm_cache_mode="readwrite", llm_cache_dir=cache_dir))
+                for run in ("cold", "warm"):
+                    result = await run_level(cached, stats, args.course, level)
+                    print(f"cache {run:<5} requests {result['requests']:>3}  wall {result['wall']:.2f}s")
+    finally:
+        shutdown.set()
+        await server
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
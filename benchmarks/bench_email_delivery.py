@@ -0,0 +1,64 @@
+"""
+Бенчмарк: отправка писем при всплеске регистраций.
+
+Поднимает локальный SMTP (benchmarks.mock_smtp, aiosmtpd) с задержкой
+на установку соединения (TCP + TLS + AUTH у настоящего сервера) и на
+приём письма, и разом отправляет --messages писем с кодами через
+EmailDelivery в двух режимах:
+    per message — соединение на каждое письмо (как было: max_messages=1)
+    pooled      — постоянные соединения, переиспользуемые между письмами
+
+Запуск:
+    python -m benchmarks.bench_email_delivery --messages 200 --connections 3
+    python -m benchmarks.bench_email_delivery --handshake-delay 0.5 --message-delay 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from app.services.email import EmailDelivery, SMTPConfig, _build_verification_message
+from benchmarks.mock_smtp import start_mock_smtp
+
+
+async def run(config: SMTPConfig, args: argparse.Namespace, max_messages: int) -> dict:
+    delivery = EmailDelivery(
+        config, connections=args.connections, queue_size=args.queue_size, max_messages=max_messages,
+    )
+    messages = [_build_verification_message(f"user{i}@example.com", "123456", "bench") for i in range(args.messages)]
+    started = time.perf_counter()
+    results = await asyncio.gather(*(delivery.send(message) for message in messages))
+    wall = time.perf_counter() - started
+    stats = delivery.stats()
+    await delivery.aclose()
+    return {"wall": wall, "sent": sum(results), **stats}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=200, help="Писем во всплеске")
+    parser.add_argument("--connections", type=int, default=3, help="SMTP-соединений (потоков отправки)")
+    parser.add_argument("--queue-size", type=int, default=50, help="Размер очереди писем")
+    parser.add_argument("--handshake-delay", type=float, default=0.3, help="Задержка нового соединения, с")
+    parser.add_argument("--message-delay", type=float, default=0.02, help="Задержка приёма письма, с")
+    args = parser.parse_args()
+
+    controller = start_mock_smtp(args.handshake_delay, args.message_delay)
+    config = SMTPConfig("127.0.0.1", controller.port, "bench", "bench", security="none")
+    print(
+        f"{'mode':<12} {'sent':>5} {'connects':>9} {'wall, s':>8} {'emails/s':>9} "
+        f"{'max queued':>11} {'wait p95, ms':>13} {'send p50, ms':>13}"
+    )
+    try:
+        for label, max_messages in (("per message", 1), ("pooled", 100)):
+            result = await run(config, args, max_messages)
+            print(
+                f"{label:<12} {result['sent']:>5} {result['connects']:>9} {result['wall']:>8.2f} "
+                f"{result['sent'] / result['wall']:>9.1f} {result['max_queued']:>11} "
+                f"{result['wait_ms']['p95']:>13.0f} {result['send_ms']['p50']:>13.1f}"
+            )
+    finally:
+        controller.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
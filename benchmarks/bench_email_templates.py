@@ -0,0 +1,89 @@
+"""
+Бенчмарк: сборка писем из шаблонов templates/emails/.
+
+Сравнивает на одних и тех же письмах (разные коды и имена):
+    jinja per send — рендер Jinja-шаблона, текстовая версия из HTML
+                     и MIMEMultipart/MIMEText на каждое письмо
+    compiled       — EmailTemplates: склейка заранее скомпилированных
+                     фрагментов и заранее готовые заголовки частей
+
+Колонки: писем в секунду на сборку и на сборку вместе с сериализацией
+в байты (её делает smtplib при отправке, в потоке SMTP-соединения).
+
+БД не нужна (DATABASE_URL нужен только для импорта пакета app).
+
+Запуск:
+    python -m benchmarks.bench_email_templates --messages 5000
+"""
+import argparse
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from app.services.email import COURSE_BENEFITS
+from app.services.email_templates import EMAIL_TEMPLATES, EmailTemplates, html_to_text
+
+
+def make_letters(count: int) -> list:
+    """Письма вперемешку: коды подтверждения и покупки (kind, email, fields, context)"""
+    letters = []
+    for index in range(count):
+        email = f"user{index}@example.com"
+        if index % 4:
+            fields = {"code": f"{index % 1000000:06d}", "username": f"Маг {index}"}
+            letters.append(("verification", email, fields, {"has_name": True}))
+        else:
+            course_id = list(COURSE_BENEFITS)[index % len(COURSE_BENEFITS)]
+            fields = {"username": f"Маг {index}", "course_title": "Курс", "amount": f"{990 + index % 10:.2f}"}
+            context = {"course_id": course_id, "benefits": COURSE_BENEFITS[course_id]}
+            letters.append(("purchase", email, fields, context))
+    return letters
+
+
+def jinja_per_send(templates: EmailTemplates, kind: str, email: str, fields: dict, context: dict) -> MIMEMultipart:
+    """Письмо «как обычно»: рендер шаблона и MIME-дерево на каждое письмо"""
+    module = templates.env.get_template(EMAIL_TEMPLATES[kind]).make_module({**context, **fields})
+    html = str(module)
+    message = MIMEMultipart("alternative")
+    message["Subject"] = " ".join(str(module.subject).split())
+    message["To"] = email
+    message.attach(MIMEText(html_to_text(html), "plain", "utf-8"))
+    message.attach(MIMEText(html, "html", "utf-8"))
+    return message
+
+
+def run(build, letters: list) -> dict:
+    started = time.perf_counter()
+    messages = [build(*letter) for letter in letters]
+    built = time.perf_counter() - started
+    for message in messages:
+        message["From"] = "bench@example.com"
+        message.as_bytes()
+    total = time.perf_counter() - started
+    return {"build": len(letters) / built, "total": len(letters) / total}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000, help="Писем в прогоне")
+    args = parser.parse_args()
+
+    letters = make_letters(args.messages)
+    started = time.perf_counter()
+    templates = EmailTemplates()
+    templates.load()
+    for kind, _, _, context in letters:
+        templates.compile(kind, context)
+    print(f"compile (startup): {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    print(f"{'mode':<16} {'build, emails/s':>16} {'build+bytes, emails/s':>22}")
+    for label, build in (
+        ("jinja per send", lambda *letter: jinja_per_send(templates, *letter)),
+        ("compiled", templates.message),
+    ):
+        result = run(build, letters)
+        print(f"{label:<16} {result['build']:>16.0f} {result['total']:>22.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Бенчмарк: одноразовый httpx-клиент на запрос против общего клиента с пулом.
+
+Mock OpenRouter без задержки: разница — стоимость создания клиента
+и установки соединения (на реальном API добавляются ещё DNS и TLS).
+
+Запуск:
+    python -m benchmarks.bench_http_client --requests 300 --concurrency 10
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from app.services.http import close_http_client, get_http_client
+from app.services.passwords import _percentile
+from benchmarks.mock_openrouter import create_mock_app, start_mock_server
+
+PAYLOAD = {"model": "bench", "messages": [{"role": "user", "content": "ping"}]}
+
+
+async def _run(url: str, requests: int, concurrency: int, shared: bool) -> dict:
+    latencies: list[float] = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        async with slots:
+            started = time.perf_counter()
+            if shared:
+                response = await get_http_client("bench", max_connections=concurrency).post(url, json=PAYLOAD)
+            else:
+                async with httpx.AsyncClient(timeout=60.0) as client:
+                    response = await client.post(url, json=PAYLOAD)
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {"rps": requests / wall, "p50": _percentile(latencies, 50), "p99": _percentile(latencies, 99)}
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8902)
+    args = parser.parse_args()
+
+    server, shutdown = await start_mock_server(create_mock_app(latency=0.0), port=args.port)
+    url = f"http://127.0.0.1:{args.port}/chat/completions"
+    try:
+        for mode, shared in (("per-request client", False), ("shared client", True)):
+            result = await _run(url, args.requests, args.concurrency, shared)
+            print(f"{mode:<20} {result['rps']:>8.0f} req/s   p50 {result['p50']:6.1f} ms   p99 {result['p99']:6.1f} ms")
+    finally:
+        await close_http_client("bench")
+        shutdown.set()
+        await server
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+"""
+Бенчмарк: поиск почти одинаковых уроков (MinHash/LSH) на тысячах уроков.
+
+Генерирует синтетические уроки по шаблону промта генерации (одинаковые
+заголовки и обрамление, разное содержание) и подмешивает копии части
+уроков с заменой доли слов. Считает время поиска и полноту: сколько
+пар с точной похожестью не ниже порога найдено.
+
+БД не нужна (DATABASE_URL нужен только для импорта пакета app).
+
+Запуск:
+    python -m benchmarks.bench_lesson_duplicates --sizes 1000,2000,5000 --threshold 0.5
+"""
+import argparse
+import random
+import time
+
+from app.services.lesson_duplicates import find_duplicates
+
+TEMPLATE = """## 🎯 Результат урока
+В этом уроке вы создадите магический эффект с помощью заклинаний. {0}
+
+## Контекст
+{1}
+
+## Шаг 1: Подготовка
+{2}
+
+## ✨ Практическое задание
+Создайте своё заклинание по примеру из урока. {3}
+
+## ✅ Проверьте себя
+- [ ] Заклинание работает
+- [ ] Результат сохранён
+"""
+
+
+def make_lesson(rng: random.Random, vocabulary: list, words: int) -> str:
+    parts = [" ".join(rng.choices(vocabulary, k=words // 4)) for _ in range(4)]
+    return TEMPLATE.format(*parts)
+
+
+def mutate(rng: random.Random, text: str, vocabulary: list, share: float) -> str:
+    """Копия урока с заменой доли слов (строки-заголовки не трогаются)"""
+    lines = []
+    for line in text.splitlines():
+        if line.startswith("#"):
+            lines.append(line)
+            continue
+        words = line.split()
+        for index in range(len(words)):
+            if rng.random() < share:
+                words[index] = rng.choice(vocabulary)
+        lines.append(" ".join(words))
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,2000,5000", help="Число уроков через запятую")
+    parser.add_argument("--words", type=int, default=700, help="Слов в уроке")
+    parser.add_argument("--vocabulary", type=int, default=20000, help="Размер словаря")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="Доля уроков-копий")
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = [f"слово{i}" for i in range(args.vocabulary)]
+    print(f"{'lessons':>8} {'copies':>7} {'pairs':>6} {'true pairs':>11} {'recall':>7} {'time, s':>8}")
+    for size in (int(x) for x in args.sizes.split(",")):
+        lessons = [make_lesson(rng, vocabulary, args.words) for _ in range(size)]
+        copies = int(size * args.duplicates)
+        for index in range(copies):
+            # Доля замен от 2% до 15%: похожесть копий около порога 0.5 и выше
+            lessons.append(mutate(rng, lessons[index], vocabulary, 0.02 + 0.13 * index / max(copies, 1)))
+        documents = list(enumerate(lessons))
+
+        started = time.perf_counter()
+        pairs = find_duplicates(documents, args.threshold)
+        elapsed = time.perf_counter() - started
+
+        # Точная похожесть каждой копии с оригиналом (на паре документов LSH не нужен)
+        truth = {
+            (index, size + index)
+            for index in range(copies)
+            for pair in find_duplicates([documents[index], documents[size + index]], 0.01)
+            if pair.similarity >= args.threshold
+        }
+        found = {(pair.first, pair.second) for pair in pairs}
+        recall = len(truth & found) / len(truth) if truth else 1.0
+        print(f"{size:>8} {copies:>7} {len(pairs):>6} {len(truth):>11} {recall:>7.2f} {elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Бенчмарк: занятость пула соединений при сохранении сгенерированных уроков.
+
+Перегенерирует курс (generate_course, force) против локального mock
+OpenRouter дважды: с записью каждого урока отдельной транзакцией
+(как раньше) и пачками по модулям (LessonWriter). Во время
+генерации отдельная задача раз в 20 мс берёт соединение из пула и
+делает SELECT 1 — так видно, мешает ли генерация веб-запросам.
+
+Нужна настоящая БД (DATABASE_URL); курс в ней будет перегенерирован.
+
+Запуск:
+    python -m benchmarks.bench_lesson_persistence --course ai-for-beginners --latency 0.2 --concurrency 8
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import text
+
+from app.config import Settings
+from app.database import engine, init_db, pool_monitor
+from app.services import course_generator as course_generator_module
+from app.services.course_generator import CourseGeneratorService
+from app.services.lesson_writer import LessonWriter
+from app.services.openrouter import OpenRouterService
+from app.services.passwords import _percentile
+from benchmarks.mock_openrouter import create_mock_app, start_mock_server
+
+
+async def probe(stop: asyncio.Event, latencies: list) -> None:
+    """Веб-запрос в миниатюре: взять соединение, SELECT 1, вернуть"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+        latencies.append((time.perf_counter() - started) * 1000)
+        await asyncio.sleep(0.02)
+
+
+async def run(generator: CourseGeneratorService, course: str, max_batch: int) -> dict:
+    writers = []
+
+    def make_writer(groups) -> LessonWriter:
+        writers.append(LessonWriter(groups, max_batch=max_batch))
+        return writers[-1]
+
+    course_generator_module.LessonWriter = make_writer
+    before = pool_monitor.stats()
+    latencies: list = []
+    stop = asyncio.Event()
+    prober = asyncio.create_task(probe(stop, latencies))
+    started = time.perf_counter()
+    try:
+        ok = await generator.generate_course(course, force=True)
+    finally:
+        stop.set()
+        await prober
+        course_generator_module.LessonWriter = LessonWriter
+    after = pool_monitor.stats()
+    return {
+        "ok": ok,
+        "wall": time.perf_counter() - started,
+        # Без соединений самой пробы
+        "checkouts": after["checkouts"] - before["checkouts"] - len(latencies),
+        "transactions": sum(writer.transactions for writer in writers),
+        "db_ms": sum(writer.db_seconds for writer in writers) * 1000,
+        "probe_p95": _percentile(sorted(latencies), 95),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--course", default="ai-for-beginners", help="Slug курса из каталога")
+    parser.add_argument("--latency", type=float, default=0.2, help="Задержка ответа mock LLM, с")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8902)
+    args = parser.parse_args()
+
+    await init_db()
+    app = create_mock_app(args.latency, args.latency / 2)
+    server, shutdown = await start_mock_server(app, port=args.port)
+    generator = CourseGeneratorService(
+        openrouter=OpenRouterService(Settings(
+            openrouter_api_key="bench",
+            openrouter_base_url=f"http://127.0.0.1:{args.port}/api/v1",
+            llm_cache_mode="off",
+            llm_rpm=0,
+            llm_tpm=0,
+        )),
+        concurrency=args.concurrency,
+    )
+
+    print(
+        f"{'writes':<18} {'wall, s':>8} {'checkouts':>10} {'transactions':>13} "
+        f"{'write conn, ms':>15} {'probe p95, ms':>14}"
+    )
+    try:
+        for label, max_batch in (("per lesson", 1), ("batched by module", 20)):
+            result = await run(generator, args.course, max_batch)
+            print(
+                f"{label:<18} {result['wall']:>8.2f} {result['checkouts']:>10} {result['transactions']:>13} "
+                f"{result['db_ms']:>15.1f} {result['probe_p95']:>14.2f}"
+                + ("" if result["ok"] else "  (generation failed)")
+            )
+    finally:
+        shutdown.set()
+        await server
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
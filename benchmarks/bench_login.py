@@ -0,0 +1,89 @@
+"""
+Бенчмарк: задержка входа при конкурентной нагрузке до и после выноса bcrypt.
+
+Моделирует воркер Hypercorn: пачка одновременных логинов плюс поток
+«лёгких» запросов (страницы без bcrypt). Сравниваются два режима:
+- inline: bcrypt.checkpw прямо в корутине (как было в User.check_password)
+- service: проверка через PasswordHasher в отдельном пуле потоков
+
+Запуск:
+    python -m benchmarks.bench_login --logins 50 --rounds 12
+"""
+import argparse
+import asyncio
+import time
+
+import bcrypt
+
+from app.services.passwords import PasswordHasher, PasswordHasherBusy, _percentile
+
+
+async def _light_requests(stop: asyncio.Event, latencies: list[float]) -> None:
+    """Имитация обычных запросов: каждые 5 мс короткая корутина"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.005)
+        latencies.append((time.perf_counter() - started) * 1000 - 5)
+
+
+async def _run(mode: str, logins: int, password_hash: bytes, hasher: PasswordHasher) -> dict:
+    login_latencies: list[float] = []
+    light_latencies: list[float] = []
+    rejected = 0
+
+    async def login() -> None:
+        # Задержка считается от начала всплеска: учитывает ожидание в очереди
+        nonlocal rejected
+        if mode == "inline":
+            bcrypt.checkpw(b"password123", password_hash)
+        else:
+            try:
+                await hasher.verify_password("password123", password_hash.decode())
+            except PasswordHasherBusy:
+                rejected += 1
+                return
+        login_latencies.append((time.perf_counter() - started) * 1000)
+
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(_light_requests(stop, light_latencies))
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    wall = time.perf_counter() - started
+    stop.set()
+    await ticker
+
+    login_latencies.sort()
+    light_latencies.sort()
+    return {
+        "mode": mode,
+        "wall_s": wall,
+        "login_p50": _percentile(login_latencies, 50),
+        "login_p99": _percentile(login_latencies, 99),
+        "other_p99": _percentile(light_latencies, 99),
+        "rejected": rejected,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50, help="Одновременных логинов")
+    parser.add_argument("--rounds", type=int, default=12, help="cost-фактор bcrypt")
+    parser.add_argument("--workers", type=int, default=2, help="Потоков в пуле PasswordHasher")
+    args = parser.parse_args()
+
+    password_hash = bcrypt.hashpw(b"password123", bcrypt.gensalt(args.rounds))
+    hasher = PasswordHasher(rounds=args.rounds, workers=args.workers, max_queue=args.logins)
+
+    print(f"{'mode':<8} {'wall, s':>8} {'login p50':>10} {'login p99':>10} {'other p99':>10} {'rejected':>9}")
+    for mode in ("inline", "service"):
+        r = await _run(mode, args.logins, password_hash, hasher)
+        print(
+            f"{r['mode']:<8} {r['wall_s']:>8.2f} {r['login_p50']:>9.0f}ms {r['login_p99']:>9.0f}ms "
+            f"{r['other_p99']:>9.0f}ms {r['rejected']:>9}"
+        )
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,97 @@
+"""
+Бенчмарк: пропускная способность учёта неудачных входов.
+
+Сценарий «подбор пароля»: на каждую попытку выполняется проверка лимита
+и запись неудачной попытки, ключи — N разных IP. Сравниваются:
+- legacy: прежняя схема на LoginAttempt (SELECT + COMMIT на каждый шаг)
+- memory: движок app.utils.limiter, бэкенд в памяти процесса
+- postgres: движок app.utils.limiter, UNLOGGED-таблица (один upsert на шаг)
+
+Запуск (legacy и postgres требуют доступный DATABASE_URL):
+    python -m benchmarks.bench_rate_limit --attempts 2000 --concurrency 20
+    python -m benchmarks.bench_rate_limit --memory-only
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app.utils.limiter import MemoryBackend, PostgresBackend, SlidingWindowLimiter
+
+
+async def _legacy_failed_login(identifier: str) -> None:
+    """Прежняя реализация: check_rate_limit + record_failed_login через LoginAttempt"""
+    from app.database import AsyncSessionLocal
+    from app.models import LoginAttempt
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(LoginAttempt).where(LoginAttempt.identifier == identifier))
+        attempt = result.scalar_one_or_none()
+        if attempt and attempt.attempts >= 5:
+            attempt.is_blocked = True
+            await db.commit()
+            return
+
+        result = await db.execute(select(LoginAttempt).where(LoginAttempt.identifier == identifier))
+        attempt = result.scalar_one_or_none()
+        if not attempt:
+            db.add(LoginAttempt(identifier=identifier, attempts=1, last_attempt_at=datetime.utcnow()))
+        else:
+            attempt.attempts += 1
+            attempt.last_attempt_at = datetime.utcnow()
+        await db.commit()
+
+
+def _engine_failed_login(limiter: SlidingWindowLimiter):
+    async def failed_login(identifier: str) -> None:
+        decision = await limiter.peek(identifier)
+        if decision.allowed:
+            await limiter.hit(identifier)
+    return failed_login
+
+
+async def _measure(name: str, func, attempts: int, concurrency: int, keys: int) -> None:
+    queue: asyncio.Queue[int] = asyncio.Queue()
+    for i in range(attempts):
+        queue.put_nowait(i)
+
+    async def worker() -> None:
+        while not queue.empty():
+            i = queue.get_nowait()
+            await func(f"bench-{i % keys}")
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    print(f"{name:<10} {attempts / elapsed:>12.0f} attempts/s  ({elapsed:.2f} s)")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--keys", type=int, default=500, help="Количество разных IP")
+    parser.add_argument("--memory-only", action="store_true", help="Не обращаться к PostgreSQL")
+    args = parser.parse_args()
+
+    if not args.memory_only:
+        from app.database import engine, init_db
+        from app.models import LoginAttempt
+        await init_db()
+        await _measure("legacy", _legacy_failed_login, args.attempts, args.concurrency, args.keys)
+        async with engine.begin() as conn:
+            await conn.execute(LoginAttempt.__table__.delete().where(LoginAttempt.identifier.like("bench-%")))
+
+        limiter = SlidingWindowLimiter(PostgresBackend(), prefix="bench", limit=5, window=900)
+        await _measure("postgres", _engine_failed_login(limiter), args.attempts, args.concurrency, args.keys)
+        for i in range(args.keys):
+            await limiter.reset(f"bench-{i}")
+
+    limiter = SlidingWindowLimiter(MemoryBackend(), prefix="bench", limit=5, window=900)
+    await _measure("memory", _engine_failed_login(limiter), args.attempts, args.concurrency, args.keys)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,278 @@
+"""
+Локальный mock OpenRouter (/api/v1/chat/completions) для тестов и бенчмарков.
+
+Отвечает после задержки из заданного распределения: на запросы квиза
+(system prompt просит JSON) — валидным JSON квиза, на остальные —
+Markdown урока. С "stream": true отвечает потоком server-sent events:
+первый фрагмент через десятую часть задержки, остальные равномерно
+до её конца, последним — фрагмент с usage. В usage — токены и (если
+запрошено "usage": {"include": true}) стоимость по справочным ценам.
+
+Сбои (MockProfile):
+    error_rate         — доля ответов 500/502/503 с телом ошибки OpenRouter
+    stream_error_rate  — доля потоков, оборванных фрагментом {"error": ...}
+    burst_every/length — в конце каждых burst_every секунд на burst_length
+                         секунд все запросы получают 429 с Retry-After
+    tail_rate/factor   — доля запросов, задержка которых умножается на factor
+
+Считает запросы, ошибки, 429 и максимум одновременных запросов.
+
+Запуск отдельно:
+    python -m benchmarks.mock_openrouter --port 8900 --latency 1.0 --distribution lognormal --error-rate 0.05
+    OPENROUTER_BASE_URL=http://127.0.0.1:8900/api/v1 python generate_course.py
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from dataclasses import dataclass, field, fields
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from quart import Quart, Response, jsonify, request
+
+DISTRIBUTIONS = ("uniform", "lognormal", "exponential")
+# USD за 1M токенов (вход, выход), как в generation_usage.MODEL_PRICES
+# (mock не импортирует app: пакету нужен DATABASE_URL)
+PRICES = {
+    "openai/gpt-5.1": (1.25, 10.0),
+    "openai/gpt-5-mini": (0.25, 2.0),
+}
+
+
+@dataclass
+class MockProfile:
+    """Задержки и сбои mock-сервера"""
+    latency: float = 1.0  # uniform: среднее, lognormal: медиана, exponential: среднее (с)
+    jitter: float = 0.0  # uniform: разброс ±jitter
+    distribution: str = "uniform"
+    sigma: float = 0.5  # lognormal: разброс логарифма задержки
+    tail_rate: float = 0.0
+    tail_factor: float = 10.0
+    error_rate: float = 0.0
+    error_statuses: tuple = (500, 502, 503)
+    stream_error_rate: float = 0.0
+    burst_every: float = 0.0
+    burst_length: float = 0.0
+    seed: int | None = None
+    rng: random.Random = field(init=False, repr=False)
+
+    def __post_init__(self):
+        if self.distribution not in DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {self.distribution}")
+        self.rng = random.Random(self.seed)
+
+    def sample_latency(self) -> float:
+        if self.distribution == "lognormal":
+            delay = self.latency * math.exp(self.rng.gauss(0.0, self.sigma))
+        elif self.distribution == "exponential":
+            delay = self.rng.expovariate(1 / self.latency) if self.latency > 0 else 0.0
+        else:
+            delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if self.tail_rate and self.rng.random() < self.tail_rate:
+            delay *= self.tail_factor
+        return max(0.0, delay)
+
+    def burst_remaining(self, elapsed: float) -> float:
+        """Сколько ещё длится всплеск 429 (0 — всплеска нет)"""
+        if self.burst_every <= 0 or self.burst_length <= 0:
+            return 0.0
+        # Всплеск — в конце каждого периода, первый через burst_every - burst_length
+        remaining = self.burst_every - elapsed % self.burst_every
+        return remaining if remaining <= self.burst_length else 0.0
+
+    def error_status(self) -> int | None:
+        if self.error_rate and self.rng.random() < self.error_rate:
+            return self.rng.choice(self.error_statuses)
+        return None
+
+    def stream_fails(self) -> bool:
+        return bool(self.stream_error_rate) and self.rng.random() < self.stream_error_rate
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    """Аргументы командной строки для MockProfile (общие для mock и бенчмарков)"""
+    parser.add_argument("--latency", type=float, default=1.0, help="Задержка ответа, с (см. --distribution)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="uniform: разброс ±jitter, с")
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="uniform")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal: разброс логарифма задержки")
+    parser.add_argument("--tail-rate", type=float, default=0.0, help="Доля очень медленных ответов")
+    parser.add_argument("--tail-factor", type=float, default=10.0, help="Во сколько раз они медленнее")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля ответов 5xx")
+    parser.add_argument("--stream-error-rate", type=float, default=0.0, help="Доля оборванных потоков")
+    parser.add_argument("--burst-every", type=float, default=0.0, help="Период всплесков 429, с")
+    parser.add_argument("--burst-length", type=float, default=0.0, help="Длительность всплеска 429, с")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def profile_from_args(args: argparse.Namespace) -> MockProfile:
+    names = {f.name for f in fields(MockProfile) if f.init}
+    return MockProfile(**{name: value for name, value in vars(args).items() if name in names})
+
+
+LESSON_MARKDOWN = """## 🎯 Результат урока
+Вы создадите первое **заклинание** для магического помощника.
+
+## Шаг 1: Сформулируйте задачу
+Опишите, что нужно получить.
+
+```
+Ты — опытный редактор. Сократи текст до трёх предложений.
+```
+
+[IMAGE: схема промпта]
+
+## ✅ Проверьте себя
+- [ ] Задача сформулирована
+- [ ] Промпт проверен
+"""
+
+QUIZ = {
+    "questions": [
+        {
+            "question": f"Вопрос {i + 1}?",
+            "answers": ["Вариант 1", "Вариант 2", "Вариант 3", "Вариант 4"],
+            "correct": i % 4,
+            "explanation": "Потому что так написано в уроке.",
+        }
+        for i in range(5)
+    ]
+}
+
+
+def create_mock_app(latency: float = 1.0, jitter: float = 0.0, profile: MockProfile | None = None, **options) -> Quart:
+    """
+    Args:
+        latency: Средняя задержка ответа в секундах
+        jitter: Разброс задержки (равномерно ±jitter)
+        profile: Задержки и сбои целиком (вместо latency, jitter и options)
+        options: Остальные поля MockProfile (error_rate=0.05, distribution="lognormal", ...)
+    """
+    profile = profile or MockProfile(latency=latency, jitter=jitter, **options)
+    app = Quart(__name__)
+    stats = {
+        "requests": 0, "in_flight": 0, "max_in_flight": 0,
+        "errors": 0, "rate_limited": 0, "stream_errors": 0,
+        "prompt_tokens": 0, "completion_tokens": 0,
+    }
+    app.config["MOCK_STATS"] = stats
+    app.config["MOCK_PROFILE"] = profile
+    started = time.monotonic()
+
+    def usage_for(payload: dict, content: str) -> dict:
+        prompt_tokens = sum(len(str(m.get("content", ""))) for m in payload["messages"]) // 3
+        completion_tokens = len(content) // 3
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        prices = PRICES.get(payload.get("model"))
+        if prices and (payload.get("usage") or {}).get("include"):
+            usage["cost"] = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+        return usage
+
+    def error_body(status: int, message: str) -> dict:
+        return {"error": {"code": status, "message": message}}
+
+    @app.post("/chat/completions")
+    @app.post("/api/v1/chat/completions")
+    async def chat_completions():
+        payload = await request.get_json()
+        stats["requests"] += 1
+
+        burst = profile.burst_remaining(time.monotonic() - started)
+        if burst > 0:
+            stats["rate_limited"] += 1
+            response = jsonify(error_body(429, "Rate limit exceeded (mock burst)"))
+            response.status_code = 429
+            response.headers["Retry-After"] = str(max(1, math.ceil(burst)))
+            return response
+
+        delay = profile.sample_latency()
+        status = profile.error_status()
+        system = next((m["content"] for m in payload["messages"] if m["role"] == "system"), "")
+        content = json.dumps(QUIZ, ensure_ascii=False) if "JSON" in system else LESSON_MARKDOWN
+
+        if payload.get("stream") and status is None:
+            return stream_response(payload, content, delay)
+
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            stats["in_flight"] -= 1
+
+        if status is not None:
+            stats["errors"] += 1
+            response = jsonify(error_body(status, "Upstream provider error (mock)"))
+            response.status_code = status
+            return response
+
+        return jsonify({
+            "id": f"mock-{stats['requests']}",
+            "model": payload.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage_for(payload, content),
+        })
+
+    def stream_response(payload: dict, content: str, delay: float) -> Response:
+        chunks = [content[i:i + 40] for i in range(0, len(content), 40)]
+        fail_at = len(chunks) // 2 if profile.stream_fails() else None
+
+        async def events():
+            stats["in_flight"] += 1
+            stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            try:
+                yield ": OPENROUTER PROCESSING\n\n"
+                await asyncio.sleep(delay * 0.1)
+                for index, chunk in enumerate(chunks):
+                    if index == fail_at:
+                        # Ошибка посреди потока: статус уже 200, провайдер сообщает её фрагментом
+                        stats["stream_errors"] += 1
+                        yield f"data: {json.dumps(error_body(502, 'Provider stream interrupted (mock)'))}\n\n"
+                        return
+                    data = {"id": f"mock-{stats['requests']}", "model": payload.get("model"),
+                            "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]}
+                    yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+                    await asyncio.sleep(delay * 0.9 / len(chunks))
+                yield f"data: {json.dumps({'choices': [], 'usage': usage_for(payload, content)})}\n\n"
+                yield "data: [DONE]\n\n"
+            finally:
+                stats["in_flight"] -= 1
+
+        response = Response(events(), mimetype="text/event-stream")
+        response.timeout = None
+        return response
+
+    return app
+
+
+async def start_mock_server(app: Quart, host: str = "127.0.0.1", port: int = 8900) -> tuple[asyncio.Task, asyncio.Event]:
+    """
+    Запускает mock-сервер в текущем event loop.
+
+    Returns:
+        Tuple (задача сервера, событие остановки)
+    """
+    config = Config()
+    config.bind = [f"{host}:{port}"]
+    config.accesslog = None
+    config.errorlog = None
+    shutdown = asyncio.Event()
+    task = asyncio.create_task(serve(app, config, shutdown_trigger=shutdown.wait))
+    await asyncio.sleep(0.2)  # даём серверу занять порт
+    return task, shutdown
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+    create_mock_app(profile=profile_from_args(args)).run(port=args.port)
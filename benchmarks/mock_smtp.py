@@ -0,0 +1,109 @@
+"""
+Локальный SMTP-сервер (aiosmtpd) для тестов и бенчмарков отправки писем.
+
+Принимает любой логин (AUTH PLAIN/LOGIN без TLS) и складывает письма
+в память. Стоимость настоящего сервера имитируется задержками:
+    handshake_delay — на EHLO каждого нового соединения (TCP + TLS + AUTH
+                      у настоящего SMTP — сотни миллисекунд)
+    message_delay   — на приём каждого письма (DATA)
+
+Считает соединения, письма и максимум одновременных сессий.
+
+Запуск отдельно:
+    python -m benchmarks.mock_smtp --port 8025 --handshake-delay 0.3
+    SMTP_HOST=127.0.0.1 SMTP_PORT=8025 SMTP_SECURITY=none SMTP_USER=u SMTP_PASSWORD=p hypercorn main:app
+"""
+import argparse
+import asyncio
+import socket
+import logging
+import time
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.smtp import AuthResult
+
+# aiosmtpd пишет предупреждение об устаревшем Session.login_data на каждый AUTH
+logging.getLogger("mail.log").setLevel(logging.ERROR)
+
+
+class MockSMTPHandler:
+    """Обработчик aiosmtpd: задержки и счётчики"""
+
+    def __init__(self, handshake_delay: float = 0.0, message_delay: float = 0.0):
+        self.handshake_delay = handshake_delay
+        self.message_delay = message_delay
+        self.messages = []
+        self.connections = 0
+        self.sessions = 0
+        self.max_sessions = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        # EHLO повторяется после STARTTLS/RSET; новое соединение — первый EHLO сессии
+        if not getattr(session, "counted", False):
+            session.counted = True
+            self.connections += 1
+            self.sessions += 1
+            self.max_sessions = max(self.max_sessions, self.sessions)
+            await asyncio.sleep(self.handshake_delay)
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        await asyncio.sleep(self.message_delay)
+        self.messages.append((envelope.rcpt_tos, envelope.content))
+        return "250 Message accepted for delivery"
+
+    async def handle_QUIT(self, server, session, envelope):
+        self.sessions -= 1
+        return "221 Bye"
+
+
+def _accept_any(server, session, envelope, mechanism, auth_data) -> AuthResult:
+    return AuthResult(success=True)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_mock_smtp(
+    handshake_delay: float = 0.0,
+    message_delay: float = 0.0,
+    host: str = "127.0.0.1",
+    port: int = 0,
+) -> Controller:
+    """
+    Запускает SMTP-сервер в отдельном потоке (свой event loop).
+
+    Args:
+        port: Порт (0 — любой свободный)
+
+    Returns:
+        Controller: controller.handler — счётчики, controller.port — порт; остановка — controller.stop()
+    """
+    controller = Controller(
+        MockSMTPHandler(handshake_delay, message_delay),
+        hostname=host,
+        port=port or free_port(),
+        authenticator=_accept_any,
+        auth_require_tls=False,
+    )
+    controller.start()
+    return controller
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8025)
+    parser.add_argument("--handshake-delay", type=float, default=0.3, help="Задержка нового соединения, с")
+    parser.add_argument("--message-delay", type=float, default=0.02, help="Задержка приёма письма, с")
+    args = parser.parse_args()
+    controller = start_mock_smtp(args.handshake_delay, args.message_delay, port=args.port)
+    print(f"Mock SMTP on 127.0.0.1:{controller.port}, Ctrl+C to stop")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        controller.stop()
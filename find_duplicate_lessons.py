@@ -0,0 +1,62 @@
+"""
+Поиск почти одинаковых уроков в сгенерированных курсах (MinHash/LSH).
+
+Поздний урок каждой найденной пары помечается статусом "duplicate" —
+следующий запуск генерации курса перегенерирует его с подсказкой,
+что не повторять.
+
+    python find_duplicate_lessons.py                          # все курсы из каталога
+    python find_duplicate_lessons.py --course ai-for-beginners --threshold 0.4 --dry-run
+    python find_duplicate_lessons.py --course ai-for-beginners --regenerate
+"""
+import argparse
+import asyncio
+
+from sqlalchemy import select
+
+from app.config import Settings
+from app.data.courses import COURSES_EXTENDED
+from app.database import AsyncSessionLocal, init_db
+from app.models import Lesson
+from app.services.course_generator import get_course_generator
+from app.services.lesson_duplicates import flag_duplicate_lessons
+
+
+async def main(courses: list, threshold: float, dry_run: bool, regenerate: bool) -> None:
+    await init_db()
+    for course_slug in courses:
+        pairs = await flag_duplicate_lessons(course_slug, threshold, dry_run=dry_run)
+        if not pairs:
+            print(f"{course_slug}: no near-duplicate lessons above {threshold}")
+            continue
+
+        lesson_ids = {lesson_id for pair in pairs for lesson_id in (pair.first, pair.second)}
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(select(Lesson.id, Lesson.title).where(Lesson.id.in_(lesson_ids)))
+            titles = dict(result.all())
+        print(f"{course_slug}: {len(pairs)} pairs")
+        for pair in pairs:
+            print(
+                f"  {pair.similarity:.2f}  #{pair.second} {titles.get(pair.second)!r}"
+                f"  ~  #{pair.first} {titles.get(pair.first)!r}"
+            )
+
+        if regenerate and not dry_run:
+            await get_course_generator().generate_course(course_slug)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Поиск почти одинаковых уроков курсов")
+    parser.add_argument("--course", action="append", help="Slug курса (можно несколько; по умолчанию все)")
+    parser.add_argument(
+        "--threshold", type=float, default=None,
+        help="Порог похожести 0..1 (по умолчанию LESSON_DEDUP_THRESHOLD)",
+    )
+    parser.add_argument("--dry-run", action="store_true", help="Только показать пары, не помечать уроки")
+    parser.add_argument("--regenerate", action="store_true", help="Сразу перегенерировать помеченные уроки")
+    args = parser.parse_args()
+
+    threshold = args.threshold if args.threshold is not None else Settings().lesson_dedup_threshold
+    if not 0 < threshold <= 1:
+        parser.error("порог похожести должен быть в диапазоне (0, 1]")
+    asyncio.run(main(args.course or list(COURSES_EXTENDED), threshold, args.dry_run, args.regenerate))
@@ -2,10 +2,12 @@
 Скрипт для генерации курса "AI для повседневной работы"
 """
 import asyncio
+import os
 import sys
 from loguru import logger
 
 from app.services.course_generator import get_course_generator
+from app.services.generation_usage import get_usage_recorder
 from app.database import AsyncSessionLocal
 from app.models import User, UserCourse
 from sqlalchemy import select
@@ -17,13 +19,16 @@ async def generate_ai_for_beginners():
 
     generator = get_course_generator()
 
-    # Генерируем курс
+    # Генерируем недостающие уроки курса (--force: все уроки заново)
     success = await generator.generate_course(
         course_slug="ai-for-beginners",
         progress_callback=lambda done, total, name: logger.info(
-            f"Progress: {done}/{total} - Generating: {name}"
-        )
+            f"Progress: {done}/{total} - Generated: {name}"
+        ),
+        force="--force" in sys.argv
     )
+    # Дописываем учёт запросов к LLM (generation_usage) до выхода из скрипта
+    await get_usage_recorder().aclose()
 
     if success:
         logger.success("Course generated successfully!")
@@ -69,4 +74,7 @@ async def generate_ai_for_beginners():
 
 
 if __name__ == "__main__":
+    # --refresh: не брать ответы из кеша LLM (свежие ответы сохранятся в кеш)
+    if "--refresh" in sys.argv:
+        os.environ["LLM_CACHE_MODE"] = "refresh"
     asyncio.run(generate_ai_for_beginners())
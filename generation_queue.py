@@ -0,0 +1,94 @@
+"""
+Очередь фоновой генерации курсов.
+
+    python generation_queue.py enqueue ai-for-beginners chatgpt-pro   # поставить курсы в очередь
+    python generation_queue.py enqueue --all                           # все курсы каталога
+    python generation_queue.py enqueue ai-for-beginners --force        # перегенерировать все уроки
+    python generation_queue.py status                                  # последние задачи
+    python generation_queue.py status 42                               # одна задача
+    python generation_queue.py worker --jobs 4 --llm-concurrency 8     # воркер (до Ctrl+C)
+    python generation_queue.py worker --until-empty                    # выполнить очередь и выйти
+"""
+import argparse
+import asyncio
+import signal
+import sys
+
+from loguru import logger
+
+from app.data.courses import COURSES_EXTENDED
+from app.database import init_db
+from app.services.generation_jobs import GenerationWorker, enqueue_job, get_job, list_jobs
+
+
+async def enqueue(slugs: list, force: bool = False, all_courses: bool = False) -> int:
+    """Ставит курсы в очередь, возвращает код выхода"""
+    await init_db()
+    slugs = list(COURSES_EXTENDED) if all_courses else slugs
+    unknown = [slug for slug in slugs if slug not in COURSES_EXTENDED]
+    if unknown or not slugs:
+        logger.error(f"Unknown courses: {', '.join(unknown) or '(none given)'}")
+        return 1
+
+    for slug in slugs:
+        job, created = await enqueue_job(slug, force=force)
+        print(f"#{job.id:<6} {slug:<40} {'queued' if created else 'already ' + job.status}")
+    return 0
+
+
+async def status(job_id: int | None = None, limit: int = 20) -> int:
+    """Печатает состояние задач, возвращает код выхода"""
+    await init_db()
+    jobs = [await get_job(job_id)] if job_id else await list_jobs(limit=limit)
+    if not jobs or jobs[0] is None:
+        logger.error(f"Generation job not found: {job_id}")
+        return 1
+
+    print(f"{'id':>6}  {'course':<36} {'status':<10} {'progress':>9} {'tries':>5}  current / error")
+    for job in jobs:
+        progress = f"{job.progress_done}/{job.progress_total}"
+        print(
+            f"{job.id:>6}  {job.course_slug:<36} {job.status:<10} {progress:>9} {job.attempts:>5}  "
+            f"{job.error or job.current_item or ''}"
+        )
+    return 0
+
+
+async def worker(jobs: int | None, llm_concurrency: int | None, until_empty: bool) -> int:
+    """Запускает воркер; SIGINT/SIGTERM — дождаться текущих задач и выйти"""
+    await init_db()
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    await GenerationWorker(jobs=jobs, llm_concurrency=llm_concurrency).run(stop=stop, until_empty=until_empty)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Очередь фоновой генерации курсов")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    enqueue_parser = commands.add_parser("enqueue", help="Поставить курсы в очередь")
+    enqueue_parser.add_argument("slugs", nargs="*", help="Slug курсов")
+    enqueue_parser.add_argument("--all", action="store_true", help="Все курсы каталога")
+    enqueue_parser.add_argument("--force", action="store_true", help="Перегенерировать все уроки")
+
+    status_parser = commands.add_parser("status", help="Состояние задач")
+    status_parser.add_argument("job_id", nargs="?", type=int, help="ID задачи")
+    status_parser.add_argument("--limit", type=int, default=20, help="Сколько последних задач показать")
+
+    worker_parser = commands.add_parser("worker", help="Запустить воркер")
+    worker_parser.add_argument("--jobs", type=int, default=None, help="Задач одновременно")
+    worker_parser.add_argument("--llm-concurrency", type=int, default=None, help="Запросов к LLM одновременно")
+    worker_parser.add_argument("--until-empty", action="store_true", help="Выйти, когда очередь опустеет")
+
+    args = parser.parse_args()
+    if args.command == "enqueue":
+        code = asyncio.run(enqueue(args.slugs, force=args.force, all_courses=args.all))
+    elif args.command == "status":
+        code = asyncio.run(status(args.job_id, limit=args.limit))
+    else:
+        code = asyncio.run(worker(args.jobs, args.llm_concurrency, args.until_empty))
+    sys.exit(code)
@@ -15,6 +15,7 @@ from loguru import logger
 from app.database import engine, init_db, AsyncSessionLocal
 from app.models import Base, User, UserCourse
 from app.services.course_generator import get_course_generator
+from app.services.generation_usage import get_usage_recorder
 from app.data.catalog import COURSES
 import bcrypt
 
@@ -124,6 +125,8 @@ async def generate_ai_course():
         course_slug="ai-for-beginners",
         progress_callback=progress_callback
     )
+    # Дописываем учёт запросов к LLM (generation_usage) до выхода из скрипта
+    await get_usage_recorder().aclose()
 
     if success:
         logger.success("Course generated successfully!")
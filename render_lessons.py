@@ -0,0 +1,96 @@
+"""
+Скрипт пакетного пре-рендеринга уроков (Markdown → content_html).
+
+Перерендеривает уроки без HTML и уроки, чей content_hash не совпадает
+с текущим текстом или версией рендера. Рендеринг идёт в пуле процессов,
+запись — пакетами.
+
+    python render_lessons.py                 # только устаревшие уроки
+    python render_lessons.py --force         # все уроки
+    python render_lessons.py --workers 4 --batch-size 500
+"""
+import argparse
+import asyncio
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from loguru import logger
+from sqlalchemy import select, update
+
+from app.database import AsyncSessionLocal, init_db
+from app.models import Lesson
+from app.services.lesson_renderer import content_hash, render_markdown
+
+
+async def render_lessons(force: bool = False, workers: int | None = None, batch_size: int = 200) -> int:
+    """
+    Перерендеривает уроки.
+
+    Args:
+        force: Рендерить все уроки, даже актуальные
+        workers: Количество процессов (по умолчанию — число CPU)
+        batch_size: Размер пакета чтения/записи
+
+    Returns:
+        int: Количество перерендеренных уроков
+    """
+    await init_db()
+    loop = asyncio.get_running_loop()
+    rendered = 0
+    scanned = 0
+    last_id = 0
+    started = time.perf_counter()
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        while True:
+            # Keyset-пагинация по id: не держим все уроки в памяти
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(
+                    select(Lesson.id, Lesson.content_text, Lesson.content_hash, Lesson.content_html.is_(None))
+                    .where(Lesson.id > last_id)
+                    .order_by(Lesson.id)
+                    .limit(batch_size)
+                )
+                rows = result.all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            scanned += len(rows)
+
+            stale = [
+                (lesson_id, text, digest)
+                for lesson_id, text, stored_hash, html_missing in rows
+                for digest in (content_hash(text),)
+                if force or html_missing or stored_hash != digest
+            ]
+            if not stale:
+                continue
+
+            htmls = await asyncio.gather(*(
+                loop.run_in_executor(pool, render_markdown, text) for _, text, _ in stale
+            ))
+
+            async with AsyncSessionLocal() as session:
+                await session.execute(update(Lesson), [
+                    {"id": lesson_id, "content_html": html, "content_hash": digest}
+                    for (lesson_id, _, digest), html in zip(stale, htmls)
+                ])
+                await session.commit()
+
+            rendered += len(stale)
+            logger.info(f"Rendered {rendered} lessons (scanned {scanned})")
+
+    logger.success(
+        f"Lesson rendering finished: {rendered}/{scanned} lessons in {time.perf_counter() - started:.1f}s"
+    )
+    return rendered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пре-рендеринг Markdown уроков в HTML")
+    parser.add_argument("--force", action="store_true", help="Перерендерить все уроки")
+    parser.add_argument("--workers", type=int, default=None, help="Количество процессов")
+    parser.add_argument("--batch-size", type=int, default=200, help="Размер пакета")
+    args = parser.parse_args()
+    asyncio.run(render_lessons(force=args.force, workers=args.workers, batch_size=args.batch_size))
@@ -0,0 +1,303 @@
+/**
+ * Магический квест: прохождение в браузере
+ *
+ * Граф квеста (вопросы, варианты, переходы) загружается один раз по URL с
+ * версией и кешируется браузером навсегда. Переходы между вопросами
+ * считаются локально, все ответы и контакты уходят одним запросом
+ * POST /free-quest/submit — сервер проверяет путь по графу и возвращает
+ * готовый блок результатов.
+ *
+ * Без JS (или если граф не загрузился) работают обычные формы: ответ на
+ * каждый шаг — POST /free-quest/answer.
+ */
+(() => {
+  const container = document.querySelector('[data-quest-graph]');
+  if (!container || !window.fetch) return;
+
+  const ARROW_ICON = '<svg width="20" height="20" viewBox="0 0 20 20" fill="none"><path d="M7.5 5l5 5-5 5" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/></svg>';
+  const CHECK_ICON = '<svg width="20" height="20" viewBox="0 0 20 20" fill="none"><path d="M5 10l3 3 7-7" stroke="currentColor" stroke-width="2" stroke-linecap="round" stroke-linejoin="round"/></svg>';
+  const HINT_ICON = '<svg width="20" height="20" viewBox="0 0 20 20" fill="currentColor"><path d="M10 2a8 8 0 100 16 8 8 0 000-16zm0 14a6 6 0 110-12 6 6 0 010 12zm0-9a1 1 0 011 1v4a1 1 0 11-2 0V8a1 1 0 011-1zm0-2a1 1 0 100 2 1 1 0 000-2z"/></svg>';
+  const ERROR_ICON = '<svg width="20" height="20" viewBox="0 0 20 20" fill="currentColor"><path d="M10 2a8 8 0 100 16 8 8 0 000-16zM9 5h2v6H9V5zm0 8h2v2H9v-2z"/></svg>';
+
+  const state = {
+    graph: null,
+    answers: [],   // [{question_id, answer_id} | {question_id, text}]
+    submitting: false,
+  };
+
+  // Граф загружается сразу, пока пользователь читает первый вопрос
+  const graphLoaded = fetch(container.dataset.questGraph, { credentials: 'same-origin' })
+    .then((response) => {
+      if (!response.ok) throw new Error(`HTTP ${response.status}`);
+      return response.json();
+    })
+    .then((graph) => {
+      state.graph = graph;
+      return graph;
+    });
+  graphLoaded.catch((error) => console.error('Quest graph not loaded:', error));
+
+  history.replaceState({ questStep: 0 }, '');
+
+  // ============================================
+  // НАВИГАЦИЯ ПО ГРАФУ
+  // ============================================
+
+  /** Текущий вопрос: проход по графу от старта по сохранённым ответам */
+  function currentNode() {
+    const { nodes, start } = state.graph;
+    let node = nodes[start];
+    for (const answer of state.answers) {
+      if (node.type === 'choice') {
+        node = nodes[node.answers.find((option) => option.id === answer.answer_id).next];
+      } else {
+        node = nodes[node.next];
+      }
+    }
+    return node;
+  }
+
+  function progressFor(node) {
+    if (node.type === 'text') return 90;
+    if (node.type === 'contact') return 95;
+    return Math.min(10 + state.answers.length * 9, 100);
+  }
+
+  function answer(item) {
+    state.answers.push(item);
+    history.pushState({ questStep: state.answers.length }, '');
+    render(currentNode());
+  }
+
+  // Кнопка «назад» возвращает к предыдущему вопросу
+  window.addEventListener('popstate', (event) => {
+    const step = event.state && event.state.questStep;
+    if (!state.graph || typeof step !== 'number' || step > state.answers.length) return;
+    if (!container.isConnected) {
+      // Назад со страницы результатов — квест заново
+      window.location.reload();
+      return;
+    }
+    state.answers.length = step;
+    render(currentNode());
+  });
+
+  // ============================================
+  // ОТРИСОВКА (та же разметка, что в templates/quest/)
+  // ============================================
+
+  function el(tag, className, text) {
+    const node = document.createElement(tag);
+    if (className) node.className = className;
+    if (text !== undefined) node.textContent = text;
+    return node;
+  }
+
+  function submitButton(label, icon) {
+    const button = el('button', 'btn btn--primary btn--large quest-submit', label);
+    button.type = 'submit';
+    button.insertAdjacentHTML('beforeend', icon);
+    return button;
+  }
+
+  function errorBox(message) {
+    const box = el('div', 'quest-error');
+    box.innerHTML = ERROR_ICON;
+    box.append(el('span', null, message));
+    return box;
+  }
+
+  function render(node) {
+    const progress = progressFor(node);
+    container.querySelector('.quest-progress__bar').style.width = `${progress}%`;
+    container.querySelector('.quest-progress__text').textContent = `${progress}% завершено`;
+
+    const card = container.querySelector('.quest-card');
+    card.className = 'quest-card';
+    card.replaceChildren();
+
+    const builders = { choice: renderChoice, text: renderText, contact: renderContact };
+    builders[node.type](card, node);
+    window.scrollTo({ top: 0, behavior: 'smooth' });
+  }
+
+  function header(card, node, icon, large) {
+    card.append(el('div', large ? 'quest-card__icon quest-card__icon--large' : 'quest-card__icon', icon));
+    card.append(el('h1', 'quest-card__title', node.text));
+    if (node.description) card.append(el('p', 'quest-card__description', node.description));
+  }
+
+  function renderChoice(card, node) {
+    header(card, node, '🔮');
+    const form = el('form', 'quest-form');
+    const options = el('div', 'quest-answers');
+    for (const option of node.answers) {
+      const label = el('label', 'quest-answer');
+      const input = el('input');
+      input.type = 'radio';
+      input.name = 'answer_id';
+      input.value = option.id;
+      input.required = true;
+      const content = el('div', 'quest-answer__content');
+      content.append(el('span', 'quest-answer__text', option.text), el('span', 'quest-answer__arrow', '→'));
+      label.append(input, content);
+      options.append(label);
+    }
+    form.append(options, submitButton('Продолжить путешествие ', ARROW_ICON));
+    form.addEventListener('submit', (event) => {
+      event.preventDefault();
+      answer({ question_id: node.id, answer_id: new FormData(form).get('answer_id') });
+    });
+    card.append(form);
+  }
+
+  function renderText(card, node) {
+    card.classList.add('quest-card--challenge');
+    header(card, node, '🔮✨', true);
+    if (node.hint) {
+      const hint = el('div', 'quest-hint');
+      hint.innerHTML = HINT_ICON;
+      hint.append(el('span', null, node.hint));
+      card.append(hint);
+    }
+
+    const form = el('form', 'quest-form');
+    const field = el('div', 'quest-challenge__field');
+    const label = el('label', 'quest-challenge__label', 'Ваше магическое заклинание:');
+    label.htmlFor = 'answer_text';
+    const textarea = el('textarea', 'quest-challenge__textarea');
+    textarea.id = 'answer_text';
+    textarea.rows = 6;
+    textarea.placeholder = node.placeholder || '';
+    textarea.minLength = node.min_length || 0;
+    textarea.maxLength = node.max_length;
+    textarea.required = true;
+    const counter = el('div', 'quest-challenge__counter');
+    const count = el('span', null, '0');
+    counter.append(count, ' символов');
+    textarea.addEventListener('input', () => {
+      count.textContent = textarea.value.length;
+      textarea.setCustomValidity('');
+    });
+    field.append(label, textarea, counter);
+
+    const challenge = el('div', 'quest-challenge');
+    challenge.append(field);
+    form.append(challenge, submitButton('Завершить испытание ', CHECK_ICON));
+    form.addEventListener('submit', (event) => {
+      event.preventDefault();
+      // Сервер считает длину без пробелов по краям
+      const text = textarea.value.trim();
+      if (text.length < textarea.minLength) {
+        textarea.setCustomValidity(`Минимум ${textarea.minLength} символов`);
+        textarea.reportValidity();
+        return;
+      }
+      answer({ question_id: node.id, text });
+    });
+    card.append(form);
+  }
+
+  function contactField(name, type, labelText, placeholder) {
+    const field = el('div', 'quest-contact__field');
+    const label = el('label', 'quest-contact__label', labelText);
+    label.htmlFor = name;
+    const input = el('input', 'quest-contact__input');
+    input.type = type;
+    input.id = name;
+    input.name = name;
+    input.placeholder = placeholder;
+    field.append(label, input);
+    return field;
+  }
+
+  function renderContact(card, node, error) {
+    card.classList.add('quest-card--contact');
+    header(card, node, '📞✨', true);
+    const errorSlot = el('div');
+    if (error) errorSlot.append(errorBox(error));
+
+    const form = el('form', 'quest-form quest-contact-form');
+    const or = el('div', 'quest-contact__or');
+    or.append(el('span', null, 'или'));
+    const button = submitButton('Продолжить к результатам ', ARROW_ICON);
+    form.append(
+      contactField('name', 'text', 'Как вас зовут? (по желанию)', 'Иван'),
+      contactField('telegram', 'text', 'Ваш Telegram', '@username или +7 900 123-45-67'),
+      or,
+      contactField('phone', 'tel', 'Номер телефона', '+7 (900) 123-45-67'),
+      el('div', 'quest-contact__hint', '💡 Мы свяжемся с вами в течение 24 часов для бесплатной консультации'),
+      button,
+      el('p', 'quest-contact__privacy', 'Нажимая кнопку, вы соглашаетесь с обработкой персональных данных'),
+    );
+    form.addEventListener('submit', async (event) => {
+      event.preventDefault();
+      const contact = Object.fromEntries(new FormData(form));
+      if (!contact.telegram.trim() && !contact.phone.trim()) {
+        errorSlot.replaceChildren(errorBox('Пожалуйста, укажите хотя бы один способ связи'));
+        return;
+      }
+      button.disabled = true;
+      const message = await submit(contact);
+      if (message) {
+        errorSlot.replaceChildren(errorBox(message));
+        button.disabled = false;
+      }
+    });
+    card.append(errorSlot, form);
+  }
+
+  // ============================================
+  // ОТПРАВКА ОТВЕТОВ
+  // ============================================
+
+  /** Отправляет ответы; возвращает текст ошибки или показывает результаты */
+  async function submit(contact) {
+    if (state.submitting) return null;
+    state.submitting = true;
+    try {
+      const response = await fetch(container.dataset.questSubmit, {
+        method: 'POST',
+        credentials: 'same-origin',
+        headers: { 'Content-Type': 'application/json', Accept: 'application/json' },
+        body: JSON.stringify({ version: state.graph.version, answers: state.answers, contact }),
+      });
+      const data = await response.json().catch(() => ({}));
+
+      if (response.ok && data.success) {
+        const results = document.createElement('div');
+        results.innerHTML = data.html;
+        container.replaceWith(...results.childNodes);
+        // Страница результатов открывается по этой ссылке из сессии
+        history.replaceState(null, '', data.results_url);
+        window.scrollTo({ top: 0, behavior: 'smooth' });
+        return null;
+      }
+      if (response.status === 409 && data.restart_url) {
+        window.location.href = data.restart_url;
+        return null;
+      }
+      return data.error || 'Не удалось отправить ответы. Попробуйте ещё раз.';
+    } catch (error) {
+      console.error('Quest submit failed:', error);
+      return 'Не удалось отправить ответы. Проверьте соединение и попробуйте ещё раз.';
+    } finally {
+      state.submitting = false;
+    }
+  }
+
+  // Первый вопрос отрисован сервером: перехватываем его форму
+  const firstForm = container.querySelector('.quest-form');
+  firstForm.addEventListener('submit', async (event) => {
+    event.preventDefault();
+    const answerId = new FormData(firstForm).get('answer_id');
+    try {
+      await graphLoaded;
+    } catch (error) {
+      // Граф не загрузился — обычное пошаговое прохождение через сервер
+      firstForm.submit();
+      return;
+    }
+    answer({ question_id: state.graph.start, answer_id: answerId });
+  });
+})();
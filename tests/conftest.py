@@ -0,0 +1,20 @@
+import pytest
+
+from app.services import openrouter as openrouter_module
+
+
+class ListUsageRecorder:
+    """Учёт запросов к LLM в памяти: тесты не пишут в generation_usage"""
+
+    def __init__(self):
+        self.rows = []
+
+    def record(self, row):
+        self.rows.append(row)
+
+
+@pytest.fixture(autouse=True)
+def usage_rows(monkeypatch):
+    recorder = ListUsageRecorder()
+    monkeypatch.setattr(openrouter_module, "get_usage_recorder", lambda: recorder)
+    return recorder.rows
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import random
+
+import pytest
+
+from app.services.course_generator import CourseGeneratorService
+
+
+class FakeOpenRouter:
+    """Отвечает с небольшой случайной задержкой и считает одновременные запросы"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = []
+
+    async def generate_text(self, prompt, system_prompt=None, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(random.uniform(0.001, 0.01))
+        finally:
+            self.in_flight -= 1
+        if "JSON" in (system_prompt or ""):
+            self.calls.append("quiz")
+            question = {"question": "Q?", "answers": ["a", "b", "c", "d"], "correct": 0, "explanation": "a"}
+            return json.dumps({"questions": [question] * 3})
+        self.calls.append("text")
+        lesson_title = prompt.split("Урок: ", 1)[1].split("\n", 1)[0]
+        return f"## {lesson_title}"
+
+
+@pytest.mark.asyncio
+async def test_generate_course_content_is_bounded_and_ordered():
+    openrouter = FakeOpenRouter()
+    generator = CourseGeneratorService(openrouter=openrouter, concurrency=3)
+    progress = []
+
+    modules = await generator.generate_course_content(
+        "ai-for-beginners", progress_callback=lambda done, total, title: progress.append((done, total))
+    )
+
+    from app.data.courses import COURSES_EXTENDED
+    program = COURSES_EXTENDED["ai-for-beginners"]["program"]
+    assert [m["title"] for m in modules] == [m["title"] for m in program]
+    for module, module_data in zip(modules, program):
+        assert [lesson["title"] for lesson in module["lessons"]] == module_data["lessons"]
+        for lesson in module["lessons"]:
+            assert lesson["content_text"] == f"## {lesson['title']}"
+            assert lesson["quiz_questions"]["questions"]
+
+    total = sum(len(m["lessons"]) for m in program)
+    assert openrouter.max_in_flight == 3
+    assert openrouter.calls.count("quiz") == total
+    assert progress == [(i, total) for i in range(1, total + 1)]
+
+
+@pytest.mark.asyncio
+async def test_failed_lesson_text_skips_quiz():
+    class FailingOpenRouter(FakeOpenRouter):
+        async def generate_text(self, prompt, system_prompt=None, **kwargs):
+            return None
+
+    generator = CourseGeneratorService(openrouter=FailingOpenRouter(), concurrency=2)
+    content = await generator.generate_lesson_content("Урок", "Модуль", "Курс")
+    assert "Контент не сгенерирован" in content["content_text"]
+    assert content["quiz_questions"] is None
+
+
+def test_needs_generation():
+    from types import SimpleNamespace
+
+    from app.services.course_generator import needs_generation
+
+    assert needs_generation(SimpleNamespace(generation_status="pending", content_text=None))
+    assert needs_generation(SimpleNamespace(generation_status="failed", content_text="## old"))
+    assert needs_generation(SimpleNamespace(generation_status="duplicate", content_text="## old"))
+    assert needs_generation(SimpleNamespace(
+        generation_status="ready", content_text="# Урок\n\nКонтент не сгенерирован. Попробуйте позже."
+    ))
+    assert not needs_generation(SimpleNamespace(generation_status="ready", content_text="## Урок"))
+
+
+@pytest.mark.asyncio
+async def test_each_lesson_is_checkpointed_as_it_finishes():
+    from app.services.course_generator import LessonTask
+
+    generator = CourseGeneratorService(openrouter=FakeOpenRouter(), concurrency=2)
+    tasks = [LessonTask(module_index=0, order=i, title=f"Урок {i}", module_title="М", lesson_id=i) for i in range(1, 6)]
+    saved = []
+
+    async def on_lesson(task, content):
+        saved.append((task.lesson_id, content["content_text"]))
+
+    await generator._generate_lessons(tasks, "Курс", "начинающие", on_lesson=on_lesson)
+    assert sorted(saved) == [(i, f"## Урок {i}") for i in range(1, 6)]
+
+
+@pytest.mark.asyncio
+async def test_lesson_is_ready_only_after_it_is_saved(monkeypatch):
+    from app.services import lesson_writer
+    from app.services.course_generator import LessonTask
+
+    committed = set()
+    events = []
+
+    async def save_lessons(results):
+        await asyncio.sleep(0.001)
+        committed.update(lesson_id for lesson_id, content in results)
+        return 0.001
+
+    def lesson_callback(task, status, chars):
+        events.append((task.lesson_id, status, task.lesson_id in committed))
+
+    monkeypatch.setattr(lesson_writer, "save_lessons", save_lessons)
+    generator = CourseGeneratorService(openrouter=FakeOpenRouter(), concurrency=2)
+    tasks = [
+        LessonTask(module_index=i // 3, order=i, title=f"Урок {i}", module_title="М", lesson_id=i)
+        for i in range(1, 6)
+    ]
+
+    failed = await generator._generate_and_save(
+        "c", tasks, course_title="Курс", target_audience="начинающие", lesson_callback=lesson_callback
+    )
+
+    assert failed == 0
+    ready = [(lesson_id, saved) for lesson_id, status, saved in events if status == "ready"]
+    assert sorted(ready) == [(i, True) for i in range(1, 6)]
+    assert all(not saved for _, status, saved in events if status == "generated")
@@ -0,0 +1,117 @@
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.services.course_outline import CHANNEL, CourseOutlineCache, build_outline
+
+# PostgreSQL для проверки LISTEN/NOTIFY между процессами
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+ROWS = [
+    # module_id, order, title, description, lesson_id, order, title, minutes, is_free
+    (2, 2, "Глава 2", None, 21, 1, "Урок 2.1", 15, True),
+    (1, 1, "Глава 1", None, 12, 2, "Урок 1.2", 15, False),
+    (1, 1, "Глава 1", None, 11, 1, "Урок 1.1", 15, True),
+    (3, 3, "Глава 3", None, None, None, None, None, None),
+]
+
+
+def test_build_outline_orders_lessons_and_links_neighbours():
+    outline = build_outline("ai-for-beginners", ROWS)
+
+    assert outline.lesson_ids == (11, 12, 21)
+    assert outline.first_lesson.id == 11
+    assert outline.next_lesson(12).id == 21
+    assert outline.prev_lesson(21).id == 12
+    assert outline.next_lesson(21) is None
+    assert outline.modules[2].lessons == ()
+    assert outline.version == build_outline("ai-for-beginners", list(reversed(ROWS))).version
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_load():
+    loads = 0
+
+    async def loader(slug):
+        nonlocal loads
+        loads += 1
+        await asyncio.sleep(0.01)
+        return build_outline(slug, ROWS)
+
+    cache = CourseOutlineCache(ttl=60, loader=loader)
+    outlines = await asyncio.gather(*(cache.get("ai-for-beginners") for _ in range(10)))
+
+    assert loads == 1
+    assert all(outline is outlines[0] for outline in outlines)
+
+    cache.invalidate("ai-for-beginners")
+    await cache.get("ai-for-beginners")
+    assert loads == 2
+
+
+@pytest.mark.asyncio
+async def test_unknown_lesson_reloads_stale_outline_once():
+    loads = []
+    rows = {1: ROWS, 2: ROWS + [(3, 3, "Глава 3", None, 31, 1, "Урок 3.1", 15, False)]}
+
+    async def loader(slug):
+        loads.append(slug)
+        return build_outline(slug, rows[min(len(loads), 2)])
+
+    # Свежий снимок не перечитывается: перебор ID не нагружает БД
+    cache = CourseOutlineCache(ttl=60, loader=loader, miss_reload_after=60)
+    assert not (await cache.get_with_lesson("ai-for-beginners", 31)).contains(31)
+    assert len(loads) == 1
+
+    # Урок добавил генератор в другом процессе, уведомление не дошло
+    cache.miss_reload_after = 0
+    assert (await cache.get_with_lesson("ai-for-beginners", 31)).contains(31)
+    assert (await cache.get_with_lesson("ai-for-beginners", 99)).contains(31)
+    assert len(loads) == 3
+    assert cache.stats()["miss_reloads"] == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL is not set")
+async def test_notify_from_another_process_invalidates_outline():
+    engine = create_async_engine(TEST_DATABASE_URL)
+    loads = 0
+
+    async def loader(slug):
+        nonlocal loads
+        loads += 1
+        return build_outline(slug, ROWS)
+
+    cache = CourseOutlineCache(ttl=600, loader=loader)
+    stop = asyncio.Event()
+    listener = asyncio.create_task(cache.listen(stop, engine=engine))
+    try:
+        for _ in range(500):
+            if cache.subscribed:
+                break
+            await asyncio.sleep(0.01)
+        await cache.get("ai-for-beginners")
+
+        # Снимок загружен после подписки — NOTIFY из «воркера генерации» его сбрасывает
+        async with engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+            await conn.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": CHANNEL, "payload": "ai-for-beginners"},
+            )
+        for _ in range(100):
+            if cache.notifications:
+                break
+            await asyncio.sleep(0.01)
+
+        assert cache.notifications == 1
+        assert "ai-for-beginners" not in cache.stats()["courses"]
+        await cache.get("ai-for-beginners")
+        assert loads == 2
+    finally:
+        stop.set()
+        await listener
+        await engine.dispose()
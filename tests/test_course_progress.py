@@ -0,0 +1,151 @@
+import asyncio
+import os
+import uuid
+from contextlib import asynccontextmanager
+
+import pytest
+from sqlalchemy import delete, select
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app.models import CourseModule, Lesson, User, UserCourseProgress, UserLessonProgress
+from app.models.user import Base
+from app.services.course_outline import build_outline
+from app.services.course_progress import mark_lesson_completed, progress_percent, touch_course_progress
+
+# Отдельная БД PostgreSQL для тестов с настоящими UPDATE/upsert (таблицы создаются, строки удаляются)
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+
+
+class FakeResult:
+    def __init__(self, rowcount: int):
+        self.rowcount = rowcount
+
+
+class FakeSession:
+    """Запоминает выполненные выражения; UPDATE затрагивает rowcount строк"""
+
+    def __init__(self, rowcount: int = 1):
+        self.rowcount = rowcount
+        self.statements = []
+
+    async def execute(self, stmt):
+        self.statements.append(str(stmt.compile(dialect=postgresql.dialect())))
+        return FakeResult(self.rowcount)
+
+
+OUTLINE = build_outline("course", [
+    (1, 1, "M1", None, 10, 1, "L1", 15, False),
+    (1, 1, "M1", None, 11, 2, "L2", 15, False),
+    (2, 2, "M2", None, 12, 1, "L3", 15, False),
+])
+
+
+def test_progress_percent():
+    assert progress_percent(0, 0) == 0
+    assert progress_percent(1, 3) == 33
+    assert progress_percent(5, 3) == 100
+
+
+@pytest.mark.asyncio
+async def test_completion_increments_summary_once():
+    db = FakeSession(rowcount=1)
+    assert await mark_lesson_completed(db, 1, 10, OUTLINE)
+    assert len(db.statements) == 2
+    assert "status != " in db.statements[0]
+    assert "ON CONFLICT (user_id, course_slug) DO UPDATE" in db.statements[1]
+    assert "least(user_course_progress.completed_lessons + " in db.statements[1]
+
+    # Урок уже был завершён — сводку не трогаем
+    db = FakeSession(rowcount=0)
+    assert not await mark_lesson_completed(db, 1, 10, OUTLINE)
+    assert len(db.statements) == 1
+
+
+@pytest.mark.asyncio
+async def test_touch_recounts_only_for_other_outline_version():
+    db = FakeSession()
+    await touch_course_progress(db, 1, 11, OUTLINE, completed_lessons=1)
+    sql = db.statements[0]
+    assert "ON CONFLICT (user_id, course_slug) DO UPDATE" in sql
+    assert "user_course_progress.outline_version IS DISTINCT FROM excluded.outline_version" in sql
+
+
+@asynccontextmanager
+async def course_in_db(lessons: int = 3):
+    """Пользователь и курс из lessons уроков (начатых) в TEST_DATABASE_URL"""
+    if not TEST_DATABASE_URL:
+        pytest.skip("TEST_DATABASE_URL is not set")
+    engine = create_async_engine(TEST_DATABASE_URL)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    tag = uuid.uuid4().hex[:8]
+    async with sessions() as db:
+        user = User(username=f"progress-{tag}", email=f"progress-{tag}@example.com")
+        module = CourseModule(course_slug=f"course-{tag}", order=1, title="M1")
+        db.add_all([user, module])
+        await db.flush()
+        rows = [Lesson(module_id=module.id, order=i, title=f"L{i}") for i in range(1, lessons + 1)]
+        db.add_all(rows)
+        await db.flush()
+        db.add_all(UserLessonProgress(user_id=user.id, lesson_id=row.id, status="in_progress") for row in rows)
+        await db.commit()
+    outline = build_outline(module.course_slug, [
+        (module.id, 1, "M1", None, row.id, row.order, row.title, 15, False) for row in rows
+    ])
+    try:
+        yield sessions, user.id, outline
+    finally:
+        async with sessions() as db:
+            await db.execute(delete(UserCourseProgress).where(UserCourseProgress.user_id == user.id))
+            await db.execute(delete(UserLessonProgress).where(UserLessonProgress.user_id == user.id))
+            await db.execute(delete(Lesson).where(Lesson.module_id == module.id))
+            await db.execute(delete(CourseModule).where(CourseModule.id == module.id))
+            await db.execute(delete(User).where(User.id == user.id))
+            await db.commit()
+        await engine.dispose()
+
+
+async def complete(sessions, user_id, lesson_id, outline) -> bool:
+    async with sessions() as db:
+        completed = await mark_lesson_completed(db, user_id, lesson_id, outline)
+        await db.commit()
+        return completed
+
+
+async def summary(sessions, user_id, outline) -> tuple:
+    async with sessions() as db:
+        progress = await db.scalar(select(UserCourseProgress).where(
+            UserCourseProgress.user_id == user_id, UserCourseProgress.course_slug == outline.course_slug,
+        ))
+        return progress.completed_lessons, progress.total_lessons, progress.progress_percent
+
+
+@pytest.mark.asyncio
+async def test_completing_lessons_counts_each_lesson_once():
+    async with course_in_db() as (sessions, user_id, outline):
+        first, second, third = outline.lesson_ids
+
+        assert await complete(sessions, user_id, first, outline)
+        assert await summary(sessions, user_id, outline) == (1, 3, 33)
+
+        # Повторное завершение урока — не новое завершение
+        assert not await complete(sessions, user_id, first, outline)
+        assert await summary(sessions, user_id, outline) == (1, 3, 33)
+
+        assert await complete(sessions, user_id, second, outline)
+        assert await complete(sessions, user_id, third, outline)
+        assert await summary(sessions, user_id, outline) == (3, 3, 100)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_completion_of_one_lesson_counts_once():
+    async with course_in_db() as (sessions, user_id, outline):
+        lesson_id = outline.lesson_ids[0]
+
+        results = await asyncio.gather(*(complete(sessions, user_id, lesson_id, outline) for _ in range(5)))
+
+        assert sorted(results) == [False] * 4 + [True]
+        assert await summary(sessions, user_id, outline) == (1, 3, 33)
@@ -0,0 +1,93 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("aiosmtpd")
+
+from app.services.email import EmailDelivery, SMTPConfig, _build_verification_message  # noqa: E402
+from benchmarks.mock_smtp import free_port, start_mock_smtp  # noqa: E402
+
+
+@pytest.fixture
+def smtp_server():
+    controllers = []
+
+    def start(**delays):
+        controllers.append(start_mock_smtp(**delays))
+        return controllers[-1]
+
+    yield start
+    for controller in controllers:
+        controller.stop()
+
+
+def make_delivery(controller, **options) -> EmailDelivery:
+    return EmailDelivery(SMTPConfig("127.0.0.1", controller.port, "user", "secret", security="none"), **options)
+
+
+def message(number: int):
+    return _build_verification_message(f"user{number}@example.com", "123456", "Маг")
+
+
+@pytest.mark.asyncio
+async def test_connections_are_reused_across_messages(smtp_server):
+    server = smtp_server(handshake_delay=0.05)
+    delivery = make_delivery(server, connections=2)
+
+    results = await asyncio.gather(*(delivery.send(message(i)) for i in range(20)))
+    await delivery.aclose()
+
+    assert all(results)
+    assert len(server.handler.messages) == 20
+    assert server.handler.connections == 2
+    assert delivery.stats()["sent"] == 20
+    rcpt_tos, content = server.handler.messages[0]
+    assert b"From: user" in content and rcpt_tos[0].endswith("@example.com")
+
+
+@pytest.mark.asyncio
+async def test_reconnects_after_idle_timeout_and_dropped_connection(smtp_server):
+    server = smtp_server()
+    delivery = make_delivery(server, connections=1, idle_timeout=0.05)
+    connection = delivery.connections[0]
+
+    assert await delivery.send(message(1))
+    await asyncio.sleep(0.1)
+    assert await delivery.send(message(2))
+    assert connection.connects == 2
+
+    # Сервер оборвал соединение между письмами: письмо уходит по новому
+    connection.idle_timeout = 60
+    connection._server.sock.shutdown(socket.SHUT_RDWR)
+    assert await delivery.send(message(3))
+    assert connection.reconnects == 1
+    await delivery.aclose()
+    assert len(server.handler.messages) == 3
+
+
+@pytest.mark.asyncio
+async def test_full_queue_applies_back_pressure(smtp_server):
+    server = smtp_server(message_delay=0.02)
+    delivery = make_delivery(server, connections=1, queue_size=2)
+
+    senders = [asyncio.create_task(delivery.send(message(i))) for i in range(8)]
+    await asyncio.sleep(0.01)
+    assert delivery.stats()["queued"] <= 2
+
+    assert all(await asyncio.gather(*senders))
+    assert delivery.stats()["max_queued"] == 2
+    await delivery.aclose()
+
+
+@pytest.mark.asyncio
+async def test_unconfigured_or_unreachable_smtp_reports_failure(smtp_server):
+    server = smtp_server()
+    unconfigured = EmailDelivery(SMTPConfig("127.0.0.1", server.port, "", "", security="none"))
+    assert await unconfigured.send(message(1)) is False
+    assert server.handler.connections == 0
+
+    unreachable = EmailDelivery(SMTPConfig("127.0.0.1", free_port(), "user", "secret", security="none", timeout=1))
+    assert await unreachable.send(message(2)) is False
+    assert unreachable.stats()["failed"] == 1
+    await unreachable.aclose()
@@ -0,0 +1,98 @@
+import email
+from email.header import decode_header, make_header
+
+import pytest
+from jinja2 import DictLoader
+
+from app.services.email import COURSE_BENEFITS, build_email
+from app.services.email_templates import EMAIL_TEMPLATES, EmailTemplates, encode_header, html_to_text
+
+
+@pytest.fixture(scope="module")
+def templates():
+    templates = EmailTemplates()
+    templates.load()
+    return templates
+
+
+def parse(message):
+    message["From"] = "robot@example.com"
+    return email.message_from_bytes(message.as_bytes())
+
+
+def test_html_to_text_keeps_paragraphs_lists_and_links():
+    html = """<html><head><title>Т</title><style>p {color: red}</style></head><body>
+        <h1>Заголовок</h1>
+        <p>Первая
+           строка<br>вторая &amp; третья</p>
+        <ul><li>Раз</li><li>Два</li></ul>
+        <p><a href="https://neuromagicai.ru/courses/x">Начать</a> и
+           <a href="mailto:hello@neuro-magic.ru">hello@neuro-magic.ru</a></p>
+    </body></html>"""
+
+    assert html_to_text(html) == (
+        "Заголовок\n\nПервая строка\nвторая & третья\n\n- Раз\n- Два\n\n"
+        "Начать (https://neuromagicai.ru/courses/x) и hello@neuro-magic.ru"
+    )
+
+
+def test_encode_header_roundtrip():
+    assert encode_header("Plain subject") == "Plain subject"
+    subject = "Вы приобрели курс «Промпт-инжиниринг для всех» на Нейромагии!"
+
+    encoded = encode_header(subject, linesep="\r\n")
+
+    assert all(len(line) <= 76 for line in encoded.split("\r\n"))
+    assert str(make_header(decode_header(encoded))) == subject
+
+
+def test_compiled_render_matches_jinja(templates):
+    context = {"course_id": "chatgpt-basics", "benefits": COURSE_BENEFITS["chatgpt-basics"]}
+    fields = {"username": "<Маг & Ко>", "course_title": "ChatGPT", "amount": "990.00"}
+
+    subject, html, text = templates.compile("purchase", context).render(fields)
+
+    module = templates.env.get_template(EMAIL_TEMPLATES["purchase"]).make_module({**context, **fields})
+    assert html == str(module)
+    assert subject == 'Вы приобрели курс "ChatGPT" на Нейромагии!'
+    assert "Здравствуйте, <Маг & Ко>!" in text and "&lt;Маг &amp; Ко&gt;" in html
+    assert "- ✓ Готовые шаблоны промптов" in text
+    assert "(https://neuromagicai.ru/courses/chatgpt-basics)" in text
+
+
+def test_context_selects_variant(templates):
+    named = templates.compile("verification", {"has_name": True})
+    anonymous = templates.compile("verification", {"has_name": False})
+
+    assert named.fields == ("code", "username")
+    assert anonymous.fields == ("code",)
+    assert templates.compile("verification", {"has_name": True}) is named
+    assert "Здравствуйте!" in anonymous.render({"code": "123456"})[2]
+
+
+def test_transformed_field_is_rejected():
+    templates = EmailTemplates(templates={"broken": "broken.html"})
+    templates.env.loader = DictLoader({"broken.html": "<p>{{ code|upper }}</p>"})
+
+    with pytest.raises(ValueError, match="CODE"):
+        templates.compile("broken")
+
+
+def test_message_is_valid_multipart():
+    message = parse(build_email("verification", "mage@example.com", {"code": "654321", "username": "Маг"}))
+
+    assert str(make_header(decode_header(message["Subject"]))) == "Код подтверждения регистрации на Нейромагии: 654321"
+    assert message["To"] == "mage@example.com"
+    text, html = message.get_payload()
+    assert (text.get_content_type(), html.get_content_type()) == ("text/plain", "text/html")
+    assert "654321" in text.get_payload(decode=True).decode()
+    assert "Здравствуйте, Маг!" in html.get_payload(decode=True).decode()
+
+
+def test_field_cannot_inject_headers():
+    payload = {"username": "Маг", "course_title": "Курс\nBcc: victim@example.com", "course_id": "x", "amount": 1}
+
+    message = parse(build_email("purchase", "mage@example.com", payload))
+
+    assert message["Bcc"] is None
+    assert "Bcc: victim@example.com" in str(make_header(decode_header(message["Subject"])))
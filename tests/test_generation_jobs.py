@@ -0,0 +1,168 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import generation_jobs
+from app.services.generation_jobs import GenerationWorker, JobProgress
+
+
+class FakeQueue:
+    """Очередь задач в памяти вместо таблицы generation_jobs"""
+
+    def __init__(self, slugs):
+        self.queued = [
+            SimpleNamespace(id=i, course_slug=slug, lesson_id=None, force=False, attempts=1)
+            for i, slug in enumerate(slugs, start=1)
+        ]
+        self.finished = {}
+        self.progress = {}
+        self.events = []
+        self.cancel = set()
+
+    async def claim_job(self, worker_id):
+        return self.queued.pop(0) if self.queued else None
+
+    async def update_progress(self, job_id, worker_id, done, total, current_item):
+        self.progress[job_id] = (done, total)
+        return job_id in self.cancel
+
+    async def finish_job(self, job_id, worker_id, status, error=None):
+        self.finished[job_id] = status
+
+    async def requeue_stale_jobs(self, stale_after):
+        return 0
+
+    async def publish_event(self, event):
+        self.events.append(event)
+
+
+class FakeGenerator:
+    """Генерирует курс из lessons уроков, считая одновременные запросы к LLM"""
+
+    def __init__(self, lessons=5, delay=0.005):
+        self.lessons = lessons
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.courses_in_flight = 0
+        self.max_courses_in_flight = 0
+
+    async def generate_course(self, course_slug, progress_callback=None, force=False, slots=None, lesson_callback=None):
+        self.courses_in_flight += 1
+        self.max_courses_in_flight = max(self.max_courses_in_flight, self.courses_in_flight)
+
+        async def lesson(index):
+            task = SimpleNamespace(lesson_id=index, title=f"Урок {index}")
+            async with slots:
+                self.in_flight += 1
+                self.max_in_flight = max(self.max_in_flight, self.in_flight)
+                lesson_callback(task, "started", 0)
+                try:
+                    await asyncio.sleep(self.delay)
+                finally:
+                    self.in_flight -= 1
+                lesson_callback(task, "streaming", 100)
+                lesson_callback(task, "ready", 100)
+            progress_callback(index, self.lessons, f"Урок {index}")
+
+        try:
+            await asyncio.gather(*(lesson(i) for i in range(1, self.lessons + 1)))
+        finally:
+            self.courses_in_flight -= 1
+        return course_slug != "broken"
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    fake = FakeQueue(["a", "b", "c", "broken"])
+    for name in ("claim_job", "update_progress", "finish_job", "requeue_stale_jobs", "publish_event"):
+        monkeypatch.setattr(generation_jobs, name, getattr(fake, name))
+    return fake
+
+
+@pytest.mark.asyncio
+async def test_worker_runs_jobs_concurrently_with_shared_llm_budget(queue):
+    generator = FakeGenerator()
+    worker = GenerationWorker(jobs=3, llm_concurrency=4, generator=generator, poll_interval=0.01)
+
+    await asyncio.wait_for(worker.run(until_empty=True), timeout=5)
+
+    assert queue.finished == {1: "succeeded", 2: "succeeded", 3: "succeeded", 4: "failed"}
+    assert queue.progress == {i: (5, 5) for i in range(1, 5)}
+    assert generator.max_courses_in_flight == 3
+    assert generator.max_in_flight == 4
+    assert worker.processed == 4
+
+    statuses = [(e["job_id"], e["status"]) for e in queue.events if e["type"] == "status"]
+    assert sorted(statuses) == sorted(
+        [(i, "running") for i in range(1, 5)] + [(1, "succeeded"), (2, "succeeded"), (3, "succeeded"), (4, "failed")]
+    )
+    lessons = [lesson for e in queue.events if e["type"] == "progress" for lesson in e["lessons"]]
+    assert {lesson["status"] for lesson in lessons} <= {"started", "streaming", "ready"}
+    assert all("ttfb_ms" in lesson for lesson in lessons if lesson["status"] == "ready")
+
+
+@pytest.mark.asyncio
+async def test_cancel_requested_stops_running_job(queue):
+    queue.queued = queue.queued[:1]
+    queue.cancel.add(1)
+    generator = FakeGenerator(lessons=2, delay=10)
+    worker = GenerationWorker(
+        jobs=1, llm_concurrency=2, generator=generator,
+        poll_interval=0.01, heartbeat_interval=0.02, events_interval=0.01,
+    )
+
+    await asyncio.wait_for(worker.run(until_empty=True), timeout=5)
+
+    assert queue.finished == {1: "cancelled"}
+    assert generator.in_flight == 0
+
+
+def test_job_progress_keeps_latest_state():
+    progress = JobProgress()
+    progress(1, 10, "Первый")
+    progress(2, 10, "Второй")
+    assert (progress.done, progress.total, progress.current_item) == (2, 10, "Второй")
+
+
+class RacingSession:
+    """Сессия, где активная задача курса завершается между INSERT и SELECT"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.statements = []
+        self.committed = False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def execute(self, statement):
+        self.statements.append(type(statement).__name__)
+        return SimpleNamespace(scalar_one_or_none=lambda value=self.results.pop(0): value)
+
+    async def commit(self):
+        self.committed = True
+
+
+@pytest.mark.asyncio
+async def test_enqueue_retries_insert_when_active_job_finished(monkeypatch):
+    job = SimpleNamespace(id=7)
+    session = RacingSession([None, None, job])
+    monkeypatch.setattr(generation_jobs, "AsyncSessionLocal", lambda: session)
+
+    assert await generation_jobs.enqueue_job("a") == (job, True)
+    assert session.statements == ["Insert", "Select", "Insert"] and session.committed
+
+    active = RacingSession([None, job])
+    monkeypatch.setattr(generation_jobs, "AsyncSessionLocal", lambda: active)
+    assert await generation_jobs.enqueue_job("a") == (job, False)
+
+
+@pytest.mark.asyncio
+async def test_finish_job_rejects_non_final_status():
+    with pytest.raises(ValueError):
+        await generation_jobs.finish_job(1, "worker", "running")
@@ -0,0 +1,92 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.config import Settings
+from app.services import openrouter as openrouter_module
+from app.services.generation_usage import LLMCall, UsageRecorder, current_usage_context, usage_context
+from app.services.openrouter import OpenRouterService
+
+
+@pytest.mark.asyncio
+async def test_usage_context_is_nested_and_task_local():
+    seen = {}
+
+    async def lesson(lesson_id):
+        with usage_context(lesson_id=lesson_id):
+            await asyncio.sleep(0.001 * (3 - lesson_id))
+            seen[lesson_id] = current_usage_context()
+
+    with usage_context(course_slug="c", job_id=7):
+        await asyncio.gather(*(lesson(i) for i in (1, 2)))
+        assert current_usage_context() == {"course_slug": "c", "job_id": 7}
+    assert current_usage_context() == {}
+    assert seen == {i: {"course_slug": "c", "job_id": 7, "lesson_id": i} for i in (1, 2)}
+
+
+def test_call_row_uses_provider_cost_or_price_table():
+    with usage_context(course_slug="c", purpose="quiz"):
+        call = LLMCall(model="openai/gpt-5.1")
+    call.status, call.attempts = "ok", 3
+    call.usage = {"prompt_tokens": 1_000_000, "completion_tokens": 100_000}
+    row = call.to_row()
+    assert row["cost"] == pytest.approx(1.25 + 1.0)
+    assert (row["course_slug"], row["purpose"], row["retries"]) == ("c", "quiz", 2)
+
+    call.usage["cost"] = 0.5
+    assert call.to_row()["cost"] == 0.5
+    assert LLMCall(model="unknown/model").to_row()["cost"] is None
+
+
+class MemoryRecorder(UsageRecorder):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches = []
+
+    async def flush(self):
+        rows, self._buffer = self._buffer, []
+        if rows:
+            self.batches.append(rows)
+        return len(rows)
+
+
+@pytest.mark.asyncio
+async def test_recorder_writes_full_batches_and_flushes_on_close():
+    recorder = MemoryRecorder(batch_size=3, flush_interval=60)
+    for i in range(3):
+        recorder.record({"i": i})
+    await asyncio.sleep(0.01)
+    assert [len(batch) for batch in recorder.batches] == [3]
+
+    recorder.record({"i": 3})
+    await recorder.aclose()
+    assert [len(batch) for batch in recorder.batches] == [3, 1]
+
+
+@pytest.mark.asyncio
+async def test_openrouter_records_usage_with_retries(monkeypatch, tmp_path):
+    responses = [
+        httpx.Response(503),
+        httpx.Response(200, json={
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "cost": 0.001},
+        }),
+    ]
+    client = httpx.AsyncClient(transport=httpx.MockTransport(lambda request: responses.pop(0)))
+    recorder = MemoryRecorder()
+    monkeypatch.setattr(openrouter_module, "get_http_client", lambda name, **kwargs: client)
+    monkeypatch.setattr(openrouter_module, "get_usage_recorder", lambda: recorder)
+    service = OpenRouterService(Settings(openrouter_api_key="test", llm_cache_dir=str(tmp_path), llm_rpm=0, llm_tpm=0))
+    service.scheduler.backoff_base = 0.001
+
+    with usage_context(course_slug="c", lesson_id=5, purpose="lesson_text"):
+        assert await service.generate_text("урок") == "ok"
+        assert await service.generate_text("урок") == "ok"
+    await recorder.aclose()
+
+    live, cached = [row for batch in recorder.batches for row in batch]
+    assert (live["status"], live["retries"], live["prompt_tokens"], live["cost"]) == ("ok", 1, 10, 0.001)
+    assert (live["course_slug"], live["lesson_id"], live["purpose"]) == ("c", 5, "lesson_text")
+    assert (cached["status"], cached["cached"], cached["cost"]) == ("cached", True, 0.0)
+    await client.aclose()
@@ -0,0 +1,38 @@
+import httpx
+import pytest
+
+from app.config import Settings
+from app.services import openrouter as openrouter_module
+from app.services.http import close_http_client, get_http_client, http_clients_stats
+from app.services.openrouter import OpenRouterService
+
+
+@pytest.mark.asyncio
+async def test_http_client_is_shared_until_closed():
+    client = get_http_client("test", max_connections=3)
+    assert get_http_client("test") is client
+    assert http_clients_stats()["test"]["max_connections"] == 3
+
+    await close_http_client("test")
+    assert client.is_closed
+    assert "test" not in http_clients_stats()
+    assert get_http_client("test") is not client
+    await close_http_client("test")
+
+
+@pytest.mark.asyncio
+async def test_openrouter_uses_shared_client_and_timeout_override(monkeypatch):
+    seen = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        seen.append(request.extensions["timeout"]["read"])
+        return httpx.Response(200, json={"choices": [{"message": {"content": "ok"}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler), timeout=60.0)
+    monkeypatch.setattr(openrouter_module, "get_http_client", lambda name, **kwargs: client)
+    service = OpenRouterService(Settings(openrouter_api_key="test", llm_cache_mode="off"))
+
+    assert await service.generate_text("hi") == "ok"
+    assert await service.generate_text("hi", timeout=5.0) == "ok"
+    assert seen == [60.0, 5.0]
+    await client.aclose()
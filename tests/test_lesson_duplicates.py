@@ -0,0 +1,87 @@
+import json
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from app.services.course_generator import CourseGeneratorService, LessonTask, lesson_outline
+from app.services.lesson_duplicates import MinHasher, find_duplicates, lsh_params, shingles, tokenize
+
+TEMPLATE = "## 🎯 Результат урока\nВ этом уроке вы создадите магический эффект.\n{}\n## ✅ Проверьте себя\n- [ ] Готово"
+
+
+def make_lessons(count: int, seed: int = 1) -> list:
+    rng = random.Random(seed)
+    vocabulary = [f"слово{i}" for i in range(3000)]
+    return [TEMPLATE.format(" ".join(rng.choices(vocabulary, k=300))) for _ in range(count)]
+
+
+def test_shingles_ignore_headings_and_case():
+    assert tokenize("## Шаг 1: Заклинание\nСоздайте Промпт") == ["создайте", "промпт"]
+    assert shingles(tokenize("раз два три четыре пять")).size == 2
+    assert shingles(tokenize("коротко")).size == 1
+    assert shingles([]).size == 0
+
+
+def test_minhash_estimates_jaccard():
+    a = shingles([str(i) for i in range(400)])
+    b = shingles([str(i) for i in range(100, 500)])
+    exact = np.intersect1d(a, b).size / np.union1d(a, b).size
+
+    signatures = MinHasher(num_perm=256).signatures([a, b])
+
+    assert (signatures[0] == signatures[1]).mean() == pytest.approx(exact, abs=0.1)
+
+
+def test_lsh_params_find_pairs_at_threshold():
+    for threshold in (0.3, 0.5, 0.8):
+        bands, rows = lsh_params(threshold, 128)
+        assert bands * rows <= 128
+        assert 1 - (1 - threshold ** rows) ** bands >= 0.95
+
+
+def test_finds_near_duplicates_but_not_shared_template():
+    lessons = make_lessons(40)
+    words = lessons[5].split(" ")
+    words[50:60] = ["другое"] * 10
+    lessons.append(" ".join(words))  # 40: почти копия урока 5
+    lessons.append(lessons[12])  # 41: точная копия урока 12
+
+    pairs = find_duplicates(list(enumerate(lessons)), threshold=0.5)
+
+    assert [(pair.first, pair.second) for pair in pairs] == [(12, 41), (5, 40)]
+    assert pairs[0].similarity == 1.0
+    assert 0.5 <= pairs[1].similarity < 1.0
+    assert find_duplicates(list(enumerate(lessons[:40])), threshold=0.5) == []
+
+
+@pytest.mark.asyncio
+async def test_duplicate_lesson_is_regenerated_with_hint():
+    class RecordingOpenRouter:
+        def __init__(self):
+            self.calls = []
+
+        async def generate_text(self, prompt, system_prompt=None, cached_only=False, **kwargs):
+            self.calls.append((prompt, cached_only))
+            if "JSON" in (system_prompt or ""):
+                question = {"question": "Q?", "answers": ["a", "b", "c", "d"], "correct": 0, "explanation": "a"}
+                return json.dumps({"questions": [question] * 3})
+            return "## Новый урок"
+
+    openrouter = RecordingOpenRouter()
+    generator = CourseGeneratorService(openrouter=openrouter, concurrency=1)
+    original = SimpleNamespace(title="Первое заклинание", content_text="## Шаг 1: Откройте чат\nТекст")
+    task = LessonTask(
+        module_index=0, order=2, title="Второе заклинание", module_title="М", lesson_id=2,
+        avoid=lesson_outline(original),
+    )
+
+    content = await generator._generate_lesson(task, "Курс", "начинающие")
+
+    assert content["content_text"] == "## Новый урок"
+    prompt = openrouter.calls[0][0]
+    assert "Урок «Первое заклинание»\n## Шаг 1: Откройте чат" in prompt
+    assert "раскрой именно тему «Второе заклинание»" in prompt
+    # Перегенерация идёт мимо кеша LLM: прошлый ответ и был копией
+    assert not any(cached_only for _, cached_only in openrouter.calls)
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+from app.services.lesson_renderer import apply_rendering, content_hash, render_markdown
+
+
+def test_render_markdown_formats_and_sanitizes():
+    html = render_markdown(
+        "## Шаг 1\n\nТекст **урока** <script>alert(1)</script>\n\n"
+        "[ссылка](javascript:alert(1)) <img src=x onerror=alert(1)>\n\n"
+        "```\nprompt <b>\n```\n"
+    )
+    assert "<h2>Шаг 1</h2>" in html
+    assert "<strong>урока</strong>" in html
+    assert "<pre><code>prompt &lt;b&gt;" in html
+    assert "script" not in html
+    assert "javascript:" not in html
+    assert "onerror" not in html
+
+
+def test_render_markdown_placeholders_and_tasks():
+    html = render_markdown("[IMAGE: схема <b>сети</b>]\n\n- [ ] Пункт 1\n- [x] Пункт 2\n")
+    assert '<figure class="lesson-figure lesson-figure--placeholder">' in html
+    assert "&lt;b&gt;сети&lt;/b&gt;" in html
+    assert '<li class="task-item">☐ Пункт 1</li>' in html
+    assert '<li class="task-item">☑ Пункт 2</li>' in html
+
+
+def test_apply_rendering_skips_up_to_date_lessons():
+    lesson = SimpleNamespace(content_text="# Урок", content_html=None, content_hash=None)
+    assert apply_rendering(lesson)
+    assert lesson.content_hash == content_hash("# Урок")
+    assert not apply_rendering(lesson)
+
+    lesson.content_text = "# Новый урок"
+    assert apply_rendering(lesson)
+    assert "Новый урок" in lesson.content_html
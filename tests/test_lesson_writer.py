@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+
+from app.services import lesson_writer
+from app.services.lesson_writer import LessonWriter
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    written = []
+
+    async def save_lessons(results):
+        written.append([lesson_id for lesson_id, content in results])
+        await asyncio.sleep(0)
+        return 0.001
+
+    monkeypatch.setattr(lesson_writer, "save_lessons", save_lessons)
+    return written
+
+
+@pytest.mark.asyncio
+async def test_writes_one_transaction_per_completed_module(batches):
+    # Модуль 0: уроки 1, 2; модуль 1: уроки 3, 4, 5
+    writer = LessonWriter([0, 0, 1, 1, 1])
+
+    await writer.add(3, {"content_text": "c"}, 1)
+    await writer.add(1, {"content_text": "a"}, 0)
+    assert batches == []
+    await writer.add(2, None, 0)
+    assert batches == [[3, 1, 2]]
+
+    await writer.add(4, {"content_text": "d"}, 1)
+    await writer.flush()
+    await writer.flush()
+    assert batches == [[3, 1, 2], [4]]
+    assert writer.stats() == {"rows": 4, "transactions": 2, "db_ms": 2.0, "buffered": 0}
+
+
+@pytest.mark.asyncio
+async def test_batch_size_and_delay_bound_what_a_crash_can_lose(batches):
+    now = [0.0]
+    writer = LessonWriter([0] * 10, max_batch=3, max_delay=30, clock=lambda: now[0])
+
+    for lesson_id in (1, 2, 3):
+        await writer.add(lesson_id, None, 0)
+    assert batches == [[1, 2, 3]]
+
+    await writer.add(4, None, 0)
+    now[0] = 31.0
+    await writer.add(5, None, 0)
+    assert batches == [[1, 2, 3], [4, 5]]
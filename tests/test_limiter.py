@@ -0,0 +1,67 @@
+import pytest
+
+from app.utils.limiter import MemoryBackend, SlidingWindowLimiter, TokenBucketLimiter, _Limiter
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_blocks_and_recovers():
+    clock = FakeClock()
+    limiter = SlidingWindowLimiter(MemoryBackend(), "test", limit=3, window=60, clock=clock)
+
+    assert [(await limiter.hit("ip")).allowed for _ in range(4)] == [True, True, True, False]
+    decision = await limiter.peek("ip")
+    assert not decision.allowed
+    assert decision.retry_after == pytest.approx(40)
+
+    clock.now += decision.retry_after
+    assert (await limiter.peek("ip")).allowed
+
+
+@pytest.mark.asyncio
+async def test_sliding_window_reset_and_isolated_keys():
+    limiter = SlidingWindowLimiter(MemoryBackend(), "test", limit=1, window=60, clock=FakeClock())
+
+    assert (await limiter.hit("a")).allowed
+    assert not (await limiter.hit("a")).allowed
+    assert (await limiter.hit("b")).allowed
+
+    await limiter.reset("a")
+    assert (await limiter.hit("a")).allowed
+
+
+@pytest.mark.asyncio
+async def test_token_bucket_refills():
+    clock = FakeClock()
+    limiter = TokenBucketLimiter(MemoryBackend(), "test", capacity=2, rate=0.5, clock=clock)
+
+    assert [(await limiter.hit("k")).allowed for _ in range(3)] == [True, True, False]
+    clock.now += 2
+    assert (await limiter.hit("k")).allowed
+
+
+@pytest.mark.asyncio
+async def test_memory_backend_is_bounded():
+    backend = MemoryBackend(max_keys=10)
+    limiter = SlidingWindowLimiter(backend, "test", limit=1, window=60, clock=FakeClock())
+
+    for i in range(100):
+        await limiter.hit(f"ip-{i}")
+
+    assert len(backend._state) == 10
+
+
+def test_limiter_without_check_fails_on_creation():
+    class Incomplete(_Limiter):
+        pass
+
+    # Ошибка видна сразу, а не прячется за fail-open в hit()
+    with pytest.raises(TypeError):
+        Incomplete(MemoryBackend(), "test")
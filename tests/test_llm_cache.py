@@ -0,0 +1,78 @@
+import os
+import time
+
+import httpx
+import pytest
+
+from app.config import Settings
+from app.services import openrouter as openrouter_module
+from app.services.llm_cache import LLMCache, LLMCacheMiss, cache_key
+from app.services.openrouter import OpenRouterService
+
+MESSAGES = [{"role": "user", "content": "Привет"}]
+
+
+def test_cache_key_depends_on_all_parameters():
+    key = cache_key("m", MESSAGES, 0.4, 100)
+    assert key == cache_key("m", [dict(MESSAGES[0])], 0.4, 100)
+    assert key != cache_key("m", MESSAGES, 0.5, 100)
+    assert key != cache_key("m", MESSAGES, 0.4, None)
+    assert key != cache_key("other", MESSAGES, 0.4, 100)
+
+
+@pytest.mark.asyncio
+async def test_modes(tmp_path):
+    key = cache_key("m", MESSAGES, 0.4, 100)
+    await LLMCache(tmp_path, mode="readwrite").put(key, "ответ", model="m")
+
+    assert await LLMCache(tmp_path, mode="readwrite").get(key) == "ответ"
+    assert await LLMCache(tmp_path, mode="replay").get(key) == "ответ"
+    assert await LLMCache(tmp_path, mode="refresh").get(key) is None
+    assert await LLMCache(tmp_path, mode="off").get(key) is None
+
+    readonly = LLMCache(tmp_path, mode="readonly")
+    await readonly.put("0" * 64, "x", model="m")
+    assert await readonly.get("0" * 64) is None
+
+    with pytest.raises(LLMCacheMiss):
+        await LLMCache(tmp_path, mode="replay").get("1" * 64)
+
+
+@pytest.mark.asyncio
+async def test_eviction_removes_least_recently_used(tmp_path):
+    cache = LLMCache(tmp_path)
+    keys = [f"{i:064x}" for i in range(6)]
+    for i, key in enumerate(keys[:5]):
+        await cache.put(key, "x" * 150, model="m")
+        os.utime(cache._path(key), (time.time() - 100 + i, time.time() - 100 + i))
+    entry_size = cache._path(keys[0]).stat().st_size
+    cache.max_bytes = int(entry_size * 5.5)
+
+    # Чтение обновляет отметку LRU: первый ключ становится самым свежим
+    assert await cache.get(keys[0]) is not None
+    await cache.put(keys[5], "x" * 150, model="m")
+
+    assert cache._size <= cache.max_bytes
+    assert cache.evictions > 0
+    assert await cache.get(keys[0]) is not None
+    assert await cache.get(keys[1]) is None
+
+
+@pytest.mark.asyncio
+async def test_openrouter_serves_repeated_prompts_from_cache(tmp_path, monkeypatch):
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        return httpx.Response(200, json={"choices": [{"message": {"content": f"ответ {len(calls)}"}}]})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(openrouter_module, "get_http_client", lambda name, **kwargs: client)
+    service = OpenRouterService(Settings(openrouter_api_key="test", llm_cache_dir=str(tmp_path)))
+
+    assert await service.generate_text("урок", temperature=0.4) == "ответ 1"
+    assert await service.generate_text("урок", temperature=0.4) == "ответ 1"
+    assert await service.generate_text("урок", temperature=0.4, refresh=True) == "ответ 2"
+    assert await service.generate_text("урок", temperature=0.4) == "ответ 2"
+    assert len(calls) == 2
+    await client.aclose()
@@ -0,0 +1,200 @@
+import asyncio
+
+import httpx
+import pytest
+
+from app.services.llm_scheduler import CircuitBreaker, LLMScheduler, parse_retry_after
+
+
+class FakeClock:
+    """Часы, которые двигает только sleep"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 3))
+        self.now += seconds
+
+
+def make_scheduler(clock, **kwargs):
+    kwargs.setdefault("breaker", CircuitBreaker(failure_threshold=3, cooldown=30, clock=clock))
+    return LLMScheduler(sleep=clock.sleep, clock=clock, backoff_base=0.5, **kwargs)
+
+
+def responder(*responses):
+    """send() для планировщика: отдаёт заготовленные ответы (или бросает исключения) по очереди"""
+    calls = []
+
+    async def send():
+        item = responses[len(calls)]
+        calls.append(item)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    return send, calls
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("7") == 7.0
+    assert parse_retry_after("-1") == 0.0
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:10 GMT", now=1445412480.0) == 10.0
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+@pytest.mark.asyncio
+async def test_retry_after_pauses_all_requests():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    send, calls = responder(httpx.Response(429, headers={"Retry-After": "12"}), httpx.Response(200))
+
+    response = await scheduler.call(send)
+
+    assert response.status_code == 200
+    assert len(calls) == 2
+    assert clock.sleeps[0] == 12.0
+    assert scheduler.breaker.state == "closed"
+    assert scheduler.retries == 1
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_not_retried():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock)
+    send, calls = responder(httpx.Response(401), httpx.Response(200))
+
+    assert (await scheduler.call(send)).status_code == 401
+    assert len(calls) == 1 and clock.sleeps == []
+
+
+@pytest.mark.asyncio
+async def test_outage_opens_breaker_and_probe_closes_it():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, max_retries=5)
+    send, calls = responder(
+        httpx.Response(503),
+        httpx.ConnectError("down"),
+        httpx.Response(502),
+        httpx.Response(200),
+    )
+
+    response = await scheduler.call(send)
+
+    assert response.status_code == 200
+    assert len(calls) == 4
+    # Три ошибки подряд открыли breaker: пробный запрос ушёл только через cooldown
+    assert scheduler.breaker.opened_count == 1
+    assert sum(clock.sleeps) >= 30
+    assert scheduler.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_retries():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, max_retries=1, breaker=CircuitBreaker(failure_threshold=10, clock=clock))
+    send, calls = responder(httpx.Response(500), httpx.Response(500), httpx.Response(200))
+
+    assert (await scheduler.call(send)).status_code == 500
+    assert len(calls) == 2
+    assert scheduler.gave_up == 1
+
+
+@pytest.mark.asyncio
+async def test_budgets_throttle_requests_and_tokens():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, rpm=60, tpm=6000)
+    # Лимитеры берут время из своих часов: подменяем их на общие
+    scheduler.rpm_limiter.clock = scheduler.tpm_limiter.clock = clock
+
+    for _ in range(3):
+        send, _ = responder(httpx.Response(200))
+        await scheduler.call(send, estimated_tokens=2500)
+
+    # TPM: после двух запросов в ведре 1000 токенов, третьему не хватает 1500 (пополнение 100 токенов/с)
+    assert scheduler.throttled >= 1
+    assert 15.0 <= sum(clock.sleeps) <= 15.1
+
+
+def half_open_breaker(clock):
+    """Breaker, у которого пауза после ошибок уже истекла: следующий запрос — проба"""
+    breaker = CircuitBreaker(failure_threshold=1, cooldown=30, clock=clock)
+    breaker.record_failure()
+    clock.now += 30
+    return breaker
+
+
+@pytest.mark.asyncio
+async def test_pause_does_not_claim_probe():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, breaker=half_open_breaker(clock), max_wait=60)
+    scheduler.pause(5)
+    send, calls = responder(httpx.Response(200))
+
+    assert (await scheduler.call(send)).status_code == 200
+    # Пробу забрал запрос после паузы, а не ожидание паузы: лишнего ожидания пробы нет
+    assert clock.sleeps == [5.0]
+    assert scheduler.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_probe_is_released_when_request_never_completes():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, breaker=half_open_breaker(clock), max_wait=60)
+    acquire_budget = scheduler._acquire_budget
+
+    async def exhausted(*args):
+        raise TimeoutError("budget")
+
+    # Бюджет не дождались: проба ещё не занята
+    scheduler._acquire_budget = exhausted
+    with pytest.raises(TimeoutError):
+        await scheduler.call(responder(httpx.Response(200))[0])
+    scheduler._acquire_budget = acquire_budget
+
+    # Проба упала с неожиданной ошибкой: освобождается владельцем
+    with pytest.raises(ValueError):
+        await scheduler.call(responder(ValueError("broken request"))[0])
+
+    send, calls = responder(httpx.Response(200))
+    assert (await scheduler.call(send)).status_code == 200
+    assert clock.sleeps == [] and scheduler.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_hedge_loser_does_not_release_foreign_probe():
+    clock = FakeClock()
+    scheduler = make_scheduler(clock, breaker=CircuitBreaker(failure_threshold=1, cooldown=30, clock=clock))
+    loser_sent, probe_sent, probe_done = asyncio.Event(), asyncio.Event(), asyncio.Event()
+
+    async def slow_loser():
+        loser_sent.set()
+        await asyncio.Event().wait()
+
+    async def probe():
+        probe_sent.set()
+        await probe_done.wait()
+        return httpx.Response(200)
+
+    # Запрос ушёл при закрытом breaker, затем провайдер лёг и пауза истекла
+    loser = asyncio.create_task(scheduler.call(slow_loser))
+    await loser_sent.wait()
+    scheduler.breaker.record_failure()
+    clock.now += 30
+    prober = asyncio.create_task(scheduler.call(probe))
+    await probe_sent.wait()
+
+    # Хедж-проигравший отменён, пока проба в пути: вторую пробу пропускать нельзя
+    loser.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await loser
+    assert scheduler.breaker.acquire() is None
+
+    probe_done.set()
+    assert (await prober).status_code == 200
+    assert scheduler.breaker.state == "closed"
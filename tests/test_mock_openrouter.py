@@ -0,0 +1,90 @@
+import statistics
+
+import httpx
+import pytest
+
+from app.config import Settings
+from app.services import openrouter as openrouter_module
+from app.services.course_generator import CourseGeneratorService
+from app.services.openrouter import OpenRouterService
+from benchmarks.mock_openrouter import MockProfile, create_mock_app
+
+BASE_URL = "http://mock/api/v1"
+
+
+@pytest.fixture
+def mock_service(monkeypatch, tmp_path):
+    """OpenRouterService поверх mock-сервера в памяти (ASGI, без сети)"""
+
+    def make(**options):
+        app = create_mock_app(**{"latency": 0.0, **options})
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app))
+        monkeypatch.setattr(openrouter_module, "get_http_client", lambda name, **kwargs: client)
+        service = OpenRouterService(Settings(
+            openrouter_api_key="test", openrouter_base_url=BASE_URL,
+            llm_cache_mode="off", llm_cache_dir=str(tmp_path), llm_rpm=0, llm_tpm=0,
+        ))
+        service.scheduler.backoff_base = service.scheduler.backoff_max = 0.001
+        return service, app.config["MOCK_STATS"]
+
+    return make
+
+
+def test_latency_distributions_are_seeded():
+    lognormal = MockProfile(latency=1.0, distribution="lognormal", sigma=0.5, seed=7)
+    samples = [lognormal.sample_latency() for _ in range(2000)]
+    assert statistics.median(samples) == pytest.approx(1.0, rel=0.1)
+    assert max(samples) > 3
+
+    again = MockProfile(latency=1.0, distribution="lognormal", sigma=0.5, seed=7)
+    assert [again.sample_latency() for _ in range(5)] == samples[:5]
+
+    tail = MockProfile(latency=1.0, tail_rate=1.0, tail_factor=10)
+    assert tail.sample_latency() == 10
+
+    with pytest.raises(ValueError):
+        MockProfile(distribution="bimodal")
+
+
+@pytest.mark.asyncio
+async def test_streams_with_usage_and_cost(mock_service, usage_rows):
+    service, stats = mock_service()
+    seen = []
+
+    text = await service.generate_text("урок", model="openai/gpt-5.1", stream=True, on_delta=lambda d, n: seen.append(n))
+
+    assert text.startswith("## 🎯 Результат урока")
+    assert len(seen) > 1 and seen[-1] == len(text)
+    usage = usage_rows[-1]
+    assert usage["stream"] and usage["completion_tokens"] == len(text) // 3
+    assert usage["cost"] > 0
+    assert stats["requests"] == 1
+
+    service, stats = mock_service(stream_error_rate=1.0)
+    assert await service.generate_text("урок", stream=True, on_delta=lambda d, n: None) is None
+    assert stats["stream_errors"] == 1
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_burst_returns_retry_after(mock_service):
+    service, stats = mock_service(burst_every=1000, burst_length=1000)
+
+    response = await service.client.post(f"{BASE_URL}/chat/completions", json={"messages": []})
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert response.json()["error"]["code"] == 429
+    assert stats["rate_limited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_course_generation_retries_through_server_errors(mock_service):
+    service, stats = mock_service(error_rate=0.2, seed=3)
+    generator = CourseGeneratorService(openrouter=service, concurrency=4)
+
+    modules = await generator.generate_course_content("ai-for-beginners")
+    lessons = [lesson for module in modules for lesson in module["lessons"]]
+
+    assert lessons and all(lesson["quiz_questions"]["answer_key"] for lesson in lessons)
+    assert stats["errors"] > 0 and service.scheduler.retries == stats["errors"]
+    assert stats["in_flight"] == 0
@@ -0,0 +1,140 @@
+import asyncio
+
+import pytest
+
+from app.services.model_router import ModelRouter, parse_models
+
+PRIMARY, FALLBACK = "openai/gpt-5.1", "openai/gpt-5-mini"
+
+
+class FakeOpenRouter:
+    """Модель → (задержка, ответ или None); ответ потоком — по два символа"""
+
+    def __init__(self, behaviour, cached=None):
+        self.behaviour = behaviour
+        self.cached = cached or {}
+        self.calls = []
+        self.cancelled = []
+
+    async def generate_text(self, prompt, model=None, cached_only=False, stream=False, on_delta=None, **kwargs):
+        if cached_only:
+            text = self.cached.get(model)
+            if text and on_delta:
+                on_delta(text, len(text))
+            return text
+
+        self.calls.append(model)
+        delay, text = self.behaviour[model]
+        try:
+            await asyncio.sleep(delay)
+            if stream and text:
+                for end in range(2, len(text) + 2, 2):
+                    if on_delta(text[end - 2:end], min(end, len(text))) is False:
+                        return None
+                    await asyncio.sleep(0.01)
+                return text
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        if text and on_delta:
+            on_delta(text, len(text))
+        return text
+
+
+def make_router(openrouter, **kwargs):
+    kwargs = {"hedge_min_samples": 3, "hedge_min_delay": 0.01, **kwargs}
+    return ModelRouter(openrouter, {"quiz": [PRIMARY, FALLBACK]}, **kwargs)
+
+
+def warm_up(router, latency_ms=5.0, stream=False, now=0.0):
+    for _ in range(3):
+        router.model_stats("quiz", PRIMARY).observe(latency_ms, True, now, ttfb_ms=latency_ms if stream else None)
+
+
+def test_parse_models_drops_blanks_and_duplicates():
+    assert parse_models(f" {PRIMARY}, ,{FALLBACK},{PRIMARY}") == [PRIMARY, FALLBACK]
+
+
+@pytest.mark.asyncio
+async def test_falls_back_when_primary_fails():
+    openrouter = FakeOpenRouter({PRIMARY: (0, None), FALLBACK: (0, "ok")})
+    router = make_router(openrouter)
+
+    assert await router.generate_text("quiz", "q") == "ok"
+    assert openrouter.calls == [PRIMARY, FALLBACK]
+    assert router.model_stats("quiz", PRIMARY).errors == 1
+    assert router.model_stats("quiz", FALLBACK).wins == 1
+
+
+@pytest.mark.asyncio
+async def test_hedges_slow_primary_and_cancels_loser():
+    openrouter = FakeOpenRouter({PRIMARY: (5, "slow"), FALLBACK: (0.01, "fast")})
+    router = make_router(openrouter)
+    warm_up(router)
+
+    assert await asyncio.wait_for(router.generate_text("quiz", "q"), timeout=2) == "fast"
+    assert openrouter.cancelled == [PRIMARY]
+    assert router.model_stats("quiz", FALLBACK).hedges == 1
+    assert router.model_stats("quiz", PRIMARY).cancelled == 1
+
+
+@pytest.mark.asyncio
+async def test_no_hedge_until_p95_is_known():
+    openrouter = FakeOpenRouter({PRIMARY: (0.05, "slow"), FALLBACK: (0, "fast")})
+    router = make_router(openrouter)
+
+    assert await router.generate_text("quiz", "q") == "slow"
+    assert openrouter.calls == [PRIMARY]
+
+
+@pytest.mark.asyncio
+async def test_stream_belongs_to_first_attempt_with_a_fragment():
+    openrouter = FakeOpenRouter({PRIMARY: (5, "aaaa"), FALLBACK: (0, "bbbbbb")})
+    router = make_router(openrouter)
+    warm_up(router, stream=True)
+    seen = []
+
+    text = await router.generate_text("quiz", "q", stream=True, on_delta=lambda delta, length: seen.append(delta))
+
+    assert text == "bbbbbb"
+    assert "".join(seen) == "bbbbbb"
+    assert openrouter.cancelled == [PRIMARY]
+
+
+@pytest.mark.asyncio
+async def test_caller_abort_does_not_fall_back():
+    openrouter = FakeOpenRouter({PRIMARY: (0, "aaaa"), FALLBACK: (0, "bbbb")})
+    router = make_router(openrouter)
+
+    assert await router.generate_text("quiz", "q", stream=True, on_delta=lambda delta, length: False) is None
+    assert openrouter.calls == [PRIMARY]
+    assert router.model_stats("quiz", PRIMARY).errors == 0
+
+
+@pytest.mark.asyncio
+async def test_cached_answer_of_any_model_skips_requests():
+    openrouter = FakeOpenRouter({PRIMARY: (0, "live"), FALLBACK: (0, "live")}, cached={FALLBACK: "cached"})
+    router = make_router(openrouter)
+
+    assert await router.generate_text("quiz", "q") == "cached"
+    assert await router.generate_text("quiz", "q", refresh=True) == "live"
+    assert openrouter.calls == [PRIMARY]
+
+
+def test_error_and_latency_ewma_reorder_candidates():
+    now = [0.0]
+    router = make_router(FakeOpenRouter({}), clock=lambda: now[0], error_half_life=10)
+    assert router.candidates("quiz") == [PRIMARY, FALLBACK]
+
+    for _ in range(5):
+        router.model_stats("quiz", PRIMARY).observe(100, False, now[0])
+    assert router.candidates("quiz") == [FALLBACK, PRIMARY]
+
+    # Без новых ошибок доля затухает, и основная модель снова пробуется первой
+    now[0] = 30.0
+    assert router.candidates("quiz") == [PRIMARY, FALLBACK]
+
+    router = make_router(FakeOpenRouter({}))
+    router.model_stats("quiz", PRIMARY).observe(4000, True, 0)
+    router.model_stats("quiz", FALLBACK).observe(1000, True, 0)
+    assert router.candidates("quiz") == [FALLBACK, PRIMARY]
@@ -0,0 +1,80 @@
+import json
+
+import httpx
+import pytest
+
+from app.config import Settings
+from app.services import openrouter as openrouter_module
+from app.services.openrouter import OpenRouterService
+
+
+def sse_body(*chunks, tail="data: [DONE]\n\n"):
+    events = [": OPENROUTER PROCESSING\n\n"]
+    for chunk in chunks:
+        events.append(f"data: {json.dumps({'choices': [{'delta': {'content': chunk}}]}, ensure_ascii=False)}\n\n")
+    events.append(f"data: {json.dumps({'choices': [], 'usage': {'total_tokens': 42}})}\n\n")
+    return "".join(events) + tail
+
+
+def make_service(monkeypatch, tmp_path, handler):
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(openrouter_module, "get_http_client", lambda name, **kwargs: client)
+    service = OpenRouterService(Settings(openrouter_api_key="test", llm_cache_dir=str(tmp_path), llm_rpm=0, llm_tpm=0))
+    return service, client
+
+
+@pytest.mark.asyncio
+async def test_stream_collects_deltas_and_reports_progress(monkeypatch, tmp_path):
+    payloads = []
+
+    def handler(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, text=sse_body("## Урок", "\n\nТекст", " урока"))
+
+    service, client = make_service(monkeypatch, tmp_path, handler)
+    seen = []
+    text = await service.generate_text("урок", stream=True, on_delta=lambda delta, length: seen.append(length))
+
+    assert text == "## Урок\n\nТекст урока"
+    assert payloads[0]["stream"] is True
+    assert seen == [7, 14, 20]
+    # Ответ попал в кеш: повтор без запроса, прогресс сообщается одним фрагментом
+    seen.clear()
+    assert await service.generate_text("урок", stream=True, on_delta=lambda delta, length: seen.append(length)) == text
+    assert len(payloads) == 1 and seen == [20]
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_abort_and_midstream_error(monkeypatch, tmp_path):
+    bodies = [sse_body("a" * 10, "b" * 10, "c" * 10), sse_body("x", tail='data: {"error": {"code": 502}}\n\n')]
+
+    def handler(request):
+        return httpx.Response(200, text=bodies.pop(0))
+
+    service, client = make_service(monkeypatch, tmp_path, handler)
+    aborted = await service.generate_text("p1", stream=True, on_delta=lambda delta, length: length < 15)
+    assert aborted is None
+    assert await service.generate_text("p2", stream=True, on_delta=lambda *args: None) is None
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_stream_closed_without_done_is_not_cached(monkeypatch, tmp_path, usage_rows):
+    calls = []
+    finish = f"data: {json.dumps({'choices': [{'delta': {}, 'finish_reason': 'stop'}]})}\n\n"
+    bodies = [sse_body("## Урок", "\n\nОбрыв", tail=""), sse_body("## Урок", "\n\nЦеликом", tail=finish)]
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(200, text=bodies.pop(0))
+
+    service, client = make_service(monkeypatch, tmp_path, handler)
+
+    # Соединение закрыто без [DONE] и finish_reason: обрезанный урок — ошибка, а не ответ
+    assert await service.generate_text("урок", stream=True) is None
+    assert usage_rows[-1]["status"] == "error"
+    # В кеш он не попал: следующий запуск идёт к провайдеру; finish_reason без [DONE] — полный ответ
+    assert await service.generate_text("урок", stream=True) == "## Урок\n\nЦеликом"
+    assert len(calls) == 2 and usage_rows[-1]["status"] == "ok"
+    await client.aclose()
@@ -0,0 +1,32 @@
+import asyncio
+
+import pytest
+
+from app.services.passwords import PasswordHasher, PasswordHasherBusy
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_roundtrip():
+    hasher = PasswordHasher(rounds=4, workers=1)
+    password_hash = await hasher.hash_password("secret-password")
+
+    assert await hasher.verify_password("secret-password", password_hash)
+    assert not await hasher.verify_password("wrong-password", password_hash)
+    assert not await hasher.verify_password("secret-password", None)
+    assert hasher.stats()["completed"] == 3
+    hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_requests():
+    hasher = PasswordHasher(rounds=10, workers=1, max_queue=2)
+    password_hash = await hasher.hash_password("secret-password")
+
+    results = await asyncio.gather(
+        *(hasher.verify_password("secret-password", password_hash) for _ in range(4)),
+        return_exceptions=True,
+    )
+
+    assert sum(isinstance(r, PasswordHasherBusy) for r in results) == 2
+    assert hasher.stats()["rejected"] == 2
+    hasher.shutdown()
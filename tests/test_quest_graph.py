@@ -0,0 +1,136 @@
+import json
+
+import pytest
+
+from app import create_app
+from app.data.quest_v2 import QUEST_DATA
+from app.routes import quest as quest_routes
+from app.services.quest_graph import QuestGraph, QuestPathError, get_quest_graph
+
+PROJECT = "Telegram-бот для кофейни, который принимает заказы и отвечает на вопросы"
+
+
+def walk(choose=0):
+    """Путь по графу до контактов: в каждом вопросе вариант с индексом choose (или последний)"""
+    path, current = [], "q1"
+    while QUEST_DATA[current]["type"] != "contact":
+        node = QUEST_DATA[current]
+        if node["type"] == "choice":
+            option = node["answers"][min(choose, len(node["answers"]) - 1)]
+            path.append({"question_id": current, "answer_id": option["id"]})
+            current = option["next"]
+        else:
+            path.append({"question_id": current, "text": PROJECT})
+            current = node["next"]
+    return path
+
+
+@pytest.fixture
+def leads(monkeypatch):
+    saved = []
+
+    async def save_quest_lead(answers, contact, recommendation=None):
+        saved.append((answers, contact, recommendation))
+
+    monkeypatch.setattr(quest_routes, "save_quest_lead", save_quest_lead)
+    return saved
+
+
+def test_graph_hides_profile_metadata_and_is_versioned():
+    graph = QuestGraph()
+    body = json.loads(graph.body)
+
+    assert body["version"] == graph.version == QuestGraph().version
+    first = QUEST_DATA["q1"]["answers"][0]
+    assert body["nodes"]["q1"]["answers"][0] == {"id": first["id"], "text": first["text"], "next": first["next"]}
+    assert "purpose" not in json.dumps(body["nodes"]["q1"])
+
+    changed = {**QUEST_DATA, "q1": {**QUEST_DATA["q1"], "text": "Другой текст"}}
+    assert QuestGraph(changed).version != graph.version
+
+
+@pytest.mark.parametrize("mutate, error", [
+    (lambda path: path[1:], "expected answer to q1"),
+    (lambda path: [{**path[0], "answer_id": "q9_a1"}] + path[1:], "unknown answer"),
+    (lambda path: path[:-1] + [{**path[-1], "text": "   коротко   "}], "invalid length"),
+    (lambda path: path[:3], "not finished"),
+    (lambda path: path + [path[-1]], "unexpected answer"),
+])
+def test_validate_path_rejects_invalid_paths(mutate, error):
+    with pytest.raises(QuestPathError, match=error):
+        get_quest_graph().validate_path(mutate(walk()))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("choose", [0, 1, 3])
+async def test_validated_answers_match_step_by_step_flow(choose):
+    client = create_app().test_client()
+    await client.get("/free-quest")
+    for item in walk(choose):
+        form = {"answer_id": item["answer_id"]} if "answer_id" in item else {"answer_text": item["text"]}
+        scope = {"client": (f"198.51.100.{choose}", 40000)}
+        response = await client.post("/free-quest/answer", form=form, scope_base=scope)
+        await client.get(response.headers["Location"])
+    async with client.session_transaction() as session:
+        server_answers = session["quest_answers"]
+
+    assert get_quest_graph().validate_path(walk(choose)) == server_answers
+
+
+@pytest.mark.asyncio
+async def test_graph_is_served_with_immutable_caching():
+    client = create_app().test_client()
+    version = get_quest_graph().version
+
+    page = await (await client.get("/free-quest")).get_data(as_text=True)
+    assert f"/free-quest/graph/{version}.json" in page
+
+    response = await client.get(f"/free-quest/graph/{version}.json")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert (await response.get_json())["version"] == version
+
+    stale = await client.get("/free-quest/graph/000000000000.json")
+    assert stale.status_code == 302 and stale.headers["Location"].endswith(f"{version}.json")
+
+
+@pytest.mark.asyncio
+async def test_submit_returns_results_and_saves_lead(leads):
+    client = create_app().test_client()
+    scope = {"client": ("198.51.100.20", 40000)}
+    payload = {"version": get_quest_graph().version, "answers": walk(), "contact": {"telegram": " @mage "}}
+
+    response = await client.post("/free-quest/submit", json=payload, scope_base=scope)
+
+    assert response.status_code == 200
+    data = await response.get_json()
+    assert data["success"] and data["results_url"] == "/free-quest/results"
+    assert data["recommendation"]["recommendations"]
+    assert data["recommendation"]["recommendations"][0]["title"] in data["html"]
+    [(answers, contact, recommendation)] = leads
+    assert contact == {"telegram": "@mage", "phone": "", "name": ""}
+    assert answers[-1]["user_prompt"] == PROJECT and recommendation == data["recommendation"]
+
+    # Страница результатов по ссылке показывает те же рекомендации из сессии
+    page = await (await client.get("/free-quest/results")).get_data(as_text=True)
+    assert data["recommendation"]["recommendations"][0]["title"] in page
+
+
+@pytest.mark.asyncio
+async def test_submit_rejects_stale_version_bad_path_and_missing_contact(leads):
+    client = create_app().test_client()
+    scope = {"client": ("198.51.100.21", 40000)}
+    version = get_quest_graph().version
+
+    stale = await client.post("/free-quest/submit", scope_base=scope, json={"version": "old", "answers": walk()})
+    assert stale.status_code == 409 and (await stale.get_json())["restart_url"] == "/free-quest/restart"
+
+    bad = await client.post("/free-quest/submit", scope_base=scope, json={
+        "version": version, "answers": walk()[1:], "contact": {"telegram": "@mage"},
+    })
+    assert bad.status_code == 400
+
+    anonymous = await client.post("/free-quest/submit", scope_base=scope, json={"version": version, "answers": walk()})
+    assert anonymous.status_code == 400
+    assert "способ связи" in (await anonymous.get_json())["error"]
+    assert leads == []
@@ -0,0 +1,163 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.services import quest_leads
+from app.services.quest_leads import (
+    MAX_MESSAGE_LENGTH,
+    QuestLeadSender,
+    TelegramError,
+    lead_fields,
+    plan_messages,
+    send_telegram_message,
+)
+
+NOW = datetime(2026, 1, 1, 12, 0, 0)
+
+
+def lead(id=1, project="Бот для кофейни", attempts=0):
+    return SimpleNamespace(
+        id=id, name=f"Маг {id}", telegram=f"@mage{id}", phone="", purpose="business", access="vpn",
+        project=project, courses=["ChatGPT для бизнеса"], attempts=attempts, created_at=NOW,
+    )
+
+
+class FakeLeads:
+    """Таблица quest_leads в памяти: захват готовых заявок и запись результатов"""
+
+    def __init__(self, leads):
+        self.rows = {row.id: row for row in leads}
+        self.status = {row.id: "pending" for row in leads}
+
+    async def claim_leads(self, worker_id, limit, lease):
+        ready = [row for row_id, row in self.rows.items() if self.status[row_id] == "pending"][:limit]
+        for row in ready:
+            row.attempts += 1
+            self.status[row.id] = "sending"
+        return ready
+
+    async def finish_leads(self, changes):
+        for change in changes:
+            self.status[change["id"]] = change["status"]
+            if "attempts" in change:
+                self.rows[change["id"]].attempts = change["attempts"]
+
+
+class FakeTelegram:
+    """Bot API: первые rate_limited сообщений получают 429, первые failures — ошибку сети"""
+
+    def __init__(self, rate_limited=0, failures=0, retry_after=0.05):
+        self.rate_limited = rate_limited
+        self.failures = failures
+        self.retry_after = retry_after
+        self.messages = []
+
+    async def send(self, text):
+        if self.rate_limited:
+            self.rate_limited -= 1
+            raise TelegramError("Too Many Requests: retry after 1", retry_after=self.retry_after)
+        if self.failures:
+            self.failures -= 1
+            raise httpx.ConnectError("connection refused")
+        self.messages.append(text)
+
+
+def sender(telegram, **kwargs):
+    return QuestLeadSender(send=telegram.send, poll_interval=0.01, retry_base=0.01, **kwargs)
+
+
+@pytest.fixture
+def table(monkeypatch):
+    fake = FakeLeads([lead(i) for i in range(1, 6)])
+    monkeypatch.setattr(quest_leads, "claim_leads", fake.claim_leads)
+    monkeypatch.setattr(quest_leads, "finish_leads", fake.finish_leads)
+    return fake
+
+
+def test_lead_fields_from_answers():
+    answers = [{"purpose": "business"}, {"access": "vpn"}, {"user_prompt": "Бот для кофейни"}]
+    recommendation = {"recommendations": [{"title": f"Курс {i}"} for i in range(5)]}
+
+    fields = lead_fields(answers, {"telegram": "@mage"}, recommendation)
+
+    assert (fields["purpose"], fields["access"], fields["project"]) == ("business", "vpn", "Бот для кофейни")
+    assert fields["courses"] == ["Курс 0", "Курс 1", "Курс 2"]
+    assert fields["name"] == "" and fields["telegram"] == "@mage"
+
+
+def test_single_lead_is_detailed_burst_is_digest():
+    [(text, group)] = plan_messages([lead()])
+    assert text.startswith("🎓 НОВАЯ ЗАЯВКА С КВЕСТА") and "Время: 2026-01-01 12:00:00 UTC" in text
+
+    [(digest, group)] = plan_messages([lead(1), lead(2), lead(3)])
+    assert digest.startswith("🎓 НОВЫЕ ЗАЯВКИ С КВЕСТА: 3")
+    assert [row.id for row in group] == [1, 2, 3]
+    assert "#2 Маг 2 · @mage2" in digest
+
+
+def test_digest_splits_at_message_limit():
+    leads = [lead(i, project="проект " * 100) for i in range(1, 31)]
+
+    messages = plan_messages(leads)
+
+    assert len(messages) > 1
+    assert all(len(text) <= MAX_MESSAGE_LENGTH for text, _ in messages)
+    assert [row.id for _, group in messages for row in group] == list(range(1, 31))
+    for text, group in messages:
+        assert text.startswith(f"🎓 НОВЫЕ ЗАЯВКИ С КВЕСТА: {len(group)}")
+
+
+@pytest.mark.asyncio
+async def test_sender_sends_digest(table):
+    telegram = FakeTelegram()
+
+    await sender(telegram, digest_size=10).run(until_empty=True)
+
+    assert len(telegram.messages) == 1
+    assert set(table.status.values()) == {"sent"}
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_pauses_without_spending_attempts(table):
+    telegram = FakeTelegram(rate_limited=2)
+    lead_sender = sender(telegram, digest_size=1, max_attempts=1)
+
+    await lead_sender.run(until_empty=True)
+
+    # 429 не считается попыткой: при max_attempts=1 заявки всё равно доставлены
+    assert set(table.status.values()) == {"sent"}
+    assert len(telegram.messages) == 5
+    assert lead_sender.stats()["rate_limited"] == 2
+
+
+@pytest.mark.asyncio
+async def test_sender_retries_then_fails(table, monkeypatch):
+    await sender(FakeTelegram(failures=1), digest_size=1, max_attempts=3).run(until_empty=True)
+    assert set(table.status.values()) == {"sent"}
+
+    failing = FakeLeads([lead(1)])
+    monkeypatch.setattr(quest_leads, "claim_leads", failing.claim_leads)
+    monkeypatch.setattr(quest_leads, "finish_leads", failing.finish_leads)
+    lead_sender = sender(FakeTelegram(failures=10), digest_size=1, max_attempts=2)
+    await lead_sender.run(until_empty=True)
+    assert failing.status == {1: "failed"} and failing.rows[1].attempts == 2
+    assert lead_sender.stats()["failed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_send_telegram_message_reads_retry_after(monkeypatch):
+    def handler(request):
+        return httpx.Response(429, json={
+            "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 17",
+            "parameters": {"retry_after": 17},
+        })
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    monkeypatch.setattr(quest_leads, "get_http_client", lambda *args, **kwargs: client)
+
+    with pytest.raises(TelegramError) as error:
+        await send_telegram_message("token", "42", "text", "https://api.telegram.org")
+    assert error.value.retry_after == 17
+    await client.aclose()
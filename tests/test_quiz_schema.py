@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+from app.services.course_generator import CourseGeneratorService
+from app.services.quiz_schema import JSONScanner, QuizFormatError, extract_json, parse_quiz, validate_quiz
+
+
+def question(**overrides):
+    return {"question": "Что такое промпт?", "answers": ["a", "b", "c", "d"], "correct": 1, "explanation": "Потому что", **overrides}
+
+
+QUIZ = {"questions": [question(), question(correct=3), question(correct=0)]}
+
+
+def test_extracts_json_from_fences_prose_and_trailing_commas():
+    text = 'Вот квиз:\n```json\n{"questions": [{"answers": ["a", "}"],},],}\n```\nУдачи!'
+    assert extract_json(text) == {"questions": [{"answers": ["a", "}"]}]}
+
+
+def test_scanner_is_incremental_and_closes_truncated_output():
+    scanner = JSONScanner()
+    text = json.dumps(QUIZ, ensure_ascii=False) + " и ещё текст"
+    closed = [scanner.feed(text[i:i + 7]) for i in range(0, len(text), 7)]
+    assert closed.index(True) == (len(text) - len(" и ещё текст") - 1) // 7
+    assert scanner.loads() == QUIZ
+
+    truncated = JSONScanner()
+    truncated.feed('{"questions": [{"question": "Q", "answers": ["a", "b\\')
+    assert truncated.loads() == {"questions": [{"question": "Q", "answers": ["a", "b"]}]}
+    truncated = JSONScanner()
+    truncated.feed('{"questions": [{"question": "Q", "explanation":')
+    assert truncated.loads() == {"questions": [{"question": "Q"}]}
+
+
+def test_valid_quiz_is_normalized_to_compact_form():
+    raw = {"questions": [question(question="  Q?  ", correct="2", extra="x"), question(correct="b")]}
+    quiz = validate_quiz(raw)
+    assert quiz["answer_key"] == [2, 1]
+    assert quiz["questions"][0] == {
+        "question": "Q?", "answers": ["a", "b", "c", "d"], "correct": 2, "explanation": "Потому что"
+    }
+    assert validate_quiz(raw["questions"]) == quiz
+
+
+def test_schema_problems_are_listed_with_valid_questions_kept():
+    raw = {"questions": [question(), question(answers=["a", "b"]), question(correct=4, explanation=" ")]}
+    with pytest.raises(QuizFormatError) as error:
+        validate_quiz(raw)
+    assert len(error.value.problems) == 3
+    assert any("вопрос 2" in problem and "4 непустых" in problem for problem in error.value.problems)
+    assert len(error.value.valid_questions) == 1
+
+    with pytest.raises(QuizFormatError):
+        parse_quiz("Не получилось")
+
+
+class QuizOpenRouter:
+    """Первый ответ — сломанный квиз, дальше — ответ на просьбу исправить"""
+
+    def __init__(self, first, repaired):
+        self.answers = [first, repaired]
+        self.prompts = []
+
+    async def generate_text(self, prompt, system_prompt=None, cached_only=False, **kwargs):
+        self.prompts.append(prompt)
+        return self.answers.pop(0) if self.answers else None
+
+
+@pytest.mark.asyncio
+async def test_invalid_quiz_is_repaired_without_lesson_text():
+    broken = json.dumps({"questions": [question(correct=7)] + QUIZ["questions"][1:]})
+    openrouter = QuizOpenRouter(broken, "```json\n" + json.dumps(QUIZ) + "\n```")
+    generator = CourseGeneratorService(openrouter=openrouter, concurrency=1)
+
+    quiz = await generator.generate_quiz("Урок", "СЕКРЕТНЫЙ ТЕКСТ УРОКА")
+
+    assert quiz["answer_key"] == [1, 3, 0]
+    repair_prompt = openrouter.prompts[1]
+    assert "СЕКРЕТНЫЙ ТЕКСТ УРОКА" not in repair_prompt
+    assert "вопрос 1" in repair_prompt and broken in repair_prompt
+
+
+@pytest.mark.asyncio
+async def test_valid_questions_survive_failed_repair():
+    broken = json.dumps({"questions": QUIZ["questions"] + [question(answers=[])]})
+    generator = CourseGeneratorService(openrouter=QuizOpenRouter(broken, "всё ещё не JSON"), concurrency=1)
+
+    quiz = await generator.generate_quiz("Урок", "текст")
+    assert quiz["answer_key"] == [1, 3, 0]
+
+    generator = CourseGeneratorService(openrouter=QuizOpenRouter('{"questions": []}', None), concurrency=1)
+    assert await generator.generate_quiz("Урок", "текст") is None
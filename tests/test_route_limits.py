@@ -0,0 +1,91 @@
+import pytest
+
+from app import create_app
+from app.utils import rate_limit as rate_limit_module
+
+
+def client_at(ip):
+    """Адрес соединения для тестового запроса"""
+    return {"client": (ip, 40000)}
+
+
+@pytest.mark.asyncio
+async def test_quest_contact_is_rate_limited_per_ip():
+    client = create_app().test_client()
+    scope = client_at("203.0.113.7")
+
+    statuses = [
+        (await client.post("/free-quest/contact", form={"name": "Тест"}, scope_base=scope)).status_code
+        for _ in range(6)
+    ]
+
+    assert statuses == [200] * 5 + [429]
+    response = await client.post("/free-quest/contact", form={}, scope_base=client_at("203.0.113.8"))
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_rejection_has_retry_after_and_json_body():
+    client = create_app().test_client()
+    scope = client_at("203.0.113.9")
+    headers = {"Accept": "application/json"}
+
+    for _ in range(10):
+        await client.post("/auth/register/resend", headers=headers, scope_base=scope)
+    response = await client.post("/auth/register/resend", headers=headers, scope_base=scope)
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert (await response.get_json())["success"] is False
+
+
+@pytest.mark.asyncio
+async def test_forwarded_for_is_ignored_without_trusted_proxies():
+    client = create_app().test_client()
+    scope = client_at("203.0.113.10")
+
+    statuses = [
+        (await client.post(
+            "/free-quest/contact", form={}, scope_base=scope,
+            headers={"X-Forwarded-For": f"192.0.2.{i}"},
+        )).status_code
+        for i in range(6)
+    ]
+
+    # Подмена заголовка не даёт новый счётчик: лимит по адресу соединения
+    assert statuses == [200] * 5 + [429]
+
+
+@pytest.mark.asyncio
+async def test_trusted_proxy_hop_is_taken_from_the_right(monkeypatch):
+    monkeypatch.setattr(rate_limit_module, "TRUSTED_PROXIES", 1)
+    client = create_app().test_client()
+    proxy = client_at("10.0.0.2")
+
+    statuses = [
+        (await client.post(
+            "/free-quest/contact", form={}, scope_base=proxy,
+            headers={"X-Forwarded-For": f"192.0.2.{i}, 203.0.113.11"},
+        )).status_code
+        for i in range(6)
+    ]
+    assert statuses == [200] * 5 + [429]
+
+    # Другой клиент за тем же прокси считается отдельно
+    response = await client.post(
+        "/free-quest/contact", form={}, scope_base=proxy, headers={"X-Forwarded-For": "203.0.113.12"}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_payment_webhook_is_not_rate_limited():
+    client = create_app().test_client()
+    scope = client_at("203.0.113.13")
+
+    statuses = {
+        (await client.post("/payments/webhook", json={}, scope_base=scope)).status_code
+        for _ in range(150)
+    }
+
+    assert statuses == {200}
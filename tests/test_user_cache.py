@@ -0,0 +1,46 @@
+import pytest
+
+from app import create_app
+from app.services.user_cache import UserIdentity, UserIdentityCache
+
+
+class CountingCache(UserIdentityCache):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.loads = 0
+
+    async def _load(self, user_id):
+        self.loads += 1
+        return UserIdentity(user_id, f"user{user_id}", f"user{user_id}@example.com", "avatar.svg", True)
+
+
+@pytest.mark.asyncio
+async def test_cache_hits_request_memo_and_invalidation():
+    app = create_app()
+    cache = CountingCache(ttl=60)
+
+    async with app.app_context():
+        assert (await cache.get(1)).username == "user1"
+        await cache.get(1)
+        assert cache.request_hits == 1
+
+    async with app.app_context():
+        await cache.get(1)
+        assert cache.hits == 1
+
+        cache.invalidate(1)
+        await cache.get(1)
+
+    assert cache.loads == 2
+    assert cache.stats()["misses"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cache_is_bounded_and_expires():
+    cache = CountingCache(ttl=0, max_size=2)
+    for user_id in range(5):
+        await cache.get(user_id)
+
+    assert cache.stats()["size"] == 2
+    await cache.get(4)
+    assert cache.loads == 6
@@ -0,0 +1,74 @@
+"""
+Отчёт по расходу LLM на генерацию: токены, стоимость, задержки.
+
+    python usage_report.py                              # по курсам и моделям за всё время
+    python usage_report.py --by model,purpose --since 7d
+    python usage_report.py --by lesson_id --course ai-for-beginners --since 24h
+"""
+import argparse
+import asyncio
+import re
+from datetime import datetime, timedelta
+
+from app.database import init_db
+from app.services.generation_usage import GROUP_FIELDS, usage_summary
+
+PERIOD_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+
+
+def parse_since(value: str) -> datetime | None:
+    """'7d' / '24h' / '30m' → момент начала периода (UTC), 'all' → None"""
+    if value == "all":
+        return None
+    match = re.fullmatch(r"(\d+)([mhd])", value)
+    if not match:
+        raise argparse.ArgumentTypeError("период в формате 30m / 24h / 7d или all")
+    return datetime.utcnow() - timedelta(**{PERIOD_UNITS[match.group(2)]: int(match.group(1))})
+
+
+def format_ms(value) -> str:
+    return "-" if value is None else f"{value / 1000:.1f}s"
+
+
+async def main(group_by: list, since: datetime | None, course_slug: str | None) -> None:
+    await init_db()
+    rows = await usage_summary(group_by, since=since, course_slug=course_slug)
+    if not rows:
+        print("No usage recorded for this period")
+        return
+
+    widths = [max(len(name), *(len(str(row[name])) for row in rows)) for name in group_by]
+    header = "  ".join(name.ljust(width) for name, width in zip(group_by, widths))
+    print(
+        f"{header}  {'calls':>6} {'failed':>6} {'cached':>6} {'retries':>7} "
+        f"{'prompt':>10} {'completion':>10} {'cost, $':>9} {'p50':>7} {'p95':>7} {'ttfb50':>7}"
+    )
+    for row in rows:
+        keys = "  ".join(str(row[name]).ljust(width) for name, width in zip(group_by, widths))
+        print(
+            f"{keys}  {row['calls']:>6} {row['failed']:>6} {row['cached']:>6} {row['retries']:>7} "
+            f"{row['prompt_tokens']:>10} {row['completion_tokens']:>10} {row['cost']:>9.4f} "
+            f"{format_ms(row['latency_p50_ms']):>7} {format_ms(row['latency_p95_ms']):>7} "
+            f"{format_ms(row['ttfb_p50_ms']):>7}"
+        )
+
+    total_cost = sum(row["cost"] for row in rows)
+    total_tokens = sum(row["prompt_tokens"] + row["completion_tokens"] for row in rows)
+    print(f"\nTotal: {sum(row['calls'] for row in rows)} calls, {total_tokens} tokens, ${total_cost:.4f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Отчёт по расходу LLM на генерацию курсов")
+    parser.add_argument(
+        "--by", default="course_slug,model",
+        help=f"Группировка через запятую: {', '.join(GROUP_FIELDS)}",
+    )
+    parser.add_argument("--since", type=parse_since, default=None, help="Период: 30m / 24h / 7d / all")
+    parser.add_argument("--course", default=None, help="Только один курс")
+    args = parser.parse_args()
+
+    group_by = [name.strip() for name in args.by.split(",") if name.strip()]
+    unknown = [name for name in group_by if name not in GROUP_FIELDS]
+    if unknown or not group_by:
+        parser.error(f"неизвестные поля группировки: {', '.join(unknown) or '(пусто)'}")
+    asyncio.run(main(group_by, args.since, args.course))